@@ -1,8 +1,10 @@
 import json
 import sys
+from time import perf_counter
 from dataclasses import dataclass
+from itertools import chain
 from datetime import datetime
-from typing import Sequence, Optional
+from typing import Sequence, Optional, TextIO, Iterator
 
 import click
 from flask.cli import AppGroup
@@ -14,12 +16,16 @@ from timApp.admin.timitemtype import TimDocumentType, TimItemType
 from timApp.admin.util import commit_if_not_dry
 from timApp.answer.answer import Answer, AnswerSaver
 from timApp.answer.answer_models import UserAnswer, AnswerUpload
+from timApp.answer.answerimport import AnswerImport, AnswerImportError
 from timApp.answer.answers import valid_answers_query
+from timApp.answer.exportedanswer import ExportedAnswer, ExportedAnswerSchema
+from timApp.answer.latestanswer import LatestAnswer, refresh_latest_answers
 from timApp.document.docinfo import DocInfo
 from timApp.folder.folder import Folder
 from timApp.item.block import Block
 from timApp.item.item import Item
 from timApp.plugin.taskid import TaskId
+from timApp.timdb.sqa import db
 from timApp.upload.uploadedfile import PluginUpload
 from timApp.user.user import User
 from timApp.user.usergroup import UserGroup
@@ -118,9 +124,20 @@ def delete_answers_with_ids(
 ) -> AnswerDeleteResult:
     if not isinstance(ids, list):
         raise TypeError("ids should be a list of answer ids")
+    affected = (
+        UserAnswer.query.filter(UserAnswer.answer_id.in_(ids))
+        .join(Answer)
+        .with_entities(Answer.task_id, UserAnswer.user_id)
+        .distinct()
+        .all()
+    )
     d_ua = UserAnswer.query.filter(UserAnswer.answer_id.in_(ids)).delete(
         synchronize_session=False
     )
+    if affected:
+        refresh_latest_answers(
+            {task_id for task_id, _ in affected}, {uid for _, uid in affected}
+        )
     d_as = AnswerSaver.query.filter(AnswerSaver.answer_id.in_(ids)).delete(
         synchronize_session=False
     )
@@ -346,3 +363,123 @@ def delete_old(item: Item, task: list[str], dry_run: bool) -> None:
             f"Deleting {r.deleted} of {r.total} answers from {d.path}, remaining {r.remaining}. {r.adr}"
         )
     commit_if_not_dry(dry_run)
+
+
+@answer_cli.command()
+@click.option(
+    "--batch-size", default=1000, help="How many users to process in one transaction."
+)
+@click.option("--dry-run/--no-dry-run", default=True)
+def backfill_latest(batch_size: int, dry_run: bool) -> None:
+    """Recomputes the latestanswer table from all the answers."""
+    user_ids = [
+        uid for uid, in UserAnswer.query.with_entities(UserAnswer.user_id).distinct()
+    ]
+    user_ids.sort()
+    with click.progressbar(range(0, len(user_ids), batch_size)) as bar:
+        for i in bar:
+            refresh_latest_answers(user_ids=user_ids[i : i + batch_size])
+            if not dry_run:
+                db.session.commit()
+    click.echo(f"Recomputed latest answers of {len(user_ids)} users.")
+    commit_if_not_dry(dry_run)
+
+
+@answer_cli.command()
+@click.argument("doc", type=TimDocumentType())
+@click.option("--group", required=True)
+@click.option("--rounds", default=3)
+def benchmark_latest(doc: DocInfo, group: str, rounds: int) -> None:
+    """Measures finding the latest valid answers of a group in the tasks of a document with and without the
+    latestanswer table.
+    """
+    task_ids = [
+        t
+        for t, in Answer.query.filter(Answer.task_id.startswith(f"{doc.id}."))
+        .with_entities(Answer.task_id)
+        .distinct()
+    ]
+    user_ids = (
+        User.query.join(UserGroup, User.groups)
+        .filter(UserGroup.name == group)
+        .with_entities(User.id)
+    )
+    grouped = (
+        Answer.query.filter(Answer.task_id.in_(task_ids) & (Answer.valid == True))
+        .join(UserAnswer)
+        .filter(UserAnswer.user_id.in_(user_ids))
+        .group_by(Answer.task_id, UserAnswer.user_id)
+        .with_entities(func.max(Answer.id), UserAnswer.user_id)
+    )
+    latest = LatestAnswer.query.filter(
+        LatestAnswer.task_id.in_(task_ids)
+        & LatestAnswer.user_id.in_(user_ids)
+        & (LatestAnswer.valid_answer_id != None)
+    ).with_entities(LatestAnswer.valid_answer_id, LatestAnswer.user_id)
+    click.echo(
+        f"{doc.path}: {len(task_ids)} tasks, {user_ids.count()} users in {group}"
+    )
+    for name, q in (("Grouping answers", grouped), ("latestanswer", latest)):
+        times = []
+        for _ in range(rounds):
+            start = perf_counter()
+            rows = q.all()
+            times.append(perf_counter() - start)
+        click.echo(
+            f"{name}: {len(rows)} answers, "
+            + ", ".join(f"{t * 1000:.0f} ms" for t in times)
+        )
+
+
+def read_exported_answers(f: TextIO) -> Iterator[ExportedAnswer]:
+    """Reads the answers from a file written by /exportAnswers.
+
+    The file is either a JSON array (format=json) or has one answer per line (format=ndjson).
+    The lines are read one at a time, so big exports should be in the latter format.
+    """
+    first_line = f.readline()
+    if first_line.lstrip().startswith("["):
+        for a in json.loads(first_line + f.read()):
+            yield ExportedAnswerSchema.load(a)
+        return
+    for line in chain([first_line], f):
+        if line.strip():
+            yield ExportedAnswerSchema.load(json.loads(line))
+
+
+@answer_cli.command(name="import")
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option(
+    "--doc-map",
+    "-m",
+    multiple=True,
+    help="Imports the answers of a document to another document, given as old_path=new_path.",
+)
+@click.option("--allow-missing-users/--no-allow-missing-users", default=False)
+@click.option("--match-email-case/--no-match-email-case", default=True)
+@click.option("--dry-run/--no-dry-run", default=True)
+def import_answers(
+    file: TextIO,
+    doc_map: list[str],
+    allow_missing_users: bool,
+    match_email_case: bool,
+    dry_run: bool,
+) -> None:
+    """Imports answers that have been exported with /exportAnswers. Existing answers are skipped."""
+    paths = dict(m.split("=", 1) for m in doc_map)
+    imp = AnswerImport(doc_map=paths, match_email_case=match_email_case)
+    start = perf_counter()
+    try:
+        imp.stage(read_exported_answers(file))
+        docs = imp.get_docs()
+        result = imp.run(allow_missing_users=allow_missing_users)
+    except AnswerImportError as e:
+        click.echo(str(e))
+        sys.exit(1)
+    click.echo(
+        f"Imported {result.imported} answers to {len(docs)} documents in {perf_counter() - start:.1f} s, "
+        f"skipped {result.skipped_duplicates} duplicates."
+    )
+    if result.missing_users:
+        click.echo(f"Missing users: {', '.join(result.missing_users)}")
+    commit_if_not_dry(dry_run)
@@ -0,0 +1,72 @@
+"""
+Commands for managing the auto macro and heading cache.
+See :mod:`timApp.document.automacrocache` for a description of the cache.
+"""
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from timApp.admin.timitemtype import TimDocumentType
+from timApp.document.automacrocache import clear_auto_macro_cache
+from timApp.document.docinfo import DocInfo
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.document import Document
+
+automacro_cli = AppGroup("automacros")
+
+
+@automacro_cli.command()
+@click.argument("doc", type=TimDocumentType(), required=False)
+def clear(doc: DocInfo | None) -> None:
+    """Clears the auto macro cache of a document, or of all documents if no document is given."""
+    clear_auto_macro_cache(doc.id if doc else None)
+    click.echo("Cache cleared.")
+
+
+def time_first_view(doc_id: int) -> float:
+    """Computes the auto macros of a document like the first view of the document does."""
+    d = Document(doc_id)
+    pars = d.get_paragraphs()
+    settings = d.get_settings()
+    start = perf_counter()
+    DocParagraph.load_auto_macros(
+        doc_id, pars, settings, clear_cache=False, persist=True
+    )
+    return perf_counter() - start
+
+
+@automacro_cli.command()
+@click.argument("doc", type=TimDocumentType())
+@click.option("--concurrency", default=8, type=int, help="Number of concurrent views.")
+@click.option("--rounds", default=3, type=int)
+def benchmark(doc: DocInfo, concurrency: int, rounds: int) -> None:
+    """Measures the auto macro computation time of concurrent first views of a document.
+
+    Use a large document with heading numbering enabled. The cache of the document is cleared before each round.
+    """
+    click.echo(
+        f"Document {doc.path}: {len(doc.document.get_par_ids())} paragraphs, "
+        f"{concurrency} concurrent views"
+    )
+    app = current_app._get_current_object()
+    for r in range(rounds):
+        clear_auto_macro_cache(doc.id)
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+            def run(_: int) -> float:
+                with app.app_context():
+                    return time_first_view(doc.id)
+
+            times = list(executor.map(run, range(concurrency)))
+        wall = perf_counter() - start
+        warm = time_first_view(doc.id)
+        click.echo(
+            f"Round {r + 1}: wall {wall * 1000:.0f} ms, "
+            f"per view median {statistics.median(times) * 1000:.0f} ms, "
+            f"max {max(times) * 1000:.0f} ms, warm view {warm * 1000:.0f} ms"
+        )
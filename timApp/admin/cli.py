@@ -1,9 +1,15 @@
 from flask import Flask
 
 from timApp.admin.answer_cli import answer_cli
+from timApp.admin.automacro_cli import automacro_cli
 from timApp.admin.item_cli import item_cli
+from timApp.admin.parstore_cli import parstore_cli
+from timApp.admin.plugin_cli import plugin_cli
+from timApp.admin.print_cli import print_cli
+from timApp.admin.search_cli import search_cli
 from timApp.admin.sisu_cli import sisu_cli
 from timApp.admin.user_cli import user_cli
+from timApp.admin.version_cli import version_cli
 from timApp.admin.language_cli import language_cli
 from timApp.admin.translationservice_cli import tr_service_cli
 
@@ -11,10 +17,16 @@ from timApp.admin.translationservice_cli import tr_service_cli
 def register_clis(app: Flask) -> None:
     for c in [
         answer_cli,
+        automacro_cli,
         item_cli,
+        parstore_cli,
+        plugin_cli,
+        print_cli,
+        search_cli,
         sisu_cli,
         user_cli,
         language_cli,
         tr_service_cli,
+        version_cli,
     ]:
         app.cli.add_command(c)
@@ -1,7 +1,12 @@
 import shutil
+import statistics
+import time
 from secrets import token_urlsafe
+from threading import Event, Lock, Thread
+from time import perf_counter
 
 import click
+from flask import current_app
 from flask.cli import AppGroup
 
 from timApp.admin.fix_orphan_documents import (
@@ -9,11 +14,26 @@ from timApp.admin.fix_orphan_documents import (
     move_docs_without_block,
 )
 from timApp.admin.util import commit_if_not_dry
+from timApp.document.changelogfile import (
+    convert_legacy_changelog,
+    LEGACY_CHANGELOG_FILE_NAME,
+)
 from timApp.document.docentry import DocEntry
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.document import Document
+from timApp.document.docupdates import (
+    get_doc_update_hub,
+    get_par_diff,
+    get_par_diff_cache,
+)
+from timApp.document.version import Version
+from timApp.document.viewcontext import default_view_ctx
 from timApp.document.translation.translation import Translation
 from timApp.item.block import Block, BlockType
+from timApp.markdown.templatecache import get_template_cache
 from timApp.notification.notification import Notification
 from timApp.notification.pending_notification import PendingNotification
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.timdb.dbaccess import get_files_path
 from timApp.timdb.sqa import db
@@ -82,6 +102,7 @@ def cleanup_bookmark_docs(
             block.accesses = {}
             Translation.query.filter_by(doc_id=bm_doc.id).delete()
             ReadParagraph.query.filter_by(doc_id=bm_doc.id).delete()
+            LatestReadParagraph.query.filter_by(doc_id=bm_doc.id).delete()
             PendingNotification.query.filter_by(doc_id=bm_doc.id).delete()
             VelpGroupsInDocument.query.filter_by(doc_id=bm_doc.id).delete()
             Notification.query.filter_by(block_id=bm_doc.id).delete()
@@ -139,6 +160,32 @@ def fix_orphans(dry_run: bool) -> None:
     commit_if_not_dry(dry_run)
 
 
+@item_cli.command()
+@click.option("--dry-run/--no-dry-run", default=True)
+def convert_changelogs(dry_run: bool) -> None:
+    """Converts all legacy (newest first) document changelogs to the append-only format.
+
+    Documents are not locked while they are edited, so this should be run while TIM is not in use.
+    """
+    docs_path = get_files_path() / "docs"
+    found = 0
+    with click.progressbar(list(docs_path.iterdir())) as bar:
+        for doc_dir in bar:
+            if (
+                not doc_dir.name.isdigit()
+                or not (doc_dir / LEGACY_CHANGELOG_FILE_NAME).is_file()
+            ):
+                continue
+            found += 1
+            if dry_run:
+                continue
+            with Document(int(doc_dir.name)).get_lock():
+                convert_legacy_changelog(doc_dir)
+    click.echo(f"{'Found' if dry_run else 'Converted'} {found} legacy changelogs.")
+    if dry_run:
+        click.echo("Dry run enabled, nothing changed.")
+
+
 @item_cli.command()
 def verify_io() -> None:
     """Basic IO test to verify that documents can be created on the current TIM install"""
@@ -192,6 +239,13 @@ Second paragraph
         exit(1)
 
     click.echo("Deleting document")
+    delete_test_document(d)
+
+    click.echo("Done, basic IO seems to work!")
+
+
+def delete_test_document(d: DocEntry) -> None:
+    """Deletes a document created by a test command and moves its files to the deleted folder."""
     block = d.block
     block.accesses = {}
     db.session.delete(d)
@@ -208,4 +262,173 @@ Second paragraph
     shutil.move(doc_dir.as_posix(), deleted_docs)
     shutil.move(pars_dir.as_posix(), deleted_pars)
 
-    click.echo("Done, basic IO seems to work!")
+
+@item_cli.command()
+@click.option(
+    "--viewers", default=500, type=int, help="Number of simultaneous viewers."
+)
+@click.option("--edits", default=100, type=int, help="Number of edits to the document.")
+@click.option("--interval", default=0.2, type=float, help="Seconds between the edits.")
+def loadtest_live_updates(viewers: int, edits: int, interval: float) -> None:
+    """Simulates many viewers of one document while the document is being edited.
+
+    Creates a temporary document and edits it while every viewer waits for the new versions like the /docEvents
+    stream does and fetches the diff from its previous version like /getParDiff does. Reports how soon the viewers
+    saw the edits and how many diffs had to be computed. The new versions are delivered through Redis, so this must
+    be run in an environment where Redis is available.
+    """
+    app = current_app._get_current_object()
+    doc_path = f"users/{token_urlsafe(10)}/loadtest"
+    entry = DocEntry.create(doc_path, title="Live update load test")
+    db.session.commit()
+    doc_id = entry.id
+    d = entry.document
+    pars = [d.add_paragraph(f"Paragraph {i}") for i in range(10)]
+    start_version = d.get_version()
+
+    hub = get_doc_update_hub()
+    diff_cache = get_par_diff_cache()
+    computed_before = diff_cache.computed
+    published: dict[Version, float] = {}
+    latencies: list[float] = []
+    fetches = 0
+    stats_lock = Lock()
+    final_version: list[Version] = []
+    stop = Event()
+
+    def view() -> None:
+        nonlocal fetches
+        with app.app_context():
+            hub.watch(doc_id)
+            try:
+                version = start_version
+                while not stop.is_set():
+                    if final_version and version >= final_version[0]:
+                        return
+                    new_version = hub.wait(doc_id, version, 1)
+                    if new_version <= version:
+                        continue
+                    doc = Document(doc_id)
+                    get_par_diff(doc, version, default_view_ctx)
+                    now = perf_counter()
+                    with stats_lock:
+                        fetches += 1
+                        if new_version in published:
+                            latencies.append(now - published[new_version])
+                    version = doc.get_version()
+            finally:
+                hub.unwatch(doc_id)
+
+    threads = [Thread(target=view, daemon=True) for _ in range(viewers)]
+    for t in threads:
+        t.start()
+    # Let the viewers start watching before editing.
+    time.sleep(1)
+
+    click.echo(f"Editing document {doc_path} {edits} times with {viewers} viewers")
+    for i in range(edits):
+        major, minor = d.get_version()
+        # Record the edit time before the edit because the viewers may see the new version before it returns.
+        with stats_lock:
+            published[
+                (major, minor + 1) if i % 3 == 1 else (major + 1, 0)
+            ] = perf_counter()
+        if i % 3 == 0:
+            pars.append(d.add_paragraph(f"New paragraph {i}"))
+        elif i % 3 == 1:
+            d.modify_paragraph(pars[i % len(pars)].get_id(), f"Edited paragraph {i}")
+        else:
+            d.delete_paragraph(pars.pop(0).get_id())
+        time.sleep(interval)
+    final_version.append(d.get_version())
+
+    deadline = time.monotonic() + 10
+    for t in threads:
+        t.join(timeout=max(deadline - time.monotonic(), 0))
+    stop.set()
+    computed = diff_cache.computed - computed_before
+
+    latencies.sort()
+    click.echo(f"Viewers fetched {fetches} diffs, {computed} of which were computed.")
+    if latencies:
+        click.echo(
+            f"Edit-to-diff latency: median {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000:.1f} ms, "
+            f"max {latencies[-1] * 1000:.1f} ms"
+        )
+    else:
+        click.echo("The viewers did not see any edits; is Redis available?")
+
+    delete_test_document(entry)
+
+
+MACRO_BENCHMARK_SETTINGS = """``` {settings=""}
+macros:
+  course: ITKP102
+  week: 3
+  names: [Ada, Brian, Dennis, Grace, Guido, Ken, Linus, Margaret]
+  points: [1, 2, 3, 5, 8]
+```"""
+
+MACRO_BENCHMARK_PAR = """#-
+## Task %%week%%.{task} in %%course|lower%%
+
+{{% for name in names %}}
+- %%name|upper%%: %%(loop.index * week)|Pz%% points, due %%week|w2text(2030)%%
+{{% endfor %}}
+{{% set total = points|sum %}}
+Total %%total%% points, %%"d{{0}};"|srange(1, 5)|gfields%%
+"""
+
+
+@item_cli.command()
+@click.option("--pars", default=500, type=int, help="Number of paragraphs.")
+@click.option(
+    "--distinct", default=50, type=int, help="Number of distinct paragraph texts."
+)
+@click.option("--rounds", default=3, type=int)
+def benchmark_macros(pars: int, distinct: int, rounds: int) -> None:
+    """Measures preloading the HTML of a macro-heavy document with and without the compiled template cache.
+
+    Creates a temporary document whose paragraphs repeat the given number of distinct texts full of macros,
+    loops and filters. The first preload, which also fills the Dumbo cache, is not measured.
+    """
+    doc_path = f"users/{token_urlsafe(10)}/macrobenchmark"
+    entry = DocEntry.create(doc_path, title="Macro benchmark")
+    entry.document.add_text(
+        "\n".join(
+            [MACRO_BENCHMARK_SETTINGS]
+            + [MACRO_BENCHMARK_PAR.format(task=i % distinct) for i in range(pars)]
+        )
+    )
+    db.session.commit()
+    d = entry.document
+    settings = d.get_settings()
+    cache = get_template_cache()
+    max_size = cache.max_size
+
+    def preload() -> float:
+        d.clear_mem_cache()
+        ps = d.get_paragraphs()
+        start = perf_counter()
+        DocParagraph.preload_htmls(
+            ps, settings, default_view_ctx, clear_cache=True, persist=False
+        )
+        return perf_counter() - start
+
+    click.echo(f"Document {doc_path}: {pars} paragraphs, {distinct} distinct texts")
+    try:
+        cache.max_size = 0
+        preload()
+        for enabled in (False, True):
+            cache.max_size = max_size if enabled else 0
+            cache.clear()
+            times = [preload() for _ in range(rounds)]
+            click.echo(
+                f"Template cache {'enabled' if enabled else 'disabled'}: "
+                + ", ".join(f"{t * 1000:.0f} ms" for t in times)
+                + (f" ({cache.hits} hits, {cache.misses} misses)" if enabled else "")
+            )
+    finally:
+        cache.max_size = max_size
+        delete_test_document(entry)
@@ -0,0 +1,210 @@
+"""
+Commands for converting documents to the packed paragraph storage layout, compacting and benchmarking it.
+See :mod:`timApp.document.parstore` for a description of the layout.
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+from pathlib import Path
+from time import perf_counter
+from typing import Generator
+
+import click
+from flask.cli import AppGroup
+
+from timApp.admin.answer_cli import collect_docs
+from timApp.admin.timitemtype import TimItemType, TimDocumentType
+from timApp.document.docinfo import DocInfo
+from timApp.document.document import Document
+from timApp.document.parstore import (
+    PackedParStore,
+    get_par_store,
+    clear_par_store_cache,
+    SEGMENT_FILE_NAME,
+    INDEX_FILE_NAME,
+)
+from timApp.item.item import Item
+
+parstore_cli = AppGroup("parstore")
+
+
+def read_legacy_pars(
+    pars_dir: Path, currents: list[tuple[str, str]]
+) -> Generator[tuple[str, str, dict], None, None]:
+    """Reads all paragraph revisions of a document stored in the file-per-paragraph layout.
+
+    :param pars_dir: The paragraph directory of the document.
+    :param currents: List where the (par_id, hash) pairs of the "current" symlinks are collected.
+    """
+    for par_entry in os.scandir(pars_dir):
+        if not par_entry.is_dir():
+            continue
+        par_id = par_entry.name
+        for rev in os.scandir(par_entry.path):
+            if rev.name == "current":
+                currents.append((par_id, os.readlink(rev.path)))
+                continue
+            with open(rev.path) as f:
+                yield par_id, rev.name, json.load(f)
+
+
+def migrate_to_packed(doc_id: int, remove_old: bool) -> int:
+    """Converts a document to the packed layout.
+
+    :return: The number of paragraph revisions that were converted.
+    """
+    store = get_par_store(doc_id)
+    if store.exists() or not store.path.is_dir():
+        return 0
+    tmp_path = store.path.parent / f"{doc_id}.packtmp"
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_store = PackedParStore(tmp_path, doc_id)
+    currents: list[tuple[str, str]] = []
+    count = 0
+
+    def counted() -> Generator[tuple[str, str, dict], None, None]:
+        nonlocal count
+        for r in read_legacy_pars(store.path, currents):
+            count += 1
+            yield r
+
+    with Document(doc_id).get_lock():
+        tmp_store.write_many(counted())
+        tmp_store.set_current_many(currents)
+        # The index is moved last because its existence is what marks the document as converted.
+        os.replace(tmp_path / SEGMENT_FILE_NAME, store.path / SEGMENT_FILE_NAME)
+        os.replace(tmp_path / INDEX_FILE_NAME, store.path / INDEX_FILE_NAME)
+        shutil.rmtree(tmp_path)
+        if remove_old:
+            for par_id, _ in currents:
+                shutil.rmtree(store.path / par_id, ignore_errors=True)
+    clear_par_store_cache()
+    return count
+
+
+def docs_with_translations(item: Item) -> Generator[DocInfo, None, None]:
+    visited = set()
+    for d in collect_docs(item):
+        for t in d.translations:
+            if t.id not in visited:
+                visited.add(t.id)
+                yield t
+
+
+@parstore_cli.command()
+@click.argument("item", type=TimItemType())
+@click.option("--dry-run/--no-dry-run", default=True)
+@click.option(
+    "--remove-old/--no-remove-old",
+    default=False,
+    help="Remove the per-paragraph files after conversion.",
+)
+def migrate(item: Item, dry_run: bool, remove_old: bool) -> None:
+    """Converts documents to the packed paragraph storage layout."""
+    total = 0
+    for d in docs_with_translations(item):
+        store = get_par_store(d.id)
+        if store.exists():
+            click.echo(f"{d.path} ({d.id}) is already converted")
+            continue
+        if dry_run:
+            click.echo(f"Would convert {d.path} ({d.id})")
+            continue
+        count = migrate_to_packed(d.id, remove_old)
+        total += count
+        click.echo(f"Converted {d.path} ({d.id}): {count} paragraph revisions")
+    if dry_run:
+        click.echo("Dry run enabled, nothing changed.")
+    else:
+        click.echo(f"Total {total} paragraph revisions converted.")
+
+
+@parstore_cli.command()
+@click.argument("item", type=TimItemType())
+@click.option(
+    "--min-dead-ratio",
+    default=0.0,
+    type=float,
+    help="Only compact the stores where superseded records take up more than this share of the segment.",
+)
+@click.option("--dry-run/--no-dry-run", default=True)
+def compact(item: Item, min_dead_ratio: float, dry_run: bool) -> None:
+    """Removes the superseded paragraph records from the packed stores of documents."""
+    total = 0
+    for d in docs_with_translations(item):
+        store = get_par_store(d.id)
+        if not store.exists() or not store.should_compact(min_dead_ratio, 0):
+            continue
+        ratio = store.get_dead_ratio()
+        if dry_run:
+            click.echo(f"Would compact {d.path} ({d.id}): {ratio:.0%} dead")
+            continue
+        freed = store.compact()
+        total += freed
+        click.echo(
+            f"Compacted {d.path} ({d.id}): {ratio:.0%} dead, freed {freed} bytes"
+        )
+    if dry_run:
+        click.echo("Dry run enabled, nothing changed.")
+    else:
+        click.echo(f"Total {total} bytes freed.")
+
+
+def drop_os_caches() -> bool:
+    try:
+        subprocess.run(["sync"], check=True)
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+def time_load_pars(doc_id: int, packed: bool) -> float:
+    clear_par_store_cache()
+    d = Document(doc_id)
+    if not packed:
+        d.par_store = None
+        d.par_store_resolved = True
+    start = perf_counter()
+    d.load_pars()
+    return perf_counter() - start
+
+
+@parstore_cli.command()
+@click.argument("doc", type=TimDocumentType())
+@click.option("--rounds", default=5, type=int)
+@click.option(
+    "--drop-os-caches/--no-drop-os-caches",
+    "drop_caches",
+    default=False,
+    help="Drop the OS page cache before each load (requires root).",
+)
+def benchmark(doc: DocInfo, rounds: int, drop_caches: bool) -> None:
+    """Compares cold load time of Document.load_pars between the two storage layouts.
+
+    The document must have been converted with --no-remove-old so that both layouts are available.
+    """
+    store = get_par_store(doc.id)
+    if not store.exists():
+        click.echo("Document has not been converted; run 'parstore migrate' first.")
+        return
+    d = doc.document
+    d.ensure_par_ids_loaded()
+    click.echo(f"Document {doc.path}: {len(d.par_ids)} paragraphs")
+    results: dict[str, list[float]] = {"files": [], "packed": []}
+    for _ in range(rounds):
+        for name, packed in (("files", False), ("packed", True)):
+            if drop_caches and not drop_os_caches():
+                click.echo("Could not drop OS caches; results are for a warm OS cache.")
+                drop_caches = False
+            results[name].append(time_load_pars(doc.id, packed))
+    for name, times in results.items():
+        click.echo(
+            f"{name:>6}: median {statistics.median(times) * 1000:.1f} ms, "
+            f"min {min(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms"
+        )
+    click.echo(f"Packed store size: {store.get_size()} bytes")
@@ -0,0 +1,97 @@
+"""
+Commands for measuring the plugin call overhead.
+See :mod:`timApp.util.httpsession` for a description of the connection pooling.
+"""
+import json
+import statistics
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter
+from typing import Generator
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from timApp.document.docsettings import DocSettings
+from timApp.document.document import Document
+from timApp.document.yamlblock import YamlBlock
+from timApp.plugin.containerLink import PluginReg, get_plugins, send_plugin_multi
+from timApp.util.httpsession import close_http_session
+
+plugin_cli = AppGroup("plugins")
+
+STUB_PLUGIN_NAME = "benchmarkstub"
+
+
+class StubPluginHandler(BaseHTTPRequestHandler):
+    """Answers every multihtml call with one HTML snippet per plugin, keeping the connection alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        plugins = json.loads(self.rfile.read(length))
+        body = json.dumps([f"<div>{i}</div>" for i in range(len(plugins))]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@contextmanager
+def stub_plugin_server() -> Generator[PluginReg, None, None]:
+    """Runs a stub plugin server in a background thread and registers it as a plugin for this process."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPluginHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    reg = PluginReg(
+        name=STUB_PLUGIN_NAME, domain="127.0.0.1", port=server.server_address[1]
+    )
+    get_plugins()[STUB_PLUGIN_NAME] = reg
+    try:
+        yield reg
+    finally:
+        del get_plugins()[STUB_PLUGIN_NAME]
+        server.shutdown()
+        server.server_close()
+
+
+def time_calls(calls: int, plugins_per_call: int) -> list[float]:
+    settings = DocSettings(Document(0), YamlBlock({DocSettings.plugin_md_key: False}))
+    plugin_dicts = [{"markup": {}} for _ in range(plugins_per_call)]
+    dumbo_opts = [settings.get_dumbo_options()] * plugins_per_call
+    times = []
+    for _ in range(calls):
+        start = perf_counter()
+        send_plugin_multi(settings, STUB_PLUGIN_NAME, plugin_dicts, dumbo_opts)
+        times.append(perf_counter() - start)
+    return times
+
+
+@plugin_cli.command()
+@click.option("--calls", default=1000, type=int, help="Number of sequential calls.")
+@click.option("--plugins", default=10, type=int, help="Number of plugins per call.")
+def benchmark_http(calls: int, plugins: int) -> None:
+    """Measures sequential multihtml calls to a local stub plugin with and without connection pooling."""
+    pooling = current_app.config["HTTP_CONNECTION_POOLING"]
+    try:
+        with stub_plugin_server():
+            for enabled in (False, True):
+                current_app.config["HTTP_CONNECTION_POOLING"] = enabled
+                close_http_session()
+                start = perf_counter()
+                times = time_calls(calls, plugins)
+                wall = perf_counter() - start
+                times.sort()
+                click.echo(
+                    f"Pooling {'on' if enabled else 'off'}: {calls} calls in {wall:.2f} s, "
+                    f"median {statistics.median(times) * 1000:.2f} ms, "
+                    f"p99 {times[int(len(times) * 0.99) - 1] * 1000:.2f} ms"
+                )
+    finally:
+        current_app.config["HTTP_CONNECTION_POOLING"] = pooling
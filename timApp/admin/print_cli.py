@@ -0,0 +1,104 @@
+"""
+Commands for measuring document printing.
+See :mod:`timApp.printing.fragmentcache` for a description of the paragraph fragment cache.
+"""
+import tempfile
+from pathlib import Path
+from secrets import token_urlsafe
+from time import perf_counter
+
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+
+from timApp.admin.item_cli import delete_test_document
+from timApp.document.docentry import DocEntry
+from timApp.document.docinfo import DocInfo
+from timApp.document.usercontext import UserContext
+from timApp.printing.documentprinter import DocumentPrinter
+from timApp.printing.print import get_template_doc
+from timApp.printing.printsettings import PrintFormat
+from timApp.timdb.sqa import db
+from timApp.user.user import User
+
+print_cli = AppGroup("print")
+
+
+def time_print(
+    doc: DocInfo, template: DocInfo | None, file_type: PrintFormat, use_cache: bool
+) -> tuple[float, float, int]:
+    """Prints the document into a temporary file.
+
+    :return: The time of building the content, the total time and the number of cached paragraph fragments.
+    """
+    current_app.config["PRINT_FRAGMENT_CACHE"] = use_cache
+    user_ctx = UserContext.from_one_user(g.user)
+    printer = DocumentPrinter(doc, template_to_use=template, urlroot="")
+    # Don't reuse the paragraphs loaded by the previous build.
+    doc.document.clear_mem_cache()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = perf_counter()
+        printer.get_content(user_ctx, target_format=file_type)
+        content_time = perf_counter() - start
+        printer.write_to_format(
+            user_ctx,
+            target_format=file_type,
+            path=Path(tmp) / f"out.{file_type.value}",
+        )
+        total_time = perf_counter() - start
+    return content_time, total_time, printer.fragment_hits
+
+
+@print_cli.command()
+@click.argument("doc_path")
+@click.option(
+    "--file-type",
+    default="latex",
+    type=click.Choice([f.value for f in PrintFormat]),
+    help="Format to print.",
+)
+def benchmark_edit(doc_path: str, file_type: str) -> None:
+    """Measures how long printing takes after a one-paragraph edit, with and without the fragment cache.
+
+    The document is copied to a temporary document, which is edited and deleted afterwards.
+    """
+    src = DocEntry.find_by_path(doc_path)
+    if src is None:
+        raise click.ClickException(f"Document not found: {doc_path}")
+    print_type = PrintFormat(file_type)
+    template, _, error, _ = get_template_doc(src, -1)
+    if error:
+        click.echo(f"{error}; printing without a template.")
+    g.user = User.get_anon()
+    use_cache = current_app.config["PRINT_FRAGMENT_CACHE"]
+
+    doc = DocEntry.create(f"users/{token_urlsafe(10)}/printbenchmark", title=src.title)
+    doc.document.add_text(src.document.export_markdown(export_ids=False))
+    db.session.commit()
+    try:
+        pars = [p for p in doc.document.get_paragraphs() if not p.is_setting()]
+        if not pars:
+            raise click.ClickException("The document has no paragraphs to edit.")
+        n = len(pars)
+
+        def report(title: str, enabled: bool) -> None:
+            content_time, total_time, hits = time_print(
+                doc, template, print_type, enabled
+            )
+            click.echo(
+                f"{title}: content {content_time:.2f} s, total {total_time:.2f} s, "
+                f"{hits}/{n} paragraphs from the cache"
+            )
+
+        report("Full build", False)
+        report("Filling the cache", True)
+        edited = pars[n // 2]
+        doc.document.modify_paragraph(
+            edited.get_id(), edited.get_markdown() + "\n\nEdited."
+        )
+        click.echo(f"Edited paragraph {edited.get_id()}.")
+        report("Full build after the edit", False)
+        report("Cached build after the edit", True)
+    finally:
+        current_app.config["PRINT_FRAGMENT_CACHE"] = use_cache
+        delete_test_document(doc)
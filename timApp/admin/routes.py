@@ -4,11 +4,14 @@ from dataclasses import dataclass
 from flask import flash, url_for, Blueprint, Response
 
 from timApp.auth.accesshelper import verify_admin
+from timApp.markdown.dumbocache import get_dumbo_cache_stats
+from timApp.plugin.containerLink import get_plugin
+from timApp.plugin.pluginreqs import invalidate_plugin_reqs
 from timApp.timdb.sqa import db
 from timApp.user.user import User
 from timApp.user.usergroup import UserGroup
 from timApp.util.flask.requesthelper import use_model
-from timApp.util.flask.responsehelper import safe_redirect, json_response
+from timApp.util.flask.responsehelper import safe_redirect, json_response, ok_response
 
 admin_bp = Blueprint("admin", __name__, url_prefix="")
 
@@ -49,6 +52,28 @@ def restart_server() -> Response:
     return safe_redirect(url_for("start_page"))
 
 
+@dataclass
+class InvalidatePluginReqsModel:
+    plugin: str | None = None
+
+
+@admin_bp.post("/plugins/reqs/invalidate")
+@use_model(InvalidatePluginReqsModel)
+def invalidate_reqs(m: InvalidatePluginReqsModel) -> Response:
+    """Invalidates the cached reqs of the given plugin or all plugins, e.g. after deploying a plugin."""
+    verify_admin()
+    if m.plugin is not None:
+        get_plugin(m.plugin)
+    invalidate_plugin_reqs(m.plugin)
+    return ok_response()
+
+
+@admin_bp.get("/dumbo/cache/stats")
+def dumbo_cache_stats() -> Response:
+    verify_admin()
+    return json_response(get_dumbo_cache_stats())
+
+
 @admin_bp.get("/users/search/<term>")
 def search_users(term: str) -> Response:
     verify_admin()
@@ -0,0 +1,52 @@
+"""
+Commands for managing the search index.
+See :mod:`timApp.util.searchindex` for a description of the index.
+"""
+from time import perf_counter
+
+import click
+from flask.cli import AppGroup
+
+from timApp.util.flask.search import (
+    SEARCH_INDEX_FOLDER,
+    create_search_files,
+    update_search_index,
+)
+from timApp.util.searchindex import open_index
+
+search_cli = AppGroup("search")
+
+
+@search_cli.command()
+def rebuild() -> None:
+    """Rebuilds the search index from all documents."""
+    _, msg = create_search_files()
+    click.echo(msg)
+
+
+@search_cli.command()
+def update() -> None:
+    """Updates the documents that have been modified since the previous update."""
+    click.echo(f"Updated {update_search_index()} documents.")
+
+
+@search_cli.command()
+@click.argument("text")
+@click.option("--whole-words", is_flag=True)
+@click.option("--regex", is_flag=True)
+def query(text: str, whole_words: bool, regex: bool) -> None:
+    """Shows the size of the search index and how many documents may match the query."""
+    index = open_index(SEARCH_INDEX_FOLDER)
+    if index is None:
+        raise click.UsageError("The search index has not been built.")
+    click.echo(
+        f"{index.doc_count()} documents in {len(index.segments)} segments, "
+        f"last update at {index.updated:.0f}"
+    )
+    start = perf_counter()
+    matches = index.find_content(text, regex, whole_words)
+    click.echo(
+        f"{len(matches)} candidate documents, "
+        f"{sum(len(m.par_indices) for m in matches if m.par_indices is not None)} candidate paragraphs "
+        f"in {(perf_counter() - start) * 1000:.0f} ms"
+    )
@@ -14,9 +14,11 @@ from flask.cli import AppGroup
 from sqlalchemy import func
 
 from timApp.admin.import_accounts import import_accounts_impl
+from timApp.answer.latestanswer import refresh_latest_answers
 from timApp.auth.accesstype import AccessType
 from timApp.document.docentry import DocEntry
 from timApp.document.docinfo import move_document
+from timApp.readmark.readings import refresh_latest_read_marks
 from tim_common.timjsonencoder import TimJsonEncoder
 from timApp.tim_app import get_home_organization_group
 from timApp.timdb.sqa import db
@@ -285,6 +287,10 @@ def do_merge_users(u_prim: User, u_sec: User, force=False) -> MergeResult:
             u_prim_group.accesses_alt.pop(key)
             u_sec_group.accesses_alt[key] = a
             break
+    # The latest read marks and answers are derived from the moved data.
+    db.session.flush()
+    refresh_latest_read_marks([u_prim_group.id, u_sec_group.id])
+    refresh_latest_answers(user_ids=[u_prim.id, u_sec.id])
     return moved_data
 
 
@@ -0,0 +1,81 @@
+"""
+Commands for compacting document version files into deltas and for measuring their cost.
+See :mod:`timApp.document.versionfile` for a description of the format.
+"""
+import statistics
+from time import perf_counter
+
+import click
+from flask.cli import AppGroup
+
+from timApp.admin.parstore_cli import docs_with_translations
+from timApp.admin.timitemtype import TimItemType, TimDocumentType
+from timApp.document.docinfo import DocInfo
+from timApp.document.versionfile import (
+    compact_versions,
+    list_versions,
+    read_version_header,
+    read_version_lines,
+    get_version_file_path,
+)
+from timApp.item.item import Item
+
+version_cli = AppGroup("versions")
+
+
+@version_cli.command()
+@click.argument("item", type=TimItemType())
+@click.option("--dry-run/--no-dry-run", default=True)
+def compact(item: Item, dry_run: bool) -> None:
+    """Re-encodes the version files of documents as deltas against periodic snapshots."""
+    total_before = 0
+    total_after = 0
+    for d in docs_with_translations(item):
+        doc = d.document
+        if not doc.get_doc_dir().is_dir():
+            continue
+        with doc.get_lock():
+            before, after = compact_versions(doc.get_doc_dir(), dry_run=dry_run)
+        total_before += before
+        total_after += after
+        click.echo(f"{d.path} ({d.id}): {before} -> {after} bytes")
+    click.echo(f"Total: {total_before} -> {total_after} bytes")
+    if dry_run:
+        click.echo("Dry run enabled, nothing changed.")
+
+
+@version_cli.command()
+@click.argument("doc", type=TimDocumentType())
+@click.option("--rounds", default=5, type=int)
+def stats(doc: DocInfo, rounds: int) -> None:
+    """Prints the disk usage of the version files of a document and the time to reconstruct its versions."""
+    doc_dir = doc.document.get_doc_dir()
+    versions = list_versions(doc_dir)
+    if not versions:
+        click.echo("Document has no versions.")
+        return
+    size = 0
+    deltas = 0
+    for ver in versions:
+        size += get_version_file_path(doc_dir, ver).stat().st_size
+        if read_version_header(doc_dir, ver) is not None:
+            deltas += 1
+    click.echo(
+        f"Document {doc.path}: {len(versions)} versions ({deltas} deltas), {size} bytes"
+    )
+    for name, ver in (("oldest", versions[0]), ("latest", versions[-1])):
+        times = []
+        for _ in range(rounds):
+            start = perf_counter()
+            read_version_lines(doc_dir, ver)
+            times.append(perf_counter() - start)
+        click.echo(
+            f"{name:>6} {ver}: median {statistics.median(times) * 1000:.2f} ms, "
+            f"max {max(times) * 1000:.2f} ms"
+        )
+    start = perf_counter()
+    for ver in versions:
+        read_version_lines(doc_dir, ver)
+    click.echo(
+        f"All versions: {(perf_counter() - start) * 1000 / len(versions):.2f} ms per version"
+    )
@@ -0,0 +1,367 @@
+"""Bulk import of exported answers.
+
+Importing a backup of a course may mean hundreds of thousands of answers, so the answers are not handled as ORM
+objects. Instead:
+
+1. The answers are copied to a temporary table with COPY.
+2. The documents and the users are looked up with joins.
+3. The answers that already exist (same document, task, time, validity, points and user) are marked as duplicates.
+4. The answer ids are taken from the sequence in the order of the answer times, so the ids of the imported answers
+   are in the same order as their timestamps; the latest answer is assumed to have the largest id.
+5. The answer and useranswer rows are inserted with INSERT ... SELECT, and the latest answers of the affected users
+   are recomputed.
+
+Usage::
+
+    imp = AnswerImport(doc_map=doc_map)
+    imp.stage(exported_answers)
+    for d in imp.get_docs():
+        verify_teacher_access(d)
+    result = imp.run(allow_missing_users=False)
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator, Any
+
+from sqlalchemy import (
+    Table,
+    MetaData,
+    Column,
+    Integer,
+    Text,
+    DateTime,
+    Boolean,
+    Float,
+    select,
+    func,
+    and_,
+    bindparam,
+    cast,
+    exists,
+    distinct,
+    false,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.elements import ColumnElement, Grouping
+
+from timApp.answer.answer import Answer
+from timApp.answer.answer_models import UserAnswer
+from timApp.answer.exportedanswer import ExportedAnswer
+from timApp.answer.latestanswer import refresh_latest_answers
+from timApp.document.docentry import DocEntry
+from timApp.timdb.sqa import db
+from timApp.user.user import User
+from timApp.util.utils import seq_to_str
+
+staging = Table(
+    "answer_import",
+    MetaData(),
+    Column("seq", Integer, primary_key=True, autoincrement=False),
+    Column("doc", Text, nullable=False),
+    Column("task", Text, nullable=False),
+    Column("time", DateTime(timezone=True), nullable=False),
+    Column("valid", Boolean, nullable=False),
+    Column("points", Float),
+    Column("email", Text, nullable=False),
+    Column("content", Text, nullable=False),
+    Column("doc_id", Integer),
+    Column("task_id", Text),
+    Column("user_id", Integer),
+    Column("duplicate", Boolean, nullable=False, server_default=false()),
+    Column("answer_id", Integer),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+"""The answers being imported. Filled with COPY, so the columns are listed in COPY_COLUMNS order."""
+
+COPY_COLUMNS = ["seq", "doc", "task", "time", "valid", "points", "email", "content"]
+
+
+class AnswerImportError(Exception):
+    """The answers cannot be imported; nothing was imported."""
+
+
+@dataclass
+class AnswerImportResult:
+    imported: int
+    skipped_duplicates: int
+    missing_users: list[str]
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "imported": self.imported,
+            "skipped_duplicates": self.skipped_duplicates,
+            "missing_users": self.missing_users,
+        }
+
+
+def to_copy_value(value: Any) -> str:
+    """Formats a value for the text format of COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class LineReader:
+    """A file-like object that reads the lines from an iterator, for COPY."""
+
+    def __init__(self, lines: Iterator[str]):
+        self.lines = lines
+        self.buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+        data = "".join(parts)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class AnswerImport:
+    """Imports exported answers (see ExportedAnswer) with a few set-based queries.
+
+    Everything is done in the transaction of the current session; the caller commits.
+    """
+
+    def __init__(
+        self, doc_map: dict[str, str] | None = None, match_email_case: bool = True
+    ):
+        """
+        :param doc_map: Maps the document paths of the exported answers to the paths of the target documents.
+        :param match_email_case: Whether the emails must match case-sensitively.
+        """
+        self.doc_map = doc_map or {}
+        self.match_email_case = match_email_case
+        self.conn: Connection = db.session.connection()
+
+    def stage(self, answers: Iterable[ExportedAnswer]) -> None:
+        """Copies the answers to the staging table and looks up their documents."""
+        staging.create(self.conn)
+        lines = (
+            "\t".join(
+                to_copy_value(v)
+                for v in (
+                    i,
+                    self.doc_map.get(a.doc, a.doc),
+                    a.task,
+                    a.time,
+                    a.valid,
+                    a.points,
+                    a.email,
+                    a.content,
+                )
+            )
+            + "\n"
+            for i, a in enumerate(answers)
+        )
+        cursor = self.conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {staging.name} ({', '.join(COPY_COLUMNS)}) FROM STDIN",
+                LineReader(lines),
+            )
+        finally:
+            cursor.close()
+        self.conn.execute(f"ANALYZE {staging.name}")
+        s, d = staging.c, DocEntry.__table__.c
+        self.conn.execute(
+            staging.update()
+            .where(s.doc == d.name)
+            .values(doc_id=d.id, task_id=cast(d.id, Text) + "." + s.task)
+        )
+
+    def get_docs(self) -> list[DocEntry]:
+        """Returns the documents that the answers are imported to.
+
+        :raises AnswerImportError: if some of the documents do not exist.
+        """
+        s = staging.c
+        missing_docs = [
+            doc
+            for doc, in self.conn.execute(
+                select([distinct(s.doc)]).where(s.doc_id == None)
+            )
+        ]
+        if missing_docs:
+            raise AnswerImportError(f"Some documents not found: {set(missing_docs)}")
+        return DocEntry.query.filter(
+            DocEntry.id.in_(select([distinct(s.doc_id)]))
+        ).all()
+
+    def email_expr(self, email: ColumnElement) -> ColumnElement:
+        """Returns the expression that the emails are matched by."""
+        return email if self.match_email_case else func.lower(email)
+
+    def find_users(self, allow_missing_users: bool) -> list[str]:
+        """Sets the user ids of the staged answers.
+
+        :return: The emails that do not match any user.
+        """
+        s, u = staging.c, User.__table__.c
+        if not self.match_email_case:
+            ambiguous = [
+                f"{e}: {seq_to_str(emails)}"
+                for e, emails in self.conn.execute(
+                    select([func.lower(u.email), func.array_agg(u.email)])
+                    .where(func.lower(u.email).in_(select([func.lower(s.email)])))
+                    .group_by(func.lower(u.email))
+                    .having(func.count() > 1)
+                )
+            ]
+            if ambiguous:
+                raise AnswerImportError(
+                    f"There are multiple users for the same email, "
+                    f"cannot import with match_email_case = False: {seq_to_str(ambiguous)}"
+                )
+        self.conn.execute(
+            staging.update()
+            .where(self.email_expr(s.email) == self.email_expr(u.email))
+            .values(user_id=u.id)
+        )
+        missing_users = sorted(
+            email
+            for email, in self.conn.execute(
+                select([distinct(self.email_expr(s.email))]).where(s.user_id == None)
+            )
+        )
+        if missing_users and not allow_missing_users:
+            raise AnswerImportError(f"Email(s) not found: {seq_to_str(missing_users)}")
+        return missing_users
+
+    def mark_duplicates(self) -> int:
+        """Marks the staged answers that already exist.
+
+        :return: The number of duplicates.
+        """
+        s, a, ua = staging.c, Answer.__table__.c, UserAnswer.__table__.c
+        existing = (
+            exists()
+            .select_from(Answer.__table__.join(UserAnswer.__table__))
+            .where(
+                and_(
+                    a.task_id == s.task_id,
+                    a.answered_on == s.time,
+                    a.valid == s.valid,
+                    a.points.isnot_distinct_from(s.points),
+                    ua.user_id == s.user_id,
+                )
+            )
+        )
+        return self.conn.execute(
+            staging.update()
+            .where(and_(s.user_id != None, existing))
+            .values(duplicate=True)
+        ).rowcount
+
+    def assign_answer_ids(self) -> int:
+        """Takes ids for the new answers from the answer id sequence in the order of the answer times.
+
+        :return: The number of new answers.
+        """
+        s = staging.c
+        importable = and_(s.user_id != None, s.duplicate == False)
+        count = self.conn.execute(
+            select([func.count()]).select_from(staging).where(importable)
+        ).scalar()
+        if not count:
+            return 0
+        ids = sorted(
+            i
+            for i, in self.conn.execute(
+                select(
+                    [func.nextval(func.pg_get_serial_sequence("answer", "id"))]
+                ).select_from(func.generate_series(1, count))
+            )
+        )
+        ranked = (
+            select(
+                [
+                    s.seq,
+                    func.row_number().over(order_by=[s.time, s.seq]).label("rn"),
+                ]
+            )
+            .where(importable)
+            .alias("ranked")
+        )
+        # A subscripted cast must be in parentheses.
+        id_array = Grouping(cast(bindparam("ids", ids), ARRAY(Integer)))
+        self.conn.execute(
+            staging.update()
+            .where(s.seq == ranked.c.seq)
+            .values(answer_id=id_array[ranked.c.rn])
+        )
+        return count
+
+    def insert_answers(self) -> None:
+        s = staging.c
+        new = s.answer_id != None
+        self.conn.execute(
+            Answer.__table__.insert().from_select(
+                ["id", "task_id", "content", "points", "answered_on", "valid"],
+                select([s.answer_id, s.task_id, s.content, s.points, s.time, s.valid])
+                .where(new)
+                .order_by(s.answer_id),
+            )
+        )
+        self.conn.execute(
+            UserAnswer.__table__.insert().from_select(
+                ["answer_id", "user_id"],
+                select([s.answer_id, s.user_id]).where(new).order_by(s.answer_id),
+            )
+        )
+        # Sanity check: the ids must be in the same order as the timestamps of the answers.
+        prev_time = func.lag(s.time).over(order_by=s.answer_id).label("prev_time")
+        ordered = select([s.time, prev_time]).where(new).alias("ordered")
+        if self.conn.execute(
+            select([func.count()])
+            .select_from(ordered)
+            .where(ordered.c.prev_time > ordered.c.time)
+        ).scalar():
+            raise Exception(
+                "Import bug: Answer ids were in different order than answer timestamps. Imported nothing."
+            )
+
+        # The answers were not inserted through the session, so the latest answers must be updated here.
+        task_ids = [
+            t for t, in self.conn.execute(select([distinct(s.task_id)]).where(new))
+        ]
+        user_ids = [
+            u for u, in self.conn.execute(select([distinct(s.user_id)]).where(new))
+        ]
+        refresh_latest_answers(task_ids, user_ids)
+
+    def run(self, allow_missing_users: bool = False) -> AnswerImportResult:
+        """Imports the staged answers that do not exist yet.
+
+        :param allow_missing_users: Whether to skip the answers of missing users instead of failing.
+        :raises AnswerImportError: if there are missing users and allow_missing_users is False
+         or if the users cannot be identified by their emails.
+        """
+        missing_users = self.find_users(allow_missing_users)
+        dupes = self.mark_duplicates()
+        imported = self.assign_answer_ids()
+        if imported:
+            self.insert_answers()
+        staging.drop(self.conn)
+        return AnswerImportResult(
+            imported=imported,
+            skipped_duplicates=dupes,
+            missing_users=missing_users,
+        )
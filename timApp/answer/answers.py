@@ -5,8 +5,10 @@ from collections import defaultdict, OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
+from itertools import islice
 from typing import (
     Iterable,
+    Iterator,
     Any,
     Generator,
     TypeVar,
@@ -26,19 +28,25 @@ from sqlalchemy.orm import selectinload, defaultload, Query, joinedload, contain
 
 from timApp.answer.answer import Answer
 from timApp.answer.answer_models import AnswerTag, UserAnswer
+from timApp.answer.latestanswer import LatestAnswer
 from timApp.answer.pointsumrule import PointSumRule, PointType, Group
+from timApp.auth.accesshelper import AccessDenied
 from timApp.document.viewcontext import OriginInfo
 from timApp.plugin.plugintype import PluginType, PluginTypeLazy, PluginTypeBase
 from timApp.plugin.taskid import TaskId
 from timApp.timdb.sqa import db
-from timApp.upload.upload import get_pluginupload
+from timApp.upload.upload import (
+    get_pluginupload,
+    get_answer_pluginuploads,
+    PluginUpload,
+)
 from timApp.user.user import Consent, User
 from timApp.user.usergroup import UserGroup
 from timApp.util.answerutil import (
     task_ids_to_strlist,
     AnswerPeriodOptions,
 )
-from timApp.util.flask.requesthelper import is_testing
+from timApp.util.flask.requesthelper import is_testing, RouteException
 from timApp.util.logger import log_warning
 from timApp.velp.annotation_model import Annotation
 
@@ -70,16 +78,14 @@ def get_latest_answers_query(task_id: TaskId, users: list[User]) -> Query:
 
 
 def get_latest_valid_answers_query(task_id: TaskId, users: list[User]) -> Query:
-    sq = (
-        Answer.query.filter_by(task_id=task_id.doc_task, valid=True)
-        .join(User, Answer.users)
-        .filter(User.id.in_([u.id for u in users]))
-        .group_by(User.id)
-        .with_entities(func.max(Answer.id).label("aid"), User.id.label("uid"))
-        .subquery()
+    return (
+        Answer.query.join(LatestAnswer, Answer.id == LatestAnswer.valid_answer_id)
+        .filter(
+            (LatestAnswer.task_id == task_id.doc_task)
+            & LatestAnswer.user_id.in_([u.id for u in users])
+        )
+        .with_entities(Answer)
     )
-    datas = Answer.query.join(sq, Answer.id == sq.c.aid).with_entities(Answer)
-    return datas
 
 
 def is_redundant_answer(
@@ -221,6 +227,7 @@ class SortOptions(Enum):
 class FormatOptions(Enum):
     JSON = "json"
     TEXT = "text"
+    NDJSON = "ndjson"
 
 
 class AnswerPrintOptions(Enum):
@@ -253,14 +260,33 @@ class AllAnswersOptions(AnswerPeriodOptions):
     salt_len: int = field(default=32, metadata={"data_key": "saltLen"})
 
 
-def get_all_answers(
+def get_answer_upload_path(content: Any) -> str | None:
+    """Returns the path of the single uploaded file of a (csPlugin) answer, or None if there is not exactly one."""
+    if not isinstance(content, dict):
+        return None
+    files = content.get("uploadedFiles")
+    if not isinstance(files, list) or len(files) != 1:
+        return None
+    p = files[0]["path"]
+    prefix = "/uploads/"
+    if p.startswith(prefix):
+        p = p[len(prefix) :]
+    return p
+
+
+def iter_all_answers(
     task_ids: list[TaskId],
     options: AllAnswersOptions,
-) -> list[str] | list[dict]:
-    """Gets all answers to the specified tasks.
+    batch_size: int = 1000,
+) -> Iterator[str | dict]:
+    """Iterates over all answers to the specified tasks, formatted according to the options.
+
+    The answers are read from the database and the uploads are fetched in batches, so the memory use does not
+    depend on the number of answers.
 
     :param task_ids: The ids of the tasks to get answers for.
     :param options: The options for getting and printing the answers.
+    :param batch_size: How many answers to read at a time.
     """
     print_header = options.print in (AnswerPrintOptions.ALL, AnswerPrintOptions.HEADER)
     print_answers = options.print in (
@@ -310,14 +336,12 @@ def get_all_answers(
         case SortOptions.TASK:
             q = q.order_by(Answer.task_id, User.name, Answer.answered_on)
     q = q.with_entities(Answer, User, sub.c.count)
-    result = []
-    result_json = []
+    doc_ids = {tid.doc_id for tid in task_ids if tid.doc_id is not None}
 
     lf = "\n"
     if options.print == AnswerPrintOptions.ANSWERS_NO_LINE:
         lf = ""
 
-    qq: Iterable[tuple[Answer, User, int]] = q
     cnt = 0
     hidden_user_names: dict[str, str] = {}
 
@@ -341,7 +365,37 @@ def get_all_answers(
             hashes.add(hash_result)
             return hash_result
 
-    for a, u, n in qq:
+    def iter_rows() -> Generator[tuple[Answer, User, int, Any, Any], None, None]:
+        """Yields the answer rows with the parsed contents and the prefetched uploads.
+
+        If an upload cannot be read, an error message is yielded instead of it; the response is already being
+        streamed, so the error cannot fail the request anymore.
+        """
+        rows: Iterator[tuple[Answer, User, int]] = iter(q.yield_per(batch_size))
+        while batch := list(islice(rows, batch_size)):
+            contents = [json.loads(a.content) for a, _, _ in batch]
+            upload_paths = [get_answer_upload_path(c) for c in contents]
+            uploads = get_answer_pluginuploads(
+                [p for p in upload_paths if p is not None], doc_ids
+            )
+            for (a, u, n), line, p in zip(batch, contents, upload_paths):
+                upload: tuple[str, PluginUpload] | str | None = None
+                if p is not None:
+                    try:
+                        upload = uploads.get(p) or get_pluginupload(p)
+                    except AccessDenied:
+                        upload = "ERROR: No access to the uploaded file; cannot show content."
+                    except RouteException as e:
+                        upload = f"ERROR: {e.description or 'Invalid upload path.'}"
+                yield a, u, n, line, upload
+
+    def format_answer(
+        a: Answer,
+        u: User,
+        n: int,
+        line: Any,
+        upload: tuple[str, PluginUpload] | str | None,
+    ) -> str | dict:
         points = str(a.points)
         if points == "None":
             points = ""
@@ -352,7 +406,6 @@ def get_all_answers(
             if not name:
                 name = f"user_{hasher(u.id)}"
                 hidden_user_names[u.name] = name
-        line = json.loads(a.content)
         header = "; ".join(
             [
                 name,
@@ -368,12 +421,12 @@ def get_all_answers(
         if isinstance(line, dict):  # maybe csPlugin?
             files = line.get("uploadedFiles")
             if isinstance(files, list):
-                if len(files) == 1:
-                    p = files[0]["path"]
-                    prefix = "/uploads/"
-                    if p.startswith(prefix):
-                        p = p[len(prefix) :]
-                    mt, pu = get_pluginupload(p)
+                if upload is None:
+                    answ = f"ERROR: There are more than 1 file uploads ({len(files)}) in this answer; cannot show content."
+                elif isinstance(upload, str):
+                    answ = upload
+                else:
+                    mt, pu = upload
                     if mt == "text/plain":
                         try:
                             answ = pu.data.decode()
@@ -381,8 +434,6 @@ def get_all_answers(
                             answ = UnicodeDammit(pu.data).unicode_markup
                     else:
                         answ = "ERROR: Uploaded file is binary; cannot show content."
-                else:
-                    answ = f"ERROR: There are more than 1 file uploads ({len(files)}) in this answer; cannot show content."
             elif "usercode" in line:
                 answ = str(line.get("usercode", "-"))
             else:
@@ -406,8 +457,8 @@ def get_all_answers(
                         taskid = taskid[i + 1 :]
                     res += taskid + ";" + answ.replace("\n", "\\n")
 
-                result.append(res)
-            case FormatOptions.JSON:
+                return res
+            case FormatOptions.JSON | FormatOptions.NDJSON:
                 user_json = u.to_json() if print_header else {}
                 user_json["name"] = name
                 if options.name != NameOptions.BOTH:
@@ -442,11 +493,11 @@ def get_all_answers(
                 if print_answers:
                     result_json_item |= {"resolved_content": answ}
 
-                result_json.append(result_json_item)
-    if options.format == FormatOptions.TEXT:
-        return result
-    else:
-        return result_json
+                return result_json_item
+
+    return (
+        format_answer(a, u, n, line, upload) for a, u, n, line, upload in iter_rows()
+    )
 
 
 def get_all_answer_initial_query(
@@ -537,8 +588,6 @@ def get_users_for_tasks(
     subquery_answers = Answer.query.with_entities(
         Answer.id, Answer.points, Answer.answered_on
     ).subquery()
-    if answer_filter is None:
-        answer_filter = true()
     time_labels = (
         [
             func.min(Answer.answered_on).label("answered_on_min"),
@@ -547,19 +596,34 @@ def get_users_for_tasks(
         if with_answer_time
         else []
     )
-    subquery_user_answers = (
-        valid_answers_query(task_ids)
-        .filter(answer_filter)
-        .join(UserAnswer, UserAnswer.answer_id == Answer.id)
-        .group_by(UserAnswer.user_id, Answer.task_id)
-        .with_entities(
-            Answer.task_id,
-            UserAnswer.user_id.label("uid"),
-            func.max(Answer.id).label("aid"),
-            *time_labels,
+    if answer_filter is None and not with_answer_time:
+        # Without a filter, the latest valid answers are already known.
+        subquery_user_answers = (
+            LatestAnswer.query.filter(
+                LatestAnswer.task_id.in_(task_ids_to_strlist(task_ids))
+                & (LatestAnswer.valid_answer_id != None)
+            )
+            .with_entities(
+                LatestAnswer.task_id,
+                LatestAnswer.user_id.label("uid"),
+                LatestAnswer.valid_answer_id.label("aid"),
+            )
+            .subquery()
+        )
+    else:
+        subquery_user_answers = (
+            valid_answers_query(task_ids)
+            .filter(answer_filter if answer_filter is not None else true())
+            .join(UserAnswer, UserAnswer.answer_id == Answer.id)
+            .group_by(UserAnswer.user_id, Answer.task_id)
+            .with_entities(
+                Answer.task_id,
+                UserAnswer.user_id.label("uid"),
+                func.max(Answer.id).label("aid"),
+                *time_labels,
+            )
+            .subquery()
         )
-        .subquery()
-    )
     sub_joined = (
         db.session.query(subquery_user_answers, subquery_answers, subquery_annotantions)
         .join(subquery_answers, subquery_user_answers.c.aid == subquery_answers.c.id)
@@ -2,6 +2,8 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Union, Optional
 
+from tim_common.marshmallow_dataclass import class_schema
+
 
 @dataclass
 class ExportedAnswer:
@@ -13,3 +15,6 @@ class ExportedAnswer:
     valid: bool
     doc: str
     host: str | None = None
+
+
+ExportedAnswerSchema = class_schema(ExportedAnswer)()
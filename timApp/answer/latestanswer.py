@@ -0,0 +1,236 @@
+"""The latest answer and the answer counts of each user in each task.
+
+Many views need the latest (valid) answer of a set of users in a set of tasks. Finding them from the answer table
+means grouping all the answers of the tasks by task and user, which gets slow when there are many answers.
+The latestanswer table stores the results of that grouping, and it is kept up to date when answers are flushed:
+
+* a new answer increments the counts of its users and becomes their latest answer,
+* if the validity, the task or the users of an existing answer change or the answer is deleted, the rows of its users
+  in its tasks (both the old and the new one if the task changed) are recomputed from the answers.
+
+Bulk deletes and updates do not go through the session, so code that does them must call
+:func:`refresh_latest_answers` itself.
+"""
+from collections import defaultdict
+from typing import Collection, Any
+
+from sqlalchemy import event, func, select, and_, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
+
+from timApp.answer.answer import Answer
+from timApp.answer.answer_models import UserAnswer
+from timApp.timdb.sqa import db
+
+
+class LatestAnswer(db.Model):
+    """The latest answer and the number of answers of a user in a task."""
+
+    __tablename__ = "latestanswer"
+
+    task_id = db.Column(db.Text, primary_key=True)
+    """Task id, in the same form as in Answer."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey("useraccount.id"), primary_key=True)
+    """User id."""
+
+    answer_id = db.Column(
+        db.Integer, db.ForeignKey("answer.id", ondelete="CASCADE"), nullable=False
+    )
+    """The latest answer."""
+
+    count = db.Column(db.Integer, nullable=False)
+    """The number of answers."""
+
+    valid_answer_id = db.Column(
+        db.Integer, db.ForeignKey("answer.id", ondelete="CASCADE"), nullable=True
+    )
+    """The latest valid answer, or None if there are no valid answers."""
+
+    valid_count = db.Column(db.Integer, nullable=False)
+    """The number of valid answers."""
+
+    __table_args__ = (db.Index("latestanswer_user_id_idx", "user_id"),)
+
+
+def add_latest_answers(
+    session: Session, answers: list[tuple[Answer, set[int]]]
+) -> None:
+    """Makes the new answers the latest answers of their users and increments the counts.
+
+    The counts are incremented in the database, so concurrently saved answers are all counted.
+
+    :param answers: The new answers and the ids of their users.
+    """
+    rows: dict[tuple[str, int], dict[str, Any]] = {}
+    for a, user_ids in answers:
+        for uid in user_ids:
+            key = a.task_id, uid
+            r = rows.get(key)
+            if r is None:
+                r = rows[key] = {
+                    "task_id": a.task_id,
+                    "user_id": uid,
+                    "answer_id": a.id,
+                    "count": 0,
+                    "valid_answer_id": None,
+                    "valid_count": 0,
+                }
+            r["answer_id"] = max(r["answer_id"], a.id)
+            r["count"] += 1
+            if a.valid:
+                r["valid_answer_id"] = max(r["valid_answer_id"] or 0, a.id)
+                r["valid_count"] += 1
+    if not rows:
+        return
+    t = LatestAnswer.__table__
+    stmt = insert(t).values(list(rows.values()))
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[t.c.task_id, t.c.user_id],
+            set_={
+                # GREATEST ignores NULLs.
+                "answer_id": func.greatest(t.c.answer_id, stmt.excluded.answer_id),
+                "count": t.c.count + stmt.excluded.count,
+                "valid_answer_id": func.greatest(
+                    t.c.valid_answer_id, stmt.excluded.valid_answer_id
+                ),
+                "valid_count": t.c.valid_count + stmt.excluded.valid_count,
+            },
+        )
+    )
+
+
+def refresh_latest_answers(
+    task_ids: Collection[str] | None = None,
+    user_ids: Collection[int] | None = None,
+    session: Session | None = None,
+) -> None:
+    """Recomputes the latest answers of the users in the tasks from the answers.
+
+    :param task_ids: The tasks to recompute, or None for all tasks.
+    :param user_ids: The users to recompute, or None for all users.
+    :param session: The session to use; by default, the current session.
+    """
+    s = session if session is not None else db.session
+    delete_cond = and_(
+        LatestAnswer.task_id.in_(task_ids) if task_ids is not None else true(),
+        LatestAnswer.user_id.in_(user_ids) if user_ids is not None else true(),
+    )
+    s.execute(LatestAnswer.__table__.delete().where(delete_cond))
+    valid_id = func.max(Answer.id).filter(Answer.valid == True)
+    latest = (
+        select(
+            [
+                Answer.task_id,
+                UserAnswer.user_id,
+                func.max(Answer.id),
+                func.count(Answer.id),
+                valid_id,
+                func.count(Answer.id).filter(Answer.valid == True),
+            ]
+        )
+        .select_from(Answer.__table__.join(UserAnswer.__table__))
+        .where(
+            and_(
+                Answer.task_id.in_(task_ids) if task_ids is not None else true(),
+                UserAnswer.user_id.in_(user_ids) if user_ids is not None else true(),
+            )
+        )
+        .group_by(Answer.task_id, UserAnswer.user_id)
+    )
+    t = LatestAnswer.__table__
+    stmt = insert(t).from_select(
+        ["task_id", "user_id", "answer_id", "count", "valid_answer_id", "valid_count"],
+        latest,
+    )
+    # A concurrently saved answer may have inserted a row after the delete above.
+    s.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[t.c.task_id, t.c.user_id],
+            set_={
+                "answer_id": stmt.excluded.answer_id,
+                "count": stmt.excluded.count,
+                "valid_answer_id": stmt.excluded.valid_answer_id,
+                "valid_count": stmt.excluded.valid_count,
+            },
+        )
+    )
+
+
+def get_changed_user_ids(a: Answer) -> set[int]:
+    """Returns the ids of the users that have been added to or removed from the answer in the session."""
+    ids: set[int] = set()
+    for attr in ("users", "users_all"):
+        h = get_history(a, attr, passive=PASSIVE_NO_INITIALIZE)
+        ids.update(u.id for u in h.added)
+        ids.update(u.id for u in h.deleted)
+    return ids
+
+
+def get_answer_users(
+    session: Session, answer_ids: Collection[int]
+) -> set[tuple[int, int]]:
+    """Returns the (answer id, user id) pairs of the answers."""
+    return {
+        (answer_id, user_id)
+        for answer_id, user_id in session.execute(
+            select([UserAnswer.answer_id, UserAnswer.user_id]).where(
+                UserAnswer.answer_id.in_(answer_ids)
+            )
+        )
+    }
+
+
+@event.listens_for(db.session, "before_flush")
+def find_users_of_deleted_answers(
+    session: Session, _flush_context: Any, _instances: Any
+) -> None:
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Answer)]
+    if deleted:
+        # The users of the answers are deleted in the flush.
+        session.info["deleted_answer_users"] = get_answer_users(session, deleted)
+
+
+@event.listens_for(db.session, "after_flush")
+def update_latest_answers(session: Session, _flush_context: Any) -> None:
+    new_answers = {obj.id: obj for obj in session.new if isinstance(obj, Answer)}
+    changed: dict[int, tuple[set[str], set[int]]] = {}
+    for obj in session.dirty:
+        if isinstance(obj, Answer):
+            user_ids = get_changed_user_ids(obj)
+            task_history = get_history(obj, "task_id")
+            if (
+                user_ids
+                or task_history.has_changes()
+                or get_history(obj, "valid").has_changes()
+            ):
+                changed[obj.id] = {obj.task_id, *task_history.deleted}, user_ids
+    for obj in session.deleted:
+        if isinstance(obj, Answer):
+            changed[obj.id] = {obj.task_id}, set()
+    deleted_answer_users = session.info.pop("deleted_answer_users", set())
+    if not new_answers and not changed:
+        return
+    # The users may have been added from either side of the relationship, so they are read from the database.
+    answer_users = (
+        get_answer_users(session, [*new_answers, *changed]) | deleted_answer_users
+    )
+    new_users = defaultdict(set)
+    for answer_id, user_id in answer_users:
+        if answer_id in new_answers:
+            new_users[answer_id].add(user_id)
+        elif answer_id in changed:
+            changed[answer_id][1].add(user_id)
+    if new_answers:
+        add_latest_answers(
+            session, [(a, new_users[answer_id]) for answer_id, a in new_answers.items()]
+        )
+    # Answers in the same tasks (e.g. when renaming a task) are recomputed together.
+    refreshed: dict[frozenset[str], set[int]] = defaultdict(set)
+    for task_ids, user_ids in changed.values():
+        refreshed[frozenset(task_ids)] |= user_ids
+    for tasks, users in refreshed.items():
+        if users:
+            refresh_latest_answers(tasks, users, session)
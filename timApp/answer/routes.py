@@ -5,9 +5,19 @@ import re
 from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Union, Any, Callable, TypedDict, DefaultDict
+from enum import Enum
+from itertools import chain
+from typing import (
+    Union,
+    Any,
+    Callable,
+    TypedDict,
+    DefaultDict,
+    Iterable,
+    Generator,
+)
 
-from flask import Response
+from flask import Response, stream_with_context
 from flask import current_app
 from flask import request
 from marshmallow import validates_schema, ValidationError
@@ -17,6 +27,7 @@ from sqlalchemy.orm import lazyload
 
 from timApp.answer.answer import Answer
 from timApp.answer.answer_models import AnswerUpload
+from timApp.answer.answerimport import AnswerImport, AnswerImportError
 from timApp.answer.answers import (
     get_existing_answers_info,
     save_answer,
@@ -27,7 +38,7 @@ from timApp.answer.answers import (
     AllAnswersOptions,
     FormatOptions,
     AnswerPrintOptions,
-    get_all_answers,
+    iter_all_answers,
 )
 from timApp.answer.backup import send_answer_backup_if_enabled
 from timApp.answer.exportedanswer import ExportedAnswer
@@ -129,7 +140,13 @@ from timApp.util.flask.requesthelper import (
     NotExist,
     get_from_url,
 )
-from timApp.util.flask.responsehelper import json_response, ok_response, to_dict
+from timApp.util.flask.responsehelper import (
+    json_response,
+    ok_response,
+    to_dict,
+    csv_response,
+    json_stream_response,
+)
 from timApp.util.flask.typedblueprint import TypedBlueprint
 from timApp.util.get_fields import (
     get_fields_and_users,
@@ -140,11 +157,7 @@ from timApp.util.get_fields import (
     GetFieldsAccess,
 )
 from timApp.util.logger import log_info
-from timApp.util.utils import (
-    get_current_time,
-    approximate_real_name,
-    convert_email_to_lower,
-)
+from timApp.util.utils import get_current_time, approximate_real_name
 from timApp.util.utils import local_timezone
 from timApp.util.utils import try_load_json, seq_to_str, is_valid_email
 from timApp.velp.annotations import get_annotations_with_comments_in_document
@@ -2003,20 +2016,70 @@ def hide_points(a: Answer | dict) -> dict:
     return j
 
 
+class AnswerExportFormat(Enum):
+    JSON = "json"
+    """A JSON array that can be given to /importAnswers."""
+
+    NDJSON = "ndjson"
+    """One JSON object per line."""
+
+    CSV = "csv"
+
+
+EXPORT_ANSWERS_BATCH_SIZE = 1000
+
+
 @answers.get("/exportAnswers/<path:doc_path>")
-def export_answers(doc_path: str) -> Response:
+def export_answers(
+    doc_path: str,
+    export_format: AnswerExportFormat = field(
+        default=AnswerExportFormat.JSON,
+        metadata={
+            "by_value": True,
+            "data_key": "format",
+        },
+    ),
+) -> Response:
+    """Exports all answers of a document.
+
+    The answers are read with a server-side cursor and written to the response as they are read,
+    so the memory use does not depend on the number of answers.
+
+    :param doc_path: Path of the document.
+    :param export_format: Export format to use.
+    """
     d = DocEntry.find_by_path(doc_path, try_translation=False)
     if not d:
         raise RouteException("Document not found")
     verify_teacher_access(d)
-    answer_list: list[tuple[Answer, str]] = (
+    q = (
         Answer.query.filter(Answer.task_id.startswith(f"{d.id}."))
         .join(User, Answer.users)
         .with_entities(Answer, User.email)
-        .all()
+        .yield_per(EXPORT_ANSWERS_BATCH_SIZE)
     )
-    return json_response(
-        [
+    answer_rows: Iterable[tuple[Answer, str]] = q
+    match export_format:
+        case AnswerExportFormat.CSV:
+            return csv_response(
+                chain(
+                    [["email", "content", "valid", "points", "time", "task", "doc"]],
+                    (
+                        [
+                            email,
+                            a.content,
+                            a.valid,
+                            a.points,
+                            a.answered_on.isoformat(),
+                            a.task_name,
+                            doc_path,
+                        ]
+                        for a, email in answer_rows
+                    ),
+                )
+            )
+    return json_stream_response(
+        (
             {
                 "email": email,
                 "content": a.content,
@@ -2026,8 +2089,9 @@ def export_answers(doc_path: str) -> Response:
                 "task": a.task_name,
                 "doc": doc_path,
             }
-            for a, email in answer_list
-        ]
+            for a, email in answer_rows
+        ),
+        ndjson=export_format == AnswerExportFormat.NDJSON,
     )
 
 
@@ -2038,106 +2102,26 @@ def import_answers(
     match_email_case: bool = True,
     doc_map: dict[str, str] = field(default_factory=dict),
 ) -> Response:
-    verify_admin()
-    doc_paths = {doc_map.get(a.doc, a.doc) for a in exported_answers}
-    docs = DocEntry.query.filter(DocEntry.name.in_(doc_paths)).all()
-    doc_path_map = {d.path: d for d in docs}
-    missing_docs = doc_paths - set(doc_path_map)
-    if missing_docs:
-        raise RouteException(f"Some documents not found: {missing_docs}")
-    for d in docs:
-        verify_teacher_access(d)
-    filter_cond = Answer.task_id.startswith(f"{docs[0].id}.")
-    for d in docs[1:]:
-        filter_cond |= Answer.task_id.startswith(f"{d.id}.")
-    existing_answers: list[tuple[Answer, str]] = (
-        Answer.query.filter(filter_cond)
-        .join(User, Answer.users)
-        .with_entities(Answer, User.email)
-        .all()
-    )
-
-    def convert_email_case(email: str) -> str:
-        return email if match_email_case else convert_email_to_lower(email)
+    """Imports answers that have been exported with /exportAnswers.
 
-    existing_set = {
-        (
-            a.parsed_task_id.doc_id,
-            a.task_name,
-            a.answered_on,
-            a.valid,
-            a.points,
-            convert_email_case(email),
-        )
-        for a, email in existing_answers
-    }
-    email_field = User.email if match_email_case else func.lower(User.email)
-
-    dupes = 0
-    all_users = User.query.filter(
-        email_field.in_([a.email for a in exported_answers])
-    ).all()
-
-    if not match_email_case:
-        all_emails = defaultdict(list)
-        for u in all_users:
-            email = convert_email_case(u.email)
-            all_emails[email].append(u.email)
-        all_duplicates = {
-            e: emails for e, emails in all_emails.items() if len(emails) > 1
-        }
-        if all_duplicates:
-            raise RouteException(
-                f"There are multiple users for the same email, "
-                f"cannot import with match_email_case = False: {all_duplicates}"
-            )
-
-    users = {convert_email_case(u.email): u for u in all_users}
-    requested_users = {convert_email_case(a.email) for a in exported_answers}
-    missing_users = requested_users - set(users.keys())
-    if missing_users and not allow_missing_users:
-        raise RouteException(f"Email(s) not found: {seq_to_str(list(missing_users))}")
-    exported_answers.sort(key=lambda a: a.time)
-    all_imported = []
-    for a in exported_answers:
-        doc_id = doc_path_map[doc_map.get(a.doc, a.doc)].id
-        if (doc_id, a.task, a.time, a.valid, a.points, a.email) not in existing_set:
-            u = users.get(a.email)
-            if not u:
-                if not allow_missing_users:
-                    raise Exception("Missing user should have been reported earlier")
-                continue
-            imported_answer = Answer(
-                task_id=f"{doc_id}.{a.task}",
-                valid=a.valid,
-                points=a.points,
-                content=a.content,
-                answered_on=a.time,
-            )
-            imported_answer.users_all.append(u)
-            db.session.add(imported_answer)
-            all_imported.append(imported_answer)
-        else:
-            dupes += 1
-    db.session.flush()
-
-    # Sanity check: Make sure that the ids are in the same order as the timestamps of the answers - we currently rely on
-    # the fact that the latest answer has the largest id.
-    all_imported.sort(key=lambda a: a.id)
-    for a, b in zip(all_imported, all_imported[1:]):
-        if a.answered_on > b.answered_on:
-            raise Exception(
-                "Import bug: Answer ids were in different order than answer timestamps. Imported nothing."
-            )
+    The answers that already exist are skipped. See :mod:`timApp.answer.answerimport`.
 
+    :param exported_answers: The exported answers.
+    :param allow_missing_users: Whether to skip the answers of the users that do not exist instead of failing.
+    :param match_email_case: Whether the emails must match case-sensitively.
+    :param doc_map: Maps the document paths of the exported answers to the paths of the target documents.
+    """
+    verify_admin()
+    imp = AnswerImport(doc_map=doc_map, match_email_case=match_email_case)
+    try:
+        imp.stage(exported_answers)
+        for d in imp.get_docs():
+            verify_teacher_access(d)
+        result = imp.run(allow_missing_users=allow_missing_users)
+    except AnswerImportError as e:
+        raise RouteException(str(e))
     db.session.commit()
-    return json_response(
-        {
-            "imported": len(all_imported),
-            "skipped_duplicates": dupes,
-            "missing_users": list(missing_users),
-        }
-    )
+    return json_response(result.to_json())
 
 
 @answers.get("/getAnswers/<task_id>/<int:user_id>")
@@ -2198,9 +2182,12 @@ def get_all_answers_plain(task_id: str, options: AllAnswersOptions) -> Response:
 def get_all_answers_list_plain(
     task_ids: list[TaskId], options: AllAnswersOptions
 ) -> Response:
-    all_answers = get_all_answers_as_list(task_ids, options)
-    if options.format == FormatOptions.JSON:
-        return json_response(all_answers)
+    all_answers = iter_all_answers_checked(task_ids, options)
+    match options.format:
+        case FormatOptions.JSON:
+            return json_stream_response(all_answers)
+        case FormatOptions.NDJSON:
+            return json_stream_response(all_answers, ndjson=True)
     jointext = "\n"
     print_answers = (
         options.print == AnswerPrintOptions.ALL
@@ -2208,13 +2195,23 @@ def get_all_answers_list_plain(
     )
     if print_answers:
         jointext = "\n\n----------------------------------------------------------------------------------\n"
-    text = jointext.join(all_answers)
-    return Response(text, mimetype="text/plain")
 
+    def generate() -> Generator[str, None, None]:
+        sep = ""
+        for text in all_answers:
+            yield sep + text
+            sep = jointext
+
+    return Response(stream_with_context(generate()), mimetype="text/plain")
 
-def get_all_answers_as_list(
+
+def iter_all_answers_checked(
     task_ids: list[TaskId], options: AllAnswersOptions
-) -> list[str]:
+) -> Iterable[str] | Iterable[dict]:
+    """Checks the access to the answers of the tasks and returns an iterator over the answers.
+
+    The access is checked immediately; the answers are read from the database as the result is iterated.
+    """
     verify_logged_in()
     if not task_ids:
         return []
@@ -2252,7 +2249,7 @@ def get_all_answers_as_list(
                 "For optimal results, use at least 10 characters for the hash"
             )
 
-    return get_all_answers(task_ids, options)
+    return iter_all_answers(task_ids, options)
 
 
 class GraphData(TypedDict):
@@ -10,6 +10,7 @@ from sqlalchemy import inspect
 
 from timApp.auth.accesstype import AccessType
 from timApp.auth.auth_models import BlockAccess
+from timApp.auth.rightscache import clear_request_cache
 from timApp.auth.session.util import (
     SessionExpired,
     session_has_access,
@@ -151,12 +152,15 @@ def check_inherited_right(
     grace_period: timedelta,
 ) -> BlockAccess | None:
     has_access = None
+    inherited_right_docs = current_app.config["INHERIT_FOLDER_RIGHTS_DOCS"]
+    if not inherited_right_docs:
+        return None
     is_docinfo = isinstance(b, DocInfo)
     if is_docinfo or (isinstance(b, Block) and b.type_id == BlockType.Document.value):
         doc = b if is_docinfo else DocEntry.find_by_id(b.id)
         if not doc:
             return None
-        if doc.path_without_lang in current_app.config["INHERIT_FOLDER_RIGHTS_DOCS"]:
+        if doc.path_without_lang in inherited_right_docs:
             has_access = u.has_access(b.parent, access_type, grace_period)
     return has_access
 
@@ -709,6 +713,7 @@ def grant_access_to_session_users(i: ItemOrBlock):
 
 
 def reset_request_access_cache():
+    clear_request_cache()
     del_attr_if_exists(g, "manageable")
     del_attr_if_exists(g, "viewable")
     del_attr_if_exists(g, "teachable")
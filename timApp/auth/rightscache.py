@@ -0,0 +1,524 @@
+"""Cache of the effective rights of users to items.
+
+Checking a right with :meth:`User.has_some_access` needs the current groups of the user and all the accesses of
+the block, and :func:`get_user_rights_for_item` checks nine rights. Instead, the accesses that the groups of a user
+have to a block are loaded once into an :class:`EffectiveAccesses` snapshot from which any right can be checked.
+The snapshot contains the times when the accesses and the group memberships are in effect, and the rights are
+checked against the current time whenever they are used, so a cached snapshot never grants an access that has
+expired or not started yet.
+
+The snapshots are cached for the duration of the request (in ``g``) and, if RIGHTS_CACHE_SHARED is enabled,
+in Redis. The Redis entries are invalidated with generation counters: each user, each block and the whole cache have
+a counter that is incremented when a session commits changes to the memberships of the user or to the accesses of
+the block (bulk deletes and updates of them increment the global counter). An entry is used only if it was stored
+with the current counters, which are read before the snapshot is loaded from the database.
+
+The rights are checked without the cache when they depend on the session of the current user (locked access type or
+active groups, or a session that has no access to the item) or when the database session has unflushed changes to
+memberships or accesses.
+"""
+from __future__ import annotations
+
+import pickle
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
+
+from flask import g, has_app_context
+from redis import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
+
+from timApp.auth.auth_models import BlockAccess
+from timApp.timdb.sqa import db
+from timApp.user.usergroupmember import UserGroupMember, membership_current
+from timApp.util.logger import log_warning
+from timApp.util.utils import get_current_time
+
+if TYPE_CHECKING:
+    from timApp.auth.get_user_rights_for_item import UserItemRights
+    from timApp.user.user import User, ItemOrBlock
+
+ENTRY_KEY_PREFIX = "tim-rights-"
+GLOBAL_GEN_KEY = "tim-rights-gen"
+USER_GEN_KEY_PREFIX = "tim-rights-gen-user-"
+BLOCK_GEN_KEY_PREFIX = "tim-rights-gen-block-"
+
+RIGHTS_CHANGES_KEY = "rights_changes"
+
+AccessKey = tuple[int, int]
+"""A (user id, block id) pair."""
+
+
+class AccessChecker(ABC):
+    """Checks the rights of a user to an item."""
+
+    logged_in: bool
+
+    @abstractmethod
+    def has_some_access(self, vals: set[int], duration: bool = False) -> bool:
+        """Returns whether the user currently has any of the given access types to the item.
+
+        See :meth:`User.has_some_access`.
+        """
+        pass
+
+    def get_item_rights(self, allow_duration: bool = False) -> UserItemRights:
+        from timApp.user.user import (
+            view_access_set,
+            edit_access_set,
+            copy_access_set,
+            teacher_access_set,
+            seeanswers_access_set,
+            manage_access_set,
+            owner_access_set,
+        )
+
+        view = self.has_some_access(view_access_set, allow_duration)
+        return {
+            "editable": self.has_some_access(edit_access_set, allow_duration),
+            "can_mark_as_read": self.logged_in and view,
+            "can_comment": self.logged_in and view,
+            "copy": self.logged_in
+            and self.has_some_access(copy_access_set, allow_duration),
+            "browse_own_answers": self.logged_in,
+            "teacher": self.has_some_access(teacher_access_set, allow_duration),
+            "see_answers": self.has_some_access(seeanswers_access_set, allow_duration),
+            "manage": self.has_some_access(manage_access_set, allow_duration),
+            "owner": self.has_some_access(owner_access_set),
+        }
+
+
+class UncachedAccesses(AccessChecker):
+    """Checks the rights with :meth:`User.has_some_access`."""
+
+    def __init__(self, user: User, item: ItemOrBlock):
+        self.user = user
+        self.item = item
+        self.logged_in = user.logged_in
+
+    def has_some_access(self, vals: set[int], duration: bool = False) -> bool:
+        return self.user.has_some_access(self.item, vals, duration=duration) is not None
+
+
+@dataclass(frozen=True)
+class AccessWindow:
+    """The times when an access of a group of the user is in effect."""
+
+    type: int
+    accessible_from: datetime | None
+    accessible_to: datetime | None
+    unlockable_from: datetime | None
+    """If set, the access can be unlocked (see :attr:`BlockAccess.unlockable`) between unlockable_from and
+    unlockable_to."""
+    unlockable_to: datetime | None
+    member_to: datetime | None
+    """The end of the membership of the user in the group."""
+
+    def is_active(self, now: datetime, duration: bool) -> bool:
+        if self.member_to is not None and now >= self.member_to:
+            return False
+        if self.accessible_from is not None and (
+            self.accessible_from <= now
+            and (self.accessible_to is None or now < self.accessible_to)
+        ):
+            return True
+        return (
+            duration
+            and self.unlockable_from is not None
+            and self.unlockable_from <= now
+            and (self.unlockable_to is None or now < self.unlockable_to)
+        )
+
+
+@dataclass(frozen=True)
+class EffectiveAccesses(AccessChecker):
+    """The accesses that the groups of a user have to a block."""
+
+    logged_in: bool
+    is_admin: bool
+    admin_to: datetime | None
+    """The end of the membership of the user in the administrators group."""
+    windows: tuple[AccessWindow, ...]
+
+    def has_some_access(self, vals: set[int], duration: bool = False) -> bool:
+        now = get_current_time()
+        if self.is_admin and (self.admin_to is None or now < self.admin_to):
+            return True
+        return any(w.type in vals and w.is_active(now, duration) for w in self.windows)
+
+
+def make_access_window(a: Any, member_to: datetime | None) -> AccessWindow:
+    """Makes an access window from a BlockAccess or a row with the same columns."""
+    unlockable = (
+        a.accessible_from is None and a.duration is not None and not a.require_confirm
+    )
+    return AccessWindow(
+        type=a.type,
+        accessible_from=a.accessible_from,
+        accessible_to=a.accessible_to,
+        unlockable_from=a.duration_from if unlockable else None,
+        unlockable_to=a.duration_to if unlockable else None,
+        member_to=member_to,
+    )
+
+
+def load_effective_accesses(
+    keys: dict[AccessKey, User]
+) -> dict[AccessKey, EffectiveAccesses]:
+    """Loads the effective accesses of the users to the blocks.
+
+    The memberships of all the users are loaded with one query and the accesses of their groups to all the blocks with
+    another.
+
+    :param keys: The (user id, block id) pairs to load and the users.
+    """
+    from timApp.user.usergroup import (
+        get_admin_group_id,
+        get_anonymous_group_id,
+        get_logged_in_group_id,
+    )
+
+    users = {u.id: u for u in keys.values()}
+    block_ids = {block_id for _, block_id in keys}
+    memberships: dict[int, dict[int, datetime | None]] = {uid: {} for uid in users}
+    for user_id, usergroup_id, membership_end in db.session.query(
+        UserGroupMember.user_id,
+        UserGroupMember.usergroup_id,
+        UserGroupMember.membership_end,
+    ).filter(UserGroupMember.user_id.in_(users) & membership_current):
+        memberships[user_id][usergroup_id] = membership_end
+    anon_group_id = get_anonymous_group_id()
+    logged_in_group_id = get_logged_in_group_id()
+    for uid, u in users.items():
+        memberships[uid][anon_group_id] = None
+        if u.logged_in:
+            memberships[uid][logged_in_group_id] = None
+    group_ids = set(chain.from_iterable(memberships.values()))
+    accesses = defaultdict(list)
+    for a in db.session.query(
+        BlockAccess.block_id,
+        BlockAccess.usergroup_id,
+        BlockAccess.type,
+        BlockAccess.accessible_from,
+        BlockAccess.accessible_to,
+        BlockAccess.duration,
+        BlockAccess.duration_from,
+        BlockAccess.duration_to,
+        BlockAccess.require_confirm,
+    ).filter(
+        BlockAccess.block_id.in_(block_ids) & BlockAccess.usergroup_id.in_(group_ids)
+    ):
+        accesses[a.block_id].append(a)
+    admin_group_id = get_admin_group_id()
+    result = {}
+    for user_id, block_id in keys:
+        groups = memberships[user_id]
+        result[user_id, block_id] = EffectiveAccesses(
+            logged_in=users[user_id].logged_in,
+            is_admin=admin_group_id in groups,
+            admin_to=groups.get(admin_group_id),
+            windows=tuple(
+                make_access_window(a, groups[a.usergroup_id])
+                for a in accesses[block_id]
+                if a.usergroup_id in groups
+            ),
+        )
+    return result
+
+
+@dataclass
+class RightsChanges:
+    """The users and blocks whose rights have been changed in a session."""
+
+    user_ids: set[int] = field(default_factory=set)
+    block_ids: set[int] = field(default_factory=set)
+    everything: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.user_ids or self.block_ids or self.everything)
+
+
+def _changed_ids(obj: Any, attr: str) -> set[int]:
+    h = get_history(obj, attr, passive=PASSIVE_NO_INITIALIZE)
+    return {o.id for o in chain(h.added, h.deleted)}
+
+
+def find_rights_changes(
+    session: Session, objs: Iterable[Any], changes: RightsChanges
+) -> None:
+    """Adds the changes that the new, changed or deleted objects make to the rights."""
+    from timApp.item.block import Block
+    from timApp.user.user import User
+    from timApp.user.usergroup import UserGroup
+
+    for obj in objs:
+        if isinstance(obj, BlockAccess):
+            changes.block_ids.add(obj.block_id)
+        elif isinstance(obj, UserGroupMember):
+            changes.user_ids.add(obj.user_id)
+        elif isinstance(obj, User):
+            if _changed_ids(obj, "groups"):
+                changes.user_ids.add(obj.id)
+        elif isinstance(obj, UserGroup):
+            if obj in session.deleted:
+                # The memberships of the group are deleted along with it.
+                changes.everything = True
+            changes.user_ids.update(_changed_ids(obj, "users"))
+        elif isinstance(obj, Block):
+            if _changed_ids(obj, "accesses"):
+                changes.block_ids.add(obj.id)
+
+
+def has_unflushed_rights_changes(session: Session) -> bool:
+    if not session.new and not session.deleted and not session.dirty:
+        return False
+    changes = RightsChanges()
+    find_rights_changes(
+        session, chain(session.new, session.dirty, session.deleted), changes
+    )
+    return bool(changes)
+
+
+def get_rights_changes(session: Session) -> RightsChanges:
+    """Returns the changes to the rights that the session has flushed but not committed."""
+    return session.info.setdefault(RIGHTS_CHANGES_KEY, RightsChanges())
+
+
+def get_request_cache() -> dict[AccessKey, EffectiveAccesses] | None:
+    if not has_app_context():
+        return None
+    if not hasattr(g, "effective_accesses"):
+        g.effective_accesses = {}
+    return g.effective_accesses
+
+
+def clear_request_cache() -> None:
+    if has_app_context() and hasattr(g, "effective_accesses"):
+        del g.effective_accesses
+
+
+def is_shared_cache_enabled() -> bool:
+    from timApp.tim_app import app
+
+    return app.config["RIGHTS_CACHE_SHARED"]
+
+
+def _client() -> Redis:
+    from timApp.document.caching import rclient
+
+    return rclient
+
+
+def _entry_key(key: AccessKey) -> str:
+    return f"{ENTRY_KEY_PREFIX}{key[0]}-{key[1]}"
+
+
+def read_shared_entries(
+    keys: Iterable[AccessKey],
+) -> tuple[dict[AccessKey, EffectiveAccesses], dict[AccessKey, tuple[int, int, int]]]:
+    """Reads the entries from Redis along with the current generation counters.
+
+    :return: The valid entries and the current generations of all the keys.
+    """
+    keys = list(keys)
+    user_ids = sorted({user_id for user_id, _ in keys})
+    block_ids = sorted({block_id for _, block_id in keys})
+    values = _client().mget(
+        [
+            GLOBAL_GEN_KEY,
+            *(f"{USER_GEN_KEY_PREFIX}{uid}" for uid in user_ids),
+            *(f"{BLOCK_GEN_KEY_PREFIX}{bid}" for bid in block_ids),
+            *(_entry_key(k) for k in keys),
+        ]
+    )
+    global_gen = int(values[0] or 0)
+    user_gens = {uid: int(v or 0) for uid, v in zip(user_ids, values[1:])}
+    block_gens = {
+        bid: int(v or 0) for bid, v in zip(block_ids, values[1 + len(user_ids) :])
+    }
+    entries = {}
+    gens = {}
+    for k, data in zip(keys, values[1 + len(user_ids) + len(block_ids) :]):
+        gens[k] = global_gen, user_gens[k[0]], block_gens[k[1]]
+        if data is not None:
+            stored_gens, accesses = pickle.loads(data)
+            if stored_gens == gens[k]:
+                entries[k] = accesses
+    return entries, gens
+
+
+def write_shared_entries(
+    entries: dict[AccessKey, EffectiveAccesses],
+    gens: dict[AccessKey, tuple[int, int, int]],
+) -> None:
+    from timApp.tim_app import app
+
+    expire_secs = app.config["RIGHTS_CACHE_EXPIRE_SECS"]
+    pipe = _client().pipeline(transaction=False)
+    for k, accesses in entries.items():
+        pipe.set(_entry_key(k), pickle.dumps((gens[k], accesses)), ex=expire_secs)
+    pipe.execute()
+
+
+def invalidate_shared_entries(changes: RightsChanges) -> None:
+    pipe = _client().pipeline(transaction=False)
+    if changes.everything:
+        pipe.incr(GLOBAL_GEN_KEY)
+    for uid in changes.user_ids:
+        pipe.incr(f"{USER_GEN_KEY_PREFIX}{uid}")
+    for bid in changes.block_ids:
+        pipe.incr(f"{BLOCK_GEN_KEY_PREFIX}{bid}")
+    pipe.execute()
+
+
+def is_session_dependent(u: User) -> bool:
+    """Returns whether the rights of the user depend on the locked access type or active groups of the session."""
+    from timApp.auth.access.util import (
+        get_locked_access_type,
+        get_locked_active_groups,
+    )
+
+    if not u.is_current_user or u.skip_access_lock:
+        return False
+    return (
+        get_locked_access_type() is not None or get_locked_active_groups() is not None
+    )
+
+
+def get_access_checkers(
+    items: Sequence[ItemOrBlock], users: Sequence[User]
+) -> dict[AccessKey, AccessChecker]:
+    """Returns the access checkers of the users to the items.
+
+    The accesses that are not cached are loaded with two queries regardless of the number of users and items.
+
+    :return: The checkers by (user id, item id).
+    """
+    from timApp.auth.session.util import has_valid_session, is_allowed_document
+    from timApp.item.item import Item
+
+    session = db.session()
+    unflushed_changes = has_unflushed_rights_changes(session)
+    result: dict[AccessKey, AccessChecker] = {}
+    pending: dict[AccessKey, User] = {}
+    for u in users:
+        uncached = unflushed_changes or is_session_dependent(u)
+        valid_session = uncached or has_valid_session(u)
+        for i in items:
+            if uncached or not (
+                valid_session or (isinstance(i, Item) and is_allowed_document(i.path))
+            ):
+                result[u.id, i.id] = UncachedAccesses(u, i)
+            else:
+                pending[u.id, i.id] = u
+    local = get_request_cache()
+    misses = {}
+    for k, u in pending.items():
+        accesses = local.get(k) if local is not None else None
+        if accesses is not None:
+            result[k] = accesses
+        else:
+            misses[k] = u
+    if not misses:
+        return result
+    # Entries must not be shared before the changes of this session are committed.
+    use_shared = is_shared_cache_enabled() and not get_rights_changes(session)
+    gens = None
+    if use_shared:
+        try:
+            shared, gens = read_shared_entries(misses)
+        except RedisError as e:
+            log_warning(f"Could not read cached rights: {e}")
+            shared = {}
+        for k, accesses in shared.items():
+            result[k] = accesses
+            del misses[k]
+        if local is not None:
+            local.update(shared)
+    if not misses:
+        return result
+    loaded = load_effective_accesses(misses)
+    result.update(loaded)
+    if local is not None:
+        local.update(loaded)
+    if gens is not None:
+        try:
+            write_shared_entries(loaded, gens)
+        except RedisError as e:
+            log_warning(f"Could not cache rights: {e}")
+    return result
+
+
+def get_access_checker(i: ItemOrBlock, u: User) -> AccessChecker:
+    return get_access_checkers([i], [u])[u.id, i.id]
+
+
+def get_rights_for_items(
+    items: Sequence[ItemOrBlock], u: User, allow_duration: bool = False
+) -> dict[int, UserItemRights]:
+    """Returns the rights of the user to each of the items by item id."""
+    checkers = get_access_checkers(items, [u])
+    return {i.id: checkers[u.id, i.id].get_item_rights(allow_duration) for i in items}
+
+
+def get_rights_for_users(
+    i: ItemOrBlock, users: Sequence[User], allow_duration: bool = False
+) -> dict[int, UserItemRights]:
+    """Returns the rights of each of the users to the item by user id."""
+    checkers = get_access_checkers([i], users)
+    return {u.id: checkers[u.id, i.id].get_item_rights(allow_duration) for u in users}
+
+
+@event.listens_for(db.session, "after_flush")
+def record_rights_changes(session: Session, _flush_context: Any) -> None:
+    changes = RightsChanges()
+    find_rights_changes(
+        session, chain(session.new, session.dirty, session.deleted), changes
+    )
+    if changes:
+        recorded = get_rights_changes(session)
+        recorded.user_ids |= changes.user_ids
+        recorded.block_ids |= changes.block_ids
+        recorded.everything |= changes.everything
+        clear_request_cache()
+
+
+def record_bulk_rights_changes(context: Any) -> None:
+    if context.primary_table in (BlockAccess.__table__, UserGroupMember.__table__):
+        get_rights_changes(context.session).everything = True
+        clear_request_cache()
+
+
+event.listen(db.session, "after_bulk_delete", record_bulk_rights_changes)
+event.listen(db.session, "after_bulk_update", record_bulk_rights_changes)
+
+
+def _is_nested(session: Session) -> bool:
+    return session.transaction is not None and session.transaction.nested
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_committed_rights(session: Session) -> None:
+    if _is_nested(session):
+        return
+    changes = session.info.pop(RIGHTS_CHANGES_KEY, None)
+    if not changes or not is_shared_cache_enabled():
+        return
+    try:
+        invalidate_shared_entries(changes)
+    except RedisError as e:
+        log_warning(f"Could not invalidate cached rights: {e}")
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_rights_changes(session: Session) -> None:
+    clear_request_cache()
+    # The changes made before a savepoint are still to be committed.
+    if not _is_nested(session):
+        session.info.pop(RIGHTS_CHANGES_KEY, None)
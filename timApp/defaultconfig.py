@@ -43,6 +43,16 @@ COMPRESS_MIMETYPES = [
 COMPRESS_MIN_SIZE = 50
 DEBUG = False
 FILES_PATH = "/tim_files"
+# If True, new documents store their paragraphs in a single packed segment file instead of one file per
+# paragraph revision. Existing documents can be converted with "flask parstore migrate".
+PACKED_PAR_STORE = False
+# A packed store is compacted when superseded paragraph records take up more than this share of its segment file.
+PACKED_PAR_STORE_COMPACT_RATIO = 0.5
+# Shared tier of the auto macro and heading cache: "redis" or "memory" (process-local, for development only).
+AUTO_MACRO_CACHE_BACKEND = "redis"
+AUTO_MACRO_CACHE_EXPIRE_SECS = 3600 * 24 * 7
+# How long a process may hold the per-document lock while computing auto macros.
+AUTO_MACRO_CACHE_LOCK_TIMEOUT = 60
 LOG_DIR = "/service/tim_logs/"
 LOG_FILE = "timLog.log"
 LOG_LEVEL = logging.INFO
@@ -85,9 +95,78 @@ LAST_READ_BOOKMARK_LIMIT = 15
 PLUGIN_COUNT_LAZY_LIMIT = 20
 QST_PLUGIN_PORT = 5000
 PLUGIN_CONNECT_TIMEOUT = 0.5
+# How many plugin types are rendered concurrently when rendering a page, and the timeout for rendering one type.
+PLUGIN_RENDER_CONCURRENCY = 8
+PLUGIN_RENDER_TIMEOUT = 40
+# Log the slowest plugin type of a page render if the plugin calls take longer than this (seconds).
+PLUGIN_RENDER_LOG_THRESHOLD = 2.0
+# How long plugin reqs responses are cached, and how soon a failed refresh is retried (seconds).
+PLUGIN_REQS_TTL = 3600
+PLUGIN_REQS_RETRY_SECS = 30
+# How often each process checks whether an admin has invalidated the plugin reqs cache (seconds).
+PLUGIN_REQS_GENERATION_CHECK_SECS = 5
+# Whether to fetch the reqs of all plugins in the background when TIM starts.
+PLUGIN_REQS_WARM_UP = True
+# Cache for Dumbo conversion results: "memory" (per-process LRU bounded by DUMBO_CACHE_MAX_SIZE characters),
+# "redis" (shared, entries expire after DUMBO_CACHE_EXPIRE_SECS) or None (disabled).
+DUMBO_CACHE_BACKEND = "memory"
+DUMBO_CACHE_MAX_SIZE = 64 * 1024 * 1024
+DUMBO_CACHE_EXPIRE_SECS = 3600 * 24
+# Calls to plugins and Dumbo reuse keep-alive connections from a per-process pool. HTTP_POOL_MAXSIZE is the number of
+# idle connections kept per host and HTTP_POOL_HOSTS the number of hosts whose connections are kept.
+HTTP_CONNECTION_POOLING = True
+HTTP_POOL_HOSTS = 32
+HTTP_POOL_MAXSIZE = 32
+# The search index is written in segments of at most SEARCH_INDEX_SEGMENT_DOCS documents. Incremental updates
+# write small segments that are merged when there are more than SEARCH_INDEX_MAX_SMALL_SEGMENTS of them.
+SEARCH_INDEX_SEGMENT_DOCS = 10000
+SEARCH_INDEX_MAX_SMALL_SEGMENTS = 8
+# How long a long-polling lecture update request waits for lecture events (seconds).
+LECTURE_LONG_POLL_SECS = 10
+# Lecture clients with an event stream only poll for updates this often unless they get an event (seconds).
+LECTURE_EVENT_STREAM_POLL_INTERVAL = 30
+# How long a lecture event stream stays open before the client has to reconnect (seconds).
+LECTURE_EVENT_STREAM_SECS = 600
+# How many paragraph diffs between document versions are memoized for live updates in each process.
+DOC_DIFF_CACHE_SIZE = 256
+# How many parsed plugin markups are cached in each process; 0 disables the cache. If PLUGIN_MARKUP_CACHE_SHARED
+# is True, the parsed markups are also shared between processes in Redis for PLUGIN_MARKUP_CACHE_EXPIRE_SECS.
+PLUGIN_MARKUP_CACHE_SIZE = 5000
+PLUGIN_MARKUP_CACHE_SHARED = False
+PLUGIN_MARKUP_CACHE_EXPIRE_SECS = 3600 * 24
+# How many compiled macro templates are cached in each process; 0 disables the cache.
+MACRO_TEMPLATE_CACHE_SIZE = 10000
+# The effective rights of users to items are cached for the duration of a request and, if RIGHTS_CACHE_SHARED is
+# True, shared between processes in Redis for RIGHTS_CACHE_EXPIRE_SECS (see timApp/auth/rightscache.py).
+RIGHTS_CACHE_SHARED = True
+RIGHTS_CACHE_EXPIRE_SECS = 3600
+# How long a document event stream stays open before the client has to reconnect (seconds).
+DOC_EVENT_STREAM_SECS = 600
+# Views with a document event stream only poll for changes this often unless they get an event (seconds).
+DOC_EVENT_STREAM_POLL_INTERVAL = 60
+# Documents are printed in Celery print jobs. Unfinished jobs are forgotten after PRINT_JOB_TIMEOUT seconds
+# (e.g. if the worker died) and the results of finished jobs are kept for PRINT_JOB_RESULT_SECS seconds.
+PRINT_JOB_TIMEOUT = 1800
+PRINT_JOB_RESULT_SECS = 600
+# How long a request for a printed PDF waits for its print job (seconds).
+PRINT_JOB_WAIT_SECS = 300
+# At most this many LaTeX processes are run at the same time; others wait at most PRINT_LATEX_SLOT_TIMEOUT seconds.
+PRINT_MAX_LATEX_PROCESSES = 2
+PRINT_LATEX_SLOT_TIMEOUT = 600
+# The printable fragments of paragraphs are cached in Redis so that only the changed paragraphs are converted
+# again when a document is printed after an edit.
+PRINT_FRAGMENT_CACHE = True
+PRINT_FRAGMENT_CACHE_EXPIRE_SECS = 3600 * 24 * 7
 
 # When enabled, the readingtypes on_screen and hover_par will not be saved in the database.
 DISABLE_AUTOMATIC_READINGS = False
+
+# Whether read marks are buffered in Redis and inserted into the database in bulk (see timApp/readmark/readmarkbuffer.py).
+READMARK_BUFFER = True
+# When this many marks have been buffered, a Celery task flushes them into the database.
+READMARK_BUFFER_MAX_MARKS = 500
+# How often the buffered marks are flushed into the database by Celery beat.
+READMARK_BUFFER_FLUSH_SECS = 5
 HELP_EMAIL = "tim@jyu.fi"
 
 # Default sender address for email.
@@ -109,6 +188,10 @@ CELERYBEAT_SCHEDULE = {
         "task": "timApp.tim_celery.update_search_files",
         "schedule": crontab(hour="*/12", minute="0"),
     },
+    "update-search-index": {
+        "task": "timApp.tim_celery.update_search_index_task",
+        "schedule": crontab(minute="*/10"),
+    },
     "process-notifications": {
         "task": "timApp.tim_celery.process_notifications",
         "schedule": crontab(minute="*/5"),
@@ -121,6 +204,10 @@ CELERYBEAT_SCHEDULE = {
         "task": "timApp.tim_celery.cleanup_verifications",
         "schedule": crontab(minute="*/10"),
     },
+    "flush-read-marks": {
+        "task": "timApp.tim_celery.flush_read_marks_task",
+        "schedule": timedelta(seconds=READMARK_BUFFER_FLUSH_SECS),
+    },
 }
 # This makes the log format a little less verbose by omitting the Celery task id (which is an UUID).
 CELERYD_TASK_LOG_FORMAT = (
@@ -0,0 +1,310 @@
+"""Cache for the auto macro values and headings of document paragraphs.
+
+The auto macros of a paragraph (such as heading numbers) depend on all the paragraphs before it,
+so computing them for the first view of a large document is expensive. The computed values are cached
+per (document, version, paragraph). Because the document version is part of the key, editing the document
+invalidates the cached values; the entries of old versions simply expire from the shared tier.
+
+The cache has two tiers:
+
+* an in-process LRU tier that holds the values of recently used document versions, and
+* a shared tier (:class:`RedisAutoMacroStore` by default) so that the values computed by one TIM process
+  are visible to all processes and hosts.
+
+Values are computed while holding a per-document lock of the shared tier, so concurrent first views of a document
+compute the values only once.
+"""
+from __future__ import annotations
+
+import pickle
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, ContextManager, Iterator
+
+from filelock import FileLock
+from redis import Redis
+from redis.exceptions import LockError
+
+from timApp.document.version import Version
+from timApp.util.logger import log_warning
+
+VersionKey = tuple[int, int, int]
+"""The key of the values of a document version: (doc_id, major, minor)."""
+
+MACRO_FIELD_PREFIX = "m:"
+HEADING_FIELD_PREFIX = "h:"
+
+LOCAL_TIER_SIZE = 64
+"""How many document versions are kept in the in-process tier."""
+
+
+class AutoMacroStore(ABC):
+    """The shared tier of the auto macro cache.
+
+    The values of a document version are stored as a single mapping from field names to values.
+    """
+
+    @abstractmethod
+    def load(self, key: VersionKey) -> dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def save(self, key: VersionKey, values: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self, doc_id: int | None) -> None:
+        """Removes the values of all versions of the document, or of all documents if doc_id is None."""
+        pass
+
+    @abstractmethod
+    def lock(self, doc_id: int) -> ContextManager:
+        """Returns the per-document lock.
+
+        The lock is only an optimization: if it cannot be acquired in time, the values are computed without it.
+        """
+        pass
+
+
+DOCS_KEY = "tim-automacros-docs"
+"""The Redis set of the ids of the documents that have cached values."""
+
+
+class RedisAutoMacroStore(AutoMacroStore):
+    """Stores the values of each document version in a Redis hash.
+
+    The names of the hashes of each document are kept in a set, and the ids of the documents in DOCS_KEY,
+    so clearing the cache does not need to scan the whole key space. The sets expire along with the hashes.
+    """
+
+    def __init__(self, expire_secs: int, lock_timeout: int):
+        self.expire_secs = expire_secs
+        self.lock_timeout = lock_timeout
+
+    @staticmethod
+    def _client() -> Redis:
+        from timApp.document.caching import rclient
+
+        return rclient
+
+    @staticmethod
+    def get_name(key: VersionKey) -> str:
+        doc_id, major, minor = key
+        return f"tim-automacros-{doc_id}-{major}-{minor}"
+
+    @staticmethod
+    def get_names_key(doc_id: int) -> str:
+        return f"tim-automacros-names-{doc_id}"
+
+    def load(self, key: VersionKey) -> dict[str, Any]:
+        return {
+            k.decode(): pickle.loads(v)
+            for k, v in self._client().hgetall(self.get_name(key)).items()
+        }
+
+    def save(self, key: VersionKey, values: dict[str, Any]) -> None:
+        if not values:
+            return
+        name = self.get_name(key)
+        names_key = self.get_names_key(key[0])
+        pipe = self._client().pipeline()
+        pipe.hset(name, mapping={k: pickle.dumps(v) for k, v in values.items()})
+        pipe.sadd(names_key, name)
+        pipe.sadd(DOCS_KEY, key[0])
+        for k in (name, names_key, DOCS_KEY):
+            pipe.expire(k, self.expire_secs)
+        pipe.execute()
+
+    def clear(self, doc_id: int | None) -> None:
+        client = self._client()
+        if doc_id is None:
+            doc_ids = [int(d) for d in client.smembers(DOCS_KEY)]
+        else:
+            doc_ids = [doc_id]
+        for d in doc_ids:
+            names_key = self.get_names_key(d)
+            client.delete(*client.smembers(names_key), names_key)
+            client.srem(DOCS_KEY, d)
+
+    @contextmanager
+    def lock(self, doc_id: int) -> Iterator[None]:
+        lock = self._client().lock(
+            f"tim-automacros-lock-{doc_id}",
+            timeout=self.lock_timeout,
+            blocking_timeout=self.lock_timeout,
+        )
+        acquired = lock.acquire()
+        if not acquired:
+            log_warning(
+                f"Could not acquire the auto macro lock of document {doc_id}, computing without it"
+            )
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except LockError:
+                    # The lock expired while computing; another process may already hold it.
+                    pass
+
+
+class LocalAutoMacroStore(AutoMacroStore):
+    """Keeps the values only in the memory of the current process. Meant for development setups without Redis."""
+
+    def __init__(self) -> None:
+        self.values: dict[VersionKey, dict[str, Any]] = {}
+
+    def load(self, key: VersionKey) -> dict[str, Any]:
+        return dict(self.values.get(key, {}))
+
+    def save(self, key: VersionKey, values: dict[str, Any]) -> None:
+        self.values.setdefault(key, {}).update(values)
+
+    def clear(self, doc_id: int | None) -> None:
+        for key in list(self.values):
+            if doc_id is None or key[0] == doc_id:
+                del self.values[key]
+
+    def lock(self, doc_id: int) -> ContextManager:
+        return FileLock(f"/tmp/automacros_{doc_id}_lock")
+
+
+class LocalTier:
+    """An LRU cache of the values of document versions within one process."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[VersionKey, dict[str, Any]] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: VersionKey) -> dict[str, Any] | None:
+        with self.lock:
+            values = self.entries.get(key)
+            if values is not None:
+                self.entries.move_to_end(key)
+            return values
+
+    def put(self, key: VersionKey, values: dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[key] = values
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def drop(self, doc_id: int | None) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                if doc_id is None or key[0] == doc_id:
+                    del self.entries[key]
+
+
+local_tier = LocalTier(LOCAL_TIER_SIZE)
+
+_store: AutoMacroStore | None = None
+
+
+def get_auto_macro_store() -> AutoMacroStore:
+    """Returns the shared tier configured with the AUTO_MACRO_CACHE_BACKEND option."""
+    global _store
+    if _store is None:
+        from timApp.tim_app import app
+
+        backend = app.config["AUTO_MACRO_CACHE_BACKEND"]
+        if backend == "redis":
+            _store = RedisAutoMacroStore(
+                expire_secs=app.config["AUTO_MACRO_CACHE_EXPIRE_SECS"],
+                lock_timeout=app.config["AUTO_MACRO_CACHE_LOCK_TIMEOUT"],
+            )
+        elif backend == "memory":
+            _store = LocalAutoMacroStore()
+        else:
+            raise ValueError(f"Unknown AUTO_MACRO_CACHE_BACKEND: {backend}")
+    return _store
+
+
+def clear_auto_macro_cache(doc_id: int | None = None) -> None:
+    """Clears both tiers of the cache for the given document, or for all documents if doc_id is None."""
+    local_tier.drop(doc_id)
+    get_auto_macro_store().clear(doc_id)
+
+
+class AutoMacroCache:
+    """The auto macro and heading cache of a single document, as used by one request.
+
+    New values are kept in memory until :meth:`flush` is called. A non-persistent cache (used e.g. for previews)
+    reads the cached values but never writes anything to the tiers.
+    """
+
+    def __init__(
+        self,
+        doc_id: int,
+        persist: bool = True,
+        store: AutoMacroStore | None = None,
+    ):
+        self.doc_id = doc_id
+        self.persist = persist
+        self.store = store if store is not None else get_auto_macro_store()
+        self.loaded: dict[Version, dict[str, Any]] = {}
+        self.pending: dict[Version, dict[str, Any]] = {}
+        self.bypass_local_tier = False
+
+    def _get(self, ver: Version, field: str) -> Any:
+        pending = self.pending.get(ver)
+        if pending is not None and field in pending:
+            return pending[field]
+        values = self.loaded.get(ver)
+        if values is None:
+            key = (self.doc_id, *ver)
+            values = None if self.bypass_local_tier else local_tier.get(key)
+            if values is None:
+                values = self.store.load(key)
+                local_tier.put(key, values)
+            self.loaded[ver] = values
+        return values.get(field)
+
+    def _set(self, ver: Version, field: str, value: Any) -> None:
+        self.pending.setdefault(ver, {})[field] = value
+
+    def get_macros(self, par_id: str, ver: Version) -> dict | None:
+        return self._get(ver, MACRO_FIELD_PREFIX + par_id)
+
+    def set_macros(self, par_id: str, ver: Version, value: dict) -> None:
+        self._set(ver, MACRO_FIELD_PREFIX + par_id, value)
+
+    def get_headings(self, par_id: str, ver: Version) -> list[str] | None:
+        return self._get(ver, HEADING_FIELD_PREFIX + par_id)
+
+    def set_headings(self, par_id: str, ver: Version, value: list[str]) -> None:
+        self._set(ver, HEADING_FIELD_PREFIX + par_id, value)
+
+    def lock(self) -> ContextManager:
+        """Returns the per-document lock that should be held while computing missing values."""
+        return self.store.lock(self.doc_id)
+
+    def reload(self) -> None:
+        """Discards the values read so far and reads them again from the shared tier on next access.
+
+        This should be called after acquiring the lock because another process may have computed the values.
+        """
+        self.loaded = {}
+        self.bypass_local_tier = True
+
+    def flush(self) -> None:
+        """Writes the new values to both tiers."""
+        if not self.persist:
+            return
+        for ver, values in self.pending.items():
+            key = (self.doc_id, *ver)
+            self.store.save(key, values)
+            local_tier.put(key, {**self.loaded.get(ver, {}), **values})
+        self.pending = {}
+
+    def clear(self) -> None:
+        """Clears the cached values of all versions of the document."""
+        self.loaded = {}
+        self.pending = {}
+        if self.persist:
+            clear_auto_macro_cache(self.doc_id)
@@ -52,9 +52,10 @@ class Changelog:
         )
         ug_obj_map = {}
         for e in self.entries:
-            if e.par_id in par_ids:
-                usergroup_ids.add(e.group_id)
-                par_entry_map[e.par_id][e.group_id].append(e)
+            for par_id in e.par_ids:
+                if par_id in par_ids:
+                    usergroup_ids.add(e.group_id)
+                    par_entry_map[par_id][e.group_id].append(e)
         User = timApp.user.user.User
         UserGroup = timApp.user.usergroup.UserGroup
         result = (
@@ -13,6 +13,7 @@ class OperationType(Enum):
     Delete = "Deleted"
     Insert = "Inserted"
     Modify = "Modified"
+    Edit = "Edited"
 
 
 class Operation:
@@ -29,6 +30,10 @@ class Operation:
             return InsertOperation(op, d.get("before_id"))
         elif op == OperationType.Modify:
             return ModifyOperation(op, old_hash=d["old_hash"], new_hash=d["new_hash"])
+        elif op == OperationType.Edit:
+            return EditOperation(
+                op, added=d["added"], deleted=d["deleted"], changed=d["changed"]
+            )
         else:
             assert False, "Unknown OperationType"
 
@@ -65,6 +70,43 @@ class InsertOperation(Operation):
         self.before_id = before_id
 
 
+class EditOperation(Operation):
+    """Multiple paragraph operations that were saved as a single document version."""
+
+    def to_json(self):
+        return {"added": self.added, "deleted": self.deleted, "changed": self.changed}
+
+    def __init__(
+        self,
+        op: OperationType,
+        added: list[str],
+        deleted: list[str],
+        changed: list[str],
+    ) -> None:
+        super().__init__(op)
+        self.added = added
+        self.deleted = deleted
+        self.changed = changed
+
+
+def get_entry_par_ids(entry: dict) -> list[str]:
+    """Returns the ids of the paragraphs affected by a raw changelog entry."""
+    if entry["op"] == OperationType.Edit.value:
+        p = entry["op_params"]
+        return p["added"] + p["deleted"] + p["changed"]
+    return [entry["par_id"]]
+
+
+def get_entry_created_par_ids(entry: dict) -> list[str]:
+    """Returns the ids of the paragraphs that were created by a raw changelog entry."""
+    op = entry["op"]
+    if op == OperationType.Edit.value:
+        return entry["op_params"]["added"]
+    if op in (OperationType.Add.value, OperationType.Insert.value):
+        return [entry["par_id"]]
+    return []
+
+
 class ChangelogEntry:
     def __init__(
         self,
@@ -81,6 +123,13 @@ class ChangelogEntry:
         self.group_id = group_id
         self.par_id = par_id
 
+    @property
+    def par_ids(self) -> list[str]:
+        """Returns the ids of all paragraphs affected by this entry."""
+        if isinstance(self.op, EditOperation):
+            return self.op.added + self.op.deleted + self.op.changed
+        return [self.par_id]
+
     def to_json(self):
         return {
             "ver": self.version,
@@ -0,0 +1,87 @@
+"""Reading and writing of document changelog files.
+
+The changelog of a document is stored in ``<doc_dir>/changelog.jsonl`` as JSON lines in chronological order,
+so a new entry is written by appending a single line. The entries are read from the end of the file
+backwards so that reading the latest entries does not depend on the length of the changelog.
+
+Older TIM versions stored the changelog in ``<doc_dir>/changelog`` in reverse chronological order,
+which required rewriting the whole file for every entry. Such files are converted to the new format
+by :func:`convert_legacy_changelog`.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Generator
+
+CHANGELOG_FILE_NAME = "changelog.jsonl"
+LEGACY_CHANGELOG_FILE_NAME = "changelog"
+
+READ_BLOCK_SIZE = 64 * 1024
+
+JSON_STRING_RE = re.compile(r'"([^"\\]*)"')
+
+
+def read_lines_reversed(
+    path: Path, block_size: int = READ_BLOCK_SIZE
+) -> Generator[str, None, None]:
+    """Yields the lines of a file from the last line to the first one.
+
+    The file is read backwards in blocks, so only the part of the file that is actually consumed is read.
+    Empty lines are skipped.
+    """
+    with path.open("rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + remainder
+            lines = data.split(b"\n")
+            # The first line may continue in the previous block.
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line.decode()
+        if remainder:
+            yield remainder.decode()
+
+
+def line_mentions_any(line: str, ids: set[str]) -> bool:
+    """Returns whether a raw changelog line contains any of the ids as a JSON string, without decoding the line.
+
+    The changelog entries contain no strings with escape sequences, so every string of the line is found.
+    """
+    return not ids.isdisjoint(JSON_STRING_RE.findall(line))
+
+
+def append_changelog_entry(path: Path, entry: dict) -> None:
+    with path.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def convert_legacy_changelog(doc_dir: Path) -> bool:
+    """Converts a legacy (newest first) changelog of a document to the append-only format.
+
+    If the document already has an append-only changelog, the legacy entries are placed before the existing ones.
+
+    :return: True if a legacy changelog was found and converted.
+    """
+    legacy = doc_dir / LEGACY_CHANGELOG_FILE_NAME
+    if not legacy.is_file():
+        return False
+    new = doc_dir / CHANGELOG_FILE_NAME
+    with legacy.open("r") as f:
+        lines = [line for line in f.read().split("\n") if line]
+    fd, tmpname = mkstemp(dir=doc_dir)
+    with os.fdopen(fd, "w") as f:
+        for line in reversed(lines):
+            f.write(line + "\n")
+        if new.is_file():
+            with new.open("r") as existing:
+                f.write(existing.read())
+    os.replace(tmpname, new)
+    legacy.unlink()
+    return True
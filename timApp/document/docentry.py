@@ -4,6 +4,7 @@ from typing import TYPE_CHECKING, Any
 
 from sqlalchemy.orm import foreign
 
+from timApp.auth.rightscache import get_access_checkers
 from timApp.document.docinfo import DocInfo
 from timApp.document.document import Document
 from timApp.document.translation.translation import Translation
@@ -263,7 +264,14 @@ def get_documents(
     result = q.all()
     if not filter_user:
         return result
-    return [r for r in result if filter_user.has_view_access(r)]
+    from timApp.user.user import view_access_set
+
+    checkers = get_access_checkers(result, [filter_user])
+    return [
+        r
+        for r in result
+        if checkers[filter_user.id, r.id].has_some_access(view_access_set)
+    ]
 
 
 def get_documents_in_folder(
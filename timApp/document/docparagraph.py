@@ -2,16 +2,15 @@ from __future__ import annotations
 
 import json
 import os
-import shelve
 from collections import defaultdict
 from copy import copy
 from typing import TYPE_CHECKING
 
 import commonmark
-import filelock
 from commonmark.node import Node
 from jinja2.sandbox import SandboxedEnvironment
 
+from timApp.document.automacrocache import AutoMacroCache
 from timApp.document.documentparser import DocumentParser
 from timApp.document.documentparseroptions import DocumentParserOptions
 from timApp.document.documentwriter import DocumentWriter
@@ -39,6 +38,7 @@ from tim_common.utils import parse_bool
 if TYPE_CHECKING:
     from timApp.document.document import Document
     from timApp.document.docinfo import DocInfo
+    from timApp.document.parstore import PackedParStore
 
 SKIPPED_ATTRS = {"r", "rd", "rp", "ra", "rt", "mt", "settings"}
 
@@ -244,6 +244,11 @@ class DocParagraph:
         :return: The retrieved DocParagraph.
 
         """
+        store = doc.get_par_store()
+        if store is not None:
+            t = store.get_current(par_id)
+            if t is not None:
+                return cls.get(doc, par_id, t)
         try:
             t = os.readlink(cls._get_path(doc, par_id, "current"))
             return cls.get(doc, par_id, t)
@@ -260,6 +265,11 @@ class DocParagraph:
         :return: The retrieved DocParagraph.
 
         """
+        store = doc.get_par_store()
+        if store is not None:
+            d = store.read(par_id, t)
+            if d is not None:
+                return cls.from_dict(doc, d)
         try:
             with open(cls._get_path(doc, par_id, t)) as f:
                 return cls.from_dict(doc, json.loads(f.read()))
@@ -578,55 +588,15 @@ class DocParagraph:
             return []
 
         doc_id = pars[0].doc.doc_id
-        macro_cache_file = f"/tmp/tim_auto_macros_{doc_id}"
-        heading_cache_file = f"/tmp/heading_cache_{doc_id}"
-
-        first_pars = []
         if context_par is not None:
-            first_pars = [context_par]
-            pars = first_pars + pars
-
-        if not persist:
-            cache = {}
-            heading_cache = {}
-            with shelve.open(macro_cache_file) as c, shelve.open(
-                heading_cache_file
-            ) as hc:
-
-                # Basically we want the cache objects to be non-persistent, so we convert them to normal dicts
-                # Find out better way if possible...
-                for par in first_pars:
-                    key = str((par.get_id(), par.doc.get_version()))
-                    value = c.get(key)
-                    if value is not None:
-                        cache[key] = value
-                    value = hc.get(par.get_id())
-                    if value is not None:
-                        heading_cache[par.get_id()] = value
-            unloaded_pars = cls.get_unloaded_pars(
-                pars, settings, cache, heading_cache, clear_cache
-            )
-        else:
-            with filelock.FileLock(f"/tmp/cache_lock_{doc_id}"):
-                if clear_cache:
-                    try:
-                        os.remove(macro_cache_file + ".db")
-                    except FileNotFoundError:
-                        pass
-                    try:
-                        os.remove(heading_cache_file + ".db")
-                    except FileNotFoundError:
-                        pass
-                with shelve.open(macro_cache_file) as cache, shelve.open(
-                    heading_cache_file
-                ) as heading_cache:
-                    unloaded_pars = cls.get_unloaded_pars(
-                        pars, settings, cache, heading_cache, clear_cache
-                    )
-                    for k, v in heading_cache.items():
-                        heading_cache[k] = v
+            pars = [context_par] + pars
+
+        unloaded_pars = cls.load_auto_macros(
+            doc_id, pars, settings, clear_cache, bool(persist)
+        )
 
         changed_pars = []
+        pars_to_write = []
         if len(unloaded_pars) > 0:
 
             def deref_tr_par(p):
@@ -666,20 +636,57 @@ class DocParagraph:
                 par.html_cache[auto_macro_hash] = h
                 par._set_html(h, sanitized=True)
                 if persist and not par.from_preamble():
-                    par.__write()
+                    pars_to_write.append(par)
+        cls.write_many(pars_to_write)
         return changed_pars
 
+    @classmethod
+    def load_auto_macros(
+        cls,
+        doc_id: int,
+        pars: list[DocParagraph],
+        settings,
+        clear_cache: bool,
+        persist: bool,
+    ):
+        """Computes the auto macros of the given paragraphs using the auto macro cache of the document
+        and finds out which paragraphs need to be preloaded again.
+
+        :param doc_id: The id of the document whose cache is used.
+        :return: The unloaded paragraphs as returned by :meth:`get_unloaded_pars`.
+        """
+        cache = AutoMacroCache(doc_id, persist=persist)
+        if persist and clear_cache:
+            cache.clear()
+        needs_compute = [
+            p for p in pars if not p.is_dynamic() and (clear_cache or p.html is None)
+        ]
+        if persist and not all(
+            cache.get_macros(p.get_id(), p.doc.get_version()) is not None
+            for p in needs_compute
+        ):
+            # Compute the missing values only once even if the document is being viewed concurrently.
+            with cache.lock():
+                cache.reload()
+                unloaded_pars = cls.get_unloaded_pars(
+                    pars, settings, cache, clear_cache
+                )
+                cache.flush()
+        else:
+            unloaded_pars = cls.get_unloaded_pars(pars, settings, cache, clear_cache)
+            cache.flush()
+
+        return unloaded_pars
+
     @classmethod
     def get_unloaded_pars(
-        cls, pars, settings, auto_macro_cache, heading_cache, clear_cache=False
+        cls, pars, settings, auto_macro_cache: AutoMacroCache, clear_cache=False
     ):
         """Finds out which of the given paragraphs need to be preloaded again.
 
         :param pars: The list of paragraphs to be processed.
         :param settings: The settings for the document.
-        :param auto_macro_cache: The cache object from which to retrieve and store the auto macro data.
-        :param heading_cache: A cache object to store headings into. The key is paragraph id and value is a list of headings
-         in that paragraph.
+        :param auto_macro_cache: The cache object from which to retrieve and store the auto macro data and headings.
         :param clear_cache: Whether all caches should be refreshed.
         :return: A 5-tuple of the form:
           (paragraph, hash of the auto macro values, auto macros, so far used headings, old HTML).
@@ -702,7 +709,7 @@ class DocParagraph:
             try:
                 auto_number_start = settings.auto_number_start()
                 auto_macros = par.get_auto_macro_values(
-                    macros, env, auto_macro_cache, heading_cache, auto_number_start
+                    macros, env, auto_macro_cache, auto_number_start
                 )
             except RecursionError:
                 raise TimDbException(
@@ -710,7 +717,9 @@ class DocParagraph:
                 )
             auto_macro_hash = hashfunc(settings_hash + str(auto_macros))
 
-            par_headings = heading_cache.get(par.get_id())
+            par_headings = auto_macro_cache.get_headings(
+                par.get_id(), par.doc.get_version()
+            )
             if cumulative_headings:
                 # Performance optimization: copy only if the set of headings changes
                 if par_headings:
@@ -765,17 +774,15 @@ class DocParagraph:
         self,
         macros,
         env: TimSandboxedEnvironment,
-        auto_macro_cache,
-        heading_cache,
+        auto_macro_cache: AutoMacroCache,
         auto_number_start,
     ):
         """Returns the auto macros values for the current paragraph. Auto macros include things like current
         heading/table/figure numbers.
 
-        :param heading_cache: A cache object to store headings into. The key is paragraph id and value is a list of headings
-         in that paragraph.
         :param macros: Macros to apply for the paragraph.
-        :param auto_macro_cache: The cache object from which to retrieve and store the auto macro data.
+        :param auto_macro_cache: The cache object from which to retrieve and store the auto macro data and
+         the headings of each paragraph.
         :param auto_number_start: Object of heading start numbers.
         :return: Auto macro values as a dict.
         :param env: Environment for macros.
@@ -783,18 +790,19 @@ class DocParagraph:
 
         """
 
-        key = str((self.get_id(), self.doc.get_version()))
-        cached = auto_macro_cache.get(key)
+        par_id = self.get_id()
+        ver = self.doc.get_version()
+        cached = auto_macro_cache.get_macros(par_id, ver)
         if cached is not None:
             return cached
 
         prev_par: DocParagraph = self.doc.get_previous_par(self)
         if prev_par is None:
             prev_par_auto_values = {"h": auto_number_start}
-            heading_cache[self.get_id()] = []
+            auto_macro_cache.set_headings(par_id, ver, [])
         else:
             prev_par_auto_values = prev_par.get_auto_macro_values(
-                macros, env, auto_macro_cache, heading_cache, auto_number_start
+                macros, env, auto_macro_cache, auto_number_start
             )
 
         # If the paragraph is a translation but it has not been translated (empty markdown), we use the md from the original.
@@ -811,8 +819,8 @@ class DocParagraph:
             or prev_par.has_class("nonumber")
             or (deref and deref.has_class("nonumber"))
         ):
-            auto_macro_cache[key] = prev_par_auto_values
-            heading_cache[self.get_id()] = []
+            auto_macro_cache.set_macros(par_id, ver, prev_par_auto_values)
+            auto_macro_cache.set_headings(par_id, ver, [])
             return prev_par_auto_values
 
         md_expanded = prev_par.md
@@ -844,9 +852,9 @@ class DocParagraph:
                 deltas[level] += 1
                 for i in range(level + 1, 7):
                     deltas[i] = auto_number_start.get(i, 0)
-        heading_cache[self.get_id()] = title_ids
+        auto_macro_cache.set_headings(par_id, ver, title_ids)
         result = {"h": deltas}
-        auto_macro_cache[key] = result
+        auto_macro_cache.set_macros(par_id, ver, result)
         return result
 
     def sanitize_html(self):
@@ -942,6 +950,10 @@ class DocParagraph:
         return self._get_path(self.doc, self.id, self.hash)
 
     def __write(self):
+        store = self.doc.get_par_store()
+        if store is not None:
+            store.write(self.id, self.hash, self.dict(include_html_cache=True))
+            return
         file_name = self.get_path()
         does_exist = os.path.isfile(file_name)
 
@@ -953,8 +965,27 @@ class DocParagraph:
         with open(file_name, "w") as f:
             f.write(json.dumps(self.dict(include_html_cache=True)))
 
-    def set_latest(self):
+    @classmethod
+    def write_many(cls, pars: list[DocParagraph]) -> None:
+        """Stores the paragraphs to disk. The paragraphs in a packed store are written with a single append."""
+        by_store: defaultdict[PackedParStore, list[DocParagraph]] = defaultdict(list)
+        for par in pars:
+            store = par.doc.get_par_store()
+            if store is None:
+                par.__write()
+            else:
+                by_store[store].append(par)
+        for store, store_pars in by_store.items():
+            store.write_many(
+                (p.id, p.hash, p.dict(include_html_cache=True)) for p in store_pars
+            )
+
+    def set_latest(self) -> None:
         """Updates the 'current' symlink to point to this paragraph version."""
+        store = self.doc.get_par_store()
+        if store is not None:
+            store.set_current(self.get_id(), self.get_hash())
+            return
         linkpath = self._get_path(self.doc, self.get_id(), "current")
         if linkpath == self.get_hash():
             return
@@ -996,7 +1027,7 @@ class DocParagraph:
         else:
             self.doc.modify_paragraph_obj(self.get_id(), self)
 
-    def store(self):
+    def store(self) -> None:
         """Stores the paragraph to disk."""
         self.__write()
 
@@ -1342,11 +1373,8 @@ def create_final_par(
 
 def get_heading_counts(ctx: DocParagraph):
     d = ctx.doc
-    macro_cache_file = f"/tmp/tim_auto_macros_{d.doc_id}"
-    ps = commonmark.Parser()
-    with shelve.open(macro_cache_file) as cache:
-        vals = cache.get(str((ctx.get_id(), d.get_version())), {}).get("h")
-        return vals
+    cache = AutoMacroCache(d.doc_id, persist=False)
+    return (cache.get_macros(ctx.get_id(), d.get_version()) or {}).get("h")
 
 
 def add_heading_numbers(
@@ -1359,12 +1387,12 @@ def add_heading_numbers(
     initial_heading_counts: dict[int, int] | None = None,
 ):
     d = ctx.doc
-    macro_cache_file = f"/tmp/tim_auto_macros_{ctx.doc.doc_id}"
-    # TODO: Cache sould be picked up only once and used as a paramter
     ps = commonmark.Parser()
     parsed = ps.parse(s)
-    with shelve.open(macro_cache_file) as cache:
-        vals = cache.get(str((ctx.get_id(), d.get_version())), {}).get("h")
+    # The values of a document version are kept in the in-process tier of the cache,
+    # so this is cheap for all but the first paragraph.
+    cache = AutoMacroCache(d.doc_id, persist=False)
+    vals = (cache.get_macros(ctx.get_id(), d.get_version()) or {}).get("h")
     if not vals:
         return s
     lines = s.splitlines(keepends=False)
@@ -185,6 +185,7 @@ class DocSettings:
         self.doc = doc
         self.__dict = settings_dict if settings_dict else YamlBlock()
         self.macroinfo_cache = {}
+        self.plugin_markup_hash: str | None = None
 
     def to_paragraph(self) -> DocParagraph:
         text = "```\n" + self.__dict.to_markdown() + "\n```"
@@ -474,6 +475,14 @@ class DocSettings:
     def mathtype(self, default="mathjax") -> MathType:
         return MathType.from_string(self.__dict.get(self.mathtype_key, default))
 
+    def get_plugin_markup_hash(self) -> str:
+        """Returns a hash of the settings that are applied to the markup of plugins before expanding its macros."""
+        if self.plugin_markup_hash is None:
+            self.plugin_markup_hash = hashfunc(
+                f"{self.get_charmacros()}{self.get_globalmacros()}"
+            )
+        return self.plugin_markup_hash
+
     def get_hash(self):
         macroinfo = self.get_macroinfo(default_view_ctx)
         macros = macroinfo.get_macros()
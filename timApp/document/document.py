@@ -6,26 +6,45 @@ import shutil
 from datetime import datetime
 from difflib import SequenceMatcher
 from pathlib import Path
-from tempfile import mkstemp
 from time import time
-from typing import Iterable, Generator
+from typing import Iterable, Generator, Iterator
 from typing import TYPE_CHECKING
 
 from filelock import FileLock
 from lxml import etree, html
 
 from timApp.document.changelog import Changelog
-from timApp.document.changelogentry import ChangelogEntry
+from timApp.document.changelogentry import (
+    ChangelogEntry,
+    OperationType,
+    get_entry_par_ids,
+    get_entry_created_par_ids,
+)
+from timApp.document.changelogfile import (
+    CHANGELOG_FILE_NAME,
+    LEGACY_CHANGELOG_FILE_NAME,
+    read_lines_reversed,
+    append_changelog_entry,
+    line_mentions_any,
+)
 from timApp.document.docparagraph import DocParagraph
 from timApp.document.docsettings import DocSettings, resolve_settings_for_pars
+from timApp.document.docupdates import publish_doc_version
 from timApp.document.documentparser import DocumentParser
 from timApp.document.documentparseroptions import DocumentParserOptions
 from timApp.document.documentwriter import DocumentWriter
 from timApp.document.editing.documenteditresult import DocumentEditResult
+from timApp.document.editing.documentedittransaction import DocumentEditTransaction
 from timApp.document.exceptions import DocExistsError, ValidationException
+from timApp.document.parstore import PackedParStore, resolve_par_store
 from timApp.document.preloadoption import PreloadOption
 from timApp.document.validationresult import ValidationResult
 from timApp.document.version import Version
+from timApp.document.versionfile import (
+    get_version_file_path,
+    read_version_lines,
+    write_version_lines,
+)
 from timApp.document.viewcontext import ViewContext, default_view_ctx
 from timApp.document.yamlblock import YamlBlock
 from timApp.timdb.exceptions import (
@@ -92,6 +111,10 @@ class Document:
         self.par_map = None
         # List of preamble pars if they have been inserted
         self.preamble_pars = None
+        # The packed paragraph store of the document, or None if the document uses the file-per-paragraph layout
+        self.par_store: PackedParStore | None = None
+        # Whether par_store has been resolved
+        self.par_store_resolved = False
 
     @property
     def id(self):
@@ -109,6 +132,14 @@ class Document:
     def __repr__(self):
         return f"Document(id={self.doc_id})"
 
+    def get_par_store(self) -> PackedParStore | None:
+        """Returns the packed paragraph store of this document, or None if the paragraphs are stored
+        as separate files."""
+        if not self.par_store_resolved:
+            self.par_store = resolve_par_store(self.doc_id)
+            self.par_store_resolved = True
+        return self.par_store
+
     def __iter__(self) -> DocParagraphIter | CacheIterator:
         if self.par_cache is None:
             return DocParagraphIter(self)
@@ -423,13 +454,20 @@ class Document:
         )
 
     def get_version_path(self, ver: Version | None = None) -> Path:
+        """Returns the path of the version file.
+
+        Note that the file may be stored as a delta; use get_version_lines to read the contents.
+        """
         version = self.get_version() if ver is None else ver
-        return (
-            self.get_documents_dir()
-            / str(self.doc_id)
-            / str(version[0])
-            / str(version[1])
-        )
+        return get_version_file_path(self.get_doc_dir(), version)
+
+    def get_version_lines(self, ver: Version | None = None) -> list[str]:
+        """Returns the paragraph list of the given version as "par_id/hash" lines.
+
+        :param ver: The version, or None for the latest version.
+        """
+        version = self.get_version() if ver is None else ver
+        return read_version_lines(self.get_doc_dir(), version)
 
     def get_refs_dir(self, ver: Version | None = None) -> Path:
         version = self.get_version() if ver is None else ver
@@ -445,16 +483,14 @@ class Document:
         return self.get_refs_dir(ver) / "reflist_to"
 
     def getlogfilename(self) -> Path:
-        return self.get_doc_dir() / "changelog"
+        return self.get_doc_dir() / CHANGELOG_FILE_NAME
+
+    def get_legacy_logfilename(self) -> Path:
+        return self.get_doc_dir() / LEGACY_CHANGELOG_FILE_NAME
 
     def __write_changelog(
         self, ver: Version, operation: str, par_id: str, op_params: dict | None = None
     ):
-        logname = self.getlogfilename()
-        src = logname.open("r") if logname.exists() else None
-        destfd, tmpname = mkstemp()
-        dest = os.fdopen(destfd, "w")
-
         ts = time()
         timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
         entry = {
@@ -465,23 +501,28 @@ class Document:
             "ver": ver,
             "time": timestamp,
         }
-        dest.write(json.dumps(entry))
-        dest.write("\n")
-
-        while src:
-            line = src.readline()
-            if line:
-                dest.write(line)
-            else:
-                src.close()
-                src = None
+        append_changelog_entry(self.getlogfilename(), entry)
 
-        dest.close()
-        shutil.copyfile(tmpname, logname)
-        os.unlink(tmpname)
+    def __read_changelog_lines(self) -> Generator[str, None, None]:
+        """Yields the raw changelog lines, newest first."""
+        logname = self.getlogfilename()
+        if logname.is_file():
+            yield from read_lines_reversed(logname)
+        # Entries in a legacy changelog that has not been converted yet are older than the ones above.
+        legacy = self.get_legacy_logfilename()
+        if legacy.is_file():
+            with legacy.open("r") as f:
+                for line in f:
+                    if line != "\n":
+                        yield line
 
     def __increment_version(
-        self, op: str, par_id: str, increment_major: bool, op_params: dict | None = None
+        self,
+        op: str,
+        par_id: str,
+        increment_major: bool,
+        lines: list[str],
+        op_params: dict | None = None,
     ) -> Version:
         ver_exists = True
         ver = self.get_version()
@@ -494,11 +535,9 @@ class Document:
             ver_exists = (self.get_version_path(ver)).is_file()
         if increment_major:
             (self.get_documents_dir() / str(self.doc_id) / str(ver[0])).mkdir()
-        if old_ver[0] > 0:
-            shutil.copyfile(self.get_version_path(old_ver), self.get_version_path(ver))
-        else:
-            with self.get_version_path(ver).open("w"):
-                pass
+        write_version_lines(
+            self.get_doc_dir(), ver, lines, old_ver if old_ver[0] > 0 else None
+        )
         self.__write_changelog(ver, op, par_id, op_params)
         self.version = ver
         self.par_cache = None
@@ -510,6 +549,7 @@ class Document:
         self.own_settings = None
         self.single_par_cache = {}
         self.ref_doc_cache = {}
+        publish_doc_version(self.doc_id, ver)
         return ver
 
     def __update_metadata(
@@ -593,15 +633,11 @@ class Document:
         p.store()
         p.set_latest()
         old_ver = self.get_version()
-        new_ver = self.__increment_version("Added", p.get_id(), increment_major=True)
-        old_path = self.get_version_path(old_ver)
-        new_path = self.get_version_path(new_ver)
-        if old_path.exists():
-            shutil.copyfile(old_path, new_path)
-
-        with new_path.open("a") as f:
-            f.write(p.get_id() + "/" + p.get_hash())
-            f.write("\n")
+        lines = self.get_version_lines(old_ver)
+        lines.append(f"{p.get_id()}/{p.get_hash()}")
+        new_ver = self.__increment_version(
+            "Added", p.get_id(), increment_major=True, lines=lines
+        )
         if update_meta:
             self.__update_metadata([p], old_ver, new_ver)
         return p
@@ -628,20 +664,16 @@ class Document:
         """
         self.raise_if_not_exist(par_id)
         old_ver = self.get_version()
-        new_ver = self.__increment_version("Deleted", par_id, increment_major=True)
+        lines = [
+            line
+            for line in self.get_version_lines(old_ver)
+            if not line.startswith(par_id)
+        ]
+        new_ver = self.__increment_version(
+            "Deleted", par_id, increment_major=True, lines=lines
+        )
         self.__update_metadata([], old_ver, new_ver)
 
-        with self.get_version_path(old_ver).open("r") as f_src:
-            with self.get_version_path(new_ver).open("w") as f:
-                while True:
-                    line = f_src.readline()
-                    if not line:
-                        return
-                    if line.startswith(par_id):
-                        pass
-                    else:
-                        f.write(line)
-
     def insert_paragraph(
         self,
         text: str,
@@ -681,29 +713,23 @@ class Document:
         p.store()
         p.set_latest()
         old_ver = self.get_version()
+        new_line = f"{p.get_id()}/{p.get_hash()}"
+        lines = []
+        for line in self.get_version_lines(old_ver):
+            if insert_before_id and line.startswith(insert_before_id):
+                lines.append(new_line)
+            lines.append(line)
+            if insert_after_id and line.startswith(insert_after_id):
+                lines.append(new_line)
         new_ver = self.__increment_version(
             "Inserted",
             p.get_id(),
             increment_major=True,
+            lines=lines,
             op_params={"before_id": insert_before_id}
             if insert_before_id
             else {"after_id": insert_after_id},
         )
-
-        new_line = p.get_id() + "/" + p.get_hash() + "\n"
-        with self.get_version_path(old_ver).open("r") as f_src, self.get_version_path(
-            new_ver
-        ).open("w") as f:
-            while True:
-                line = f_src.readline()
-                if not line:
-                    break
-
-                if insert_before_id and line.startswith(insert_before_id):
-                    f.write(new_line)
-                f.write(line)
-                if insert_after_id and line.startswith(insert_after_id):
-                    f.write(new_line)
         self.__update_metadata([p], old_ver, new_ver)
         return p
 
@@ -740,27 +766,19 @@ class Document:
         old_hash = p_src.get_hash()
         if p.is_same_as(p_src):
             return p
+        old_line_start = f"{par_id}/"
+        new_line = f"{par_id}/{new_hash}"
+        lines = [
+            new_line if line.startswith(old_line_start) or line == par_id else line
+            for line in self.get_version_lines(old_ver)
+        ]
         new_ver = self.__increment_version(
             "Modified",
             par_id,
             increment_major=False,
+            lines=lines,
             op_params={"old_hash": old_hash, "new_hash": new_hash},
         )
-
-        old_line_start = f"{par_id}/"
-        old_line_legacy = f"{par_id}\n"
-        new_line = f"{par_id}/{new_hash}\n"
-        with self.get_version_path(old_ver).open("r") as f_src, self.get_version_path(
-            new_ver
-        ).open("w") as f:
-            while True:
-                line = f_src.readline()
-                if not line:
-                    break
-                if line.startswith(old_line_start) or line == old_line_legacy:
-                    f.write(new_line)
-                else:
-                    f.write(line)
         self.__update_metadata([p], old_ver, new_ver)
         return p
 
@@ -893,75 +911,39 @@ class Document:
         old_ids = [par.get_id() for par in old_pars]
         new_ids = [par["id"] for par in new_pars]
         s = SequenceMatcher(None, old_ids, new_ids)
-        opcodes = s.get_opcodes()
-        result = DocumentEditResult()
-        # Do delete operations first to avoid duplicate ids
-        for tag, i1, i2, j1, j2 in [
-            opcode for opcode in opcodes if opcode[0] in ["delete", "replace"]
-        ]:
-            for par, par_id in zip(old_pars[i1:i2], old_ids[i1:i2]):
-                self.delete_paragraph(par_id)
-                result.deleted.append(par)
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == "replace":
-                for par in new_pars[j1:j2]:
-                    before_i = self.find_insert_index(i2, old_ids)
-                    inserted = self.insert_paragraph(
-                        par["md"],
-                        attrs=par.get("attrs"),
-                        par_id=par["id"],
-                        insert_before_id=old_ids[before_i]
-                        if before_i < len(old_ids)
-                        else last_par_id,
-                    )
-                    result.added.append(inserted)
-            elif tag == "insert":
-                for par in new_pars[j1:j2]:
-                    before_i = self.find_insert_index(i2, old_ids)
-                    inserted = self.insert_paragraph(
-                        par["md"],
-                        attrs=par.get("attrs"),
-                        par_id=par["id"],
-                        insert_before_id=old_ids[before_i]
-                        if before_i < len(old_ids)
-                        else last_par_id,
-                    )
-                    result.added.append(inserted)
-            elif tag == "equal":
-                for idx, (new_par, old_par) in enumerate(
-                    zip(new_pars[j1:j2], old_pars[i1:i2])
-                ):
-                    if (
-                        new_par["t"] != old_par.get_hash()
-                        or new_par.get("attrs", {}) != old_par.get_attrs()
-                    ):
-                        if self.has_paragraph(old_par.get_id()):
-                            self.modify_paragraph(
-                                old_par.get_id(),
-                                new_par["md"],
-                                new_attrs=new_par.get("attrs"),
-                            )
-                            result.changed.append(old_par)
-                        else:
-                            before_i = self.find_insert_index(j1 + idx, new_ids)
-                            inserted = self.insert_paragraph(
-                                new_par["md"],
-                                attrs=new_par.get("attrs"),
-                                par_id=new_par["id"],
-                                insert_before_id=old_ids[before_i]
-                                if before_i < len(old_ids)
-                                else last_par_id,
-                            )
-                            result.added.append(inserted)
+        tx = self.edit_transaction()
+        tx.apply_opcodes(s.get_opcodes(), new_pars, old_pars, last_par_id=last_par_id)
+        result = tx.commit()
         if not new_ids:
             return None, None, result
         return new_ids[0], new_ids[-1], result
 
-    def find_insert_index(self, i2, old_ids):
-        before_i = i2
-        while before_i < len(old_ids) and not self.has_paragraph(old_ids[before_i]):
-            before_i += 1
-        return before_i
+    def edit_transaction(self) -> DocumentEditTransaction:
+        """Returns a transaction that can be used to make multiple paragraph changes
+        so that they are saved as a single document version."""
+        return DocumentEditTransaction(self)
+
+    def _commit_edit_transaction(self, tx: DocumentEditTransaction) -> Version:
+        ops = tx.operations
+        if len(ops) == 1:
+            op, par_id, op_params = ops[0]
+        else:
+            op, par_id = OperationType.Edit, ops[0][1]
+            op_params = {
+                "added": [p.get_id() for p in tx.result.added],
+                "deleted": [p.get_id() for p in tx.result.deleted],
+                "changed": [p.get_id() for p in tx.result.changed],
+            }
+        old_ver = self.get_version()
+        new_ver = self.__increment_version(
+            op.value,
+            par_id,
+            increment_major=any(o != OperationType.Modify for o, _, _ in ops),
+            lines=tx.get_version_lines(),
+            op_params=op_params,
+        )
+        self.__update_metadata(tx.stored_pars, old_ver, new_ver)
+        return new_ver
 
     def get_index(self, view_ctx: ViewContext) -> list[tuple]:
         pars = [par for par in DocParagraphIter(self)]
@@ -976,33 +958,43 @@ class Document:
         ]
         return get_index_from_html_list(html_list)
 
-    def get_changelog(self, max_entries: int = 100) -> Changelog:
-        log = Changelog()
-        logname = self.getlogfilename()
-        if not logname.is_file():
-            return Changelog()
+    def get_changelog(
+        self, max_entries: int = 100, par_ids: set[str] | None = None
+    ) -> Changelog:
+        """Returns the latest changelog entries of the document, newest first.
 
+        :param max_entries: The maximum number of entries to read, or -1 for all entries.
+        :param par_ids: If given, only the entries that affect these paragraphs are returned. Reading stops
+         when the entry that created each of the paragraphs has been reached. Lines that do not mention any of
+         the paragraphs are skipped without decoding them.
+        """
+        log = Changelog()
+        remaining = set(par_ids) if par_ids is not None else None
         lc = max_entries
-        with logname.open("r") as f:
-            while lc != 0:
-                line = f.readline()
-                if not line:
-                    break
-                try:
-                    entry = json.loads(line)
-                    log.append(ChangelogEntry(**entry))
-                except ValueError:
-                    print(f"doc id {self.doc_id}: malformed log line: {line}")
-                lc -= 1
-
+        for line in self.__read_changelog_lines():
+            if lc == 0 or remaining is not None and not remaining:
+                break
+            lc -= 1
+            if par_ids is not None and not line_mentions_any(line, par_ids):
+                continue
+            try:
+                entry = json.loads(line)
+                if remaining is not None:
+                    affected = get_entry_par_ids(entry)
+                    if not any(p in par_ids for p in affected):
+                        continue
+                    remaining.difference_update(get_entry_created_par_ids(entry))
+                log.append(ChangelogEntry(**entry))
+            except ValueError:
+                print(f"doc id {self.doc_id}: malformed log line: {line}")
         return log
 
     def delete_section(self, area_start, area_end) -> DocumentEditResult:
-        result = DocumentEditResult()
+        tx = self.edit_transaction()
         for par in self.get_section(area_start, area_end):
-            self.delete_paragraph(par.get_id())
-            result.deleted.append(par)
-        return result
+            tx.delete_paragraph(par.get_id())
+            tx.result.deleted.append(par)
+        return tx.commit()
 
     def get_named_section(self, section_name: str) -> list[DocParagraph]:
         if self.preload_option == PreloadOption.all:
@@ -1163,20 +1155,14 @@ class Document:
     def _load_par_ids(self):
         self.par_ids = []
         self.par_hashes = []
-        if not self.get_version_path().exists():
-            return
-        with self.get_version_path().open("r", encoding="UTF-8") as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                if len(line) > 14:
-                    # Line contains both par_id and t
-                    par_id, t = line.replace("\n", "").split("/")
-                else:
-                    par_id, t = line.replace("\n", ""), None
-                self.par_ids.append(par_id)
-                self.par_hashes.append(t)
+        for line in self.get_version_lines():
+            if len(line) > 13:
+                # Line contains both par_id and t
+                par_id, t = line.split("/")
+            else:
+                par_id, t = line, None
+            self.par_ids.append(par_id)
+            self.par_hashes.append(t)
 
     def insert_preamble_pars(self, class_names: list[str] | None = None):
         """
@@ -1312,9 +1298,32 @@ class CacheIterator:
 class DocParagraphIter:
     def __init__(self, doc: Document):
         self.doc = doc
-        self.next_index = 0
-        name = doc.get_version_path(doc.get_version())
-        self.f = name.open("r") if name.is_file() else None
+        self.lines: Iterator[str] = iter(doc.get_version_lines(doc.get_version()))
+        self.packed: Iterator[DocParagraph] | None = None
+        store = doc.get_par_store()
+        if store is not None:
+            self.packed = iter(self.__read_packed(store))
+
+    def __read_packed(self, store: PackedParStore) -> list[DocParagraph]:
+        """Reads all the paragraphs of the version at once from the packed store."""
+        keys = []
+        for line in self.lines:
+            if len(line) > 13:
+                par_id, t = line.split("/")
+            else:
+                par_id = line
+                t = store.get_current(par_id)
+            keys.append((par_id, t))
+        cache = self.doc.single_par_cache
+        missing = [k for k in keys if k[0] not in cache]
+        for (par_id, t), d in zip(missing, store.read_many(missing)):
+            if d is not None:
+                cache[par_id] = DocParagraph.from_dict(self.doc, d)
+            elif t is not None:
+                cache[par_id] = DocParagraph.get(self.doc, par_id, t)
+            else:
+                cache[par_id] = DocParagraph.get_latest(self.doc, par_id)
+        return [cache[par_id] for par_id, _ in keys]
 
     def __enter__(self):
         return self
@@ -1326,31 +1335,25 @@ class DocParagraphIter:
         return self
 
     def __next__(self) -> DocParagraph:
-        if not self.f:
-            raise StopIteration
-        while True:
-            line = self.f.readline()
-            if not line:
-                self.close()
-                raise StopIteration
-            if line != "\n":
-                if len(line) > 14:
-                    # Line contains both par_id and t
-                    par_id, t = line.rstrip("\n").split("/")
-                    cached = self.doc.single_par_cache.get(par_id)
-                    if cached:
-                        return cached
-                    fetched = DocParagraph.get(self.doc, par_id, t)
-                    self.doc.single_par_cache[par_id] = fetched
-                    return fetched
-                else:
-                    # Line contains just par_id, use the latest t
-                    return DocParagraph.get_latest(self.doc, line.rstrip("\n"))
+        if self.packed is not None:
+            return next(self.packed)
+        line = next(self.lines)
+        if len(line) > 13:
+            # Line contains both par_id and t
+            par_id, t = line.split("/")
+            cached = self.doc.single_par_cache.get(par_id)
+            if cached:
+                return cached
+            fetched = DocParagraph.get(self.doc, par_id, t)
+            self.doc.single_par_cache[par_id] = fetched
+            return fetched
+        else:
+            # Line contains just par_id, use the latest t
+            return DocParagraph.get_latest(self.doc, line)
 
     def close(self):
-        if self.f:
-            self.f.close()
-            self.f = None
+        self.lines = iter(())
+        self.packed = None if self.packed is None else iter(())
 
 
 def get_index_from_html_list(html_table) -> list[tuple]:
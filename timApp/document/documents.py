@@ -11,6 +11,7 @@ from timApp.document.translation.translation import Translation
 from timApp.document.yamlblock import YamlBlock
 from timApp.item.block import Block, BlockType
 from timApp.note.usernote import UserNote
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.user.usergroup import UserGroup
 
@@ -59,6 +60,7 @@ def delete_document(document_id: int):
     BlockAccess.query.filter_by(block_id=document_id).delete()
     Block.query.filter_by(type_id=BlockType.Document.value, id=document_id).delete()
     ReadParagraph.query.filter_by(doc_id=document_id).delete()
+    LatestReadParagraph.query.filter_by(doc_id=document_id).delete()
     UserNote.query.filter_by(doc_id=document_id).delete()
     Translation.query.filter(
         (Translation.doc_id == document_id) | (Translation.src_docid == document_id)
@@ -28,15 +28,11 @@ class DocumentVersion(Document):
     def cache_index(self):
         if self.index is None:
             self.index = {}
-            with open(self.get_version_path(self.version)) as f:
-                while True:
-                    line = f.readline()
-                    if line == "":
-                        self.indexlen = len(self.index)
-                        return
-                    entry = line.rstrip("\n").split("/")
-                    if len(entry) > 1:
-                        self.index[entry[0]] = entry[1]
+            for line in self.get_version_lines(self.version):
+                entry = line.split("/")
+                if len(entry) > 1:
+                    self.index[entry[0]] = entry[1]
+            self.indexlen = len(self.index)
 
     def __len__(self) -> int:
         self.cache_index()
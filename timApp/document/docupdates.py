@@ -0,0 +1,278 @@
+"""Notifications of new document versions for the live updates of open views.
+
+Every new version of a document (see :meth:`Document.__increment_version`) is published to the Redis channel of the
+document. Each TIM process listens to the channels of all documents with a single Redis connection
+(see :class:`DocUpdateHub`) and forwards the new versions to the event streams of the views that are open in the
+process. The views then fetch the changes with /getParDiff.
+
+Because all views of a document ask for the same version pairs, the paragraph diffs are computed once per process
+and memoized (see :func:`get_par_diff`); only the user-specific post-processing is done for every view.
+The memo holds only plain paragraph data; every request gets paragraph objects of its own because post-processing
+modifies them (e.g. with the answers of the user).
+
+If Redis is unavailable, the event streams only send heartbeats, and the views fall back to polling.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from typing import Callable, Iterator, TYPE_CHECKING
+
+from timApp.document.version import Version, ver_to_str
+from timApp.util.logger import log_warning
+
+if TYPE_CHECKING:
+    from timApp.document.docparagraph import DocParagraph
+    from timApp.document.document import Document
+    from timApp.document.viewcontext import ViewContext
+
+CHANNEL_PREFIX = "tim-doc-"
+
+
+def publish_doc_version(doc_id: int, version: Version) -> None:
+    """Publishes a new version of the document."""
+    from timApp.document.caching import rclient
+
+    try:
+        rclient.publish(f"{CHANNEL_PREFIX}{doc_id}", ver_to_str(version))
+    except Exception as e:
+        log_warning(f"Could not publish version {version} of document {doc_id}: {e}")
+
+
+def parse_version(data: str) -> Version:
+    major, minor = data.split(",")
+    return int(major), int(minor)
+
+
+@dataclass
+class DocChannel:
+    version: Version = (0, 0)
+    watchers: int = 0
+    changed: Condition = field(default_factory=Condition)
+
+
+class DocUpdateHub:
+    """Dispatches the new document versions received by this process to the open event streams.
+
+    Only the documents that have open streams in this process are tracked. A stream first starts watching the
+    document with :meth:`watch`, then reads the current version of the document, and finally waits for newer
+    versions with :meth:`wait`. This way no version that is published during the read is missed.
+    """
+
+    def __init__(self) -> None:
+        self.channels: dict[int, DocChannel] = {}
+        self.lock = Lock()
+
+    def watch(self, doc_id: int) -> None:
+        with self.lock:
+            c = self.channels.get(doc_id)
+            if c is None:
+                c = DocChannel()
+                self.channels[doc_id] = c
+            c.watchers += 1
+
+    def unwatch(self, doc_id: int) -> None:
+        with self.lock:
+            c = self.channels[doc_id]
+            c.watchers -= 1
+            if c.watchers == 0:
+                del self.channels[doc_id]
+
+    def dispatch(self, doc_id: int, version: Version) -> None:
+        with self.lock:
+            c = self.channels.get(doc_id)
+        if c is None:
+            return
+        with c.changed:
+            # Versions from different processes may arrive out of order.
+            if version > c.version:
+                c.version = version
+                c.changed.notify_all()
+
+    def wait(self, doc_id: int, version: Version, timeout: float) -> Version:
+        """Waits until the document has a version newer than the given one or the timeout expires.
+
+        :return: The newest version known to the hub (not newer than version if the wait timed out).
+        """
+        c = self.channels[doc_id]
+        with c.changed:
+            c.changed.wait_for(lambda: c.version > version, timeout)
+            return c.version
+
+    def listen(self, subscribe: Callable[[], Iterator[tuple[int, Version]]]) -> None:
+        """Dispatches the versions from the subscription forever, re-subscribing if the subscription fails."""
+        while True:
+            try:
+                for doc_id, version in subscribe():
+                    self.dispatch(doc_id, version)
+            except Exception as e:
+                log_warning(f"Document update subscription failed: {e}")
+            time.sleep(5)
+
+
+def subscribe_redis() -> Iterator[tuple[int, Version]]:
+    from timApp.document.caching import rclient
+
+    pubsub = rclient.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+    try:
+        # PubSub.listen is not annotated in the Redis stubs.
+        for message in pubsub.listen():  # type: ignore[no-untyped-call]
+            if message["type"] != "pmessage":
+                continue
+            channel = message["channel"].decode()
+            yield int(channel[len(CHANNEL_PREFIX) :]), parse_version(
+                message["data"].decode()
+            )
+    finally:
+        pubsub.close()
+
+
+_hub: DocUpdateHub | None = None
+_hub_lock = Lock()
+
+
+def get_doc_update_hub() -> DocUpdateHub:
+    """Returns the hub of this process, starting the Redis listener on first use."""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = DocUpdateHub()
+            Thread(target=_hub.listen, args=(subscribe_redis,), daemon=True).start()
+        return _hub
+
+
+DiffKey = tuple[int, Version, Version, "ViewContext"]
+
+
+@dataclass(frozen=True)
+class ParSnapshot:
+    """The data of a paragraph in a memoized diff."""
+
+    id: str
+    md: str
+    hash: str
+    attrs: dict[str, str]
+    html: str | None
+    html_sanitized: bool
+
+    @staticmethod
+    def of(par: DocParagraph) -> ParSnapshot:
+        return ParSnapshot(
+            id=par.get_id(),
+            md=par.get_markdown(),
+            hash=par.get_hash(),
+            attrs=dict(par.get_attrs()),
+            html=par.html,
+            html_sanitized=par.html_sanitized,
+        )
+
+    def to_par(self, doc: Document) -> DocParagraph:
+        from timApp.document.docparagraph import DocParagraph
+
+        par = DocParagraph.create(
+            doc,
+            par_id=self.id,
+            md=self.md,
+            par_hash=self.hash,
+            html=self.html,
+            attrs=dict(self.attrs),
+        )
+        par.html_sanitized = self.html_sanitized
+        return par
+
+
+class ParDiffCache:
+    """A memo of the paragraph diffs between two versions of a document.
+
+    The diffs are computed only once even if many requests ask for the same diff at the same time: the first one
+    computes it while the others wait for the result. The diffs of documents are immutable because versions are
+    never changed after they are written, so the memo only has to be bounded in size.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.diffs: OrderedDict[DiffKey, list[dict]] = OrderedDict()
+        self.pending: dict[DiffKey, Lock] = {}
+        self.lock = Lock()
+        self.computed = 0
+
+    def get(self, key: DiffKey, compute: Callable[[], list[dict]]) -> list[dict]:
+        while True:
+            with self.lock:
+                diff = self.diffs.get(key)
+                if diff is not None:
+                    self.diffs.move_to_end(key)
+                    return diff
+                pending = self.pending.get(key)
+                if pending is None:
+                    pending = Lock()
+                    pending.acquire()
+                    self.pending[key] = pending
+                    break
+            # Another request is computing the diff; wait for it and check the memo again.
+            with pending:
+                pass
+        try:
+            diff = compute()
+            with self.lock:
+                self.computed += 1
+                self.diffs[key] = diff
+                while len(self.diffs) > self.max_size:
+                    self.diffs.popitem(last=False)
+            return diff
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.release()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.diffs.clear()
+
+
+_diff_cache: ParDiffCache | None = None
+
+
+def get_par_diff_cache() -> ParDiffCache:
+    global _diff_cache
+    if _diff_cache is None:
+        from timApp.tim_app import app
+
+        _diff_cache = ParDiffCache(app.config["DOC_DIFF_CACHE_SIZE"])
+    return _diff_cache
+
+
+def compute_par_diff(
+    d: Document, from_version: Version, view_ctx: ViewContext
+) -> list[dict]:
+    """Computes the diff with the paragraphs replaced by :class:`ParSnapshot` objects."""
+    return [
+        {**diff, "content": tuple(ParSnapshot.of(p) for p in diff["content"])}
+        if "content" in diff
+        else diff
+        for diff in d.get_doc_version(from_version).parwise_diff(d, view_ctx)
+    ]
+
+
+def get_par_diff(
+    d: Document, from_version: Version, view_ctx: ViewContext
+) -> list[dict]:
+    """Returns the paragraph diff from the given version to the current version of the document.
+
+    The paragraphs in the result are new objects that belong to d, so they can be post-processed for the current user;
+    see :meth:`Document.parwise_diff` for the format of the result.
+    """
+    to_version = d.get_version()
+    diffs = get_par_diff_cache().get(
+        (d.doc_id, from_version, to_version, view_ctx),
+        lambda: compute_par_diff(d, from_version, view_ctx),
+    )
+    return [
+        {**diff, "content": [p.to_par(d) for p in diff["content"]]}
+        if "content" in diff
+        else dict(diff)
+        for diff in diffs
+    ]
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from timApp.document.changelogentry import OperationType
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.editing.documenteditresult import DocumentEditResult
+from timApp.timdb.exceptions import TimDbException
+
+if TYPE_CHECKING:
+    from timApp.document.document import Document
+
+
+class DocumentEditTransaction:
+    """Applies multiple paragraph operations to a document in memory and writes them as a single
+    document version with a single changelog entry.
+
+    The paragraph files themselves are stored as the operations are applied, but the paragraph list
+    of the document is only written on :meth:`commit`.
+
+    The paragraph list is kept as a linked list over the paragraph ids, so that every operation takes
+    constant time regardless of the document size. Paragraph ids are unique within a document.
+    """
+
+    def __init__(self, doc: Document):
+        doc.ensure_par_ids_loaded()
+        assert doc.par_ids is not None and doc.par_hashes is not None
+        self.doc = doc
+        self.par_hashes: dict[str, str | None] = dict(zip(doc.par_ids, doc.par_hashes))
+        self.next_ids: dict[str, str | None] = {}
+        self.prev_ids: dict[str, str | None] = {}
+        self.first_id: str | None = None
+        self.last_id: str | None = None
+        for par_id in doc.par_ids:
+            self._link_before(par_id, None)
+        self.result = DocumentEditResult()
+        # Operations in the same format as they are in the changelog: (operation, par_id, op_params).
+        self.operations: list[tuple[OperationType, str, dict | None]] = []
+        # Added or modified paragraphs; these are needed for updating the reference list.
+        self.stored_pars: list[DocParagraph] = []
+        self.committed = False
+
+    def has_paragraph(self, par_id: str) -> bool:
+        return par_id in self.par_hashes
+
+    def _check_exists(self, par_id: str) -> None:
+        if par_id not in self.par_hashes:
+            raise TimDbException(self.doc.get_par_not_found_msg(par_id))
+
+    def _link_before(self, par_id: str, before_id: str | None) -> None:
+        """Links the paragraph to the list before the given paragraph, or to the end if before_id is None."""
+        prev_id = self.prev_ids[before_id] if before_id is not None else self.last_id
+        self.prev_ids[par_id] = prev_id
+        self.next_ids[par_id] = before_id
+        if prev_id is None:
+            self.first_id = par_id
+        else:
+            self.next_ids[prev_id] = par_id
+        if before_id is None:
+            self.last_id = par_id
+        else:
+            self.prev_ids[before_id] = par_id
+
+    def _unlink(self, par_id: str) -> None:
+        prev_id = self.prev_ids.pop(par_id)
+        next_id = self.next_ids.pop(par_id)
+        if prev_id is None:
+            self.first_id = next_id
+        else:
+            self.next_ids[prev_id] = next_id
+        if next_id is None:
+            self.last_id = prev_id
+        else:
+            self.prev_ids[next_id] = prev_id
+
+    def get_par_ids(self) -> list[str]:
+        """Returns the paragraph ids in document order."""
+        ids = []
+        par_id = self.first_id
+        while par_id is not None:
+            ids.append(par_id)
+            par_id = self.next_ids[par_id]
+        return ids
+
+    def delete_paragraph(self, par_id: str) -> None:
+        self._check_exists(par_id)
+        self._unlink(par_id)
+        del self.par_hashes[par_id]
+        self.operations.append((OperationType.Delete, par_id, None))
+
+    def insert_paragraph(
+        self,
+        text: str,
+        insert_before_id: str | None = None,
+        attrs: dict | None = None,
+        par_id: str | None = None,
+    ) -> DocParagraph:
+        """Inserts a new paragraph before the given paragraph, or appends it if insert_before_id is None."""
+        p = DocParagraph.create(doc=self.doc, par_id=par_id, md=text, attrs=attrs)
+        return self.insert_paragraph_obj(p, insert_before_id=insert_before_id)
+
+    def insert_paragraph_obj(
+        self, p: DocParagraph, insert_before_id: str | None = None
+    ) -> DocParagraph:
+        assert p.doc.doc_id == self.doc.doc_id
+        if p.get_id() in self.par_hashes:
+            raise TimDbException(
+                f"Paragraph {p.get_id()} already exists in the document"
+            )
+        p.store()
+        p.set_latest()
+        if insert_before_id and insert_before_id in self.par_hashes:
+            self.operations.append(
+                (OperationType.Insert, p.get_id(), {"before_id": insert_before_id})
+            )
+        else:
+            insert_before_id = None
+            self.operations.append((OperationType.Add, p.get_id(), None))
+        self._link_before(p.get_id(), insert_before_id)
+        self.par_hashes[p.get_id()] = p.get_hash()
+        self.stored_pars.append(p)
+        return p
+
+    def modify_paragraph(
+        self, par_id: str, new_text: str, new_attrs: dict | None = None
+    ) -> DocParagraph:
+        self._check_exists(par_id)
+        if new_attrs is None:
+            new_attrs = self.doc.get_paragraph(par_id).get_attrs()
+        p = DocParagraph.create(
+            md=new_text, doc=self.doc, par_id=par_id, attrs=new_attrs
+        )
+        old_hash = self.par_hashes[par_id]
+        if old_hash is None:
+            old_hash = DocParagraph.get_latest(self.doc, par_id).get_hash()
+        p.store()
+        p.set_latest()
+        if p.get_hash() == old_hash:
+            return p
+        self.par_hashes[par_id] = p.get_hash()
+        self.operations.append(
+            (
+                OperationType.Modify,
+                par_id,
+                {"old_hash": old_hash, "new_hash": p.get_hash()},
+            )
+        )
+        self.stored_pars.append(p)
+        return p
+
+    def find_insert_index(self, i2: int, ids: list[str]) -> int:
+        before_i = i2
+        while before_i < len(ids) and not self.has_paragraph(ids[before_i]):
+            before_i += 1
+        return before_i
+
+    def apply_opcodes(
+        self,
+        opcodes: list[tuple[str, int, int, int, int]],
+        new_pars: list[dict],
+        old_pars: list[DocParagraph],
+        last_par_id: str | None = None,
+    ) -> None:
+        """Applies a SequenceMatcher opcode list that transforms old_pars into new_pars.
+
+        :param opcodes: The opcodes from SequenceMatcher(None, old_ids, new_ids).get_opcodes().
+        :param new_pars: The new paragraphs as dicts (as returned by DocumentParser.get_blocks).
+        :param old_pars: The old paragraphs.
+        :param last_par_id: The id of the paragraph before which the paragraphs at the end of old_pars should be
+         inserted, or None if they should be appended to the document.
+        """
+        result = self.result
+        old_ids = [par.get_id() for par in old_pars]
+        new_ids = [par["id"] for par in new_pars]
+        # Do delete operations first to avoid duplicate ids
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag in ("delete", "replace"):
+                for par, par_id in zip(old_pars[i1:i2], old_ids[i1:i2]):
+                    self.delete_paragraph(par_id)
+                    result.deleted.append(par)
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag in ("replace", "insert"):
+                for new_par in new_pars[j1:j2]:
+                    before_i = self.find_insert_index(i2, old_ids)
+                    inserted = self.insert_paragraph(
+                        new_par["md"],
+                        attrs=new_par.get("attrs"),
+                        par_id=new_par["id"],
+                        insert_before_id=old_ids[before_i]
+                        if before_i < len(old_ids)
+                        else last_par_id,
+                    )
+                    result.added.append(inserted)
+            elif tag == "equal":
+                for idx, (new_par, old_par) in enumerate(
+                    zip(new_pars[j1:j2], old_pars[i1:i2])
+                ):
+                    if (
+                        new_par["t"] != old_par.get_hash()
+                        or new_par.get("attrs", {}) != old_par.get_attrs()
+                    ):
+                        if self.has_paragraph(old_par.get_id()):
+                            self.modify_paragraph(
+                                old_par.get_id(),
+                                new_par["md"],
+                                new_attrs=new_par.get("attrs"),
+                            )
+                            result.changed.append(old_par)
+                        else:
+                            before_i = self.find_insert_index(j1 + idx, new_ids)
+                            inserted = self.insert_paragraph(
+                                new_par["md"],
+                                attrs=new_par.get("attrs"),
+                                par_id=new_par["id"],
+                                insert_before_id=old_ids[before_i]
+                                if before_i < len(old_ids)
+                                else last_par_id,
+                            )
+                            result.added.append(inserted)
+
+    def get_version_lines(self) -> list[str]:
+        lines = []
+        for par_id in self.get_par_ids():
+            t = self.par_hashes[par_id]
+            lines.append(f"{par_id}/{t}" if t is not None else par_id)
+        return lines
+
+    def commit(self) -> DocumentEditResult:
+        """Writes the new document version and changelog entry.
+
+        If no operation changed the document, no new version is created.
+        """
+        if self.committed:
+            raise TimDbException("Transaction has already been committed")
+        self.committed = True
+        if self.operations:
+            self.doc._commit_edit_transaction(self)
+        return self.result
@@ -0,0 +1,378 @@
+"""Packed paragraph storage.
+
+In the default layout, every paragraph revision is a separate JSON file in ``pars/<doc_id>/<par_id>/<hash>``
+and the latest revision is tracked by a ``current`` symlink. For large documents, loading the document
+therefore costs one ``open`` per paragraph.
+
+The packed layout stores all paragraph revisions of a document in a single append-only segment file
+(``pars/<doc_id>/pack.seg``, one JSON object per line). An accompanying append-only index file
+(``pars/<doc_id>/pack.idx``) maps (par_id, hash) to a byte range in the segment and records the latest
+revision of each paragraph. The index lines are of the form::
+
+    P <par_id> <hash> <offset> <length>
+    C <par_id> <hash>
+
+where ``P`` lines point to a stored revision and ``C`` lines update the latest revision of a paragraph.
+Later lines override earlier ones.
+
+Rewriting a revision (e.g. when its HTML cache changes) appends a new record and leaves the old one in the segment
+as a dead record. When the dead records take up more than PACKED_PAR_STORE_COMPACT_RATIO of the segment, the store
+is compacted: the live records are copied to a new segment and a new index is written whose first line is::
+
+    S <segment file name>
+
+The index is replaced atomically, so readers either see the old index and the old segment or the new ones. Readers
+notice the replacement from the changed inode of the index file.
+"""
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Generator
+
+from filelock import FileLock
+
+SEGMENT_FILE_NAME = "pack.seg"
+INDEX_FILE_NAME = "pack.idx"
+
+# Segments smaller than this are not compacted automatically.
+MIN_COMPACT_BYTES = 1024 * 1024
+
+# Byte ranges that are closer than this to each other are read with a single read call.
+MAX_READ_GAP = 64 * 1024
+
+ParKey = tuple[str, str]
+
+
+class PackedParStore:
+    """Stores all paragraph revisions of a single document in one segment file."""
+
+    def __init__(self, path: Path, doc_id: int, compact_ratio: float | None = None):
+        """
+        :param path: The paragraph directory of the document.
+        :param doc_id: The document id.
+        :param compact_ratio: The store is compacted after a write when the share of dead records is larger than
+         this; None to never compact automatically.
+        """
+        self.path = path
+        self.doc_id = doc_id
+        self.compact_ratio = compact_ratio
+        self.segment_path = path / SEGMENT_FILE_NAME
+        self.index_path = path / INDEX_FILE_NAME
+        self.entries: dict[ParKey, tuple[int, int]] = {}
+        self.current: dict[str, str] = {}
+        # How many bytes of the index file have been read into memory.
+        self.index_pos = 0
+        # The inode of the index file that has been read; it changes when the store is compacted.
+        self.index_ino: int | None = None
+        # Total size of the records in the segment that have been superseded by a later record with the same key.
+        self.dead_bytes = 0
+
+    def __repr__(self) -> str:
+        return f"PackedParStore(doc_id={self.doc_id})"
+
+    def exists(self) -> bool:
+        return self.index_path.is_file()
+
+    def get_lock(self) -> FileLock:
+        return FileLock(f"/tmp/parstore_{self.doc_id}_lock")
+
+    def _reset(self) -> None:
+        self.entries = {}
+        self.current = {}
+        self.index_pos = 0
+        self.index_ino = None
+        self.dead_bytes = 0
+        self.segment_path = self.path / SEGMENT_FILE_NAME
+
+    def refresh_index(self) -> None:
+        """Reads the part of the index file that has been appended since the last refresh."""
+        try:
+            st = self.index_path.stat()
+        except FileNotFoundError:
+            self._reset()
+            return
+        if st.st_ino == self.index_ino and st.st_size == self.index_pos:
+            return
+        with self.index_path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self.index_ino or st.st_size < self.index_pos:
+                # The store was compacted, or removed and recreated by someone else.
+                self._reset()
+                self.index_ino = st.st_ino
+            f.seek(self.index_pos)
+            data = f.read()
+        # A concurrent writer may be in the middle of a line; only consume complete lines.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode().splitlines():
+            self._apply_index_line(line)
+        self.index_pos += end
+
+    def _apply_index_line(self, line: str) -> None:
+        parts = line.split(" ")
+        if parts[0] == "P" and len(parts) == 5:
+            old = self.entries.get((parts[1], parts[2]))
+            if old is not None:
+                self.dead_bytes += old[1]
+            self.entries[(parts[1], parts[2])] = int(parts[3]), int(parts[4])
+        elif parts[0] == "C" and len(parts) == 3:
+            self.current[parts[1]] = parts[2]
+        elif parts[0] == "S" and len(parts) == 2:
+            self.segment_path = self.path / parts[1]
+
+    def _locate(self, par_id: str, t: str) -> tuple[int, int] | None:
+        loc = self.entries.get((par_id, t))
+        if loc is None:
+            self.refresh_index()
+            loc = self.entries.get((par_id, t))
+        return loc
+
+    def has(self, par_id: str, t: str) -> bool:
+        return self._locate(par_id, t) is not None
+
+    def read(self, par_id: str, t: str) -> dict | None:
+        """Reads a single paragraph revision.
+
+        :return: The paragraph data, or None if the revision is not in the store.
+        """
+        loc = self._locate(par_id, t)
+        if loc is None:
+            return None
+        offset, length = loc
+        try:
+            f = self.segment_path.open("rb")
+        except FileNotFoundError:
+            # The store was compacted after the index was read.
+            self.refresh_index()
+            return self.read_many([(par_id, t)])[0]
+        with f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def read_many(self, keys: list[ParKey]) -> list[dict | None]:
+        """Reads multiple paragraph revisions with as few reads as possible.
+
+        The byte ranges are sorted and nearby ranges are coalesced, so reading a whole document version
+        usually results in a few large sequential reads.
+
+        :param keys: The (par_id, hash) pairs to read.
+        :return: The paragraph data in the same order as the keys; None for revisions not in the store.
+        """
+        self.refresh_index()
+        try:
+            return self._read_many(keys)
+        except FileNotFoundError:
+            # The store was compacted after the index was read.
+            self.refresh_index()
+            return self._read_many(keys)
+
+    def _read_many(self, keys: list[ParKey]) -> list[dict | None]:
+        result: list[dict | None] = [None] * len(keys)
+        if not keys:
+            return result
+        located = []
+        for i, k in enumerate(keys):
+            loc = self.entries.get(k)
+            if loc is not None:
+                located.append((loc[0], loc[1], i))
+        if not located:
+            return result
+        located.sort()
+        with self.segment_path.open("rb") as f:
+            start = 0
+            while start < len(located):
+                end = start + 1
+                range_end = located[start][0] + located[start][1]
+                while (
+                    end < len(located) and located[end][0] - range_end <= MAX_READ_GAP
+                ):
+                    range_end = max(range_end, located[end][0] + located[end][1])
+                    end += 1
+                base = located[start][0]
+                f.seek(base)
+                chunk = f.read(range_end - base)
+                for offset, length, i in located[start:end]:
+                    result[i] = json.loads(
+                        chunk[offset - base : offset - base + length]
+                    )
+                start = end
+        return result
+
+    def write(self, par_id: str, t: str, data: dict) -> None:
+        """Appends a paragraph revision to the store."""
+        self.write_many([(par_id, t, data)])
+
+    def write_many(self, records: Iterable[tuple[str, str, dict]]) -> None:
+        """Appends multiple paragraph revisions to the store with a single lock acquisition."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self.get_lock():
+            # Another process may have compacted the store.
+            self.refresh_index()
+            index_lines = []
+            with self.segment_path.open("ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                for par_id, t, data in records:
+                    payload = (json.dumps(data) + "\n").encode()
+                    f.write(payload)
+                    index_lines.append(f"P {par_id} {t} {offset} {len(payload)}\n")
+                    offset += len(payload)
+            # The segment must be written before the index so that readers never see dangling entries.
+            self._append_index(index_lines)
+            if self.compact_ratio is not None and self.should_compact(
+                self.compact_ratio
+            ):
+                self._compact()
+
+    def get_current(self, par_id: str) -> str | None:
+        """Returns the hash of the latest revision of the given paragraph."""
+        # The latest revision may have been changed by another process, so always check for new index entries.
+        # This costs only a stat call if nothing has changed.
+        self.refresh_index()
+        return self.current.get(par_id)
+
+    def set_current(self, par_id: str, t: str) -> None:
+        """Marks the given revision as the latest one of the paragraph."""
+        self.refresh_index()
+        if self.current.get(par_id) == t:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self.get_lock():
+            self._append_index([f"C {par_id} {t}\n"])
+
+    def set_current_many(self, currents: Iterable[tuple[str, str]]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self.get_lock():
+            self._append_index([f"C {par_id} {t}\n" for par_id, t in currents])
+
+    def _append_index(self, lines: list[str]) -> None:
+        if not lines:
+            return
+        with self.index_path.open("a") as f:
+            f.write("".join(lines))
+        self.refresh_index()
+
+    def get_segment_size(self) -> int:
+        try:
+            return self.segment_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def get_dead_ratio(self) -> float:
+        """Returns the share of the segment that is taken by superseded records."""
+        self.refresh_index()
+        size = self.get_segment_size()
+        return self.dead_bytes / size if size else 0.0
+
+    def should_compact(
+        self, min_dead_ratio: float, min_bytes: int | None = None
+    ) -> bool:
+        """Returns whether the store is worth compacting.
+
+        :param min_dead_ratio: The share of dead records must be larger than this.
+        :param min_bytes: The segment must be at least this large; by default MIN_COMPACT_BYTES.
+        """
+        if min_bytes is None:
+            min_bytes = MIN_COMPACT_BYTES
+        return (
+            self.get_segment_size() >= min_bytes
+            and self.get_dead_ratio() > min_dead_ratio
+        )
+
+    def compact(self) -> int:
+        """Rewrites the segment without the superseded records.
+
+        :return: The number of bytes freed.
+        """
+        if not self.exists():
+            return 0
+        with self.get_lock():
+            return self._compact()
+
+    def _compact(self) -> int:
+        # The lock must be held.
+        self.refresh_index()
+        old_segment = self.segment_path
+        old_size = self.get_segment_size()
+        new_name = f"pack.{uuid.uuid4().hex}.seg"
+        new_segment = self.path / new_name
+        index_lines = [f"S {new_name}\n"]
+        keys = sorted(self.entries, key=lambda k: self.entries[k][0])
+        with new_segment.open("wb") as out:
+            offset = 0
+            for k, data in zip(keys, self._read_raw(keys)):
+                out.write(data)
+                index_lines.append(f"P {k[0]} {k[1]} {offset} {len(data)}\n")
+                offset += len(data)
+        index_lines.extend(f"C {par_id} {t}\n" for par_id, t in self.current.items())
+        tmp_index = self.path / f"{INDEX_FILE_NAME}.tmp"
+        with tmp_index.open("w") as f:
+            f.write("".join(index_lines))
+        os.replace(tmp_index, self.index_path)
+        # Readers that still use the old index retry after failing to open the old segment.
+        old_segment.unlink()
+        self.refresh_index()
+        return old_size - offset
+
+    def _read_raw(self, keys: list[ParKey]) -> Generator[bytes, None, None]:
+        """Yields the raw records of the keys, which must be sorted by their offsets."""
+        with self.segment_path.open("rb") as f:
+            for k in keys:
+                offset, length = self.entries[k]
+                f.seek(offset)
+                yield f.read(length)
+
+    def get_size(self) -> int:
+        """Returns the total size of the store files in bytes."""
+        size = 0
+        self.refresh_index()
+        for p in (self.segment_path, self.index_path):
+            if p.is_file():
+                size += p.stat().st_size
+        return size
+
+
+def get_compact_ratio() -> float:
+    from timApp.tim_app import app
+
+    return app.config["PACKED_PAR_STORE_COMPACT_RATIO"]
+
+
+def get_pars_dir(doc_id: int) -> Path:
+    from timApp.timdb.dbaccess import get_files_path
+
+    return get_files_path() / "pars" / str(doc_id)
+
+
+@lru_cache(maxsize=512)
+def _get_store(path: Path, doc_id: int) -> PackedParStore:
+    # The store objects are cached so that the in-memory index survives between requests;
+    # refresh_index takes care of reading entries written by other processes.
+    return PackedParStore(path, doc_id, get_compact_ratio())
+
+
+def get_par_store(doc_id: int) -> PackedParStore:
+    """Returns the (cached) packed store object of a document. The store does not necessarily exist on disk."""
+    return _get_store(get_pars_dir(doc_id), doc_id)
+
+
+def clear_par_store_cache() -> None:
+    _get_store.cache_clear()
+
+
+def resolve_par_store(doc_id: int) -> PackedParStore | None:
+    """Returns the packed store to use for the document, or None if the document uses the file-per-paragraph layout.
+
+    A document uses the packed layout if it has been migrated or if it was created while the PACKED_PAR_STORE
+    option was enabled.
+    """
+    from timApp.tim_app import app
+
+    store = get_par_store(doc_id)
+    if store.exists():
+        return store
+    if app.config["PACKED_PAR_STORE"] and not store.path.exists():
+        return store
+    return None
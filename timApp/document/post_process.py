@@ -24,13 +24,13 @@ from timApp.markdown.markdownconverter import expand_macros
 from timApp.note.notes import get_notes, UserNoteAndUser
 from timApp.plugin.plugin import Plugin
 from timApp.plugin.pluginControl import pluginify
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readings import (
     get_common_readings,
     get_read_expiry_condition,
     has_anything_read,
 )
 from timApp.readmark.readmarkcollection import ReadMarkCollection
-from timApp.readmark.readparagraph import ReadParagraph
 from timApp.user.user import User, has_no_higher_right
 from timApp.util.flask.responsehelper import flash_if_visible
 from timApp.util.timtiming import taketime
@@ -124,7 +124,9 @@ def post_process_pars(
 
     if settings.show_authors():
         hide_authors = view_ctx.hide_names_requested
-        authors = doc.get_changelog(-1).get_authorinfo(pars)
+        authors = doc.get_changelog(
+            -1, par_ids={p.get_id() for p in pars}
+        ).get_authorinfo(pars)
         if hide_authors:
             for ainfo in authors.values():
                 for a in ainfo.authors:
@@ -193,10 +195,13 @@ def post_process_pars(
             readings = []
         else:
             readings = get_common_readings(
-                usergroup_ids, doc, get_read_expiry_condition(settings.read_expiry())
+                usergroup_ids,
+                doc,
+                get_read_expiry_condition(settings.read_expiry(), LatestReadParagraph),
+                latest=True,
             )
         taketime("readings end")
-        for r in readings:  # type: ReadParagraph
+        for r in readings:  # type: LatestReadParagraph
             key = (r.par_id, r.doc_id)
             pars = pars_dict.get(key)
             if pars:
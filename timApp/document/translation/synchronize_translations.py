@@ -36,37 +36,25 @@ def synchronize_translations(doc: DocInfo, edit_result: DocumentEditResult):
                 tr_ids.append(tr_id)
             s = SequenceMatcher(None, tr_rps, orig_ids)
             opcodes = s.get_opcodes()
+            tx = tr_doc.edit_transaction()
             for tag, i1, i2, j1, j2 in [
                 opcode for opcode in opcodes if opcode[0] in ["delete", "replace"]
             ]:
                 for par_id in tr_ids[i1:i2]:
-                    tr_doc.delete_paragraph(par_id)
+                    tx.delete_paragraph(par_id)
             for tag, i1, i2, j1, j2 in opcodes:
-                if tag == "replace":
+                if tag in ("replace", "insert"):
                     for par_id in orig_ids[j1:j2]:
-                        before_i = tr_doc.find_insert_index(i2, tr_ids)
+                        before_i = tx.find_insert_index(i2, tr_ids)
                         tr_par = create_reference(
                             tr_doc, orig.doc_id, par_id, r="tr", add_rd=False
                         )
                         if orig.get_paragraph(par_id).is_setting():
                             tr_par.set_attr("settings", "")
-                        tr_doc.insert_paragraph_obj(
-                            tr_par,
-                            insert_before_id=tr_ids[before_i]
-                            if before_i < len(tr_ids)
-                            else None,
-                        )
-                elif tag == "insert":
-                    for par_id in orig_ids[j1:j2]:
-                        before_i = tr_doc.find_insert_index(i2, tr_ids)
-                        tr_par = create_reference(
-                            tr_doc, orig.doc_id, par_id, r="tr", add_rd=False
-                        )
-                        if orig.get_paragraph(par_id).is_setting():
-                            tr_par.set_attr("settings", "")
-                        tr_doc.insert_paragraph_obj(
+                        tx.insert_paragraph_obj(
                             tr_par,
                             insert_before_id=tr_ids[before_i]
                             if before_i < len(tr_ids)
                             else None,
                         )
+            tx.commit()
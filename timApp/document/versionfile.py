@@ -0,0 +1,206 @@
+"""Reading and writing of document version files.
+
+A document version file (``<doc_dir>/<major>/<minor>``) lists the paragraphs of the version as
+``<par_id>/<hash>`` lines. To save disk space, a version file may also be stored as a delta
+against an earlier version. A delta file starts with the header line::
+
+    #delta <base_major> <base_minor> <depth>
+
+where ``depth`` is the number of versions written since the base snapshot. The rest of the lines are either
+
+* ``=<start> <end>``: copy the lines ``start:end`` of the base version, or
+* ``+<line>``: a literal line.
+
+Deltas are always encoded against the latest full snapshot, so reconstructing any version requires reading
+at most two files. A new snapshot is written every :data:`SNAPSHOT_INTERVAL` versions or when the delta
+would not be much smaller than the full file.
+"""
+import os
+from difflib import SequenceMatcher
+from pathlib import Path
+from tempfile import mkstemp
+
+from timApp.document.version import Version
+
+DELTA_HEADER = "#delta"
+
+SNAPSHOT_INTERVAL = 50
+"""The maximum number of consecutive delta versions that are based on the same snapshot."""
+
+MAX_DELTA_RATIO = 0.5
+"""If a delta is larger than this fraction of the full version file, a snapshot is written instead."""
+
+
+def get_version_file_path(doc_dir: Path, ver: Version) -> Path:
+    return doc_dir / str(ver[0]) / str(ver[1])
+
+
+def parse_delta_header(line: str) -> tuple[Version, int] | None:
+    """Parses the header of a delta file.
+
+    :return: The base version and the depth of the delta, or None if the line is not a delta header.
+    """
+    if not line.startswith(DELTA_HEADER):
+        return None
+    _, major, minor, depth = line.split(" ")
+    return (int(major), int(minor)), int(depth)
+
+
+def _read_raw_lines(path: Path) -> list[str]:
+    with path.open("r", encoding="UTF-8") as f:
+        return f.read().splitlines()
+
+
+def read_version_lines(doc_dir: Path, ver: Version) -> list[str]:
+    """Returns the paragraph lines (without newlines) of a document version, reconstructing it from
+    its base version if the version is stored as a delta.
+
+    :return: The lines, or an empty list if the version file does not exist.
+    """
+    path = get_version_file_path(doc_dir, ver)
+    if not path.is_file():
+        return []
+    lines = _read_raw_lines(path)
+    if not lines:
+        return lines
+    header = parse_delta_header(lines[0])
+    if header is None:
+        return [line for line in lines if line]
+    base_ver, _ = header
+    return apply_delta(read_version_lines(doc_dir, base_ver), lines[1:])
+
+
+def read_version_header(doc_dir: Path, ver: Version) -> tuple[Version, int] | None:
+    path = get_version_file_path(doc_dir, ver)
+    if not path.is_file():
+        return None
+    with path.open("r", encoding="UTF-8") as f:
+        return parse_delta_header(f.readline().rstrip("\n"))
+
+
+def encode_delta(base_lines: list[str], lines: list[str]) -> list[str]:
+    delta = []
+    s = SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in s.get_opcodes():
+        if tag == "equal":
+            delta.append(f"={i1} {i2}")
+        else:
+            delta.extend(f"+{line}" for line in lines[j1:j2])
+    return delta
+
+
+def apply_delta(base_lines: list[str], delta: list[str]) -> list[str]:
+    lines = []
+    for d in delta:
+        if d.startswith("="):
+            start, end = d[1:].split(" ")
+            lines.extend(base_lines[int(start) : int(end)])
+        elif d.startswith("+"):
+            lines.append(d[1:])
+    return lines
+
+
+def _content_size(lines: list[str]) -> int:
+    return sum(len(line) + 1 for line in lines)
+
+
+def encode_against(
+    base_ver: Version, base_lines: list[str], depth: int, lines: list[str]
+) -> list[str] | None:
+    """Encodes lines as a delta against the given snapshot.
+
+    :return: The encoded delta including the header, or None if a snapshot should be written instead.
+    """
+    if depth > SNAPSHOT_INTERVAL:
+        return None
+    delta = encode_delta(base_lines, lines)
+    if _content_size(delta) > MAX_DELTA_RATIO * _content_size(lines):
+        return None
+    return [f"{DELTA_HEADER} {base_ver[0]} {base_ver[1]} {depth}"] + delta
+
+
+def encode_version(
+    doc_dir: Path, lines: list[str], prev_ver: Version | None
+) -> list[str]:
+    """Encodes the lines of a new version as a delta against the snapshot of the previous version,
+    or returns the lines as is if a new snapshot should be written.
+    """
+    if prev_ver is None or not get_version_file_path(doc_dir, prev_ver).is_file():
+        return lines
+    header = read_version_header(doc_dir, prev_ver)
+    if header is None:
+        base_ver, depth = prev_ver, 1
+    else:
+        base_ver, prev_depth = header
+        depth = prev_depth + 1
+    if depth > SNAPSHOT_INTERVAL:
+        return lines
+    encoded = encode_against(
+        base_ver, read_version_lines(doc_dir, base_ver), depth, lines
+    )
+    return encoded if encoded is not None else lines
+
+
+def write_version_lines(
+    doc_dir: Path, ver: Version, lines: list[str], prev_ver: Version | None
+) -> None:
+    """Writes a new version file, as a delta if possible.
+
+    :param doc_dir: The document directory.
+    :param ver: The version to write.
+    :param lines: The paragraph lines of the version.
+    :param prev_ver: The previous version of the document; it determines the base snapshot of the delta.
+    """
+    encoded = encode_version(doc_dir, lines, prev_ver)
+    with get_version_file_path(doc_dir, ver).open("w", encoding="UTF-8") as f:
+        f.write("".join(line + "\n" for line in encoded))
+
+
+def list_versions(doc_dir: Path) -> list[Version]:
+    """Returns all the versions of a document in ascending order."""
+    versions = []
+    for major in os.listdir(doc_dir):
+        if not major.isdigit() or not (doc_dir / major).is_dir():
+            continue
+        for minor in os.listdir(doc_dir / major):
+            if minor.isdigit():
+                versions.append((int(major), int(minor)))
+    versions.sort()
+    return versions
+
+
+def compact_versions(doc_dir: Path, dry_run: bool = False) -> tuple[int, int]:
+    """Re-encodes all the versions of a document so that full copies are replaced by deltas.
+
+    The contents of every version stay the same. Since deltas only refer to earlier versions,
+    the versions can be rewritten one by one in ascending order.
+
+    :return: The total size of the version files before and after compaction.
+    """
+    size_before = 0
+    size_after = 0
+    base: tuple[Version, list[str]] | None = None
+    depth = 0
+    for ver in list_versions(doc_dir):
+        path = get_version_file_path(doc_dir, ver)
+        size_before += path.stat().st_size
+        lines = read_version_lines(doc_dir, ver)
+        encoded = (
+            encode_against(base[0], base[1], depth + 1, lines)
+            if base is not None
+            else None
+        )
+        if encoded is None:
+            encoded = lines
+            base = ver, lines
+            depth = 0
+        else:
+            depth += 1
+        content = "".join(line + "\n" for line in encoded)
+        size_after += len(content.encode())
+        if not dry_run:
+            fd, tmpname = mkstemp(dir=path.parent)
+            with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                f.write(content)
+            os.replace(tmpname, path)
+    return size_before, size_after
@@ -1,6 +1,7 @@
 """Routes for document view."""
 import dataclasses
 import html
+import json
 import time
 from difflib import context_diff
 from typing import Union, Any, ValuesView, Generator
@@ -30,6 +31,7 @@ from timApp.auth.accesshelper import (
 )
 from timApp.auth.auth_models import BlockAccess
 from timApp.auth.get_user_rights_for_item import get_user_rights_for_item
+from timApp.auth.rightscache import get_access_checkers
 from timApp.auth.sessioninfo import get_current_user_object, logged_in, save_last_page
 from timApp.document.caching import check_doc_cache, set_doc_cache, refresh_doc_expire
 from timApp.document.create_item import create_or_copy_item, create_citation_doc
@@ -38,6 +40,7 @@ from timApp.document.docinfo import DocInfo
 from timApp.document.docparagraph import DocParagraph
 from timApp.document.docrenderresult import DocRenderResult
 from timApp.document.docsettings import DocSettings, get_minimal_visibility_settings
+from timApp.document.docupdates import get_doc_update_hub, get_par_diff
 from timApp.document.document import (
     get_index_from_html_list,
     dereference_pars,
@@ -97,7 +100,7 @@ from timApp.timdb.sqa import db
 from timApp.user.groups import verify_group_view_access
 from timApp.user.settings.style_utils import resolve_themes
 from timApp.user.settings.styles import generate_style
-from timApp.user.user import User, has_no_higher_right
+from timApp.user.user import User, has_no_higher_right, view_access_set
 from timApp.user.usergroup import (
     UserGroup,
     get_usergroup_eager_query,
@@ -125,6 +128,8 @@ from tim_common.html_sanitize import sanitize_html
 
 DEFAULT_RELEVANCE = 10
 
+DOC_EVENT_HEARTBEAT_SECS = 15
+
 view_page = TypedBlueprint(
     "view_page",
     __name__,
@@ -1073,7 +1078,11 @@ def get_items(folder: str, recurse=False):
     docs.sort(key=lambda d: d.title.lower())
     folders = Folder.get_all_in_path(root_path=folder, recurse=recurse)
     folders.sort(key=lambda d: d.title.lower())
-    return [f for f in folders if u.has_view_access(f)] + docs
+    # This also caches the rights of the user to the items for their JSON.
+    checkers = get_access_checkers(folders + docs, [u])
+    return [
+        f for f in folders if checkers[u.id, f.id].has_some_access(view_access_set)
+    ] + docs
 
 
 def get_linked_groups(i: Item) -> tuple[list[UserGroupWithSisuInfo], list[str]]:
@@ -1124,8 +1133,6 @@ def is_exam_mode(settings: DocSettings, rights: dict):
 
 @view_page.get("/getParDiff/<int:doc_id>/<int:major>/<int:minor>")
 def check_updated_pars(doc_id, major, minor):
-    # return json_response({'diff': None,
-    #                       'version': None})
     # taketime("before verify")
     doc = get_doc_or_abort(doc_id)
     verify_view_access(doc)
@@ -1141,15 +1148,24 @@ def check_updated_pars(doc_id, major, minor):
         live_updates = 0
     # taketime("after liveupdates")
     view_ctx = default_view_ctx
-    diffs = list(
-        d.get_doc_version((major, minor)).parwise_diff(d, view_ctx)
-    )  # TODO cache this, about <5 ms
+    # The diff is shared by all viewers of the document, so it is computed only once per version pair.
+    diffs = get_par_diff(d, (major, minor), view_ctx)
     # taketime("after diffs")
+    result = {
+        "diff": diffs,
+        "version": d.get_version(),
+        "live": live_updates,
+        "stream_poll": current_app.config["DOC_EVENT_STREAM_POLL_INTERVAL"],
+    }
+    if not any(diff.get("content") for diff in diffs):
+        # Nothing to render, so the rights of the user are not needed.
+        return json_response(result)
     curr_user = get_current_user_object()
     rights = get_user_rights_for_item(
         doc, curr_user
     )  # about 30-40 ms # TODO: this is the slowest part
     # taketime("after rights")
+    user_diffs = []
     for diff in diffs:  # about < 1 ms
         if diff.get("content"):
             post_process_result = post_process_pars(
@@ -1158,20 +1174,68 @@ def check_updated_pars(doc_id, major, minor):
                 UserContext.from_one_user(curr_user),
                 view_ctx,
             )
-            diff["content"] = {
-                "texts": render_template(
-                    "partials/paragraphs.jinja2",
-                    text=post_process_result.texts,
-                    rights=rights,
-                    preview=False,
-                    hide_readmarks=settings.hide_readmarks(),
-                ),
-                "js": post_process_result.js_paths,
-                "css": post_process_result.css_paths,
+            diff = {
+                **diff,
+                "content": {
+                    "texts": render_template(
+                        "partials/paragraphs.jinja2",
+                        text=post_process_result.texts,
+                        rights=rights,
+                        preview=False,
+                        hide_readmarks=settings.hide_readmarks(),
+                    ),
+                    "js": post_process_result.js_paths,
+                    "css": post_process_result.css_paths,
+                },
             }
+        user_diffs.append(diff)
     # taketime("after for diffs")
-    return json_response(
-        {"diff": diffs, "version": d.get_version(), "live": live_updates}
+    result["diff"] = user_diffs
+    return json_response(result)
+
+
+@view_page.get("/docEvents/<int:doc_id>")
+def doc_events(doc_id: int):
+    """Streams the new versions of the document as server-sent events.
+
+    The client should call /getParDiff after each event to get the changes; see :mod:`timApp.document.docupdates`.
+    The stream ends after DOC_EVENT_STREAM_SECS seconds, after which the client reconnects.
+    """
+    doc = get_doc_or_abort(doc_id)
+    verify_view_access(doc)
+    stream_secs = current_app.config["DOC_EVENT_STREAM_SECS"]
+    # The stream does not need the database, so don't keep the connection.
+    db.session.commit()
+    hub = get_doc_update_hub()
+
+    def generate():
+        hub.watch(doc_id)
+        try:
+            version = Document(doc_id).get_version()
+            deadline = time.monotonic() + stream_secs
+            yield "retry: 5000\n\n"
+            # The version may have changed before the stream was opened.
+            yield f"event: version\ndata: {json.dumps(version)}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                new_version = hub.wait(
+                    doc_id, version, min(remaining, DOC_EVENT_HEARTBEAT_SECS)
+                )
+                if new_version <= version:
+                    # Keeps proxies from closing the connection and detects closed connections.
+                    yield ": keepalive\n\n"
+                    continue
+                version = new_version
+                yield f"event: version\ndata: {json.dumps(version)}\n\n"
+        finally:
+            hub.unwatch(doc_id)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -0,0 +1,140 @@
+"""Notifications of changes in running lectures.
+
+The routes that change the state of a lecture (e.g. a new message or question) publish an event to the Redis
+channel of the lecture after committing the change. Each TIM process listens to the channels of all lectures with
+a single Redis connection (see :class:`LectureEventHub`) and wakes up the requests that are waiting for the events
+of the lecture: the long-polling getUpdates requests and the event streams of the clients.
+
+The events only tell that something has changed; the clients fetch the actual changes with getUpdates.
+If Redis is unavailable, the waiting requests simply time out, which makes them behave like plain polling.
+
+Changes that happen when time passes are not published, because no request makes them: a lecture or a question
+reaching its end time, or a user dropping from the lecture after being inactive. The event streams of the clients
+send END_TIME themselves when the lecture reaches its end time; the clients know the end times of the questions;
+and the lecturers, who see the users, long-poll at least every LECTURE_LONG_POLL_SECS.
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from typing import Callable, Iterator
+
+from timApp.util.logger import log_warning
+
+CHANNEL_PREFIX = "tim-lecture-"
+
+MESSAGE = "message"
+QUESTION = "question"
+QUESTION_END_TIME = "question_end_time"
+POINTS = "points"
+USERS = "users"
+END = "end"
+END_TIME = "end_time"
+"""Sent by the event stream itself when the lecture reaches its end time; never published."""
+
+RECENT_EVENTS = 32
+"""How many recent events of a lecture are kept for waiters that have not yet seen them."""
+
+
+def publish_lecture_event(lecture_id: int, kind: str) -> None:
+    """Publishes an event of the lecture. Must be called after the change has been committed."""
+    from timApp.document.caching import rclient
+
+    try:
+        rclient.publish(f"{CHANNEL_PREFIX}{lecture_id}", kind)
+    except Exception as e:
+        log_warning(
+            f"Could not publish lecture event {kind} of lecture {lecture_id}: {e}"
+        )
+
+
+@dataclass
+class LectureChannel:
+    seq: int = 0
+    recent: deque[tuple[int, str]] = field(
+        default_factory=lambda: deque(maxlen=RECENT_EVENTS)
+    )
+    changed: Condition = field(default_factory=Condition)
+
+
+class LectureEventHub:
+    """Dispatches the events received by this process to the waiting requests.
+
+    Every event of a lecture gets a sequence number. A waiter first reads the current sequence number with
+    :meth:`get_seq`, then checks the state of the lecture, and finally waits for events newer than the sequence
+    number. This way no event that happens during the check is missed.
+    """
+
+    def __init__(self) -> None:
+        self.channels: dict[int, LectureChannel] = {}
+        self.lock = Lock()
+
+    def _channel(self, lecture_id: int) -> LectureChannel:
+        with self.lock:
+            c = self.channels.get(lecture_id)
+            if c is None:
+                c = LectureChannel()
+                self.channels[lecture_id] = c
+            return c
+
+    def get_seq(self, lecture_id: int) -> int:
+        return self._channel(lecture_id).seq
+
+    def dispatch(self, lecture_id: int, kind: str) -> None:
+        c = self._channel(lecture_id)
+        with c.changed:
+            c.seq += 1
+            c.recent.append((c.seq, kind))
+            c.changed.notify_all()
+
+    def wait(self, lecture_id: int, seq: int, timeout: float) -> tuple[int, list[str]]:
+        """Waits until the lecture has events newer than seq or the timeout expires.
+
+        :return: The new sequence number and the kinds of the new events (empty if the wait timed out).
+        """
+        c = self._channel(lecture_id)
+        with c.changed:
+            c.changed.wait_for(lambda: c.seq > seq, timeout)
+            return c.seq, [kind for s, kind in c.recent if s > seq]
+
+    def listen(self, subscribe: Callable[[], Iterator[tuple[int, str]]]) -> None:
+        """Dispatches the events from the subscription forever, re-subscribing if the subscription fails."""
+        while True:
+            try:
+                for lecture_id, kind in subscribe():
+                    self.dispatch(lecture_id, kind)
+            except Exception as e:
+                log_warning(f"Lecture event subscription failed: {e}")
+            time.sleep(5)
+
+
+def subscribe_redis() -> Iterator[tuple[int, str]]:
+    from timApp.document.caching import rclient
+
+    pubsub = rclient.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+    try:
+        # PubSub.listen is not annotated in the Redis stubs.
+        for message in pubsub.listen():  # type: ignore[no-untyped-call]
+            if message["type"] != "pmessage":
+                continue
+            channel = message["channel"].decode()
+            yield int(channel[len(CHANNEL_PREFIX) :]), message["data"].decode()
+    finally:
+        pubsub.close()
+
+
+_hub: LectureEventHub | None = None
+_hub_lock = Lock()
+
+
+def get_lecture_event_hub() -> LectureEventHub:
+    """Returns the hub of this process, starting the Redis listener on first use."""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = LectureEventHub()
+            Thread(target=_hub.listen, args=(subscribe_redis,), daemon=True).start()
+        return _hub
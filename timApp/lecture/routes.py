@@ -38,6 +38,17 @@ from timApp.lecture.askedquestion import (
     user_activity_lock,
 )
 from timApp.lecture.lecture import Lecture
+from timApp.lecture.lectureevents import (
+    publish_lecture_event,
+    get_lecture_event_hub,
+    MESSAGE,
+    QUESTION,
+    QUESTION_END_TIME,
+    POINTS,
+    USERS,
+    END,
+    END_TIME,
+)
 from timApp.lecture.lectureanswer import LectureAnswer, get_totals
 from timApp.lecture.lectureutils import (
     is_lecturer_of,
@@ -71,6 +82,8 @@ from timApp.util.utils import get_current_time
 
 lecture_routes = Blueprint("lecture", __name__, url_prefix="")
 
+LECTURE_EVENT_HEARTBEAT_SECS = 15
+
 
 @dataclass
 class AskedIdModel:
@@ -162,6 +175,7 @@ class GetUpdatesModel:
     doc_id: int | None = field(metadata={"data_key": "d"}, default=None)
     use_questions: bool = field(metadata={"data_key": "q"}, default=False)
     use_wall: bool = field(metadata={"data_key": "m"}, default=False)
+    has_event_stream: bool = field(metadata={"data_key": "s"}, default=False)
 
 
 @lecture_routes.get("/getUpdates")
@@ -174,6 +188,62 @@ def get_updates(m: GetUpdatesModel):
     return json_response(ret, date_conversion=True)
 
 
+@lecture_routes.get("/lectureEvents")
+def lecture_events():
+    """Streams the events of the current lecture as server-sent events.
+
+    Each event tells the kinds of the changes (see :mod:`timApp.lecture.lectureevents`); the client should then
+    call /getUpdates to get the changes. The stream ends after LECTURE_EVENT_STREAM_SECS seconds, after which
+    the client reconnects.
+
+    Reaching the end time of the lecture is not published by anyone, so the stream sends an END_TIME event
+    itself when the end time passes.
+    """
+    lecture = get_current_lecture_or_abort()
+    lecture_id = lecture.lecture_id
+    stream_secs = current_app.config["LECTURE_EVENT_STREAM_SECS"]
+    end_at = (
+        time.monotonic() + (lecture.end_time - get_current_time()).total_seconds()
+        if lecture.end_time
+        else None
+    )
+    # The stream does not need the database, so don't keep the connection.
+    db.session.commit()
+    hub = get_lecture_event_hub()
+
+    def generate():
+        seq = hub.get_seq(lecture_id)
+        deadline = time.monotonic() + stream_secs
+        yield "retry: 5000\n\n"
+        end_sent = end_at is None
+        while True:
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                return
+            timeout = min(remaining, LECTURE_EVENT_HEARTBEAT_SECS)
+            if not end_sent:
+                timeout = max(0.0, min(timeout, end_at - now))
+            seq, events = hub.wait(lecture_id, seq, timeout)
+            if not events and not end_sent and time.monotonic() >= end_at:
+                # The lecture may have been extended meanwhile; getUpdates tells the client.
+                end_sent = True
+                events = [END_TIME]
+            if not events:
+                # Keeps proxies from closing the connection and detects closed connections.
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: update\ndata: {json.dumps(events)}\n\n"
+            if END in events:
+                return
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @lecture_routes.before_request
 def lecture_before_request():
     tim_main_execute("SET LOCAL lock_timeout = '1s'")
@@ -190,7 +260,8 @@ EXTRA_FIELD_NAME = "extra"
 def do_get_updates(m: GetUpdatesModel):
     """Gets updates from some lecture.
 
-    Checks updates in 1 second frequently and answers if there is updates.
+    In long poll mode, waits for the events of the lecture (see :mod:`timApp.lecture.lectureevents`)
+    and answers as soon as there are updates for the user.
 
     """
     client_last_id = m.client_last_id
@@ -200,7 +271,6 @@ def do_get_updates(m: GetUpdatesModel):
     use_questions = m.use_questions
     session["use_questions"] = use_questions
 
-    step = 0
     lecture = get_current_lecture()
 
     doc_id = m.doc_id
@@ -261,6 +331,15 @@ def do_get_updates(m: GetUpdatesModel):
         long_poll = long_poll_t
     if long_poll:
         poll_interval_ms = 1000
+    if m.has_event_stream and not is_lecturer:
+        # The client polls as soon as it gets an event, so polling is only a fallback.
+        poll_interval_ms = (
+            current_app.config["LECTURE_EVENT_STREAM_POLL_INTERVAL"] * 1000
+        )
+        long_poll = False
+    # Don't wait when testing.
+    if current_app.config["TESTING"]:
+        long_poll = False
 
     lecture_ending = 100
     base_resp = None
@@ -268,7 +347,10 @@ def do_get_updates(m: GetUpdatesModel):
     basic_info = {
         "ms": poll_interval_ms,
     }
-    while step <= 10:
+    hub = get_lecture_event_hub() if long_poll else None
+    deadline = time.monotonic() + current_app.config["LECTURE_LONG_POLL_SECS"]
+    seq = hub.get_seq(lecture_id) if hub else 0
+    while True:
         lecture = get_current_lecture()
         if not lecture:
             return get_running_lectures(doc_id)
@@ -320,18 +402,20 @@ def do_get_updates(m: GetUpdatesModel):
         if list_of_new_messages:
             return base_resp
 
-        if not long_poll or current_app.config["TESTING"]:
-            # Don't loop when testing.
+        if not hub:
             break
 
-        # Database updates may have happened during sleep, so we have to expire all objects so that they will be
-        # reloaded. Additionally, we don't want to keep the connection open during sleep, so we call commit()
+        # Database updates may have happened during the wait, so we have to expire all objects so that they will be
+        # reloaded. Additionally, we don't want to keep the connection open during the wait, so we call commit()
         # instead of expire_all().
         db.session.commit()
 
-        # For long poll wait 1 sec before new check.
-        time.sleep(1)
-        step += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        seq, events = hub.wait(lecture_id, seq, remaining)
+        if not events:
+            break
 
     if lecture_ending != 100 or lecturers or students:
         return base_resp
@@ -473,6 +557,7 @@ def send_message(m: SendMessageModel):
     msg = Message(message=m.message, user_id=get_current_user_id())
     lecture.messages.append(msg)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, MESSAGE)
     return json_response(msg, date_conversion=True)
 
 
@@ -705,6 +790,7 @@ def end_lecture():
     lecture.end_time = now
     empty_lecture(lecture)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, END)
     return json_response(get_running_lectures(lecture.doc_id), date_conversion=True)
 
 
@@ -779,6 +865,7 @@ def delete_lecture(m: DeleteLectureModel):
         AskedQuestion.query.filter_by(lecture_id=lecture.lecture_id).delete()
         db.session.delete(lecture)
     db.session.commit()
+    publish_lecture_event(m.lecture_id, END)
 
     return json_response(get_running_lectures(lecture.doc_id), date_conversion=True)
 
@@ -827,6 +914,7 @@ def join_lecture():
         update_activity(lecture, u)
 
         db.session.commit()
+        publish_lecture_event(lecture.lecture_id, USERS)
 
     return json_response(
         {
@@ -847,6 +935,7 @@ def leave_lecture_route():
     lecture = get_lecture_from_request(check_access=False)
     leave_lecture(lecture)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, USERS)
     return ok_response()
 
 
@@ -868,6 +957,7 @@ def extend_question():
         raise RouteException("Question is not running")
     rq.end_time += timedelta(seconds=extend)
     db.session.commit()
+    publish_lecture_event(q.lecture_id, QUESTION_END_TIME)
     return ok_response()
 
 
@@ -959,6 +1049,7 @@ def ask_question():
     )
     db.session.add(rq)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, QUESTION)
     return json_response(question, date_conversion=True)
 
 
@@ -985,6 +1076,7 @@ def show_points(m: ShowAnswerPointsModel):
     current_points_id = m.current_points_id
     new_question = get_new_question(lecture, current_question_id, current_points_id)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, POINTS)
     if new_question is not None:
         return json_response(new_question, date_conversion=True)
     return empty_response()
@@ -1082,6 +1174,7 @@ def stop_question(m: AskedIdModel):
         aq, [QuestionActivityKind.Usershown, QuestionActivityKind.Useranswered]
     )
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id, QUESTION_END_TIME)
     return ok_response()
 
 
@@ -0,0 +1,176 @@
+"""Content-addressed cache of Dumbo conversion results.
+
+Each item of a Dumbo batch is converted independently, so the result of an item depends only on the request path,
+the batch-level options and the item itself. The cache key is a hash of these; see :func:`get_item_key`.
+
+The results are stored as JSON strings so that callers never share mutable result objects with the cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+
+from redis import Redis
+
+from tim_common.timjsonencoder import TimJsonEncoder
+
+KEY_PREFIX = "tim-dumbo-"
+HITS_KEY = "tim-dumbo-cache-hits"
+MISSES_KEY = "tim-dumbo-cache-misses"
+
+
+def get_item_key(path: str, opts: dict, item: Any) -> str:
+    h = hashlib.sha256(
+        json.dumps([path, opts, item], sort_keys=True, cls=TimJsonEncoder).encode()
+    )
+    return h.hexdigest()
+
+
+class DumboCache(ABC):
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        pass
+
+    @abstractmethod
+    def set_many(self, values: dict[str, str]) -> None:
+        pass
+
+    def record(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+
+    def get_stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+        }
+
+
+class NullDumboCache(DumboCache):
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        return [None] * len(keys)
+
+    def set_many(self, values: dict[str, str]) -> None:
+        pass
+
+
+class LruDumboCache(DumboCache):
+    """An in-process LRU cache whose size is bounded by the total length of the cached results."""
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[str, str] = OrderedDict()
+        self.lock = Lock()
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        result: list[str | None] = []
+        with self.lock:
+            for k in keys:
+                v = self.entries.get(k)
+                if v is not None:
+                    self.entries.move_to_end(k)
+                result.append(v)
+        return result
+
+    def set_many(self, values: dict[str, str]) -> None:
+        with self.lock:
+            for k, v in values.items():
+                if len(v) > self.max_size:
+                    continue
+                old = self.entries.pop(k, None)
+                if old is not None:
+                    self.size -= len(old)
+                self.entries[k] = v
+                self.size += len(v)
+            while self.size > self.max_size:
+                _, v = self.entries.popitem(last=False)
+                self.size -= len(v)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {**super().get_stats(), "entries": len(self.entries), "size": self.size}
+
+
+class RedisDumboCache(DumboCache):
+    """Stores the results in Redis with an expiration time. The hit counters are shared by all processes."""
+
+    def __init__(self, expire_secs: int):
+        super().__init__()
+        self.expire_secs = expire_secs
+
+    @staticmethod
+    def _client() -> Redis:
+        from timApp.document.caching import rclient
+
+        return rclient
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        if not keys:
+            return []
+        return [
+            v.decode() if v is not None else None
+            for v in self._client().mget([KEY_PREFIX + k for k in keys])
+        ]
+
+    def set_many(self, values: dict[str, str]) -> None:
+        if not values:
+            return
+        pipe = self._client().pipeline(transaction=False)
+        for k, v in values.items():
+            pipe.set(KEY_PREFIX + k, v, ex=self.expire_secs)
+        pipe.execute()
+
+    def record(self, hits: int, misses: int) -> None:
+        super().record(hits, misses)
+        pipe = self._client().pipeline(transaction=False)
+        if hits:
+            pipe.incrby(HITS_KEY, hits)
+        if misses:
+            pipe.incrby(MISSES_KEY, misses)
+        pipe.execute()
+
+    def get_stats(self) -> dict[str, Any]:
+        hits, misses = (int(v or 0) for v in self._client().mget(HITS_KEY, MISSES_KEY))
+        total = hits + misses
+        return {
+            "process": super().get_stats(),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else None,
+        }
+
+
+_cache: DumboCache | None = None
+
+
+def get_dumbo_cache() -> DumboCache:
+    """Returns the cache configured with the DUMBO_CACHE_BACKEND option."""
+    global _cache
+    if _cache is None:
+        from timApp.tim_app import app
+
+        backend = app.config["DUMBO_CACHE_BACKEND"]
+        if backend == "memory":
+            _cache = LruDumboCache(app.config["DUMBO_CACHE_MAX_SIZE"])
+        elif backend == "redis":
+            _cache = RedisDumboCache(app.config["DUMBO_CACHE_EXPIRE_SECS"])
+        elif backend is None:
+            _cache = NullDumboCache()
+        else:
+            raise ValueError(f"Unknown DUMBO_CACHE_BACKEND: {backend}")
+    return _cache
+
+
+def get_dumbo_cache_stats() -> dict[str, Any]:
+    return get_dumbo_cache().get_stats()
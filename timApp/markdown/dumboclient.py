@@ -5,6 +5,8 @@ from typing import NamedTuple, overload
 
 import requests
 
+from timApp.markdown.dumbocache import get_dumbo_cache, get_item_key
+from timApp.util.httpsession import http_request
 from tim_common.timjsonencoder import TimJsonEncoder
 
 
@@ -122,32 +124,54 @@ def call_dumbo(
     """
     is_dict = isinstance(data, dict)
     opts = options.dict()
-    try:
-        if path in KEYS_PATHS:
-            if is_dict:
-                data_to_send = {"content": [{"content": data}], **opts}
-            else:
-                if data_opts:
-                    data_to_send = {
-                        "content": [
-                            {"content": d, **o.dict()} for d, o in zip(data, data_opts)
-                        ],
-                        **opts,
-                    }
-                else:
-                    data_to_send = {"content": [{"content": d} for d in data], **opts}
+    items: list
+    if path in KEYS_PATHS:
+        if is_dict:
+            items = [{"content": data}]
+        elif data_opts:
+            items = [{"content": d, **o.dict()} for d, o in zip(data, data_opts)]
         else:
-            data_to_send = {"content": data, **opts}
-        r = requests.post(
-            url=DUMBO_URL + path, data=json.dumps(data_to_send, cls=TimJsonEncoder)
+            items = [{"content": d} for d in data]
+    else:
+        items = data
+    returned = convert_cached(path, items, opts)
+    if is_dict:
+        return returned[0]
+    else:
+        return returned
+
+
+def convert_cached(path: str, items: list, opts: dict) -> list:
+    """Converts a batch of items with Dumbo, sending only the items that are not in the Dumbo cache.
+
+    :return: The converted items in the same order as the given items.
+    """
+    cache = get_dumbo_cache()
+    keys = [get_item_key(path, opts, item) for item in items]
+    cached = cache.get_many(keys)
+    missing = [i for i, c in enumerate(cached) if c is None]
+    cache.record(hits=len(items) - len(missing), misses=len(missing))
+    results = [json.loads(c) if c is not None else None for c in cached]
+    if missing:
+        converted = post_dumbo(path, [items[i] for i in missing], opts)
+        to_cache = {}
+        for i, r in zip(missing, converted):
+            results[i] = r
+            to_cache[keys[i]] = json.dumps(r)
+        cache.set_many(to_cache)
+    return results
+
+
+def post_dumbo(path: str, items: list, opts: dict) -> list:
+    try:
+        r = http_request(
+            "post",
+            DUMBO_URL + path,
+            data=json.dumps({"content": items, **opts}, cls=TimJsonEncoder),
         )
         r.encoding = "utf-8"
     except requests.ConnectionError:
         raise Exception("Failed to connect to Dumbo")
     if r.status_code != 200:
         raise DumboHTMLException()
-    returned = r.json()
-    if is_dict:
-        return returned[0]
-    else:
-        return returned
+    return r.json()
@@ -21,6 +21,7 @@ from timApp.markdown.autocounters import (
     check_autonumber_error,
 )
 from timApp.markdown.dumboclient import call_dumbo
+from timApp.markdown.templatecache import get_template_cache
 from timApp.util.utils import get_error_html, title_to_id
 from timApp.util.utils import widen_fields
 from tim_common.html_sanitize import sanitize_html, presanitize_html_body
@@ -314,6 +315,35 @@ def preinc(v, delta=1):
 # ------------------------ Jinja filters end ---------------------------------------------------------------
 
 
+def apply_char_macros(
+    text: str, settings: DocSettings | None, env: TimSandboxedEnvironment
+) -> str:
+    """Replaces the character macros of the document and the autocounters in the text."""
+    charmacros = settings.get_charmacros() if settings else None
+    if charmacros:
+        for cm_key, cm_value in charmacros.items():
+            text = text.replace(cm_key, cm_value)
+    if env.counters:
+        text = env.counters.do_char_macros(text)
+    return text
+
+
+def apply_global_macros(text: str, settings: DocSettings | None) -> str:
+    """Replaces the global macros of the document in the text and prepends the ADDFOREVERY macro to it."""
+    globalmacros = settings.get_globalmacros() if settings else None
+    if globalmacros:
+        for gmacro in globalmacros:
+            macrotext = "%%" + gmacro + "%%"
+            pos = text.find(macrotext)
+            if pos >= 0:
+                gm = str(globalmacros.get(gmacro, ""))
+                text = text.replace(macrotext, gm)
+        gm = str(globalmacros.get("ADDFOREVERY", ""))
+        if gm:
+            text = gm + "\n" + text
+    return text
+
+
 def expand_macros(
     text: str,
     macros,
@@ -322,26 +352,11 @@ def expand_macros(
     ignore_errors: bool = False,
 ):
     # return text  # comment out when want to take time if this slows things
-    charmacros = settings.get_charmacros() if settings else None
-    if charmacros:
-        for cm_key, cm_value in charmacros.items():
-            text = text.replace(cm_key, cm_value)
-    if env.counters:
-        text = env.counters.do_char_macros(text)
+    text = apply_char_macros(text, settings, env)
     if not has_macros(text, env):
         return text
     try:
-        globalmacros = settings.get_globalmacros() if settings else None
-        if globalmacros:
-            for gmacro in globalmacros:
-                macrotext = "%%" + gmacro + "%%"
-                pos = text.find(macrotext)
-                if pos >= 0:
-                    gm = str(globalmacros.get(gmacro, ""))
-                    text = text.replace(macrotext, gm)
-            gm = str(globalmacros.get("ADDFOREVERY", ""))
-            if gm:
-                text = gm + "\n" + text
+        text = apply_global_macros(text, settings)
         startstr = env.comment_start_string + "LOCAL"
         beg = text.find(startstr)
         if beg >= 0:
@@ -354,7 +369,7 @@ def expand_macros(
         # TODO: should local macros be used in counters???
         if env.counters:
             env.counters.start_of_block()
-        conv = env.from_string(text).render(macros)
+        conv = get_template_cache().from_string(env, text).render(macros)
         if env.counters and env.counters.need_update_labels:
             conv = env.counters.update_labels(conv)
         env.counters.is_plugin = False
@@ -0,0 +1,130 @@
+"""Cache of compiled macro templates.
+
+Expanding the macros of a paragraph (see :func:`expand_macros`) parses the paragraph text as a Jinja2 template and
+compiles it to Python code. The same texts are expanded over and over again (every preload of a document and every
+view with user macros), so the compiled code is cached per process.
+
+Only the code is shared, not the templates: the code looks up the filters from the environment it is bound to when
+it is rendered, so the filters of :class:`AutoCounters` still update the counters of the document being rendered.
+Jinja2 calls filters with constant arguments already when compiling, so the code is compiled in an environment where
+only the builtin filters can be called; otherwise the results of stateful filters (counters, ``belongs``, ``isview``,
+``now``) would be baked into the shared code. The text includes the LOCAL macro block, and the local macros are given to the
+template when it is rendered, so they need no special handling.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from types import CodeType
+from typing import Hashable, Callable, Any
+
+from jinja2 import Template
+from jinja2.filters import FILTERS
+
+from timApp.markdown.autocounters import TimSandboxedEnvironment
+
+
+def get_autoescape(env: TimSandboxedEnvironment) -> bool:
+    """Returns whether templates created with :meth:`Environment.from_string` are autoescaped."""
+    if callable(env.autoescape):
+        # Templates created from strings have no name.
+        return bool(env.autoescape(None))
+    return env.autoescape
+
+
+def get_env_key(env: TimSandboxedEnvironment) -> Hashable:
+    """Returns the part of the environment configuration that affects the compiled code of a template."""
+    return (
+        env.variable_start_string,
+        env.variable_end_string,
+        env.block_start_string,
+        env.block_end_string,
+        env.comment_start_string,
+        env.comment_end_string,
+        env.lstrip_blocks,
+        env.trim_blocks,
+        get_autoescape(env),
+        frozenset(env.filters),
+    )
+
+
+def get_uncallable_filter(f: Callable) -> Callable:
+    def uncallable(*args: Any, **kwargs: Any) -> Any:
+        raise RuntimeError("Filter called while compiling")
+
+    # The compiled code passes the context or the environment to the filter based on this.
+    if hasattr(f, "jinja_pass_arg"):
+        setattr(uncallable, "jinja_pass_arg", getattr(f, "jinja_pass_arg"))
+    return uncallable
+
+
+class TemplateCodeCache:
+    """A bounded LRU cache of compiled template code, keyed by the template text and the environment configuration."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.codes: OrderedDict[tuple[str, Hashable], CodeType] = OrderedDict()
+        self.compile_envs: dict[Hashable, TimSandboxedEnvironment] = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def from_string(self, env: TimSandboxedEnvironment, source: str) -> Template:
+        """Like :meth:`Environment.from_string`, but reuses the compiled code of an earlier identical template."""
+        if self.max_size <= 0:
+            return env.from_string(source)
+        key = (source, get_env_key(env))
+        with self.lock:
+            code = self.codes.get(key)
+            if code is not None:
+                self.codes.move_to_end(key)
+                self.hits += 1
+        if code is None:
+            # Syntax errors are raised here, so they are never cached.
+            code = self.get_compile_env(env).compile(source)
+            with self.lock:
+                self.misses += 1
+                self.codes[key] = code
+                while len(self.codes) > self.max_size:
+                    self.codes.popitem(last=False)
+        return env.template_class.from_code(env, code, env.make_globals(None))
+
+    def get_compile_env(self, env: TimSandboxedEnvironment) -> TimSandboxedEnvironment:
+        """Returns an environment with the same configuration as the given one for compiling templates.
+
+        The filters of the environment are replaced with ones that fail if they are called, which prevents Jinja2 from
+        evaluating them when compiling.
+        """
+        key = get_env_key(env)
+        with self.lock:
+            compile_env = self.compile_envs.get(key)
+        if compile_env is None:
+            compile_env = TimSandboxedEnvironment(
+                env.variable_start_string, autoescape=get_autoescape(env)
+            )
+            compile_env.filters = {
+                name: f if FILTERS.get(name) is f else get_uncallable_filter(f)
+                for name, f in env.filters.items()
+            }
+            with self.lock:
+                self.compile_envs[key] = compile_env
+        return compile_env
+
+    def clear(self) -> None:
+        with self.lock:
+            self.codes.clear()
+            self.compile_envs.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_template_cache: TemplateCodeCache | None = None
+
+
+def get_template_cache() -> TemplateCodeCache:
+    global _template_cache
+    if _template_cache is None:
+        from timApp.tim_app import app
+
+        _template_cache = TemplateCodeCache(app.config["MACRO_TEMPLATE_CACHE_SIZE"])
+    return _template_cache
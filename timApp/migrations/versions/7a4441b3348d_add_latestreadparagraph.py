@@ -0,0 +1,71 @@
+"""Add latestreadparagraph table for the latest read marks
+
+Revision ID: 7a4441b3348d
+Revises: d37c210f7269
+Create Date: 2026-10-18 12:14:03.518204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "7a4441b3348d"
+down_revision = "d37c210f7269"
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table(
+        "latestreadparagraph",
+        sa.Column("usergroup_id", sa.Integer(), nullable=False),
+        sa.Column("doc_id", sa.Integer(), nullable=False),
+        sa.Column("par_id", sa.Text(), nullable=False),
+        sa.Column(
+            "type",
+            postgresql.ENUM(name="readparagraphtype", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("par_hash", sa.Text(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["doc_id"],
+            ["block.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["usergroup_id"],
+            ["usergroup.id"],
+        ),
+        sa.PrimaryKeyConstraint("usergroup_id", "doc_id", "par_id", "type"),
+    )
+    op.execute(
+        """
+INSERT INTO latestreadparagraph (usergroup_id, doc_id, par_id, type, par_hash, timestamp)
+SELECT DISTINCT ON (usergroup_id, doc_id, par_id, type) usergroup_id, doc_id, par_id, type, par_hash, timestamp
+FROM readparagraph
+WHERE doc_id IS NOT NULL
+ORDER BY usergroup_id, doc_id, par_id, type, timestamp DESC, id DESC
+"""
+    )
+    op.create_index(
+        "latestreadparagraph_usergroup_id_doc_id_idx",
+        "latestreadparagraph",
+        ["usergroup_id", "doc_id", "par_id", "type", "par_hash", "timestamp"],
+        unique=False,
+    )
+    op.create_index(
+        "latestreadparagraph_doc_id_usergroup_id_idx",
+        "latestreadparagraph",
+        ["doc_id", "usergroup_id", "type", "par_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "latestreadparagraph_doc_id_usergroup_id_idx", table_name="latestreadparagraph"
+    )
+    op.drop_index(
+        "latestreadparagraph_usergroup_id_doc_id_idx", table_name="latestreadparagraph"
+    )
+    op.drop_table("latestreadparagraph")
@@ -0,0 +1,52 @@
+"""Add latestanswer table for the latest answers of each user in each task
+
+Revision ID: c8c2da34ab74
+Revises: 7a4441b3348d
+Create Date: 2026-10-18 14:02:41.730112
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "c8c2da34ab74"
+down_revision = "7a4441b3348d"
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        "latestanswer",
+        sa.Column("task_id", sa.Text(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("answer_id", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("valid_answer_id", sa.Integer(), nullable=True),
+        sa.Column("valid_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["answer_id"], ["answer.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["valid_answer_id"], ["answer.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["useraccount.id"],
+        ),
+        sa.PrimaryKeyConstraint("task_id", "user_id"),
+    )
+    # The table can be recomputed later with the "answer backfill-latest" command.
+    op.execute(
+        """
+INSERT INTO latestanswer (task_id, user_id, answer_id, count, valid_answer_id, valid_count)
+SELECT a.task_id, ua.user_id, max(a.id), count(a.id),
+       max(a.id) FILTER (WHERE a.valid), count(a.id) FILTER (WHERE a.valid)
+FROM answer a
+JOIN useranswer ua ON ua.answer_id = a.id
+GROUP BY a.task_id, ua.user_id
+"""
+    )
+    op.create_index(
+        "latestanswer_user_id_idx", "latestanswer", ["user_id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("latestanswer_user_id_idx", table_name="latestanswer")
+    op.drop_table("latestanswer")
@@ -0,0 +1,248 @@
+"""Cache of compiled programs for the compiled languages.
+
+The compile command of a language is run in the same container as the program (see run/compile.sh in run2),
+so every run compiles the program again. The cache stores the files that the compile command produced and
+the compile output. The key is a hash of the language, the compile command line, the container and the contents
+of the files in the program directory.
+
+On a miss, the files matching the output patterns are removed and the program is compiled in a run of its own
+(with save_compile_output=True). The output files are stored before the program is run; otherwise the program
+could replace the compiled files with something else.
+On a hit, the files are copied back to the program directory and the compile command is replaced with
+REPLAY_COMMANDLINE, which only prints the saved compile output.
+
+Entries are directories under COMPILE_CACHE_DIR. The mtime of an entry is updated on each hit, and the least
+recently used entries are removed when the cache grows over COMPILE_CACHE_MAX_BYTES. Setting
+COMPILE_CACHE_MAX_BYTES to 0 disables the cache.
+"""
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from fnmatch import fnmatch
+
+from cs_logging import log_warning
+
+CACHE_DIR = os.environ.get("COMPILE_CACHE_DIR", "/tmp/compile_cache")
+MAX_BYTES = int(os.environ.get("COMPILE_CACHE_MAX_BYTES", str(1024**3)))
+
+# Programs whose directory is bigger than this are not cached; hashing them would take too long.
+MAX_SOURCE_FILES = 200
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Change this when the format of the entries or the key changes.
+CACHE_VERSION = "1"
+
+# Files that run/compile.sh writes when run2 is called with save_compile_output=True.
+COMPILE_OUT = "run/compile.out"
+COMPILE_ERR = "run/compile.err"
+COMPILE_STATUS = "run/compile.status"
+
+CACHED_OUT = "run/compile.cached.out"
+CACHED_ERR = "run/compile.cached.err"
+REPLAY_COMMANDLINE = f"cat {CACHED_OUT} && cat {CACHED_ERR} >&2"
+
+# Files in the program directory that do not affect compiling.
+IGNORED_FILES = ["run/*", "pwd.txt"]
+
+
+def is_enabled() -> bool:
+    return MAX_BYTES > 0
+
+
+def walk_files(path: str):
+    """Yields the relative paths of the regular files under the path in a stable order."""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            if os.path.isfile(full) and not os.path.islink(full):
+                yield os.path.relpath(full, path)
+
+
+def matches_any(relpath: str, patterns: list[str]) -> bool:
+    return any(fnmatch(relpath, p) for p in patterns)
+
+
+def get_cache_key(
+    prgpath: str,
+    language: str,
+    compile_commandline: str,
+    dockercontainer: str,
+    outputs: list[str],
+    ignored: list[str],
+) -> str | None:
+    """Returns the cache key of the program or None if the program should not be cached.
+
+    :param prgpath: The program directory.
+    :param language: Name of the language.
+    :param compile_commandline: The compile command, with the program directory replaced by /home/agent.
+    :param dockercontainer: The container where the program is compiled.
+    :param outputs: Patterns of the files produced by the compile command, relative to prgpath.
+    :param ignored: Patterns of other files that do not affect compiling.
+    """
+    h = hashlib.sha256()
+    for part in (CACHE_VERSION, language, compile_commandline, dockercontainer):
+        h.update(part.encode())
+        h.update(b"\0")
+    count = 0
+    size = 0
+    for relpath in walk_files(prgpath):
+        if matches_any(relpath, outputs) or matches_any(relpath, ignored):
+            continue
+        count += 1
+        size += os.path.getsize(os.path.join(prgpath, relpath))
+        if count > MAX_SOURCE_FILES or size > MAX_SOURCE_BYTES:
+            return None
+        h.update(relpath.encode())
+        h.update(b"\0")
+        with open(os.path.join(prgpath, relpath), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key)
+
+
+def restore(key: str, prgpath: str) -> bool:
+    """Copies the cached files of the key to the program directory.
+
+    The saved compile output is written to CACHED_OUT and CACHED_ERR for REPLAY_COMMANDLINE.
+
+    :return: True if the key was in the cache.
+    """
+    entry = entry_path(key)
+    files = os.path.join(entry, "files")
+    if not os.path.isdir(files):
+        return False
+    try:
+        for relpath in walk_files(files):
+            dest = os.path.join(prgpath, relpath)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(os.path.join(files, relpath), dest)
+        os.makedirs(os.path.join(prgpath, "run"), exist_ok=True)
+        shutil.copyfile(os.path.join(entry, "out"), os.path.join(prgpath, CACHED_OUT))
+        shutil.copyfile(os.path.join(entry, "err"), os.path.join(prgpath, CACHED_ERR))
+        os.utime(entry)
+    except OSError:
+        # The entry was evicted while copying; the compile command overwrites whatever was copied.
+        return False
+    return True
+
+
+def clean_compile_output(prgpath: str) -> None:
+    """Removes the compile output files of run2 and restore from the program directory."""
+    for f in (COMPILE_OUT, COMPILE_ERR, COMPILE_STATUS, CACHED_OUT, CACHED_ERR):
+        try:
+            os.remove(os.path.join(prgpath, f))
+        except OSError:
+            pass
+
+
+def compile_succeeded(prgpath: str) -> bool:
+    """Returns whether the compile command of a run with save_compile_output=True succeeded."""
+    try:
+        with open(os.path.join(prgpath, COMPILE_STATUS)) as f:
+            return f.read().strip() == "0"
+    except OSError:
+        # The program was not compiled (e.g. the container did not start).
+        return False
+
+
+def remove_outputs(prgpath: str, outputs: list[str]) -> None:
+    """Removes the files and links matching the output patterns from the program directory.
+
+    This must be done before compiling the program for store; earlier runs may have left files that
+    look like compiled files.
+    """
+    for root, dirs, files in os.walk(prgpath):
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            full = os.path.join(root, name)
+            if matches_any(os.path.relpath(full, prgpath), outputs):
+                os.remove(full)
+
+
+def store(key: str, prgpath: str, outputs: list[str]) -> bool:
+    """Stores the files produced by a successful compile to the cache.
+
+    :param key: The cache key from get_cache_key.
+    :param prgpath: The program directory, after remove_outputs and a run with save_compile_output=True that
+     only compiled the program. Nothing else may have been run in the directory since, or the stored files
+     cannot be trusted.
+    :param outputs: Patterns of the files produced by the compile command.
+    :return: True if the files were stored.
+    """
+    if not compile_succeeded(prgpath):
+        return False
+    produced = [
+        relpath for relpath in walk_files(prgpath) if matches_any(relpath, outputs)
+    ]
+    if not produced:
+        return False
+    entry = entry_path(key)
+    if os.path.isdir(entry):
+        return False
+    tmp = os.path.join(CACHE_DIR, "tmp-" + str(uuid.uuid4()))
+    try:
+        for relpath in produced:
+            dest = os.path.join(tmp, "files", relpath)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(os.path.join(prgpath, relpath), dest)
+        shutil.copyfile(os.path.join(prgpath, COMPILE_OUT), os.path.join(tmp, "out"))
+        shutil.copyfile(os.path.join(prgpath, COMPILE_ERR), os.path.join(tmp, "err"))
+        # Another run may have stored the same key meanwhile; then renaming fails.
+        os.rename(tmp, entry)
+    except OSError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(entry):
+            log_warning(f"Could not store compiled files to cache: {e}")
+        return False
+    evict()
+    return True
+
+
+def get_entries() -> list[tuple[float, int, str]]:
+    """Returns the (last used time, size, path) of the cache entries."""
+    entries = []
+    try:
+        dirs = list(os.scandir(CACHE_DIR))
+    except OSError:
+        return entries
+    for d in dirs:
+        if not d.is_dir() or d.name.startswith("tmp-"):
+            continue
+        try:
+            size = sum(
+                os.path.getsize(os.path.join(d.path, f)) for f in walk_files(d.path)
+            )
+            entries.append((d.stat().st_mtime, size, d.path))
+        except OSError:
+            pass
+    return entries
+
+
+def evict(max_bytes: int | None = None) -> None:
+    """Removes the least recently used entries until the cache fits in max_bytes (default MAX_BYTES)."""
+    if max_bytes is None:
+        max_bytes = MAX_BYTES
+    entries = sorted(get_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+    # Leftovers of interrupted stores.
+    try:
+        for d in os.scandir(CACHE_DIR):
+            if d.name.startswith("tmp-") and d.stat().st_mtime < time.time() - 3600:
+                shutil.rmtree(d.path, ignore_errors=True)
+    except OSError:
+        pass
+
+
+def clear() -> None:
+    """Removes all entries from the cache."""
+    evict(0)
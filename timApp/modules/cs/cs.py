@@ -7,6 +7,7 @@ import http.server
 import io
 import json
 import logging
+import math
 import os
 import re
 import shlex
@@ -22,13 +23,20 @@ from subprocess import Popen, PIPE, check_output
 from traceback import print_exc
 from urllib.request import urlopen
 
+import sandbox
 from cs_logging import get_logger
 from file_handler import FileHandler
 from file_util import write_safe, rm, rm_safe
 from languages import dummy_language, sanitize_cmdline
 from manager import all_js_files, all_css_files
 from points import return_points, get_points_rule, check_number_rule, give_points
-from run import generate_filename, run2_subdir
+from run import generate_filename, run2_subdir, get_volume_args, CS3_TAG
+from worker_pool import (
+    BoundedForkingMixIn,
+    BUSY_MESSAGE,
+    WORKERS,
+    is_status_path,
+)
 from tim_common.cs_sanitizer import cs_min_sanitize, svg_sanitize, tim_sanitize
 from tim_common.fileParams import (
     encode_json_data,
@@ -996,8 +1004,16 @@ class TIMServer(http.server.BaseHTTPRequestHandler):
 
     def do_GET(self):
         # print("do_GET ==================================================")
+        if is_status_path(self.path):
+            return self.do_status()
         self.do_all(get_params(self))
 
+    def do_status(self):
+        do_headers(self, "application/json")
+        get_status = getattr(self.server, "get_status", None)
+        status = get_status() if get_status else {}
+        self.wout(json.dumps({"server": type(self.server).__name__, **status}))
+
     def do_POST(self):
         # print("do_POST =================================================")
         if self.path == "/cs/fetchExternal":
@@ -1195,9 +1211,22 @@ class TIMServer(http.server.BaseHTTPRequestHandler):
         timeout = (
             timeout + 2.5
         )  # +2.5 because we want languages to realize the timeout first
+        accepted_at = getattr(self.server, "accepted_at", None)
+        if accepted_at is not None:
+            # The time spent in the queue of the worker pool is part of the timeout.
+            timeout -= time.monotonic() - accepted_at
+            if timeout <= 0:
+                self.send_response(503)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-type", "application/json")
+                self.end_headers()
+                self.wout(json.dumps({"error": BUSY_MESSAGE}))
+                return
+        # The languages give the run what is left of the time of the request.
+        query.deadline = time.monotonic() + timeout - 2.5
         try:
             signal.signal(signal.SIGALRM, signal_handler)
-            signal.alarm(timeout)  # Ten seconds
+            signal.alarm(max(1, math.ceil(timeout)))
         except Exception as e:
             # print("No signal", e)  #  TODO; why is this signal at all when it always comes here?
             pass
@@ -2080,6 +2109,12 @@ if __debug__:
         """Handle requests in a separate thread."""
 
     print("Debug mode/ThreadingMixIn")
+elif WORKERS > 0:
+
+    class ThreadedHTTPServer(BoundedForkingMixIn, http.server.HTTPServer):
+        """Handle requests in a separate process, with a bounded number of processes."""
+
+    print(f"Normal mode/BoundedForkingMixIn, {WORKERS} workers")
 else:
 
     class ThreadedHTTPServer(socketserver.ForkingMixIn, http.server.HTTPServer):
@@ -2090,6 +2125,8 @@ else:
 
 if __name__ == "__main__":
     init_directories()
+    if sandbox.POOL_SIZE > 0:
+        sandbox.warm_up(f"timimages/cs3:{CS3_TAG}", get_volume_args([]))
     server = ThreadedHTTPServer(("", PORT), TIMServer)
     print("Starting server, use <Ctrl-C> to stop")
     server.serve_forever()
@@ -2,6 +2,7 @@ import codecs
 import functools
 import hashlib
 import json
+import math
 import os
 import re
 import shlex
@@ -17,6 +18,7 @@ from zipfile import ZipFile
 
 import requests
 
+import compile_cache
 from file_util import File, default_filename, write_safe, rm_safe
 from modifiers import Modifier
 from points import give_points
@@ -89,6 +91,22 @@ def is_compile_error(out, err):
     return out.find("Compile error") >= 0 or err.find("Compile error") >= 0
 
 
+def limit_timeout(timeout, end):
+    """Limits the timeout (in seconds) of a run to the time left before end (a time.monotonic() value).
+
+    :return: timeout, or the whole seconds left before end if it is less, but at least one second
+    """
+    if end is None:
+        return timeout
+    remaining = math.floor(end - time.monotonic())
+    try:
+        if remaining < float(timeout):
+            return max(1, remaining)
+    except ValueError:
+        pass
+    return timeout
+
+
 def file_hash(s):
     h = hashlib.new("ripemd160")
     h.update(s.encode())
@@ -124,7 +142,10 @@ class Language:
             self.genname = file_hash(sourcefiles)
         self.delete_tmp = True
         self.opt = get_param(query, "opt", "")
-        self.timeout = get_param(query, "timeout", 10)
+        # The request may have waited in the queue of the worker pool (see cs.py do_all).
+        self.timeout = limit_timeout(
+            get_param(query, "timeout", 10), getattr(query, "deadline", None)
+        )
         self.task_id = get_param(query, "taskID", "")
         self.doc_id, self.dummy = (self.task_id + "NONE.none").split(".", 1)
         self.no_x11 = get_json_param(query.jso, "markup", "noX11", False)
@@ -268,6 +289,38 @@ class Language:
     def get_cmdline(self):
         return ""
 
+    def compile_outputs(self) -> list[str] | None:
+        """
+        :return: patterns of the files that the compile command produces, relative to prgpath,
+                 or None if the compiled program should not be cached
+        """
+        return None
+
+    def get_compile_cache_key(self, cwd):
+        if (
+            not self.compile_commandline
+            or not compile_cache.is_enabled()
+            or not self.markup.get("compileCache", True)
+            or self.rootpath is not None
+            or cwd != self.prgpath
+            or get_param(self.query, "nocode", False)
+        ):
+            return None
+        outputs = self.compile_outputs()
+        if outputs is None:
+            return None
+        return compile_cache.get_cache_key(
+            self.prgpath,
+            type(self).__name__,
+            self.compile_commandline,
+            f"{self.dockercontainer} {CS3_TAG}",
+            outputs,
+            [
+                *compile_cache.IGNORED_FILES,
+                os.path.relpath(self.inputfilename, self.prgpath),
+            ],
+        )
+
     def set_stdin(self, userinput):
         stdin_default = None
 
@@ -381,26 +434,70 @@ class Language:
 
         mounts = self.query.jso.get("markup", {}).get("mounts", [])
 
-        code, out, err, pwddir = run2_subdir(
-            args,
+        cwd = df(cwd, self.prgpath)
+        timeout = df(timeout, self.timeout)
+        deadline = getattr(self.query, "deadline", None)
+        run_kwargs = dict(
             dir=self.rootpath,
-            cwd=df(cwd, self.prgpath),
+            cwd=cwd,
             shell=df(shell, False),
             kill_tree=df(kill_tree, True),
-            timeout=df(timeout, self.timeout),
+            timeout=limit_timeout(timeout, deadline),
             env=df(env, dict(os.environ)),
-            stdin=df(stdin, self.stdin),
-            uargs=uargs,
             code=df(code, "utf-8"),
             extra=df(extra, ""),
             ulimit=df(ulimit, self.ulimit),
             no_x11=df(no_x11, self.no_x11),
             savestate=df(savestate, self.savestate),
             dockercontainer=df(dockercontainer, self.dockercontainer),
-            compile_commandline=self.compile_commandline,
             mounts=mounts,
             extra_mappings=extra_mappings,
         )
+        compile_commandline = self.compile_commandline
+        cache_key = self.get_compile_cache_key(cwd)
+        if cache_key:
+            compile_cache.clean_compile_output(self.prgpath)
+            if compile_cache.restore(cache_key, self.prgpath):
+                compile_commandline = compile_cache.REPLAY_COMMANDLINE
+            else:
+                # Compile in a run of its own so that the program cannot change the compiled files
+                # before they are stored.
+                outputs = self.compile_outputs()
+                compile_cache.remove_outputs(self.prgpath, outputs)
+                started = time.monotonic()
+                code, out, err, pwddir = run2_subdir(
+                    ["true"],
+                    **run_kwargs,
+                    compile_commandline=compile_commandline,
+                    save_compile_output=True,
+                )
+                if not compile_cache.compile_succeeded(self.prgpath):
+                    compile_cache.clean_compile_output(self.prgpath)
+                    return code, out, err, pwddir
+                stored = compile_cache.store(cache_key, self.prgpath, outputs)
+                if self.just_compile:
+                    compile_cache.clean_compile_output(self.prgpath)
+                    return code, "", "Compiled " + self.filename, pwddir
+                if stored and compile_cache.restore(cache_key, self.prgpath):
+                    compile_commandline = compile_cache.REPLAY_COMMANDLINE
+                # Compiling and running share the timeout, as when they are done in the same run.
+                try:
+                    end = started + float(timeout)
+                except ValueError:
+                    end = None
+                if deadline is not None and (end is None or deadline < end):
+                    end = deadline
+                run_kwargs["timeout"] = limit_timeout(timeout, end)
+
+        code, out, err, pwddir = run2_subdir(
+            args,
+            **run_kwargs,
+            stdin=df(stdin, self.stdin),
+            uargs=uargs,
+            compile_commandline=compile_commandline,
+        )
+        if cache_key:
+            compile_cache.clean_compile_output(self.prgpath)
         if self.just_compile and not err:
             return code, "", "Compiled " + self.filename, pwddir
         return code, out, err, pwddir
@@ -537,6 +634,9 @@ class CS(Language):
         )
         return cmdline
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         code, out, err, pwddir = self.runself(
             ["dotnet", "exec", *CS.runtime_config(), self.pure_exename]
@@ -588,6 +688,9 @@ class GoLang(Language):
             f"{self.compiler} build {self.opt} -o {self.exename} {self.sourcefilename}"
         )
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself([self.pure_exename])
 
@@ -796,6 +899,10 @@ class CSComtest(
         )
         return cmdline
 
+    def compile_outputs(self):
+        # ComTest generates the test source from the program.
+        return [os.path.normpath(self.testdll), f"{self.filename}Test.cs"]
+
     def run(self, result, sourcelines, points_rule):
         eri = -1
         code, out, err, pwddir = self.runself(
@@ -921,6 +1028,9 @@ class Java(Language):
             + f" {self.javaname}"
         )
 
+    def compile_outputs(self):
+        return ["*.class"]
+
     def run(self, result, sourcelines, points_rule):
         code, out, err, pwddir = self.runself(
             [
@@ -951,6 +1061,9 @@ class Kotlin(Java):
     def get_cmdline(self):
         return f"kotlinc  {self.filename} -include-runtime -d {self.jarname}"
 
+    def compile_outputs(self):
+        return [self.jarname]
+
     def run(self, result, sourcelines, points_rule):
         code, out, err, pwddir = self.runself(
             ["java", "-jar", self.jarname], ulimit=df(self.ulimit, "ulimit -f 10000")
@@ -1033,6 +1146,10 @@ class JComtest(Java, Modifier):
     def get_cmdline(self):
         return f"java comtest.ComTest {self.sourcefilename} && javac {self.sourcefilename} {self.testcs}"
 
+    def compile_outputs(self):
+        # ComTest generates the test source from the program.
+        return ["*.class", os.path.relpath(self.testcs, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         code, out, err, pwddir = self.runself(
             ["java", "org.junit.runner.JUnitCore", self.testdll], no_uargs=True
@@ -1104,6 +1221,9 @@ class Scala(Language):
     def get_cmdline(self):
         return "scalac %s" % self.sourcefilename
 
+    def compile_outputs(self):
+        return ["*.class"]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself(
             ["scala", self.classname], ulimit=df(self.ulimit, "ulimit -f 10000")
@@ -1126,6 +1246,9 @@ class CC(Language):
             self.compiler + f" -Wall {self.opt} {self.sources()} -o {self.exename} -lm"
         )
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself([self.pure_exename])
 
@@ -1209,6 +1332,9 @@ class Fortran(Language):
             + f" -Wall {self.opt} {self.sourcefilename} -o {self.exename} -lm"
         )
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath), "*.mod"]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself([self.pure_exename])
 
@@ -1903,6 +2029,9 @@ class FS(Language):
     def get_cmdline(self):
         return f"fsharpc --nologo --out:{self.exename} {self.sourcefilename}"
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself(["mono", self.pure_exename])
 
@@ -2203,6 +2332,9 @@ class Rust(Language):
     def get_cmdline(self):
         return f"{self.compiler} -C debuginfo=0 -o {self.exename} {self.opt} {self.sourcefilename}"
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath)]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself([self.pure_exename])
 
@@ -2220,6 +2352,9 @@ class Pascal(Language):
     def get_cmdline(self):
         return self.compiler + f" {self.opt} {self.sourcefilename} -o{self.exename}"
 
+    def compile_outputs(self):
+        return [os.path.relpath(self.exename, self.prgpath), "*.o"]
+
     def run(self, result, sourcelines, points_rule):
         return self.runself([self.pure_exename])
 
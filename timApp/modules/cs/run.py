@@ -9,6 +9,8 @@ import uuid
 from pathlib import PurePath, PureWindowsPath
 from subprocess import PIPE, Popen
 
+import sandbox
+from compile_cache import COMPILE_OUT, COMPILE_ERR, COMPILE_STATUS
 from file_util import write_safe, is_safe_path, rm_safe
 from tim_common.fileParams import mkdirs, tquote, get_param
 
@@ -93,6 +95,65 @@ def run(
     return p.returncode, stdout.decode(), stderr.decode()
 
 
+def get_volume_args(mounts, extra_mappings=None):
+    """
+    Return the docker arguments for the csplugin folders, the user mappings and the network of a run
+    :param mounts: User-defined mounts
+    :param extra_mappings: Extra non-user csplugin folder mappings
+    :return: docker arguments
+    """
+    compose_proj = os.environ["COMPOSE_PROJECT_NAME"]
+
+    # Convert possible Windows path to Linux style, e.g. C:/Users/... -> /C/Users/...
+    root_dir = PureWindowsPath(os.environ["TIM_ROOT"])
+    if root_dir.drive:
+        drive_letter = root_dir.drive[0]
+        root_dir = PurePath("/") / drive_letter / root_dir.relative_to(root_dir.anchor)
+
+    extra_mappings = extra_mappings or []
+
+    root_dir_path = root_dir.as_posix()
+
+    def resolve_mapping(p: str) -> list[str]:
+        orig = (
+            p if p.startswith("/cs_data/") else f"{root_dir_path}/timApp/modules/cs/{p}"
+        )
+        return ["-v", f"{orig}:/cs/{p}:ro"]
+
+    path_mappings = [
+        resolve_mapping(p)
+        for p in [
+            "rcmd.sh",
+            "cpp",
+            "java",
+            "dotnet",
+            "doxygen",
+            "mathcheck",
+            "fs",
+            "data",
+            *extra_mappings,
+        ]
+    ]
+
+    user_mappings = get_user_mappings(root_dir, mounts)
+
+    network_args = (
+        []
+        if CS3_TAG.startswith("base-")
+        else ["--network", f"{compose_proj}_csplugin_db"]
+    )
+
+    return [
+        "--tmpfs",
+        "/cs",
+        *itertools.chain.from_iterable(path_mappings),
+        *itertools.chain.from_iterable(user_mappings),
+        "-v",
+        f"{compose_proj}_csplugin_data:/cs_data:ro",
+        *network_args,
+    ]
+
+
 def get_user_mappings(root_dir, mounts):
     """
     Return list of needed docker volume mappings to map under user directory
@@ -129,7 +190,7 @@ class RunCleaner:
     def __exit__(self, type, value, traceback):
         if self.p.returncode is None:
             self.p.kill()
-            subprocess.run(["docker", "kill", self.container])
+            sandbox.runtime.kill(self.container)
 
         for file in self.files:
             rm_safe(file)
@@ -155,6 +216,7 @@ def run2(
     mounts=[],
     extra_mappings=None,
     escape_pipe=False,
+    save_compile_output=False,
 ):
     """Run that is done by opening a new docker instance to run the command.  A script rcmd.sh is needed to fullfill the
     run inside docker.
@@ -177,6 +239,7 @@ def run2(
     :param escape_pipe: If True, pipe charracter | is escaped into '|'
     :param mounts: User-defined mounts
     :param extra_mappings: Extra non-user csplugin folder mappings
+    :param save_compile_output: If True, the compile output and exit status are also saved for the compile cache
     :return: error code, stdout text, stderr text
 
     """
@@ -234,6 +297,14 @@ def run2(
             + stderrf
             + "\n"
         )
+        if save_compile_output:
+            compile_cmnds += (
+                "status=$?\n"
+                + f"cp ~/{stdoutf} ~/{COMPILE_OUT}\n"
+                + f"cp ~/{stderrf} ~/{COMPILE_ERR}\n"
+                + f"echo $status >~/{COMPILE_STATUS}\n"
+                + "exit $status\n"
+            )
         write_safe(compf, compile_cmnds)
         os.chmod(compf, 0o777)
     else:
@@ -265,88 +336,58 @@ def run2(
     # print("============")
     write_safe(cmdf, cmnds)  # kirjoitetaan komentotiedosto
     mkdirs("/tmp/run")  # varmistetaan run-hakemisto
-    udir = cwd.replace(
-        "/tmp/", ""
-    )  # koska mountattu eri tavalla, poistetaan tmp alusta
-    # print(udir,"\nWait for run")
-    compose_proj = os.environ["COMPOSE_PROJECT_NAME"]
-
-    # Convert possible Windows path to Linux style, e.g. C:/Users/... -> /C/Users/...
-    root_dir = PureWindowsPath(os.environ["TIM_ROOT"])
-    if root_dir.drive:
-        drive_letter = root_dir.drive[0]
-        root_dir = PurePath("/") / drive_letter / root_dir.relative_to(root_dir.anchor)
-
-    extra_mappings = extra_mappings or []
-
-    root_dir_path = root_dir.as_posix()
-
-    def resolve_mapping(p: str) -> list[str]:
-        orig = (
-            p if p.startswith("/cs_data/") else f"{root_dir_path}/timApp/modules/cs/{p}"
+    volume_args = get_volume_args(mounts, extra_mappings)
+    command = ["/cs/rcmd.sh", urndname + ".sh", str(no_x11), str(savestate)]
+    box = None
+    if not mounts and not extra_mappings:
+        box = sandbox.checkout(dockercontainer, cwd, volume_args)
+    if box:
+        # The X server of a pooled sandbox is already running.
+        command[2] = "True"
+        dargs = box.exec_args(command)
+        container = box.name
+    else:
+        dargs = sandbox.runtime.run_args(
+            tmpname, dockercontainer, cwd, volume_args, command
         )
-        return ["-v", f"{orig}:/cs/{p}:ro"]
-
-    path_mappings = [
-        resolve_mapping(p)
-        for p in [
-            "rcmd.sh",
-            "cpp",
-            "java",
-            "dotnet",
-            "doxygen",
-            "mathcheck",
-            "fs",
-            "data",
-            *extra_mappings,
-        ]
-    ]
-
-    user_mappings = get_user_mappings(root_dir, mounts)
-
-    network_args = (
-        []
-        if CS3_TAG.startswith("base-")
-        else ["--network", f"{compose_proj}_csplugin_db"]
-    )
-
-    dargs = [
-        "docker",
-        "run",
-        "--name",
-        tmpname,
-        "--rm=true",
-        "--tmpfs",
-        "/cs",
-        *itertools.chain.from_iterable(path_mappings),
-        *itertools.chain.from_iterable(user_mappings),
-        "-v",
-        f"/tmp/{compose_proj}_uhome/{udir}/:/home/agent/",
-        "-v",
-        f"{compose_proj}_csplugin_data:/cs_data:ro",
-        *network_args,
-        "-w",
-        "/home/agent",
-        dockercontainer,
-        "/cs/rcmd.sh",
-        urndname + ".sh",
-        str(no_x11),
-        str(savestate),
-    ]
-    # dargs = ["docker", "exec", "kana",
-    #         "/cs/rcmd.sh", urndname + ".sh", str(no_x11), str(savestate)]
+        container = tmpname
     # print(" ".join(dargs))
-    p = Popen(
-        dargs, shell=shell, cwd="/cs", stdout=PIPE, stderr=PIPE, env=env
-    )  # , timeout=timeout)
+    try:
+        p = Popen(
+            dargs,
+            shell=shell,
+            cwd=sandbox.runtime.popen_cwd,
+            stdout=PIPE,
+            stderr=PIPE,
+            env=env,
+        )  # , timeout=timeout)
+        return wait_run2(p, container, box, cwd, stdoutf, stderrf, timeout, code)
+    finally:
+        if box:
+            box.release()
+
+
+def wait_run2(p, container, box, cwd, stdoutf, stderrf, timeout, code):
+    """Waits for the run started by run2 and reads its output.
+
+    :param p: The process of the run.
+    :param container: Name of the sandbox of the run.
+    :param box: The pooled sandbox of the run or None.
+    :return: error code, stdout text, stderr text, pwd
+    """
+    pwddir = ""
     errcode = 0
     errtxt = ""
 
     with RunCleaner(
-        p, tmpname, [cwd + "/" + stdoutf, cwd + "/" + stderrf, cwd + "/pwd.txt"]
+        p, container, [cwd + "/" + stdoutf, cwd + "/" + stderrf, cwd + "/pwd.txt"]
     ):
         try:
-            stdout, stderr = p.communicate(timeout=timeout)
+            try:
+                stdout, stderr = p.communicate(timeout=timeout)
+            finally:
+                if box:
+                    box.copy_back()
             # print("stdout: ", stdout[:100])
             # print("stderr: ", stderr)
             # print("Run2 done!")
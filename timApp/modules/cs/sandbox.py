@@ -0,0 +1,379 @@
+"""Sandboxes where run2 runs the programs.
+
+By default, run2 starts a new container for every run, and starting the container takes most of the time of a short
+program. With CSPLUGIN_SANDBOX_POOL_SIZE > 0, each image has a pool of that many containers that are started once
+and reused:
+
+* A run checks out a free sandbox. The sandboxes are shared by the worker processes, so a sandbox is reserved by
+  locking its lock file.
+* The sandbox has its own home directory. The program directory is copied there before the run and copied back
+  after it, so the sandbox never sees the files of other users.
+* When the sandbox is returned, its container is removed and a new one is started in the background, so the next run
+  never sees the files (in /tmp, the /cs tmpfs or anywhere else) or the processes that the previous run left behind.
+  The sandbox stays locked until the new container has started.
+* A sandbox is also started when it is checked out if its container is not running (e.g. it was killed after
+  a timeout) or was not started cleanly.
+
+If no sandbox is free or the run needs extra mounts, run2 starts a new container as before.
+
+The containers are managed by a SandboxRuntime. DockerRuntime is the real one; LocalRuntime runs the commands as
+local processes so that run2 can be tried without Docker (see sandbox_benchmark.py).
+"""
+import fcntl
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from subprocess import Popen, DEVNULL
+
+from cs_logging import log_warning
+
+POOL_SIZE = int(os.environ.get("CSPLUGIN_SANDBOX_POOL_SIZE", 0))
+# Bigger program directories are not copied to a sandbox.
+MAX_HOME_BYTES = int(os.environ.get("CSPLUGIN_SANDBOX_MAX_HOME_BYTES", 50 * 1024**2))
+
+POOL_DIR = "/tmp/sandbox_pool"
+
+# The X server of a pooled sandbox is started with the sandbox, not for each run.
+XVFB_COMMAND = (
+    'Xvfb "$DISPLAY" -ac -screen 0 "$XVFB_WHD" -nolisten tcp +extension GLX +render -noreset -nolisten unix'
+    " >/dev/null 2>&1"
+)
+
+# What /cs/rcmd.sh does, without the X server and the symlinks to /cs_data.
+LOCAL_RCMD = """
+cd "$HOME"
+if [ -e run/compile.sh ]; then
+    run/compile.sh || { echo "Compile error" >&2; exit; }
+fi
+source "$HOME/$1"
+rm "$HOME/$1"
+"""
+
+
+class SandboxRuntime(ABC):
+    popen_cwd: str | None = None
+    """Working directory of the processes that run the commands."""
+
+    @abstractmethod
+    def run_args(
+        self, name: str, image: str, home: str, volume_args: list[str], command
+    ) -> list[str]:
+        """Returns the command line that runs the command in a new sandbox that is removed afterwards.
+
+        :param name: Name of the sandbox.
+        :param image: The image of the sandbox.
+        :param home: The directory that is the home directory of the agent in the sandbox.
+        :param volume_args: The docker arguments for the other mounts and the network.
+        :param command: The command to run.
+        """
+
+    @abstractmethod
+    def start(self, name: str, image: str, home: str, volume_args: list[str]) -> None:
+        """Starts a sandbox that waits for commands, removing the old sandbox with the same name."""
+
+    @abstractmethod
+    def is_running(self, name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def exec_args(self, name: str, home: str, command: list[str]) -> list[str]:
+        """Returns the command line that runs the command in a started sandbox."""
+
+    @abstractmethod
+    def recycle_args(
+        self, name: str, image: str, home: str, volume_args: list[str]
+    ) -> list[str]:
+        """Returns the command line that replaces a used sandbox with a new one like :meth:`start`.
+
+        The command must fail if the new sandbox was not started.
+        """
+
+    @abstractmethod
+    def kill(self, name: str) -> None:
+        """Kills the sandbox after a timeout."""
+
+    @abstractmethod
+    def remove(self, name: str) -> None:
+        pass
+
+
+def host_path(path: str) -> str:
+    """Returns the path on the Docker host of a path under /tmp."""
+    udir = path.replace("/tmp/", "", 1)
+    return f"/tmp/{os.environ['COMPOSE_PROJECT_NAME']}_uhome/{udir}/"
+
+
+class DockerRuntime(SandboxRuntime):
+    popen_cwd = "/cs"
+
+    def run_args(self, name, image, home, volume_args, command):
+        return [
+            "docker",
+            "run",
+            "--name",
+            name,
+            "--rm=true",
+            *volume_args,
+            "-v",
+            f"{host_path(home)}:/home/agent/",
+            "-w",
+            "/home/agent",
+            image,
+            *command,
+        ]
+
+    def start_args(self, name, image, home, volume_args):
+        return [
+            "docker",
+            "run",
+            "--detach",
+            "--name",
+            name,
+            "--rm=true",
+            *volume_args,
+            "-v",
+            f"{host_path(home)}:/home/agent/",
+            "-w",
+            "/home/agent",
+            image,
+            "bash",
+            "-c",
+            f"{XVFB_COMMAND} & exec sleep infinity",
+        ]
+
+    def start(self, name, image, home, volume_args):
+        self.remove(name)
+        subprocess.run(
+            self.start_args(name, image, home, volume_args),
+            check=True,
+            stdout=DEVNULL,
+        )
+
+    def is_running(self, name):
+        r = subprocess.run(
+            ["docker", "inspect", "--format", "{{.State.Running}}", name],
+            stdout=subprocess.PIPE,
+            stderr=DEVNULL,
+        )
+        return r.stdout.strip() == b"true"
+
+    def exec_args(self, name, home, command):
+        return [
+            "docker",
+            "exec",
+            "--user",
+            "agent",
+            "-w",
+            "/home/agent",
+            name,
+            *command,
+        ]
+
+    def recycle_args(self, name, image, home, volume_args):
+        return [
+            "sh",
+            "-c",
+            f"docker rm --force {shlex.quote(name)};"
+            f" {shlex.join(self.start_args(name, image, home, volume_args))}",
+        ]
+
+    def kill(self, name):
+        subprocess.run(["docker", "kill", name])
+
+    def remove(self, name):
+        subprocess.run(
+            ["docker", "rm", "--force", name], stdout=DEVNULL, stderr=DEVNULL
+        )
+
+
+class LocalRuntime(SandboxRuntime):
+    """Runs the commands as local processes in the home directory. Not isolated in any way."""
+
+    def run_args(self, name, image, home, volume_args, command):
+        return self.exec_args(name, home, command)
+
+    def start(self, name, image, home, volume_args):
+        pass
+
+    def is_running(self, name):
+        return True
+
+    def exec_args(self, name, home, command):
+        # command is ["/cs/rcmd.sh", script, no_x11, savestate].
+        return ["env", f"HOME={home}", "bash", "-c", LOCAL_RCMD, "rcmd", command[1]]
+
+    def recycle_args(self, name, image, home, volume_args):
+        return ["true"]
+
+    def kill(self, name):
+        pass
+
+    def remove(self, name):
+        pass
+
+
+runtime: SandboxRuntime = (
+    LocalRuntime()
+    if os.environ.get("CSPLUGIN_SANDBOX_RUNTIME") == "local"
+    else DockerRuntime()
+)
+
+
+def clear_dir(path: str) -> None:
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+
+def is_smaller_than(path: str, max_bytes: int) -> bool:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            size += os.lstat(os.path.join(root, f)).st_size
+            if size > max_bytes:
+                return False
+    return True
+
+
+def mirror_dir(src: str, dest: str) -> None:
+    """Makes dest a copy of src. Symbolic links are copied as links, so they are never followed."""
+    shutil.copytree(src, dest, symlinks=True, dirs_exist_ok=True)
+    for root, dirs, files in os.walk(dest):
+        rel = os.path.relpath(root, dest)
+        for name in dirs + files:
+            if not os.path.lexists(os.path.join(src, rel, name)):
+                p = os.path.join(root, name)
+                if os.path.isdir(p) and not os.path.islink(p):
+                    shutil.rmtree(p)
+                    dirs.remove(name)
+                else:
+                    os.remove(p)
+
+
+class Sandbox:
+    """A checked out sandbox of the pool."""
+
+    def __init__(self, name: str, slot_dir: str, lock_file, workdir: str):
+        self.name = name
+        self.slot_dir = slot_dir
+        self.home = os.path.join(slot_dir, "home")
+        self.lock_file = lock_file
+        self.workdir = workdir
+        self.image = ""
+        self.volume_args: list[str] = []
+
+    def prepare(self, image: str, volume_args: list[str]) -> None:
+        self.image = image
+        self.volume_args = volume_args
+        fresh_file = get_fresh_file(self.slot_dir)
+        if not os.path.exists(fresh_file) or not runtime.is_running(self.name):
+            runtime.start(self.name, image, self.home, volume_args)
+        else:
+            os.remove(fresh_file)
+        clear_dir(self.home)
+        mirror_dir(self.workdir, self.home)
+
+    def exec_args(self, command: list[str]) -> list[str]:
+        return runtime.exec_args(self.name, self.home, command)
+
+    def copy_back(self) -> None:
+        """Copies the files of the run back to the program directory."""
+        mirror_dir(self.home, self.workdir)
+
+    def release(self) -> None:
+        """Replaces the sandbox with a new one in the background and returns it to the pool when that is done."""
+        try:
+            clear_dir(self.home)
+            recycle = runtime.recycle_args(
+                self.name, self.image, self.home, self.volume_args
+            )
+            # The process inherits the lock, so the sandbox stays reserved until the process exits.
+            Popen(
+                ["sh", "-c", '"$@" && touch "$0"', get_fresh_file(self.slot_dir)]
+                + recycle,
+                stdout=DEVNULL,
+                stderr=DEVNULL,
+                pass_fds=[self.lock_file.fileno()],
+                start_new_session=True,
+            )
+        except OSError as e:
+            log_warning(f"Could not recycle sandbox {self.name}: {e}")
+            runtime.remove(self.name)
+        self.lock_file.close()
+
+
+def get_fresh_file(slot_dir: str) -> str:
+    """Returns the file that exists when the sandbox has been started and not used yet."""
+    return os.path.join(slot_dir, "fresh")
+
+
+def get_slot(image: str, i: int) -> tuple[str, str]:
+    """Returns the name and the directory of the ith sandbox of the image."""
+    key = hashlib.sha1(image.encode()).hexdigest()[:12]
+    slot_dir = os.path.join(POOL_DIR, key, str(i))
+    os.makedirs(os.path.join(slot_dir, "home"), exist_ok=True)
+    return (
+        f"{os.environ.get('COMPOSE_PROJECT_NAME', 'tim')}_sandbox_{key}_{i}",
+        slot_dir,
+    )
+
+
+def lock_slot(slot_dir: str):
+    """Returns the locked lock file of the sandbox or None if the sandbox is in use."""
+    lock_file = open(os.path.join(slot_dir, "lock"), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def checkout(image: str, workdir: str, volume_args: list[str]) -> Sandbox | None:
+    """Reserves a started sandbox of the image and copies the program directory to it.
+
+    :param image: The image of the sandbox.
+    :param workdir: The program directory.
+    :param volume_args: The docker arguments for the other mounts and the network, same for all runs.
+    :return: The sandbox, or None if the pool is disabled or all sandboxes are in use.
+    """
+    if POOL_SIZE <= 0 or not is_smaller_than(workdir, MAX_HOME_BYTES):
+        return None
+    for i in range(POOL_SIZE):
+        name, slot_dir = get_slot(image, i)
+        lock_file = lock_slot(slot_dir)
+        if lock_file is None:
+            continue
+        box = Sandbox(name, slot_dir, lock_file, workdir)
+        try:
+            box.prepare(image, volume_args)
+        except (OSError, subprocess.CalledProcessError) as e:
+            log_warning(f"Could not prepare sandbox {name}: {e}")
+            runtime.remove(name)
+            lock_file.close()
+            return None
+        return box
+    return None
+
+
+def warm_up(image: str, volume_args: list[str]) -> None:
+    """Starts the sandboxes of the image so that the first runs do not have to."""
+    for i in range(POOL_SIZE):
+        name, slot_dir = get_slot(image, i)
+        lock_file = lock_slot(slot_dir)
+        if lock_file is None:
+            continue
+        try:
+            runtime.start(name, image, os.path.join(slot_dir, "home"), volume_args)
+            with open(get_fresh_file(slot_dir), "w"):
+                pass
+        except (OSError, subprocess.CalledProcessError) as e:
+            log_warning(f"Could not start sandbox {name}: {e}")
+            return
+        finally:
+            lock_file.close()
@@ -0,0 +1,89 @@
+"""Compares the latency of run2 with new containers and with the sandbox pool.
+
+Run in the csplugin container:
+
+    python3 sandbox_benchmark.py --runs 50
+
+With --runtime local, the programs are run as local processes (see sandbox.LocalRuntime), so the script can be
+used to check run2 without Docker. The languages whose compiler is not installed are skipped.
+"""
+import argparse
+import os
+import shutil
+import time
+
+import sandbox
+from run import run2, generate_filename, CS3_TAG
+from tim_common.fileParams import mkdirs
+
+PROGRAMS = {
+    "python": {
+        "files": {"hello.py": 'print("Hello world!")\n'},
+        "compile": "",
+        "run": ["python3", "hello.py"],
+        "needs": "python3",
+    },
+    "java": {
+        "files": {
+            "Hello.java": 'public class Hello { public static void main(String[] a) { System.out.println("Hello world!"); } }\n'
+        },
+        "compile": "javac Hello.java",
+        "run": ["java", "Hello"],
+        "needs": "javac",
+    },
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_once(program: dict) -> float:
+    cwd = f"/tmp/tmp/{generate_filename()}"
+    mkdirs(cwd)
+    for name, content in program["files"].items():
+        with open(os.path.join(cwd, name), "w") as f:
+            f.write(content)
+    t = time.perf_counter()
+    code, out, err, _ = run2(
+        list(program["run"]),
+        cwd=cwd,
+        timeout=30,
+        env=dict(os.environ),
+        compile_commandline=program["compile"],
+        dockercontainer=f"timimages/cs3:{CS3_TAG}",
+    )
+    elapsed = time.perf_counter() - t
+    shutil.rmtree(cwd, ignore_errors=True)
+    if "Hello world!" not in out:
+        raise Exception(f"Unexpected output: {code} {out!r} {err!r}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--runtime", choices=["docker", "local"], default="docker")
+    args = parser.parse_args()
+    if args.runtime == "local":
+        sandbox.runtime = sandbox.LocalRuntime()
+        os.environ.setdefault("COMPOSE_PROJECT_NAME", "tim")
+        os.environ.setdefault("TIM_ROOT", "/opt/tim")
+    print(f"{'':8} {'':6} {'p50 (s)':>8} {'p95 (s)':>8}")
+    for lang, program in PROGRAMS.items():
+        if args.runtime == "local" and not shutil.which(program["needs"]):
+            print(f"{lang:8} skipped, {program['needs']} not found")
+            continue
+        for mode, pool_size in (("fresh", 0), ("pool", args.pool_size)):
+            sandbox.POOL_SIZE = pool_size
+            run_once(program)  # Starts the sandboxes.
+            times = [run_once(program) for _ in range(args.runs)]
+            print(
+                f"{lang:8} {mode:6} {percentile(times, 0.5):8.3f} {percentile(times, 0.95):8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
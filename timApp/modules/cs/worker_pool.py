@@ -0,0 +1,218 @@
+"""Bounded pool of worker processes for the csPlugin server.
+
+With socketserver.ForkingMixIn, every request forks a new process immediately, so a spike of requests (e.g. an exam)
+runs hundreds of compilers at the same time. BoundedForkingMixIn accepts the connections in the main process and
+queues them, and at most CSPLUGIN_WORKERS worker processes handle requests at the same time. Each request still gets
+a fresh forked process, so the request handling code can keep relying on process isolation.
+
+* If the queue already has CSPLUGIN_QUEUE_SIZE requests, new requests are rejected with 503 immediately.
+* Requests that have waited over CSPLUGIN_MAX_QUEUE_WAIT seconds in the queue are rejected with 503; TIM has most
+  likely stopped waiting for them.
+* Status requests (STATUS_PATHS) skip the queue, so the status can be seen even when the server is saturated.
+
+Setting CSPLUGIN_WORKERS to 0 uses the unbounded ForkingMixIn.
+"""
+import json
+import os
+import socket
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+WORKERS = int(os.environ.get("CSPLUGIN_WORKERS", 2 * (os.cpu_count() or 1)))
+QUEUE_SIZE = int(os.environ.get("CSPLUGIN_QUEUE_SIZE", 200))
+# TIM waits 30 seconds for an answer by default.
+MAX_QUEUE_WAIT = float(os.environ.get("CSPLUGIN_MAX_QUEUE_WAIT", 25))
+
+# How often the main process checks for finished workers when it is idle.
+POLL_INTERVAL = 0.05
+
+STATUS_PATHS = ["/status", "/cs/status"]
+
+BUSY_MESSAGE = "The server is busy. Please try again in a moment."
+
+
+def is_status_path(path: str) -> bool:
+    return path.split("?", 1)[0].rstrip("/") in STATUS_PATHS
+
+
+@dataclass
+class PendingRequest:
+    request: socket.socket
+    client_address: tuple
+    accepted_at: float
+
+
+@dataclass
+class PoolStats:
+    accepted: int = 0
+    rejected: int = 0
+    expired: int = 0
+    waits: deque = field(default_factory=lambda: deque(maxlen=1000))
+    """Queue wait times of the latest started requests."""
+
+    def wait_summary(self) -> dict:
+        if not self.waits:
+            return {"count": 0}
+        waits = sorted(self.waits)
+        return {
+            "count": len(waits),
+            "avg": sum(waits) / len(waits),
+            "p50": waits[len(waits) // 2],
+            "p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            "max": waits[-1],
+        }
+
+
+def send_busy(request: socket.socket) -> None:
+    """Replies 503 to a request that is not going to be handled."""
+    body = json.dumps({"error": BUSY_MESSAGE}).encode()
+    try:
+        # Read what the client has sent so far; closing a socket with unread data resets the connection.
+        request.setblocking(False)
+        try:
+            while request.recv(65536):
+                pass
+        except OSError:
+            pass
+        request.setblocking(True)
+        request.sendall(
+            b"HTTP/1.0 503 Service Unavailable\r\n"
+            b"Retry-After: 1\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+    except OSError:
+        pass
+
+
+class BoundedForkingMixIn:
+    """Handles each request in a new forked process, with at most `workers` processes at a time."""
+
+    workers = WORKERS
+    queue_size = QUEUE_SIZE
+    max_queue_wait = MAX_QUEUE_WAIT
+
+    accepted_at: float | None = None
+    """In a worker process: the time.monotonic() when the request was accepted."""
+
+    def __init__(self, *args, **kwargs):
+        self.pending: deque[PendingRequest] = deque()
+        self.active: set[int] = set()
+        self.uncounted: set[int] = set()
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def serve_forever(self, poll_interval=POLL_INTERVAL):
+        super().serve_forever(poll_interval)
+
+    def process_request(self, request, client_address):
+        now = time.monotonic()
+        if self.is_status_request(request):
+            self.start_worker(request, client_address, now, counted=False)
+            return
+        if len(self.pending) >= self.queue_size:
+            self.stats.rejected += 1
+            send_busy(request)
+            self.shutdown_request(request)
+            return
+        self.stats.accepted += 1
+        self.pending.append(PendingRequest(request, client_address, now))
+        self.dispatch()
+
+    def service_actions(self):
+        super().service_actions()
+        self.dispatch()
+
+    def is_status_request(self, request: socket.socket) -> bool:
+        try:
+            line = request.recv(256, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except OSError:
+            # The request has not arrived yet, so it goes through the queue.
+            return False
+        parts = line.split(b" ", 2)
+        return (
+            len(parts) >= 2
+            and parts[0] == b"GET"
+            and is_status_path(parts[1].decode(errors="replace"))
+        )
+
+    def collect_workers(self) -> None:
+        while self.active or self.uncounted:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.active.clear()
+                self.uncounted.clear()
+                return
+            if pid == 0:
+                return
+            self.active.discard(pid)
+            self.uncounted.discard(pid)
+
+    def dispatch(self) -> None:
+        """Starts the queued requests while there are free workers and rejects the expired ones."""
+        self.collect_workers()
+        now = time.monotonic()
+        while self.pending:
+            p = self.pending[0]
+            waited = now - p.accepted_at
+            if waited > self.max_queue_wait:
+                self.pending.popleft()
+                self.stats.expired += 1
+                send_busy(p.request)
+                self.shutdown_request(p.request)
+            elif len(self.active) < self.workers:
+                self.pending.popleft()
+                self.stats.waits.append(waited)
+                self.start_worker(p.request, p.client_address, p.accepted_at)
+            else:
+                break
+
+    def start_worker(self, request, client_address, accepted_at, counted=True):
+        pid = os.fork()
+        if pid:
+            (self.active if counted else self.uncounted).add(pid)
+            self.close_request(request)
+            return
+        # Same as in ForkingMixIn.process_request.
+        status = 1
+        try:
+            self.accepted_at = accepted_at
+            self.finish_request(request, client_address)
+            status = 0
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            try:
+                self.shutdown_request(request)
+            finally:
+                os._exit(status)
+
+    def get_status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "active": len(self.active),
+            "queue_depth": len(self.pending),
+            "queue_size": self.queue_size,
+            "accepted": self.stats.accepted,
+            "rejected": self.stats.rejected,
+            "expired": self.stats.expired,
+            "queue_wait": self.stats.wait_summary(),
+        }
+
+    def server_close(self):
+        super().server_close()
+        while self.pending:
+            p = self.pending.popleft()
+            send_busy(p.request)
+            self.shutdown_request(p.request)
+        for pid in self.active | self.uncounted:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.active.clear()
+        self.uncounted.clear()
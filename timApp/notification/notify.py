@@ -12,6 +12,7 @@ from timApp.auth.accesshelper import (
     verify_view_access,
     get_item_or_abort,
 )
+from timApp.auth.rightscache import get_access_checkers
 from timApp.auth.sessioninfo import get_current_user_object, get_current_user_id
 from timApp.document.docentry import DocEntry
 from timApp.document.docinfo import DocInfo
@@ -31,7 +32,12 @@ from timApp.notification.send_email import send_email
 from timApp.tim_app import app
 from timApp.timdb.exceptions import TimDbException
 from timApp.timdb.sqa import db
-from timApp.user.user import User
+from timApp.user.user import (
+    User,
+    view_access_set,
+    teacher_access_set,
+    edit_access_set,
+)
 from timApp.util.flask.responsehelper import json_response, ok_response
 from timApp.util.flask.typedblueprint import TypedBlueprint
 from timApp.util.utils import get_current_time, seq_to_str
@@ -392,15 +398,17 @@ def process_pending_notifications():
         else:
             assert False, "Unknown notification type"
         users_to_notify: set[User] = {n.user for n in doc.get_notifications(condition)}
+        checkers = get_access_checkers([doc], list(users_to_notify))
         for user in users_to_notify:
+            access = checkers[user.id, doc.id]
             if (
                 not user.email
-                or not user.has_view_access(doc)
+                or not access.has_some_access(view_access_set)
                 or user.get_prefs().is_item_excluded_from_emails(doc)
             ):
                 continue
 
-            is_teacher: bool = user.has_teacher_access(doc) is not None
+            is_teacher = access.has_some_access(teacher_access_set)
             ps_to_consider = [
                 p
                 for p in ps
@@ -422,7 +430,7 @@ def process_pending_notifications():
             msg = get_message_for(
                 ps_to_consider,
                 doc,
-                show_text=user.has_edit_access(doc)
+                show_text=access.has_some_access(edit_access_set)
                 or not ps_to_consider[0].notify_type.is_document_modification,
                 show_names=is_teacher,
             )
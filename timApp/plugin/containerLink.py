@@ -16,6 +16,7 @@ from timApp.plugin.plugin import Plugin, AUTOMD
 from timApp.plugin.pluginOutputFormat import PluginOutputFormat
 from timApp.plugin.pluginexception import PluginException
 from timApp.plugin.timtable import timTable
+from timApp.util.httpsession import http_request
 from timApp.util.logger import log_warning
 
 CSPLUGIN_DOMAIN = "csplugin"
@@ -263,6 +264,10 @@ def call_plugin_generic(
         log_warning(f"Read timeout occurred for plugin {plugin} in route {route}: {e}")
         raise PluginException(f"Read timeout when calling {plugin} ({url}).")
     else:
+        if r.status_code == 503:
+            raise PluginException(
+                f"Plugin {plugin} is busy. Please try again in a moment."
+            )
         if r.status_code >= 500:
             raise PluginException(f"Got response with status code {r.status_code}")
         return r
@@ -276,7 +281,7 @@ def do_request(
     headers: Any,
     read_timeout: int,
 ) -> requests.Response:
-    resp = requests.request(
+    resp = http_request(
         method,
         url,
         data=data,
@@ -295,17 +300,31 @@ plugin_request_fn = do_request
 def render_plugin(
     docsettings: DocSettings, plugin: Plugin, output_format: PluginOutputFormat
 ) -> str:
-    plugin_data = plugin.render_json()
+    return send_plugin_render(
+        docsettings,
+        plugin.type,
+        plugin.render_json(),
+        plugin.par.get_dumbo_options(base_opts=docsettings.get_dumbo_options()),
+        output_format,
+    )
+
+
+def send_plugin_render(
+    docsettings: DocSettings,
+    plugin_type: str,
+    plugin_data: dict,
+    dumbo_opts: DumboOptions,
+    output_format: PluginOutputFormat,
+) -> str:
+    """Renders a single plugin from its already computed render JSON. Does not access the database."""
     if docsettings.plugin_md():
         convert_md(
             [plugin_data],
-            options=plugin.par.get_dumbo_options(
-                base_opts=docsettings.get_dumbo_options()
-            ),
+            options=dumbo_opts,
             outtype="md" if output_format == PluginOutputFormat.HTML else "latex",
         )
     return call_plugin_generic(
-        plugin.type,
+        plugin_type,
         "post",
         output_format.value,
         data=json.dumps(plugin_data, cls=TimJsonEncoder),
@@ -420,8 +439,28 @@ def render_plugin_multi(
     default_auto_md: bool = False,
 ) -> str:
     opts = docsettings.get_dumbo_options()
-    plugin_dumbo_opts = [p.par.get_dumbo_options(base_opts=opts) for p in plugin_data]
-    plugin_dicts = [p.render_json() for p in plugin_data]
+    return send_plugin_multi(
+        docsettings,
+        plugin,
+        [p.render_json() for p in plugin_data],
+        [p.par.get_dumbo_options(base_opts=opts) for p in plugin_data],
+        plugin_output_format=plugin_output_format,
+        default_auto_md=default_auto_md,
+    )
+
+
+def send_plugin_multi(
+    docsettings: DocSettings,
+    plugin: str,
+    plugin_dicts: list[dict],
+    plugin_dumbo_opts: list[DumboOptions],
+    plugin_output_format: PluginOutputFormat = PluginOutputFormat.HTML,
+    default_auto_md: bool = False,
+) -> str:
+    """Renders multiple plugins of the same type from their already computed render JSONs.
+    Does not access the database.
+    """
+    opts = docsettings.get_dumbo_options()
     plugin_reg = get_plugin(plugin)
     plugin_automd = (
         plugin_reg.automd if plugin_reg.automd is not None else default_auto_md
@@ -480,7 +519,9 @@ def call_plugin_resource(
             f'http://{current_app.config["INTERNAL_PLUGIN_DOMAIN"]}'
         ):
             raise PluginException("Plugin route not found")
-        resp = requests.get(plug.host + filename, timeout=5, stream=True, params=args)
+        resp = http_request(
+            "get", plug.host + filename, timeout=5, stream=True, params=args
+        )
         resp.encoding = "utf-8"
         return resp
     except requests.exceptions.Timeout:
@@ -507,7 +548,7 @@ def call_plugin_answer(plugin: str, answer_data: dict) -> str:
 
 
 # Get lists of js and css files required by plugin, as well as list of Angular modules they define.
-@lru_cache(maxsize=100)
+# The result is cached by timApp.plugin.pluginreqs.
 def plugin_reqs(plugin: str) -> str:
     return call_plugin_generic(plugin, "get", "reqs").text
 
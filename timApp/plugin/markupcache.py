@@ -0,0 +1,210 @@
+"""Cache of the parsed markup of plugin paragraphs.
+
+Parsing the markup of a plugin paragraph means expanding its macros and loading the result as YAML
+(see :func:`get_plugin_markup`). The result depends only on
+
+* the paragraph (its markdown and attributes, i.e. its hash),
+* the settings of the document that are applied to the text before expanding it (character macros, global macros),
+* the values of the macros that the markup actually refers to, including the user-specific macros and the
+  random values of the paragraph, and
+* the global plugin attributes,
+
+so the results are cached with a hash of these as the key. The macros that the markup refers to are found by parsing
+the markup template once per paragraph (see :func:`find_markup_dependencies`). Markup that uses filters whose results
+depend on something else than their arguments (the autocounters, ``belongs``, ``isview``, ``now``, ...) or that may
+modify the macros is never cached, because its result can differ between views or the expansion has side effects.
+
+The cache has an in-process LRU tier and an optional shared tier in Redis. Both tiers store pickled results, so every
+caller gets its own copy of the values.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+from jinja2 import nodes
+from jinja2.filters import FILTERS
+from jinja2.meta import find_undeclared_variables
+from redis import Redis
+
+from timApp.markdown.autocounters import TimSandboxedEnvironment
+from tim_common.timjsonencoder import TimJsonEncoder
+
+KEY_PREFIX = "tim-plugin-markup-"
+
+PURE_TIM_FILTERS = {
+    "Pz",
+    "gfields",
+    "gfrange",
+    "srange",
+    "fmtdate",
+    "fmt",
+    "urlquote",
+    "endvalue",
+}
+"""The TIM macro filters whose results depend only on their arguments."""
+
+CACHEABLE_FILTERS = (set(FILTERS) - {"random"}) | PURE_TIM_FILTERS
+
+UNCACHEABLE_GLOBALS = {"lipsum"}
+
+MUTATING_METHODS = {
+    "append",
+    "extend",
+    "insert",
+    "pop",
+    "popitem",
+    "remove",
+    "reverse",
+    "sort",
+    "clear",
+    "update",
+    "setdefault",
+    "add",
+    "discard",
+    "difference_update",
+    "intersection_update",
+    "symmetric_difference_update",
+}
+
+
+@dataclass(frozen=True)
+class MarkupDependencies:
+    variables: tuple[str, ...]
+    """The names of the macros the markup refers to."""
+    cacheable: bool
+
+
+NO_DEPENDENCIES = MarkupDependencies(variables=(), cacheable=True)
+UNCACHEABLE = MarkupDependencies(variables=(), cacheable=False)
+
+
+def find_markup_dependencies(
+    text: str, env: TimSandboxedEnvironment
+) -> MarkupDependencies:
+    """Finds the macros that the markup template refers to and whether the expanded markup can be cached.
+
+    :param text: The markup after applying the character and global macros, i.e. the template that is rendered.
+    """
+    try:
+        ast = env.parse(text)
+    except Exception:
+        return UNCACHEABLE
+    for f in ast.find_all(nodes.Filter):
+        if f.name not in CACHEABLE_FILTERS:
+            return UNCACHEABLE
+    for c in ast.find_all(nodes.Call):
+        if isinstance(c.node, nodes.Getattr) and c.node.attr in MUTATING_METHODS:
+            return UNCACHEABLE
+    for n in ast.find_all(nodes.Name):
+        if n.name in UNCACHEABLE_GLOBALS:
+            return UNCACHEABLE
+    variables = find_undeclared_variables(ast)
+    return MarkupDependencies(variables=tuple(sorted(variables)), cacheable=True)
+
+
+def get_markup_key(*parts: Any) -> str | None:
+    """Returns the cache key for the given parts, or None if they cannot be serialized."""
+    try:
+        data = json.dumps(parts, sort_keys=True, cls=TimJsonEncoder)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class PluginMarkupCache:
+    """Caches the results of parsing plugin markup and the dependencies of the markup of each paragraph."""
+
+    def __init__(self, max_size: int, shared_expire_secs: int | None = None):
+        """
+        :param max_size: How many results and dependencies are kept in this process; 0 disables the cache.
+        :param shared_expire_secs: How long the results are kept in Redis; None disables the shared tier.
+        """
+        self.max_size = max_size
+        self.shared_expire_secs = shared_expire_secs
+        self.results: OrderedDict[str, bytes] = OrderedDict()
+        self.dependencies: OrderedDict[Hashable, MarkupDependencies] = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _client() -> Redis:
+        from timApp.document.caching import rclient
+
+        return rclient
+
+    def _put_local(self, entries: OrderedDict, key: Hashable, value: Any) -> None:
+        with self.lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def get_dependencies(
+        self, key: Hashable, compute: Callable[[], MarkupDependencies]
+    ) -> MarkupDependencies:
+        with self.lock:
+            deps = self.dependencies.get(key)
+            if deps is not None:
+                self.dependencies.move_to_end(key)
+                return deps
+        deps = compute()
+        self._put_local(self.dependencies, key, deps)
+        return deps
+
+    def get(self, key: str) -> Any | None:
+        with self.lock:
+            data = self.results.get(key)
+            if data is not None:
+                self.results.move_to_end(key)
+        if data is None and self.shared_expire_secs is not None:
+            data = self._client().get(KEY_PREFIX + key)
+            if data is not None:
+                self._put_local(self.results, key, data)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key: str, value: Any) -> None:
+        data = pickle.dumps(value)
+        self._put_local(self.results, key, data)
+        if self.shared_expire_secs is not None:
+            self._client().set(KEY_PREFIX + key, data, ex=self.shared_expire_secs)
+
+    def clear(self) -> None:
+        """Clears the in-process tier."""
+        with self.lock:
+            self.results.clear()
+            self.dependencies.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_cache: PluginMarkupCache | None = None
+
+
+def get_plugin_markup_cache() -> PluginMarkupCache:
+    global _cache
+    if _cache is None:
+        from timApp.tim_app import app
+
+        _cache = PluginMarkupCache(
+            app.config["PLUGIN_MARKUP_CACHE_SIZE"],
+            app.config["PLUGIN_MARKUP_CACHE_EXPIRE_SECS"]
+            if app.config["PLUGIN_MARKUP_CACHE_SHARED"]
+            else None,
+        )
+    return _cache
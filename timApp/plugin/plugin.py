@@ -24,7 +24,20 @@ from timApp.document.viewcontext import ViewContext
 from timApp.document.yamlblock import strip_code_block, YamlBlock, merge
 from timApp.item.taskblock import TaskBlock
 from timApp.markdown.autocounters import TimSandboxedEnvironment
-from timApp.markdown.markdownconverter import expand_macros
+from timApp.markdown.markdownconverter import (
+    expand_macros,
+    apply_char_macros,
+    apply_global_macros,
+    has_macros,
+)
+from timApp.plugin.markupcache import (
+    get_plugin_markup_cache,
+    MarkupDependencies,
+    NO_DEPENDENCIES,
+    UNCACHEABLE,
+    find_markup_dependencies,
+    get_markup_key,
+)
 from timApp.plugin.pluginOutputFormat import PluginOutputFormat
 from timApp.plugin.pluginexception import PluginException
 from timApp.plugin.plugintype import CONTENT_FIELD_NAME_MAP, PluginTypeLazy
@@ -756,8 +769,95 @@ def parse_plugin_values_macros(
     :param env: macro environment
     :return: The parsed markup values.
     """
-    yaml_str = expand_macros_for_plugin(par, macros, env)
-    return load_markup_from_yaml(yaml_str, global_attrs, par.get_attr("plugin"))
+    return get_plugin_markup(par, global_attrs, macros, env).get_values()
+
+
+@dataclass
+class PluginMarkup:
+    md: str
+    """The markup with the macros expanded."""
+    values: dict | None = None
+    error: str | None = None
+
+    def get_values(self) -> dict:
+        if self.error is not None:
+            raise PluginException(self.error)
+        return self.values
+
+
+def parse_plugin_markup(
+    par: DocParagraph,
+    global_attrs: dict[str, str],
+    macros: dict[str, object],
+    env: TimSandboxedEnvironment,
+) -> PluginMarkup:
+    md = expand_macros_for_plugin(par, macros, env)
+    try:
+        values = load_markup_from_yaml(md, global_attrs, par.get_attr("plugin"))
+    except PluginException as e:
+        return PluginMarkup(md=md, error=str(e))
+    return PluginMarkup(md=md, values=values)
+
+
+def get_plugin_markup(
+    par: DocParagraph,
+    global_attrs: dict[str, str],
+    macros: dict[str, object],
+    env: TimSandboxedEnvironment,
+) -> PluginMarkup:
+    """
+    Expands the macros of a plugin paragraph and parses its markup, or returns the cached result if the paragraph,
+    the relevant settings and the macros the markup refers to are the same as before.
+    See :mod:`timApp.plugin.markupcache`.
+    """
+    cache = get_plugin_markup_cache()
+    if not cache.enabled:
+        return parse_plugin_markup(par, global_attrs, macros, env)
+    settings = par.doc.get_settings()
+    nomacros = par.get_nomacros()
+    deps_key = (
+        par.get_hash(),
+        settings.get_plugin_markup_hash(),
+        env.variable_start_string,
+        bool(env.counters and env.counters.use_autonumbering),
+    )
+
+    def find_dependencies() -> MarkupDependencies:
+        if nomacros:
+            return NO_DEPENDENCIES
+        text = apply_char_macros(strip_code_block(par.get_markdown()), settings, env)
+        if not has_macros(text, env):
+            return NO_DEPENDENCIES
+        try:
+            text = apply_global_macros(text, settings)
+        except Exception:
+            return UNCACHEABLE
+        return find_markup_dependencies(text, env)
+
+    deps = cache.get_dependencies(deps_key, find_dependencies)
+    if not deps.cacheable:
+        return parse_plugin_markup(par, global_attrs, macros, env)
+    rnd_macros = par.get_rands()
+    if rnd_macros:
+        macros = {**macros, **rnd_macros}
+    key = get_markup_key(
+        *deps_key,
+        global_attrs,
+        {v: macros[v] for v in deps.variables if v in macros},
+    )
+    if key is None:
+        return parse_plugin_markup(par, global_attrs, macros, env)
+    cached = cache.get(key)
+    if cached is not None:
+        markup, is_plugin = cached
+        # Leave the counters in the same state as expanding the macros would.
+        if not nomacros:
+            env.counters.task_id = par.attrs.get("taskId", None)
+            env.counters.is_plugin = is_plugin
+        return markup
+    markup = parse_plugin_markup(par, global_attrs, macros, env)
+    cache.set(key, (markup, env.counters.is_plugin if env.counters else False))
+    return markup
 
 
 def expand_macros_for_plugin(par: DocParagraph, macros, env: TimSandboxedEnvironment):
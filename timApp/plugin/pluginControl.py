@@ -2,17 +2,21 @@
 import json
 from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
+from functools import partial
 from itertools import chain
+from time import perf_counter
 from typing import Optional, Union, DefaultDict
 from xml.sax.saxutils import quoteattr
 
 import attr
 import yaml
 import yaml.parser
+from flask import current_app
 from sqlalchemy import func
 
 from timApp.answer.answer import Answer
-from timApp.answer.answers import valid_answers_query, valid_taskid_filter
+from timApp.answer.answers import valid_answers_query
+from timApp.answer.latestanswer import LatestAnswer
 from timApp.auth.accesshelper import has_edit_access, verify_view_access
 from timApp.document.docentry import DocEntry
 from timApp.document.docparagraph import DocParagraph
@@ -23,14 +27,18 @@ from timApp.document.randutils import hashfunc
 from timApp.document.usercontext import UserContext
 from timApp.document.viewcontext import ViewContext
 from timApp.document.yamlblock import YamlBlock
-from timApp.markdown.dumboclient import call_dumbo
-from timApp.plugin.containerLink import plugin_reqs, get_plugin
-from timApp.plugin.containerLink import render_plugin_multi, render_plugin, get_plugins
+from timApp.markdown.dumboclient import call_dumbo, DumboOptions
+from timApp.plugin.containerLink import get_plugin
+from timApp.plugin.containerLink import (
+    get_plugins,
+    send_plugin_multi,
+    send_plugin_render,
+)
 from timApp.plugin.plugin import (
     Plugin,
     PluginRenderOptions,
     load_markup_from_yaml,
-    expand_macros_for_plugin,
+    get_plugin_markup,
     find_inline_plugins,
     InlinePlugin,
     finalize_inline_yaml,
@@ -41,8 +49,11 @@ from timApp.plugin.plugin import (
 )
 from timApp.plugin.pluginOutputFormat import PluginOutputFormat
 from timApp.plugin.pluginexception import PluginException
+from timApp.plugin.pluginreqs import get_plugin_reqs
+from timApp.plugin.renderpool import RenderTask, run_render_tasks, log_critical_path
 from timApp.plugin.taskid import TaskId
 from timApp.printing.printsettings import PrintFormat
+from timApp.util.answerutil import task_ids_to_strlist
 from timApp.util.get_fields import (
     get_fields_and_users,
     RequestedGroups,
@@ -234,13 +245,16 @@ class PluginPlacement:
             errs[0, len(md)] = rnd_error, plugin_name or defaultplugin
         elif plugin_name:
             # We want the expanded markdown here, so can't call Plugin.from_paragraph[_macros] directly.
-            macros = macroinfo.get_macros()
-            md = expand_macros_for_plugin(block, macros, macroinfo.jinja_env)
+            markup = get_plugin_markup(
+                block,
+                settings.global_plugin_attrs(),
+                macroinfo.get_macros(),
+                macroinfo.jinja_env,
+            )
+            md = markup.md
             p_range = 0, len(md)
             try:
-                vals = load_markup_from_yaml(
-                    md, settings.global_plugin_attrs(), block.get_attr("plugin")
-                )
+                vals = markup.get_values()
                 if ask_next:
                     block.ask_new = True
                     if vals.get("initNewAnswer", None) == "":
@@ -379,6 +393,7 @@ def get_answers(user, task_ids, answer_map):
     col = func.max(Answer.id).label("col")
     cnt = func.count(Answer.id).label("cnt")
     if user is None:
+        # The latest answer of a global task is the latest of all users, so LatestAnswer does not help here.
         sub = (
             valid_answers_query(task_ids)
             .add_columns(col, cnt)
@@ -386,19 +401,21 @@ def get_answers(user, task_ids, answer_map):
             .group_by(Answer.task_id)
             .subquery()
         )
+        answers: list[tuple[Answer, int]] = (
+            Answer.query.join(sub, Answer.id == sub.c.col)
+            .with_entities(Answer, sub.c.cnt)
+            .all()
+        )
     else:
-        sub = (
-            user.answers.filter(valid_taskid_filter(task_ids))
-            .add_columns(col, cnt)
-            .with_entities(col, cnt)
-            .group_by(Answer.task_id)
-            .subquery()
+        answers = (
+            Answer.query.join(LatestAnswer, Answer.id == LatestAnswer.valid_answer_id)
+            .filter(
+                (LatestAnswer.user_id == user.id)
+                & LatestAnswer.task_id.in_(task_ids_to_strlist(task_ids))
+            )
+            .with_entities(Answer, LatestAnswer.valid_count)
+            .all()
         )
-    answers: list[tuple[Answer, int]] = (
-        Answer.query.join(sub, Answer.id == sub.c.col)
-        .with_entities(Answer, sub.c.cnt)
-        .all()
-    )
     for answer, cnt in answers:
         answer_map[answer.task_id] = answer, cnt
     return cnt, answers
@@ -613,6 +630,10 @@ def pluginify(
     taketime("glb/ucu", "done")
     settings = doc.get_settings()
     all_plugins = []
+    # Everything that needs the database is done in this loop; the plugin calls themselves are run concurrently
+    # afterwards. The results are merged in the same order as the plugin types appear in the document.
+    render_tasks: list[RenderTask] = []
+    render_targets: list[tuple[str, dict[KeyType, Plugin], bool, bool]] = []
     for plugin_name, plugin_block_map in plugins.items():
         taketime("plg", plugin_name)
         try:
@@ -623,106 +644,122 @@ def pluginify(
             for p in plugin_block_map_vals:
                 all_plugins.append(p)
 
-            resp = plugin_reqs(plugin_name)
+            reqs = get_plugin_reqs(plugin_name)
         except PluginException as e:
             has_errors = True
             for idx, r in plugin_block_map.keys():
                 placements[idx].set_error(r, str(e))
             continue
         # taketime("plg e", plugin_name)
+        plugin.can_give_task = reqs.can_give_task
+        js_paths.extend(reqs.js_paths)
+        css_paths.extend(reqs.css_paths)
+
+        default_auto_md = reqs.default_automd
+        base_dumbo_opts = settings.get_dumbo_options()
+
+        if (html_out and reqs.multihtml) or (md_out and reqs.multimd):
+            render_tasks.append(
+                RenderTask(
+                    name=plugin_name,
+                    fn=partial(
+                        send_plugin_multi,
+                        settings,
+                        plugin_name,
+                        [p.render_json() for p in plugin_block_map_vals],
+                        [
+                            p.par.get_dumbo_options(base_opts=base_dumbo_opts)
+                            for p in plugin_block_map_vals
+                        ],
+                        plugin_output_format=output_format,
+                        default_auto_md=default_auto_md,
+                    ),
+                    # Embedded plugins are rendered directly and may need the request context.
+                    inline=plugin.instance is not None,
+                )
+            )
+            render_targets.append((plugin_name, plugin_block_map, plugin_lazy, True))
+        elif md_out:
+            for idx, r in plugin_block_map.keys():
+                err_msg_md = (
+                    "Plugin does not support printing yet. "
+                    "Please refer to TIM help pages if you want to learn how you can manually "
+                    "define what to print here."
+                )
+                placements[idx].set_error(r, err_msg_md)
+        else:
+            render_tasks.append(
+                RenderTask(
+                    name=plugin_name,
+                    fn=partial(
+                        render_plugin_singles,
+                        settings,
+                        plugin_name,
+                        [
+                            (
+                                p.render_json(),
+                                p.par.get_dumbo_options(base_opts=base_dumbo_opts),
+                            )
+                            for p in plugin_block_map_vals
+                        ],
+                        output_format,
+                    ),
+                    inline=plugin.instance is not None,
+                )
+            )
+            render_targets.append((plugin_name, plugin_block_map, plugin_lazy, False))
+
+    render_start = perf_counter()
+    render_results = run_render_tasks(
+        render_tasks,
+        pool_size=current_app.config["PLUGIN_RENDER_CONCURRENCY"],
+        timeout=current_app.config["PLUGIN_RENDER_TIMEOUT"],
+    )
+    log_critical_path(
+        render_results,
+        perf_counter() - render_start,
+        current_app.config["PLUGIN_RENDER_LOG_THRESHOLD"],
+    )
+    for (plugin_name, plugin_block_map, plugin_lazy, is_multi), result in zip(
+        render_targets, render_results
+    ):
+        taketime("plg e", plugin_name)
+        if result.error is not None:
+            has_errors = True
+            for idx, r in plugin_block_map.keys():
+                placements[idx].set_error(r, str(result.error))
+            continue
+        if not is_multi:
+            for ((idx, r), plugin), html in zip(plugin_block_map.items(), result.value):
+                if isinstance(html, PluginException):
+                    has_errors = True
+                    placements[idx].set_error(r, str(html))
+                    continue
+                placements[idx].set_output(r, html)
+            continue
         try:
-            reqs = json.loads(resp)
-            plugin.can_give_task = reqs.get("canGiveTask", False)
-            if plugin_name == "mmcq" or plugin_name == "mcq":
-                reqs["multihtml"] = True
-                reqs["multimd"] = True
+            plugin_htmls = json.loads(result.value)
         except ValueError as e:
             has_errors = True
             for idx, r in plugin_block_map.keys():
                 placements[idx].set_error(
-                    r, f"Failed to parse JSON from plugin reqs route: {e}"
+                    r, f"Failed to parse plugin response from multihtml route: {e}"
                 )
             continue
-        plugin_js_files, plugin_css_files = plugin_deps(reqs)
-        for src in plugin_js_files:
-            if src.startswith("http") or src.startswith("/"):  # absolute URL
-                js_paths.append(src)
-            elif src.endswith(".js"):  # relative JS URL
-                js_paths.append(f"/{plugin_name}/{src}")
-            else:  # module name
-                js_paths.append(src)
-        for src in plugin_css_files:
-            if src.startswith("http") or src.startswith("/"):
-                css_paths.append(src)
-            else:
-                css_paths.append(f"/{plugin_name}/{src}")
-
-        # Remove duplicates, preserving order TODO: could this be done out of the loop?
-        # taketime("rmv", "Remove dupl")
-        js_paths = list(OrderedDict.fromkeys(js_paths))
-        css_paths = list(OrderedDict.fromkeys(css_paths))
-
-        default_auto_md = reqs.get("default_automd", False)
-
-        if (html_out and reqs.get("multihtml")) or (md_out and reqs.get("multimd")):
-            try:
-                # taketime("plg m", plugin_name)
-                response = render_plugin_multi(
-                    settings,
-                    plugin_name,
-                    list(plugin_block_map.values()),
-                    plugin_output_format=output_format,
-                    default_auto_md=default_auto_md,
+        if not isinstance(plugin_htmls, list):
+            for ((idx, r), plugin) in plugin_block_map.items():
+                plugin.plugin_lazy = plugin_lazy
+                placements[idx].set_error(
+                    r,
+                    f"Multihtml response of {plugin_name} was not a list: {plugin_htmls}",
                 )
-                taketime("plg e", plugin_name)
-            except PluginException as e:
-                has_errors = True
-                for idx, r in plugin_block_map.keys():
-                    placements[idx].set_error(r, str(e))
-                continue
-            try:
-                plugin_htmls = json.loads(response)
-            except ValueError as e:
-                has_errors = True
-                for idx, r in plugin_block_map.keys():
-                    placements[idx].set_error(
-                        r, f"Failed to parse plugin response from multihtml route: {e}"
-                    )
-                continue
-            if not isinstance(plugin_htmls, list):
-                for ((idx, r), plugin) in plugin_block_map.items():
-                    plugin.plugin_lazy = plugin_lazy
-                    placements[idx].set_error(
-                        r,
-                        f"Multihtml response of {plugin_name} was not a list: {plugin_htmls}",
-                    )
-            else:
-                for ((idx, r), plugin), html in zip(
-                    plugin_block_map.items(), plugin_htmls
-                ):
-                    plugin.plugin_lazy = plugin_lazy
-                    placements[idx].set_output(r, html)
         else:
-            for (idx, r), plugin in plugin_block_map.items():
-                if md_out:
-                    err_msg_md = (
-                        "Plugin does not support printing yet. "
-                        "Please refer to TIM help pages if you want to learn how you can manually "
-                        "define what to print here."
-                    )
-                    placements[idx].set_error(r, err_msg_md)
-                else:
-                    try:
-                        html = render_plugin(
-                            docsettings=settings,
-                            plugin=plugin,
-                            output_format=output_format,
-                        )
-                    except PluginException as e:
-                        has_errors = True
-                        placements[idx].set_error(r, str(e))
-                        continue
-                    placements[idx].set_output(r, html)
+            for ((idx, r), plugin), html in zip(plugin_block_map.items(), plugin_htmls):
+                plugin.plugin_lazy = plugin_lazy
+                placements[idx].set_output(r, html)
+    # Remove duplicates, preserving order
+    js_paths = list(OrderedDict.fromkeys(js_paths))
+    css_paths = list(OrderedDict.fromkeys(css_paths))
     taketime("plg m", "Plugins done")
 
     taketime("plc", "Placement start")
@@ -774,35 +811,36 @@ def pluginify(
     )
 
 
+def render_plugin_singles(
+    settings: DocSettings,
+    plugin_type: str,
+    plugin_datas: list[tuple[dict, DumboOptions]],
+    output_format: PluginOutputFormat,
+) -> list[str | PluginException]:
+    """Renders plugins of a type that does not support multihtml one by one.
+
+    :return: The HTML of each plugin, or the exception if rendering the plugin failed.
+    """
+    htmls: list[str | PluginException] = []
+    for plugin_data, dumbo_opts in plugin_datas:
+        try:
+            htmls.append(
+                send_plugin_render(
+                    settings, plugin_type, plugin_data, dumbo_opts, output_format
+                )
+            )
+        except PluginException as e:
+            htmls.append(e)
+    return htmls
+
+
 def get_all_reqs():
     allreqs = {}
     for plugin, vals in get_plugins().items():
         if vals.skip_reqs:
             continue
         try:
-            resp = plugin_reqs(plugin)
+            allreqs[plugin] = get_plugin_reqs(plugin).reqs
         except PluginException:
             continue
-        try:
-            reqs = json.loads(resp)
-            allreqs[plugin] = reqs
-        except ValueError:
-            continue
     return allreqs
-
-
-def plugin_deps(p: dict) -> tuple[list[str], list[str]]:
-    """
-
-    :param p: is json of plugin requirements of the form:
-              {"js": ["js.js"], "css":["css.css"]}
-    """
-    js_files = []
-    css_files = []
-    if "css" in p:
-        for cssF in p["css"]:
-            css_files.append(cssF)
-    if "js" in p:
-        for jsF in p["js"]:
-            js_files.append(jsF)
-    return js_files, css_files
@@ -0,0 +1,238 @@
+"""Process-wide cache of plugin requirements ("reqs").
+
+The reqs route of a plugin tells which JS and CSS files the plugin needs and which features it supports.
+The response only changes when the plugin is deployed, so it is cached per (plugin name, plugin host) for
+PLUGIN_REQS_TTL seconds. The JS and CSS paths derived from the response are cached as well, so rendering a page
+does not need to parse anything.
+
+If a plugin cannot be reached when its entry is refreshed, the last known good value is used and the refresh is
+retried after PLUGIN_REQS_RETRY_SECS. Errors are not cached when there is no earlier value; otherwise a plugin that
+was not up yet when the cache was warmed up at startup (such as the plugins served by TIM itself) would fail
+until the error expires.
+
+The cache can be invalidated by admins (see :func:`invalidate_plugin_reqs`). The invalidation is propagated to
+the other TIM processes through a generation counter in Redis that each process checks at most every
+PLUGIN_REQS_GENERATION_CHECK_SECS seconds.
+"""
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+from threading import Lock, Thread
+from typing import Callable
+
+from flask import Flask
+
+from timApp.plugin.containerLink import get_plugin, get_plugins, plugin_reqs
+from timApp.plugin.pluginexception import PluginException
+from timApp.util.logger import log_warning
+
+GENERATION_KEY = "tim-plugin-reqs-generation"
+
+
+def plugin_deps(p: dict) -> tuple[list[str], list[str]]:
+    """
+
+    :param p: is json of plugin requirements of the form:
+              {"js": ["js.js"], "css":["css.css"]}
+    """
+    js_files = []
+    css_files = []
+    if "css" in p:
+        for cssF in p["css"]:
+            css_files.append(cssF)
+    if "js" in p:
+        for jsF in p["js"]:
+            js_files.append(jsF)
+    return js_files, css_files
+
+
+@dataclass
+class PluginReqs:
+    """The parsed reqs of a plugin along with the values derived from them."""
+
+    reqs: dict
+    js_paths: list[str]
+    css_paths: list[str]
+    multihtml: bool
+    multimd: bool
+    default_automd: bool
+
+    @staticmethod
+    def from_response(plugin_name: str, response: str) -> PluginReqs:
+        try:
+            reqs = json.loads(response)
+        except ValueError as e:
+            raise PluginException(f"Failed to parse JSON from plugin reqs route: {e}")
+        if not isinstance(reqs, dict):
+            raise PluginException(
+                f"Failed to parse JSON from plugin reqs route: expected an object, got {reqs}"
+            )
+        js_files, css_files = plugin_deps(reqs)
+        js_paths = []
+        css_paths = []
+        for src in js_files:
+            if src.startswith("http") or src.startswith("/"):  # absolute URL
+                js_paths.append(src)
+            elif src.endswith(".js"):  # relative JS URL
+                js_paths.append(f"/{plugin_name}/{src}")
+            else:  # module name
+                js_paths.append(src)
+        for src in css_files:
+            if src.startswith("http") or src.startswith("/"):
+                css_paths.append(src)
+            else:
+                css_paths.append(f"/{plugin_name}/{src}")
+        # mcq and mmcq are rendered by qst.
+        is_mcq = plugin_name == "mmcq" or plugin_name == "mcq"
+        return PluginReqs(
+            reqs=reqs,
+            js_paths=js_paths,
+            css_paths=css_paths,
+            multihtml=is_mcq or bool(reqs.get("multihtml")),
+            multimd=is_mcq or bool(reqs.get("multimd")),
+            default_automd=reqs.get("default_automd", False),
+        )
+
+    @property
+    def can_give_task(self) -> bool:
+        return self.reqs.get("canGiveTask", False)
+
+
+@dataclass
+class ReqsEntry:
+    value: PluginReqs
+    expires_at: float
+
+
+class PluginReqsCache:
+    def __init__(
+        self,
+        ttl: float,
+        retry_secs: float,
+        fetch: Callable[[str], str] = plugin_reqs,
+    ):
+        self.ttl = ttl
+        self.retry_secs = retry_secs
+        self.fetch = fetch
+        self.entries: dict[tuple[str, str], ReqsEntry] = {}
+        self.lock = Lock()
+
+    def get(self, plugin_name: str) -> PluginReqs:
+        """Returns the reqs of the plugin.
+
+        :raises PluginException: If the plugin does not exist or its reqs could not be fetched and
+         there is no earlier value.
+        """
+        key = (plugin_name, get_plugin(plugin_name).host)
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry is None or entry.expires_at <= now:
+            entry = self._refresh(plugin_name, key, entry, now)
+        return entry.value
+
+    def _refresh(
+        self,
+        plugin_name: str,
+        key: tuple[str, str],
+        old: ReqsEntry | None,
+        now: float,
+    ) -> ReqsEntry:
+        try:
+            value = PluginReqs.from_response(plugin_name, self.fetch(plugin_name))
+            entry = ReqsEntry(value=value, expires_at=now + self.ttl)
+        except PluginException as e:
+            if old is None:
+                raise
+            log_warning(
+                f"Could not refresh reqs of plugin {plugin_name}, using the last known value: {e}"
+            )
+            entry = ReqsEntry(value=old.value, expires_at=now + self.retry_secs)
+        with self.lock:
+            self.entries[key] = entry
+        return entry
+
+    def invalidate(self, plugin_name: str | None = None) -> None:
+        with self.lock:
+            if plugin_name is None:
+                self.entries.clear()
+            else:
+                for key in [k for k in self.entries if k[0] == plugin_name]:
+                    del self.entries[key]
+
+    def warm_up(self) -> None:
+        """Fetches the reqs of all plugins that have a reqs route."""
+        for name, reg in get_plugins().items():
+            if reg.skip_reqs:
+                continue
+            try:
+                self.get(name)
+            except PluginException:
+                pass
+
+
+_cache: PluginReqsCache | None = None
+_generation: int | None = None
+_generation_checked_at = 0.0
+
+
+def _get_generation() -> int:
+    from timApp.document.caching import rclient
+
+    return int(rclient.get(GENERATION_KEY) or 0)
+
+
+def _check_generation() -> None:
+    """Clears the local cache if some other process has invalidated the cache."""
+    from timApp.tim_app import app
+
+    global _generation, _generation_checked_at
+    now = time.monotonic()
+    if now - _generation_checked_at < app.config["PLUGIN_REQS_GENERATION_CHECK_SECS"]:
+        return
+    _generation_checked_at = now
+    try:
+        generation = _get_generation()
+    except Exception as e:
+        log_warning(f"Could not check plugin reqs cache generation: {e}")
+        return
+    if _generation is not None and generation != _generation and _cache is not None:
+        _cache.invalidate()
+    _generation = generation
+
+
+def get_plugin_reqs_cache() -> PluginReqsCache:
+    from timApp.tim_app import app
+
+    global _cache
+    if _cache is None:
+        _cache = PluginReqsCache(
+            ttl=app.config["PLUGIN_REQS_TTL"],
+            retry_secs=app.config["PLUGIN_REQS_RETRY_SECS"],
+        )
+    _check_generation()
+    return _cache
+
+
+def get_plugin_reqs(plugin_name: str) -> PluginReqs:
+    return get_plugin_reqs_cache().get(plugin_name)
+
+
+def invalidate_plugin_reqs(plugin_name: str | None = None) -> None:
+    """Invalidates the reqs of the given plugin, or of all plugins, in all TIM processes."""
+    from timApp.document.caching import rclient
+
+    global _generation
+    get_plugin_reqs_cache().invalidate(plugin_name)
+    _generation = rclient.incr(GENERATION_KEY)
+
+
+def start_plugin_reqs_warm_up(app: Flask) -> None:
+    """Fetches the reqs of all plugins in a background thread so that the first page views do not have to."""
+
+    def warm_up() -> None:
+        with app.app_context():
+            get_plugin_reqs_cache().warm_up()
+
+    Thread(target=warm_up, daemon=True).start()
@@ -0,0 +1,111 @@
+"""Concurrent execution of plugin render calls.
+
+Rendering a page calls every plugin type present on the page over HTTP. The calls are independent of each other,
+so they are run concurrently in a bounded pool of greenlets (TIM runs in gevent workers, see gunicornconf.py).
+
+The tasks must not use the database session because each greenlet would get its own session; everything that
+needs the database (such as :meth:`Plugin.render_json`) must be done before the tasks are started.
+"""
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Callable, cast
+
+import gevent
+from flask import current_app
+from gevent.pool import Pool
+from werkzeug.local import LocalProxy
+
+from timApp.plugin.pluginexception import PluginException
+from timApp.util.logger import log_info
+
+
+@dataclass
+class RenderTaskResult:
+    name: str
+    value: Any = None
+    error: PluginException | None = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class RenderTask:
+    name: str
+    fn: Callable[[], Any]
+    inline: bool = False
+    """Whether the task must be run in the calling greenlet, e.g. because it needs the request context."""
+
+
+def _run_task(
+    name: str, fn: Callable[[], Any], timeout: float
+) -> tuple[RenderTaskResult, BaseException | None]:
+    result = RenderTaskResult(name=name)
+    unexpected = None
+    start = perf_counter()
+    try:
+        with gevent.Timeout(
+            timeout, PluginException(f"Timeout when rendering plugin {name}.")
+        ):
+            result.value = fn()
+    except PluginException as e:
+        result.error = e
+    except Exception as e:
+        # Unexpected errors are re-raised in the calling greenlet.
+        unexpected = e
+    result.elapsed = perf_counter() - start
+    return result, unexpected
+
+
+def run_render_tasks(
+    tasks: list[RenderTask],
+    pool_size: int,
+    timeout: float,
+) -> list[RenderTaskResult]:
+    """Runs the render tasks concurrently.
+
+    :param tasks: The tasks. The task name is used in error messages and timing information.
+    :param pool_size: The maximum number of tasks that are run at the same time.
+    :param timeout: Timeout in seconds for each task. A timed-out task results in a PluginException.
+    :return: The results in the same order as the tasks.
+    """
+    outcomes: dict[int, tuple[RenderTaskResult, BaseException | None]] = {}
+    concurrent = [(i, t) for i, t in enumerate(tasks) if not t.inline]
+    greenlets: list[tuple[int, gevent.Greenlet]] = []
+    if pool_size > 1 and len(concurrent) > 1:
+        app = cast(LocalProxy, current_app)._get_current_object()
+
+        def run_in_app(t: RenderTask) -> Any:
+            with app.app_context():
+                return _run_task(t.name, t.fn, timeout)
+
+        pool = Pool(pool_size)
+        greenlets = [(i, pool.spawn(run_in_app, t)) for i, t in concurrent]
+    spawned = {i for i, _ in greenlets}
+    # The remaining tasks run in this greenlet while the spawned ones are waiting for their responses.
+    for i, t in enumerate(tasks):
+        if i not in spawned:
+            outcomes[i] = _run_task(t.name, t.fn, timeout)
+    gevent.joinall([g for _, g in greenlets], raise_error=True)
+    for i, g in greenlets:
+        outcomes[i] = g.value
+    outcomes_list = [outcomes[i] for i in range(len(tasks))]
+    for _, unexpected in outcomes_list:
+        if unexpected is not None:
+            raise unexpected
+    return [r for r, _ in outcomes_list]
+
+
+def log_critical_path(
+    results: list[RenderTaskResult], wall_time: float, threshold: float
+) -> None:
+    """Logs the slowest plugin of a page render if the plugin calls took longer than the threshold."""
+    if not results or wall_time < threshold:
+        return
+    critical = max(results, key=lambda r: r.elapsed)
+    others = ", ".join(
+        f"{r.name} {r.elapsed:.3f}"
+        for r in sorted(results, key=lambda r: r.elapsed, reverse=True)[1:]
+    )
+    log_info(
+        f"Plugin render took {wall_time:.3f}s; critical path: {critical.name} {critical.elapsed:.3f}s"
+        + (f" (others: {others})" if others else "")
+    )
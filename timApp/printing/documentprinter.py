@@ -5,14 +5,19 @@ import os
 import re
 import subprocess
 import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Generator
 
+from filelock import FileLock, Timeout
 from flask import current_app
 from pypandoc import _as_unicode, _validate_formats
 from pypandoc.py3compat import string_types, cast_bytes
 
 from timApp.auth.accesshelper import has_view_access
 from timApp.auth.sessioninfo import get_current_user_object
+from timApp.document.automacrocache import AutoMacroCache
 from timApp.document.docentry import DocEntry
 from timApp.document.docinfo import DocInfo
 from timApp.document.docparagraph import (
@@ -42,6 +47,7 @@ from timApp.plugin.plugin import parse_plugin_values_macros
 from timApp.plugin.pluginControl import pluginify
 from timApp.plugin.pluginOutputFormat import PluginOutputFormat
 from timApp.plugin.pluginexception import PluginException
+from timApp.printing.fragmentcache import get_hash, get_fragments, set_fragments
 from timApp.printing.printeddoc import PrintedDoc
 from timApp.printing.printsettings import PrintFormat
 from timApp.timdb.dbaccess import get_files_path
@@ -50,6 +56,7 @@ from timApp.util.utils import cache_folder_path
 from tim_common.html_sanitize import sanitize_html
 
 DEFAULT_PRINTING_FOLDER = cache_folder_path / "printed_documents"
+LATEX_SLOTS_FOLDER = cache_folder_path / "latex_slots"
 TEMPLATES_FOLDER = Path(TEMPLATE_FOLDER_NAME) / PRINT_FOLDER_NAME
 TEX_MACROS_KEY = "texmacros"
 
@@ -158,6 +165,7 @@ class DocumentPrinter:
         self.textplain = False
         self.texfiles = None
         self.urlroot = urlroot
+        self.fragment_hits = 0
 
     def get_template_id(self) -> int | None:
         if self._template_to_use:
@@ -252,16 +260,7 @@ class DocumentPrinter:
             )
         }
 
-        par_infos: [  # TODO: Why this was list[]
-            tuple[
-                DocParagraph,
-                DocSettings,
-                dict,
-                TimSandboxedEnvironment,
-                dict[str, object],
-                str,
-            ]
-        ] = []
+        candidates: list[tuple[DocParagraph, tuple]] = []
         for par in pars:
 
             # do not print document settings pars
@@ -271,11 +270,6 @@ class DocumentPrinter:
             if par.id not in processed_par_ids:
                 continue
 
-            p_info = par, *get_tex_settings_and_macros(
-                par.doc, user_ctx, self._template_to_use, tformat
-            )
-            _, _, pdoc_plugin_attrs, env, pdoc_macros, pdoc_macro_delimiter = p_info
-
             if self.texplain or self.textplain:
                 if par.get_markdown().find("#") == 0:
                     continue
@@ -283,6 +277,58 @@ class DocumentPrinter:
             if par.has_class("hidden-print"):
                 continue
 
+            p_info = par, *get_tex_settings_and_macros(
+                par.doc, user_ctx, self._template_to_use, tformat
+            )
+            candidates.append((par, p_info))
+
+        # TODO: Instead, convert all paragraph classes into environments and always emit \begin-\end for them
+        environment_classes = set(self._macros.get("texenvironment_classes", []))
+
+        # The fragments of user prints depend on the answers of the user, so they are not cached.
+        use_cache = (
+            current_app.config["PRINT_FRAGMENT_CACHE"] and not plugins_user_print
+        )
+        keys: list[str] = []
+        if use_cache:
+            print_key = get_hash(
+                tformat.value,
+                target_format.value,
+                self.texplain,
+                self.textplain,
+                self.get_template_id(),
+                self._template_to_use.last_modified if self._template_to_use else None,
+                view_ctx.urlmacros,
+                sorted(environment_classes),
+            )
+            doc_keys: dict[int, str] = {}
+            keys = [
+                self.get_fragment_key(par, p_info, print_key, doc_keys)
+                for par, p_info in candidates
+            ]
+            fragments = get_fragments(keys)
+        else:
+            fragments = [None] * len(candidates)
+        self.fragment_hits = sum(1 for f in fragments if f is not None)
+        new_fragments = [i for i, f in enumerate(fragments) if f is None]
+
+        par_infos: [  # TODO: Why this was list[]
+            tuple[
+                DocParagraph,
+                DocSettings,
+                dict,
+                TimSandboxedEnvironment,
+                dict[str, object],
+                str,
+            ]
+        ] = []
+        # The index of the fragment that each paragraph to print belongs to.
+        fragment_indices: list[int] = []
+        for index in new_fragments:
+            par, p_info = candidates[index]
+            fragments[index] = []
+            _, _, pdoc_plugin_attrs, env, pdoc_macros, pdoc_macro_delimiter = p_info
+
             ppar = par
             # Replace plugin- and question pars with regular docpars with the md defined in the 'print' block
             # of their yaml as the md content of the replacement par
@@ -302,6 +348,7 @@ class DocumentPrinter:
                         doc=self._doc_entry.document, md=plugin_yaml_beforeprint
                     )
                     par_infos.append(p_info)
+                    fragment_indices.append(index)
                     pars_to_print.append(bppar)
 
                 plugin_yaml_print = get_value(plugin_yaml, "texprint")
@@ -310,6 +357,7 @@ class DocumentPrinter:
                         doc=self._doc_entry.document, md=plugin_yaml_print
                     )
                 par_infos.append(p_info)
+                fragment_indices.append(index)
                 pars_to_print.append(ppar)
 
                 plugin_yaml_afterprint = get_value(plugin_yaml, "texafterprint")
@@ -318,10 +366,12 @@ class DocumentPrinter:
                         doc=self._doc_entry.document, md=plugin_yaml_afterprint
                     )
                     par_infos.append(p_info)
+                    fragment_indices.append(index)
                     pars_to_print.append(appar)
 
             else:
                 par_infos.append(p_info)
+                fragment_indices.append(index)
                 pars_to_print.append(ppar)
 
         # render markdown for plugins
@@ -337,20 +387,19 @@ class DocumentPrinter:
         )
         pars_to_print = presult.pars
 
-        export_pars = []
-
-        # TODO: Instead, convert all paragraph classes into environments and always emit \begin-\end for them
-        environment_classes = set(pdoc_macros.get("texenvironment_classes", []))
-
         # Get the markdown for each par dict
-        for p, (
-            _,
-            settings,
-            pdoc_plugin_attrs,
-            pdoc_macro_env,
-            pdoc_macros,
-            pdoc_macro_delimiter,
-        ) in zip(pars_to_print, par_infos):
+        for (
+            p,
+            index,
+            (
+                _,
+                par_settings,
+                pdoc_plugin_attrs,
+                pdoc_macro_env,
+                pdoc_macros,
+                pdoc_macro_delimiter,
+            ),
+        ) in zip(pars_to_print, fragment_indices, par_infos):
             md = p.prepare(view_ctx, use_md=True).output
             if not p.is_plugin() and not p.is_question():
                 if not p.get_nomacros() and not self.texplain and not self.textplain:
@@ -362,7 +411,7 @@ class DocumentPrinter:
                     md = expand_macros(
                         text=md,
                         macros=pdoc_macros,
-                        settings=settings,
+                        settings=par_settings,
                         env=pdoc_macro_env,
                         ignore_errors=False,
                     )
@@ -400,13 +449,13 @@ class DocumentPrinter:
                         md = md[3:-3]
                 if (
                     not pdoc_macros.get("texautonumber")
-                    and settings.auto_number_headings()
+                    and par_settings.auto_number_headings()
                 ):
                     md = add_heading_numbers(
                         md,
                         p,
-                        settings.heading_format(),
-                        initial_heading_counts=settings.auto_number_start(),
+                        par_settings.heading_format(),
+                        initial_heading_counts=par_settings.auto_number_start(),
                     )
 
                 """
@@ -424,7 +473,11 @@ class DocumentPrinter:
             if md.find("---") >= 0:  # check if slide separator
                 if REGSLIDESEP.match(md):
                     continue
-            export_pars.append(md)
+            fragments[index].append(md)
+
+        if use_cache:
+            set_fragments({keys[i]: fragments[i] for i in new_fragments})
+        export_pars = [md for fragment in fragments for md in fragment]
 
         if self.texplain or self.textplain:
             # Paragraphs are separated by a blank line in the Markdown format.
@@ -435,6 +488,41 @@ class DocumentPrinter:
         self._content = content
         return content
 
+    @staticmethod
+    def get_fragment_key(
+        par: DocParagraph, p_info: tuple, print_key: str, doc_keys: dict[int, str]
+    ) -> str:
+        """Returns the key of the printable fragment of the paragraph in the fragment cache.
+
+        :param p_info: The paragraph together with the settings and macros of its document.
+        :param print_key: The hash of the print options.
+        :param doc_keys: Memo of the hashes of the settings and macros of the documents.
+        """
+        _, settings, _, _, macros, _ = p_info
+        d = par.doc
+        doc_key = doc_keys.get(d.doc_id)
+        if doc_key is None:
+            # The macros include the stored autocounter values.
+            doc_key = get_hash(settings.get_dict().values, macros)
+            doc_keys[d.doc_id] = doc_key
+        heading_vals = None
+        if not macros.get("texautonumber") and settings.auto_number_headings():
+            heading_vals = (
+                AutoMacroCache(d.doc_id, persist=False).get_macros(
+                    par.get_id(), d.get_version()
+                )
+                or {}
+            ).get("h")
+        return get_hash(
+            print_key,
+            doc_key,
+            d.doc_id,
+            par.get_id(),
+            par.get_markdown(),
+            par.get_attrs(),
+            heading_vals,
+        )
+
     def get_autocounters(
         self,
         user_ctx: UserContext,
@@ -1038,7 +1126,8 @@ def tim_convert_input(
                 f.write(line)
 
     if is_pdf:
-        p, stdout = run_latex(outputfile, latex_file, new_env, "")
+        with latex_process_slot():
+            p, stdout = run_latex(outputfile, latex_file, new_env, "")
 
     # if there is an outputfile, then stdout is likely empty!
     return stdout
@@ -1059,6 +1148,35 @@ def _decode_result(s):
     return s
 
 
+@contextmanager
+def latex_process_slot() -> Generator[None, None, None]:
+    """Waits until less than PRINT_MAX_LATEX_PROCESSES LaTeX processes are running.
+
+    The slots are file locks in the cache folder, so the limit is shared by all the processes
+    (including the Celery workers) that use the same cache folder.
+    """
+    slots = current_app.config["PRINT_MAX_LATEX_PROCESSES"]
+    deadline = time.monotonic() + current_app.config["PRINT_LATEX_SLOT_TIMEOUT"]
+    LATEX_SLOTS_FOLDER.mkdir(parents=True, exist_ok=True)
+    while True:
+        for i in range(slots):
+            lock = FileLock(str(LATEX_SLOTS_FOLDER / f"{i}.lock"))
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+            try:
+                yield
+            finally:
+                lock.release()
+            return
+        if time.monotonic() > deadline:
+            raise PrintingError(
+                "Too many documents are being printed at the moment. Please try again later."
+            )
+        time.sleep(0.5)
+
+
 def run_latex(outputfile, latex_file, new_env, string_input):
     try:
         filedir = os.path.dirname(outputfile)
@@ -0,0 +1,49 @@
+"""Cache of the printable markdown fragments of paragraphs.
+
+When a document is printed, every paragraph is converted to a pandoc-markdown fragment
+(plugins are rendered, macros are expanded and headings are numbered, see :meth:`DocumentPrinter.get_content`).
+The fragment of a paragraph depends only on the paragraph itself, the settings and macros of its document (which
+include the stored autocounter values), the heading numbers before it and the print options, so the fragments are
+cached with a hash of these as the key. After a small edit, only the changed paragraphs have to be converted again.
+
+The fragments are stored in Redis so that the web processes and the Celery print workers share them.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+from tim_common.timjsonencoder import TimJsonEncoder
+
+KEY_PREFIX = "tim-print-fragment-"
+
+
+def get_hash(*parts: Any) -> str:
+    h = hashlib.sha256(json.dumps(parts, sort_keys=True, cls=TimJsonEncoder).encode())
+    return h.hexdigest()
+
+
+def get_fragments(keys: list[str]) -> list[list[str] | None]:
+    """Returns the cached fragments of the paragraphs with the given keys, or None for the ones not in the cache."""
+    from timApp.document.caching import rclient
+
+    if not keys:
+        return []
+    return [
+        json.loads(v) if v is not None else None
+        for v in rclient.mget([KEY_PREFIX + k for k in keys])
+    ]
+
+
+def set_fragments(fragments: dict[str, list[str]]) -> None:
+    from timApp.document.caching import rclient
+    from timApp.tim_app import app
+
+    if not fragments:
+        return
+    expire = app.config["PRINT_FRAGMENT_CACHE_EXPIRE_SECS"]
+    pipe = rclient.pipeline(transaction=False)
+    for k, v in fragments.items():
+        pipe.set(KEY_PREFIX + k, json.dumps(v), ex=expire)
+    pipe.execute()
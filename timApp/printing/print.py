@@ -34,6 +34,12 @@ from timApp.markdown.autocounters import (
 )
 from timApp.printing.documentprinter import DocumentPrinter, PrintingError, LaTeXError
 from timApp.printing.printeddoc import PrintedDoc
+from timApp.printing.printjobs import (
+    PrintJob,
+    submit_print_job,
+    get_print_job,
+    wait_print_job,
+)
 from timApp.printing.printsettings import PrintFormat
 from timApp.timdb.sqa import db
 from timApp.upload.upload import add_csp_if_not_pdf
@@ -181,46 +187,47 @@ def print_document(
     if template_doc is None:
         raise RouteException("The template doc was not found.")
 
-    try:
-        create_printed_doc(
-            doc_entry=doc,
-            template_doc=template_doc,
-            file_type=print_type,
-            temp=True,
-            user_ctx=UserContext.from_one_user(g.user),
-            plugins_user_print=plugins_user_print,
-            urlroot="http://localhost:5000/print/",
-        )  # request.url_root + 'print/')
-    except LaTeXError as err:
-        try:
-            print("Error occurred: " + str(err))
-            e = err.value
-            latex_access_url = f"{request.url}?file_type=latex&template_doc_id={template_doc_id}&plugins_user_code={plugins_user_print}"
-            line = e.get("line", "")
-            return json_response(
-                {
-                    "success": True,
-                    "url": print_access_url,
-                    "errormsg": "<pre>" + e.get("error", "") + "</pre>",
-                    "latex": latex_access_url,
-                    "latexline": latex_access_url + "&line=" + line + "#L" + line,
-                },
-                status_code=201,
-            )
-        except Exception as err:
-            print("General error occurred: " + str(err))
-            raise RouteException(str(err))  # TODO: maybe there's a better error code?
-        # raise RouteException(str(err))
-    except PrintingError as err:
-        print("Printing occurred: " + str(err))
-        raise RouteException(str(err))  # TODO: maybe there's a better error code?
-    except Exception as err:
-        print("General error occurred: " + str(err))
-        raise RouteException(str(err))  # TODO: maybe there's a better error code?
+    job = submit_print_job(
+        doc,
+        template_doc,
+        print_type,
+        g.user,
+        plugins_user_print=plugins_user_print,
+        force=force or plugins_user_print,  # never reuse user print
+    )
+    latex_access_url = f"{request.base_url}?file_type=latex&template_doc_id={template_doc_id}&plugins_user_code={plugins_user_print}"
+    return json_response(
+        {
+            "success": True,
+            "url": print_access_url,
+            "latex": latex_access_url,
+            **print_job_to_json(job),
+        },
+        status_code=202,
+    )
+
+
+@print_blueprint.get("/jobs/<job_id>")
+def get_print_job_status(job_id: str) -> Response:
+    """Returns the status of a print job created with the POST route. The print dialog polls this."""
+    job = get_print_job(job_id)
+    if job is None:
+        raise NotExist("Print job not found")
+    doc = DocEntry.find_by_id(job.doc_id)
+    if doc is None:
+        raise NotExist("Document not found")
+    verify_view_access(doc)
+    return json_response(print_job_to_json(job))
 
-    # print_access_url = f'{request.url}?file_type={str(print_type.value).lower()}&template_doc_id={template_doc_id}&plugins_user_code={plugins_user_print}'
-    db.session.commit()
-    return json_response({"success": True, "url": print_access_url}, status_code=201)
+
+def print_job_to_json(job: PrintJob) -> dict:
+    result = {"job": job.id, "status": job.status}
+    if job.latex_error:
+        result["errormsg"] = "<pre>" + job.latex_error.get("error", "") + "</pre>"
+        result["line"] = job.latex_error.get("line", "")
+    elif job.error:
+        result["errormsg"] = job.error
+    return result
 
 
 @print_blueprint.get("/<path:doc_path>")
@@ -277,7 +284,32 @@ def get_printed_document(
 
     pdferror = None
 
-    if cached is None:
+    if cached is None and print_type == PrintFormat.PDF:
+        # PDFs are compiled by the print job queue, which makes simultaneous requests share one compilation.
+        job = submit_print_job(
+            doc,
+            template_doc,
+            print_type,
+            g.user,
+            plugins_user_print=plugins_user_code,
+            eol_type=eol_type,
+            force=force or showerror,
+        )
+        job = wait_print_job(job.id, current_app.config["PRINT_JOB_WAIT_SECS"])
+        if job is None:
+            raise RouteException("The print job was lost. Please try again.")
+        if not job.finished:
+            raise RouteException(
+                "The document is still being printed. Please try again later."
+            )
+        if job.latex_error:
+            pdferror = job.latex_error
+        elif job.error:
+            raise RouteException(job.error)
+    elif cached is None:
+        # The other formats do not need LaTeX, so they are quick enough to be created in the request.
+        # This also keeps the print jobs from waiting for each other when a LaTeX template includes
+        # other documents with texfiles.
         try:
             create_printed_doc(
                 doc_entry=doc,
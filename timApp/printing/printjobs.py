@@ -0,0 +1,203 @@
+"""
+Print jobs that are run in Celery instead of the web request.
+
+A job is identified by the print hash of the document (see :meth:`DocumentPrinter.hash_doc_print`) together with
+the file format, so simultaneous requests for the same printout share one job. The state of the job is stored
+in Redis, from where the print dialog polls it with the /print/jobs route.
+"""
+import json
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any
+
+from flask import current_app, g
+
+from timApp.document.docentry import DocEntry
+from timApp.document.docinfo import DocInfo
+from timApp.document.randutils import hashfunc
+from timApp.document.usercontext import UserContext
+from timApp.printing.documentprinter import DocumentPrinter, PrintingError, LaTeXError
+from timApp.printing.printsettings import PrintFormat
+from timApp.timdb.sqa import db
+from timApp.user.user import User
+
+PRINT_JOB_KEY_PREFIX = "tim-print-job-"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+@dataclass
+class PrintJob:
+    id: str
+    doc_id: int
+    status: str = JOB_QUEUED
+    error: str | None = None
+    latex_error: dict[str, Any] | None = field(default=None)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+
+def get_print_job_id(
+    printer: DocumentPrinter,
+    file_type: PrintFormat,
+    plugins_user_print: bool,
+    eol_type: str,
+) -> str:
+    return hashfunc(
+        f"{printer.hash_doc_print(plugins_user_print=plugins_user_print)} {file_type.value} {eol_type}"
+    )
+
+
+def get_print_job(job_id: str) -> PrintJob | None:
+    from timApp.document.caching import rclient
+
+    data = rclient.get(f"{PRINT_JOB_KEY_PREFIX}{job_id}")
+    if data is None:
+        return None
+    return PrintJob(**json.loads(data))
+
+
+def save_print_job(job: PrintJob, only_if_new: bool = False) -> bool:
+    """Saves the state of the job.
+
+    Unfinished jobs expire after PRINT_JOB_TIMEOUT seconds in case the worker running them dies,
+    and finished jobs after PRINT_JOB_RESULT_SECS seconds.
+
+    :param only_if_new: Whether to save the job only if there is no job with the same id.
+    :return: Whether the job was saved.
+    """
+    from timApp.document.caching import rclient
+
+    expire = current_app.config[
+        "PRINT_JOB_RESULT_SECS" if job.finished else "PRINT_JOB_TIMEOUT"
+    ]
+    return bool(
+        rclient.set(
+            f"{PRINT_JOB_KEY_PREFIX}{job.id}",
+            json.dumps(asdict(job)),
+            ex=expire,
+            nx=only_if_new,
+        )
+    )
+
+
+def submit_print_job(
+    doc: DocInfo,
+    template_doc: DocInfo | None,
+    file_type: PrintFormat,
+    user: User,
+    plugins_user_print: bool = False,
+    eol_type: str = "native",
+    force: bool = False,
+) -> PrintJob:
+    """Queues a print job, or returns the existing job if the same printout is already queued, being printed
+    or printed. A failed job is always replaced, because printing may have failed for a temporary reason.
+
+    :param force: Whether to start a new job even if the same printout has already been printed.
+    """
+    from timApp.tim_celery import print_document_task
+
+    printer = DocumentPrinter(doc_entry=doc, template_to_use=template_doc, urlroot="")
+    job_id = get_print_job_id(printer, file_type, plugins_user_print, eol_type)
+    job = PrintJob(id=job_id, doc_id=doc.id)
+    while not save_print_job(job, only_if_new=True):
+        existing = get_print_job(job_id)
+        if existing is None:
+            # The existing job expired in between; try again.
+            continue
+        if existing.status != JOB_FAILED and (not existing.finished or not force):
+            return existing
+        force = False
+        delete_print_job(job_id)
+    try:
+        print_document_task.delay(
+            job_id,
+            doc.id,
+            template_doc.id if template_doc else None,
+            file_type.value,
+            user.id,
+            plugins_user_print,
+            eol_type,
+            f"http://{current_app.config['INTERNAL_PLUGIN_DOMAIN']}:5000/print/",
+        )
+    except Exception:
+        # Otherwise the queued job would block new jobs until it expires.
+        delete_print_job(job_id)
+        raise
+    return job
+
+
+def delete_print_job(job_id: str) -> None:
+    from timApp.document.caching import rclient
+
+    rclient.delete(f"{PRINT_JOB_KEY_PREFIX}{job_id}")
+
+
+def wait_print_job(job_id: str, timeout: float) -> PrintJob | None:
+    """Waits until the job is finished or the timeout expires.
+
+    :return: The last known state of the job, or None if the job does not exist.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_print_job(job_id)
+        if job is None or job.finished or time.monotonic() > deadline:
+            return job
+        time.sleep(1)
+
+
+def run_print_job(
+    job_id: str,
+    doc_id: int,
+    template_doc_id: int | None,
+    file_type: str,
+    user_id: int,
+    plugins_user_print: bool,
+    eol_type: str,
+    urlroot: str,
+) -> None:
+    """Prints the document and stores the result of the job. Run by the Celery worker."""
+    from timApp.printing.print import create_printed_doc
+
+    job = PrintJob(id=job_id, doc_id=doc_id, status=JOB_RUNNING)
+    save_print_job(job)
+    try:
+        doc = DocEntry.find_by_id(doc_id)
+        if doc is None:
+            raise PrintingError("The document was not found.")
+        template_doc = None
+        if template_doc_id is not None:
+            template_doc = DocEntry.find_by_id(template_doc_id)
+            if template_doc is None:
+                raise PrintingError("The template doc was not found.")
+        user = User.get_by_id(user_id)
+        if user is None:
+            raise PrintingError("The user was not found.")
+        # The printer gets the current user from the application context when printing user answers.
+        g.user = user
+        create_printed_doc(
+            doc_entry=doc,
+            template_doc=template_doc,
+            file_type=PrintFormat(file_type),
+            temp=True,
+            user_ctx=UserContext.from_one_user(user),
+            plugins_user_print=plugins_user_print,
+            urlroot=urlroot,
+            eol_type=eol_type,
+        )
+        db.session.commit()
+        job.status = JOB_DONE
+    except LaTeXError as err:
+        db.session.rollback()
+        job.status = JOB_FAILED
+        job.latex_error = err.value
+    except Exception as err:
+        db.session.rollback()
+        job.status = JOB_FAILED
+        job.error = str(err)
+    save_print_job(job)
@@ -0,0 +1,53 @@
+from timApp.readmark.readparagraphtype import ReadParagraphType
+from timApp.timdb.sqa import db
+
+
+class LatestReadParagraph(db.Model):
+    """The latest read mark of a User(Group) for each paragraph and read mark type.
+
+    This is kept up to date whenever read marks are added to or removed from :class:`ReadParagraph`, which keeps the
+    full history of read marks. The views and the statistics read this table instead of the history.
+    """
+
+    __tablename__ = "latestreadparagraph"
+
+    usergroup_id = db.Column(
+        db.Integer, db.ForeignKey("usergroup.id"), primary_key=True
+    )
+    """UserGroup id."""
+
+    doc_id = db.Column(db.Integer, db.ForeignKey("block.id"), primary_key=True)
+    """Document id."""
+
+    par_id = db.Column(db.Text, primary_key=True)
+    """Paragraph id."""
+
+    type = db.Column(db.Enum(ReadParagraphType), primary_key=True)
+    """Readmark type."""
+
+    par_hash = db.Column(db.Text, nullable=False)
+    """Paragraph hash at the time the latest readmark was registered."""
+
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False)
+    """The time the latest readmark was registered."""
+
+    __table_args__ = (
+        # Covers all columns so that the readings of a usergroup can be read with an index-only scan.
+        db.Index(
+            "latestreadparagraph_usergroup_id_doc_id_idx",
+            "usergroup_id",
+            "doc_id",
+            "par_id",
+            "type",
+            "par_hash",
+            "timestamp",
+        ),
+        # For the read statistics of a document.
+        db.Index(
+            "latestreadparagraph_doc_id_usergroup_id_idx",
+            "doc_id",
+            "usergroup_id",
+            "type",
+            "par_id",
+        ),
+    )
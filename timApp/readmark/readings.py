@@ -2,36 +2,63 @@ from collections import defaultdict
 from datetime import timedelta
 from typing import DefaultDict
 
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Query
 
 from timApp.document.docparagraph import DocParagraph
 from timApp.document.document import Document
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
+from timApp.readmark.readmarkbuffer import (
+    flush_doc_read_marks,
+    flush_read_marks,
+    get_insert_rows,
+    insert_read_marks,
+    BufferedReadMark,
+    upsert_latest_read_marks,
+)
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.readmark.readparagraphtype import ReadParagraphType
 from timApp.timdb.sqa import db
 from timApp.util.utils import get_current_time
 
 
-def get_read_expiry_condition(delta: timedelta):
-    return (ReadParagraph.type == ReadParagraphType.click_red) | (
-        ReadParagraph.timestamp > get_current_time() - delta
+ReadMarkModel = type[ReadParagraph] | type[LatestReadParagraph]
+
+
+def get_read_expiry_condition(delta: timedelta, model: ReadMarkModel = ReadParagraph):
+    return (model.type == ReadParagraphType.click_red) | (
+        model.timestamp > get_current_time() - delta
     )
 
 
 def get_readings(
     usergroup_id: int, doc: Document, filter_condition=None
 ) -> list[ReadParagraph]:
+    flush_read_marks([usergroup_id])
     return get_readings_filtered_query(usergroup_id, doc, filter_condition).all()
 
 
+def get_latest_readings(
+    usergroup_id: int, doc: Document, filter_condition=None
+) -> list[LatestReadParagraph]:
+    """Like :func:`get_readings`, but gets only the latest read mark of each paragraph and type."""
+    flush_read_marks([usergroup_id])
+    q = get_readings_query(usergroup_id, doc, LatestReadParagraph)
+    if filter_condition is not None:
+        q = q.filter(filter_condition)
+    return q.all()
+
+
 def has_anything_read(usergroup_ids: list[int], doc: Document) -> bool:
+    flush_read_marks(usergroup_ids)
     # Custom query for speed
     ids = doc.get_referenced_document_ids()
     ids.add(doc.doc_id)
-    query = db.session.query(ReadParagraph.id).filter(
-        ReadParagraph.doc_id.in_(ids)
-        & (ReadParagraph.usergroup_id.in_(usergroup_ids))
-        & (ReadParagraph.type == ReadParagraphType.click_red)
+    query = db.session.query(LatestReadParagraph.par_id).filter(
+        LatestReadParagraph.doc_id.in_(ids)
+        & (LatestReadParagraph.usergroup_id.in_(usergroup_ids))
+        & (LatestReadParagraph.type == ReadParagraphType.click_red)
     )
     # Normal query is generally faster than an "exists" subquery even if it causes extra data to be loaded
     return query.first() is not None
@@ -46,25 +73,29 @@ def get_readings_filtered_query(
     return q
 
 
-def get_clicked_readings_query(doc: Document) -> Query:
-    return ReadParagraph.query.filter(
-        (ReadParagraph.doc_id == doc.doc_id)
-        & (ReadParagraph.type == ReadParagraphType.click_red)
+def get_clicked_readings_query(
+    doc: Document, model: ReadMarkModel = ReadParagraph
+) -> Query:
+    return model.query.filter(
+        (model.doc_id == doc.doc_id) & (model.type == ReadParagraphType.click_red)
     )
 
 
-def get_readings_query(usergroup_id: int, doc: Document) -> Query:
+def get_readings_query(
+    usergroup_id: int, doc: Document, model: ReadMarkModel = ReadParagraph
+) -> Query:
     """Gets the reading info for a document for a user.
 
     :param doc: The document for which to get the readings.
     :param usergroup_id: The id of the user group whose readings will be fetched.
+    :param model: ReadParagraph for the full history of read marks or LatestReadParagraph for the latest ones.
 
     """
     ids = doc.get_referenced_document_ids()
     ids.add(doc.doc_id)
-    return ReadParagraph.query.filter(
-        ReadParagraph.doc_id.in_(ids) & (ReadParagraph.usergroup_id == usergroup_id)
-    ).order_by(ReadParagraph.timestamp)
+    return model.query.filter(
+        model.doc_id.in_(ids) & (model.usergroup_id == usergroup_id)
+    ).order_by(model.timestamp)
 
 
 def mark_read(
@@ -73,28 +104,97 @@ def mark_read(
     par: DocParagraph,
     read_type=ReadParagraphType.click_red,
 ):
-    rp = ReadParagraph(
-        usergroup_id=usergroup_id,
-        doc_id=doc.doc_id,
-        par_id=par.get_id(),
-        par_hash=par.get_hash(),
-        type=read_type,
+    row = {
+        "usergroup_id": usergroup_id,
+        "doc_id": doc.doc_id,
+        "par_id": par.get_id(),
+        "par_hash": par.get_hash(),
+        "type": read_type,
+        "timestamp": get_current_time(),
+    }
+    db.session.add(ReadParagraph(**row))
+    upsert_latest_read_marks([row])
+
+
+def remove_read_mark(rp: ReadParagraph) -> None:
+    """Removes the read mark from the history. The previous read mark of the paragraph becomes the latest one."""
+    db.session.delete(rp)
+    db.session.flush()
+    refresh_latest_read_marks(
+        [rp.usergroup_id], doc_id=rp.doc_id, par_id=rp.par_id, read_type=rp.type
+    )
+
+
+def refresh_latest_read_marks(
+    usergroup_ids: list[int],
+    doc_id: int | None = None,
+    par_id: str | None = None,
+    read_type: ReadParagraphType | None = None,
+) -> None:
+    """Recomputes the latest read marks of the usergroups from the history.
+
+    :param doc_id: If given, only the marks of this document are recomputed.
+    :param par_id: If given, only the marks of this paragraph are recomputed.
+    :param read_type: If given, only the marks of this type are recomputed.
+    """
+
+    def condition(model: ReadMarkModel):
+        c = model.usergroup_id.in_(usergroup_ids)
+        if doc_id is not None:
+            c = c & (model.doc_id == doc_id)
+        if par_id is not None:
+            c = c & (model.par_id == par_id)
+        if read_type is not None:
+            c = c & (model.type == read_type)
+        return c
+
+    LatestReadParagraph.query.filter(condition(LatestReadParagraph)).delete(
+        synchronize_session=False
+    )
+    key_cols = [
+        ReadParagraph.usergroup_id,
+        ReadParagraph.doc_id,
+        ReadParagraph.par_id,
+        ReadParagraph.type,
+    ]
+    latest = (
+        select([*key_cols, ReadParagraph.par_hash, ReadParagraph.timestamp])
+        .where(condition(ReadParagraph) & (ReadParagraph.doc_id != None))
+        .distinct(*key_cols)
+        .order_by(*key_cols, ReadParagraph.timestamp.desc(), ReadParagraph.id.desc())
+    )
+    db.session.execute(
+        insert(LatestReadParagraph.__table__).from_select(
+            ["usergroup_id", "doc_id", "par_id", "type", "par_hash", "timestamp"],
+            latest,
+        )
     )
-    db.session.add(rp)
 
 
 def mark_all_read(usergroup_id: int, doc: Document):
+    flush_read_marks([usergroup_id])
     existing = {
         (r.par_id, r.doc_id): r
-        for r in get_readings_query(usergroup_id, doc).filter(
-            ReadParagraph.type == ReadParagraphType.click_red
+        for r in get_readings_query(usergroup_id, doc, LatestReadParagraph).filter(
+            LatestReadParagraph.type == ReadParagraphType.click_red
         )
     }
+    now = get_current_time()
+    marks = []
     for par in doc:
         e = existing.get((par.get_id(), doc.doc_id))
         if e and e.par_hash == par.get_hash():
             continue
-        mark_read(usergroup_id, doc, par)
+        marks.append(
+            BufferedReadMark(
+                doc_id=doc.doc_id,
+                par_id=par.get_id(),
+                par_hash=par.get_hash(),
+                type=ReadParagraphType.click_red,
+                timestamp=now,
+            )
+        )
+    insert_read_marks(get_insert_rows(usergroup_id, marks))
 
 
 def remove_all_read_marks(doc: Document):
@@ -102,11 +202,19 @@ def remove_all_read_marks(doc: Document):
     # usually you'd use get_referenced_document_ids to get all document IDs
     # Since we're deleting read marks here, it's better to be safe and only remove marks only
     # for paragraphs defined directly in the document
+    flush_doc_read_marks(doc.doc_id)
     get_clicked_readings_query(doc).delete(synchronize_session=False)
+    get_clicked_readings_query(doc, LatestReadParagraph).delete(
+        synchronize_session=False
+    )
 
 
 def get_read_usergroups_count(doc: Document):
-    return get_clicked_readings_query(doc).distinct(ReadParagraph.usergroup_id).count()
+    return (
+        get_clicked_readings_query(doc, LatestReadParagraph)
+        .distinct(LatestReadParagraph.usergroup_id)
+        .count()
+    )
 
 
 def copy_readings(src_par: DocParagraph, dest_par: DocParagraph):
@@ -138,15 +246,34 @@ def copy_readings(src_par: DocParagraph, dest_par: DocParagraph):
                 type=p.type,
             )
         )
+    db.session.flush()
+    refresh_latest_read_marks(
+        [
+            p.usergroup_id
+            for p in src_par_query.with_entities(ReadParagraph.usergroup_id)
+        ],
+        doc_id=dest_par.doc.doc_id,
+        par_id=dest_par.get_id(),
+    )
 
 
-def get_common_readings(usergroup_ids: list[int], doc: Document, filter_condition=None):
+def get_common_readings(
+    usergroup_ids: list[int], doc: Document, filter_condition=None, latest=False
+):
+    """Gets the latest read marks of each paragraph and type that are common to all the usergroups.
+
+    :param latest: Whether to read the marks from LatestReadParagraph instead of the full history. The filter condition
+     must refer to the same model.
+    """
     users: list[DefaultDict[str, DefaultDict[ReadParagraphType, ReadParagraph]]] = []
     for u in usergroup_ids:
         reading_map = defaultdict(
             lambda: defaultdict(lambda: ReadParagraph(par_hash=None))
         )
-        rs = get_readings(u, doc, filter_condition)
+        if latest:
+            rs = get_latest_readings(u, doc, filter_condition)
+        else:
+            rs = get_readings(u, doc, filter_condition)
         for r in rs:
             reading_map[r.doc_id, r.par_id][r.type] = r
         users.append(reading_map)
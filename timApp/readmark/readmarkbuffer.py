@@ -0,0 +1,322 @@
+"""Write-behind buffer for read marks.
+
+Marking paragraphs read (especially the automatic on-screen and hover marks) happens constantly while documents
+are being viewed, so the marks are not inserted into the readparagraph table one request at a time. Instead, they are
+appended to a Redis list per usergroup and inserted in bulk by :func:`flush_read_marks` when
+
+* the buffer has READMARK_BUFFER_MAX_MARKS marks (a Celery task is started),
+* the flush-read-marks Celery beat task runs (every READMARK_BUFFER_FLUSH_SECS seconds), or
+* the readings of the usergroup are read (see :func:`timApp.readmark.readings.get_readings`),
+
+so users always see their own marks. The teacher statistics may lag behind by the flush interval.
+
+For each document, the usergroups that have buffered marks in it are kept in a Redis set, so that the marks of a
+document can be flushed (see :func:`flush_doc_read_marks`) without touching the buffers of other usergroups.
+
+A usergroup's buffer is flushed while holding a lock for the group, and the marks are removed from the buffer only
+after they have been committed, so that marks are never missing from both the buffer and the database.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from redis import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from timApp.document.docparagraph import DocParagraph
+from timApp.item.block import Block
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
+from timApp.readmark.readparagraph import ReadParagraph
+from timApp.readmark.readparagraphtype import ReadParagraphType
+from timApp.timdb.sqa import db
+from timApp.user.usergroup import UserGroup
+from timApp.util.logger import log_warning
+from timApp.util.utils import get_current_time
+
+BUFFER_KEY_PREFIX = "tim-readmarks-"
+GROUPS_KEY = "tim-readmarks-groups"
+COUNT_KEY = "tim-readmarks-count"
+LOCK_KEY_PREFIX = "tim-readmarks-lock-"
+DOC_GROUPS_KEY_PREFIX = "tim-readmarks-doc-groups-"
+
+INSERT_BATCH_SIZE = 1000
+
+# Removes the flushed marks from the head of the buffer and forgets the group if nothing was added meanwhile,
+# both from the set of buffered groups (KEYS[3]) and from the document group sets of the flushed marks (KEYS[4:]).
+TRIM_SCRIPT = """
+redis.call('LTRIM', KEYS[1], ARGV[1], -1)
+redis.call('DECRBY', KEYS[2], ARGV[1])
+if redis.call('LLEN', KEYS[1]) == 0 then
+    for i = 3, #KEYS do
+        redis.call('SREM', KEYS[i], ARGV[2])
+    end
+end
+"""
+
+
+@dataclass(frozen=True)
+class BufferedReadMark:
+    doc_id: int
+    par_id: str
+    par_hash: str
+    type: ReadParagraphType
+    timestamp: datetime
+
+    def to_json(self) -> str:
+        return json.dumps(
+            [
+                self.doc_id,
+                self.par_id,
+                self.par_hash,
+                self.type.value,
+                self.timestamp.isoformat(),
+            ]
+        )
+
+    @staticmethod
+    def from_json(data: str | bytes) -> BufferedReadMark:
+        doc_id, par_id, par_hash, read_type, timestamp = json.loads(data)
+        return BufferedReadMark(
+            doc_id=doc_id,
+            par_id=par_id,
+            par_hash=par_hash,
+            type=ReadParagraphType(read_type),
+            timestamp=datetime.fromisoformat(timestamp),
+        )
+
+
+def get_insert_rows(usergroup_id: int, marks: Iterable[BufferedReadMark]) -> list[dict]:
+    """Returns the rows to insert for the marks, keeping only the latest of identical marks."""
+    latest: dict[tuple, BufferedReadMark] = {}
+    for m in marks:
+        latest[m.doc_id, m.par_id, m.type, m.par_hash] = m
+    return [
+        {
+            "usergroup_id": usergroup_id,
+            "doc_id": m.doc_id,
+            "par_id": m.par_id,
+            "par_hash": m.par_hash,
+            "type": m.type,
+            "timestamp": m.timestamp,
+        }
+        for m in latest.values()
+    ]
+
+
+def insert_read_marks(
+    rows: list[dict], session: Session | Connection | None = None
+) -> None:
+    """Inserts the read marks into the history with multi-row INSERTs and updates the latest read marks.
+
+    :param session: The session or connection to use; by default, the current session.
+    """
+    s = session if session is not None else db.session
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        s.execute(
+            insert(ReadParagraph.__table__).values(rows[i : i + INSERT_BATCH_SIZE])
+        )
+    upsert_latest_read_marks(rows, s)
+
+
+def upsert_latest_read_marks(
+    rows: list[dict], session: Session | Connection | None = None
+) -> None:
+    """Updates the latest read marks with the given ones unless there already is a newer one."""
+    s = session if session is not None else db.session
+    latest: dict[tuple, dict] = {}
+    # A single upsert cannot update the same row twice.
+    for r in sorted(rows, key=lambda r: r["timestamp"]):
+        latest[r["usergroup_id"], r["doc_id"], r["par_id"], r["type"]] = r
+    latest_rows = list(latest.values())
+    t = LatestReadParagraph.__table__
+    for i in range(0, len(latest_rows), INSERT_BATCH_SIZE):
+        stmt = insert(t).values(
+            [
+                {
+                    "usergroup_id": r["usergroup_id"],
+                    "doc_id": r["doc_id"],
+                    "par_id": r["par_id"],
+                    "type": r["type"],
+                    "par_hash": r["par_hash"],
+                    "timestamp": r["timestamp"],
+                }
+                for r in latest_rows[i : i + INSERT_BATCH_SIZE]
+            ]
+        )
+        s.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[t.c.usergroup_id, t.c.doc_id, t.c.par_id, t.c.type],
+                set_={
+                    "par_hash": stmt.excluded.par_hash,
+                    "timestamp": stmt.excluded.timestamp,
+                },
+                where=t.c.timestamp <= stmt.excluded.timestamp,
+            )
+        )
+
+
+def get_doc_groups_key(doc_id: int) -> str:
+    return f"{DOC_GROUPS_KEY_PREFIX}{doc_id}"
+
+
+def _client() -> Redis:
+    from timApp.document.caching import rclient
+
+    return rclient
+
+
+def is_buffering_enabled() -> bool:
+    from timApp.tim_app import app
+
+    return app.config["READMARK_BUFFER"]
+
+
+def buffer_read_marks(
+    usergroup_ids: list[int],
+    pars: list[DocParagraph],
+    read_type: ReadParagraphType,
+) -> bool:
+    """Adds read marks of the paragraphs for each of the usergroups to the buffer.
+
+    :return: False if buffering is disabled or Redis is not available, in which case the caller should write
+     the marks itself.
+    """
+    from timApp.tim_app import app
+
+    if not app.config["READMARK_BUFFER"]:
+        return False
+    now = get_current_time()
+    marks = [
+        BufferedReadMark(
+            doc_id=p.doc.doc_id,
+            par_id=p.get_id(),
+            par_hash=p.get_hash(),
+            type=read_type,
+            timestamp=now,
+        ).to_json()
+        for p in pars
+    ]
+    if not marks:
+        return True
+    try:
+        pipe = _client().pipeline()
+        for ug in usergroup_ids:
+            pipe.rpush(f"{BUFFER_KEY_PREFIX}{ug}", *marks)
+            pipe.sadd(GROUPS_KEY, ug)
+        for doc_id in {p.doc.doc_id for p in pars}:
+            pipe.sadd(get_doc_groups_key(doc_id), *usergroup_ids)
+        pipe.incrby(COUNT_KEY, len(marks) * len(usergroup_ids))
+        count = pipe.execute()[-1]
+    except RedisError as e:
+        log_warning(f"Could not buffer read marks: {e}")
+        return False
+    max_marks = app.config["READMARK_BUFFER_MAX_MARKS"]
+    added = len(marks) * len(usergroup_ids)
+    if count // max_marks > (count - added) // max_marks:
+        from timApp.tim_celery import flush_read_marks_task
+
+        flush_read_marks_task.delay()
+    return True
+
+
+def flush_group(usergroup_id: int, blocking_timeout: float | None) -> int:
+    """Inserts the buffered marks of the usergroup into the database.
+
+    :param blocking_timeout: How long to wait for another flush of the same group to finish, or None to wait as long
+     as it takes. If the timeout expires, nothing is flushed.
+    :return: The number of flushed marks.
+    """
+    client = _client()
+    lock = client.lock(
+        f"{LOCK_KEY_PREFIX}{usergroup_id}",
+        timeout=60,
+        blocking_timeout=blocking_timeout,
+    )
+    if not lock.acquire():
+        return 0
+    try:
+        key = f"{BUFFER_KEY_PREFIX}{usergroup_id}"
+        data = client.lrange(key, 0, -1)
+        if not data:
+            client.srem(GROUPS_KEY, usergroup_id)
+            return 0
+        rows = get_insert_rows(
+            usergroup_id, (BufferedReadMark.from_json(d) for d in data)
+        )
+        # Use a separate transaction so that the marks are committed independently of the current request.
+        with db.engine.begin() as conn:
+            # The document or the usergroup may have been deleted after the marks were buffered.
+            existing_docs = {
+                r[0]
+                for r in conn.execute(
+                    select([Block.id]).where(Block.id.in_({r["doc_id"] for r in rows}))
+                )
+            }
+            if conn.execute(
+                select([UserGroup.id]).where(UserGroup.id == usergroup_id)
+            ).first():
+                insert_read_marks(
+                    [r for r in rows if r["doc_id"] in existing_docs], conn
+                )
+        client.register_script(TRIM_SCRIPT)(
+            keys=[
+                key,
+                COUNT_KEY,
+                GROUPS_KEY,
+                *(get_doc_groups_key(d) for d in {r["doc_id"] for r in rows}),
+            ],
+            args=[len(data), usergroup_id],
+        )
+        return len(data)
+    finally:
+        lock.release()
+
+
+def flush_read_marks(usergroup_ids: Iterable[int] | None = None) -> int:
+    """Flushes the buffered marks of the given usergroups, or of all usergroups.
+
+    Flushing the marks of specific usergroups is cheap if they have nothing buffered, so it is done before reading
+    their marks.
+
+    :return: The number of flushed marks.
+    """
+    if not is_buffering_enabled():
+        return 0
+    client = _client()
+    try:
+        if usergroup_ids is None:
+            groups = [int(g) for g in client.smembers(GROUPS_KEY)]
+            # The periodic flush skips the groups that are being flushed by someone else.
+            return sum(flush_group(g, blocking_timeout=0) for g in groups)
+        usergroup_ids = list(usergroup_ids)
+        pipe = client.pipeline(transaction=False)
+        for ug in usergroup_ids:
+            pipe.exists(f"{BUFFER_KEY_PREFIX}{ug}")
+        pending = [ug for ug, e in zip(usergroup_ids, pipe.execute()) if e]
+        # Wait for a concurrent flush of the group so that its marks are committed before they are read.
+        return sum(flush_group(g, blocking_timeout=10) for g in pending)
+    except RedisError as e:
+        log_warning(f"Could not flush read marks: {e}")
+        return 0
+
+
+def flush_doc_read_marks(doc_id: int) -> int:
+    """Flushes the buffered marks of the usergroups that have buffered marks in the document.
+
+    :return: The number of flushed marks.
+    """
+    if not is_buffering_enabled():
+        return 0
+    try:
+        groups = [int(g) for g in _client().smembers(get_doc_groups_key(doc_id))]
+    except RedisError as e:
+        log_warning(f"Could not flush read marks: {e}")
+        return 0
+    return flush_read_marks(groups)
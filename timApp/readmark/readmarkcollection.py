@@ -1,13 +1,14 @@
 from dataclasses import dataclass, field
 
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readparagraph import ReadParagraph
 
 
 @dataclass
 class ReadMarkCollection:
-    marks: list[ReadParagraph] = field(default_factory=list)
+    marks: list[ReadParagraph | LatestReadParagraph] = field(default_factory=list)
 
-    def add(self, r: ReadParagraph, modified=False):
+    def add(self, r: ReadParagraph | LatestReadParagraph, modified=False):
         self.marks.append(r)
         r.modified = modified
 
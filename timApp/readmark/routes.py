@@ -22,7 +22,10 @@ from timApp.readmark.readings import (
     get_common_readings,
     remove_all_read_marks,
     get_read_usergroups_count,
+    remove_read_mark,
 )
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
+from timApp.readmark.readmarkbuffer import buffer_read_marks, flush_read_marks
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.readmark.readparagraphtype import ReadParagraphType
 from timApp.sisu.sisu import IncorrectSettings
@@ -126,8 +129,17 @@ def set_read_paragraph(doc_id, par_id, read_type=None, unread=False):
             except TimDbException:
                 raise RouteException("Non-existent paragraph")
 
-    docs = {}
-    for group_id in get_session_usergroup_ids():
+    docs = {p.doc.id: p.doc for p in pars}
+    usergroup_ids = get_session_usergroup_ids()
+    if unread:
+        # The latest mark to remove may still be in the buffer.
+        flush_read_marks(usergroup_ids)
+    elif buffer_read_marks(usergroup_ids, pars, paragraph_type):
+        for d in docs.values():
+            for u in get_session_users_objs():
+                clear_doc_cache(d, u)
+        return ok_response()
+    for group_id in usergroup_ids:
         for p in pars:
             if unread:
                 rp = (
@@ -142,10 +154,9 @@ def set_read_paragraph(doc_id, par_id, read_type=None, unread=False):
                 )
                 if not rp:
                     raise RouteException("Reading not found")
-                db.session.delete(rp)
+                remove_read_mark(rp)
             else:
                 mark_read(group_id, p.doc, p, paragraph_type)
-            docs[p.doc.id] = p.doc
     try:
         db.session.commit()
     except IntegrityError:
@@ -222,19 +233,21 @@ def get_statistics(doc_path):
         )
     if block_opt:
         block_ids = split_by_semicolon(block_opt)
-        extra_condition = extra_condition & ReadParagraph.par_id.in_(block_ids)
+        extra_condition = extra_condition & LatestReadParagraph.par_id.in_(block_ids)
     automatic_types = [
         ReadParagraphType.click_par,
         ReadParagraphType.hover_par,
         ReadParagraphType.on_screen,
     ]
     cols = [
-        func.count(distinct(ReadParagraph.par_id)).filter(ReadParagraph.type == t)
+        func.count(distinct(LatestReadParagraph.par_id)).filter(
+            LatestReadParagraph.type == t
+        )
         for t in (ReadParagraphType.click_red, *automatic_types)
     ]
     cols.append(
-        func.count(distinct(ReadParagraph.par_id)).filter(
-            ReadParagraph.type.in_(automatic_types)
+        func.count(distinct(LatestReadParagraph.par_id)).filter(
+            LatestReadParagraph.type.in_(automatic_types)
         )
     )
     column_names = (
@@ -252,7 +265,7 @@ def get_statistics(doc_path):
             f"Invalid sort option. Possible values are {seq_to_str(column_names)}."
         )
     q = (
-        UserGroup.query.join(ReadParagraph)
+        UserGroup.query.join(LatestReadParagraph)
         .filter_by(doc_id=d.id)
         .filter(extra_condition)
         .add_columns(*cols)
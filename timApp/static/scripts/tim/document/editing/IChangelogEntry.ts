@@ -2,7 +2,7 @@ import {ReadonlyMoment} from "tim/util/readonlymoment";
 
 export type IChangelogEntry = {
     group: string;
-    op: "Added" | "Deleted" | "Modified" | "Inserted";
+    op: "Added" | "Deleted" | "Modified" | "Inserted" | "Edited";
     op_params: null; // TODO
     par_id: string;
     time: ReadonlyMoment;
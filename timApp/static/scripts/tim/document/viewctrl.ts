@@ -260,6 +260,10 @@ export class ViewCtrl implements IController {
         nullable(t.string)
     );
     private liveUpdates: number;
+    private docEventSource?: EventSource;
+    private newDocVersion?: [number, number];
+    private lastParDiffTime = 0;
+    private docEventStreamPoll = 60;
     private oldWidth: number;
     public defaultAction: string | undefined;
     public reviewCtrl: ReviewController;
@@ -574,19 +578,62 @@ export class ViewCtrl implements IController {
         );
     }
 
+    /**
+     * Keeps an event stream open to the document. The server sends the new version of the document whenever
+     * it changes, so the changes only need to be fetched when there are some.
+     */
+    private openDocEventStream() {
+        if (this.docEventSource || typeof EventSource === "undefined") {
+            return;
+        }
+        this.docEventSource = new EventSource(`/docEvents/${this.docId}`);
+        this.docEventSource.addEventListener("version", (e) => {
+            this.newDocVersion = JSON.parse((e as MessageEvent<string>).data);
+        });
+    }
+
+    /**
+     * Tells whether the changes of the document should be fetched now.
+     * With an open event stream, they are fetched only when the stream has told about a newer version,
+     * or occasionally in case an event was missed.
+     */
+    private shouldFetchParDiff() {
+        if (this.docEventSource?.readyState !== EventSource.OPEN) {
+            return true;
+        }
+        if (
+            this.newDocVersion &&
+            (this.newDocVersion[0] !== this.docVersion[0] ||
+                this.newDocVersion[1] !== this.docVersion[1])
+        ) {
+            return true;
+        }
+        return (
+            Date.now() - this.lastParDiffTime >= this.docEventStreamPoll * 1000
+        );
+    }
+
     startLiveUpdates() {
         const sc = this.scope;
         const origLiveUpdates = this.liveUpdates;
         if (!origLiveUpdates) {
+            this.docEventSource?.close();
+            this.docEventSource = undefined;
             return;
         }
+        this.openDocEventStream();
         let stop: IPromise<unknown> | undefined;
         stop = $interval(async () => {
+            if (!this.shouldFetchParDiff()) {
+                return;
+            }
+            this.lastParDiffTime = Date.now();
             const r = await to(
                 $http.get<{
                     version: [number, number];
                     diff: DiffResult[];
                     live: number;
+                    stream_poll: number;
                 }>(
                     `/getParDiff/${this.docId}/${this.docVersion[0]}/${this.docVersion[1]}`
                 )
@@ -596,6 +643,7 @@ export class ViewCtrl implements IController {
             }
             const response = r.result;
             this.docVersion = response.data.version;
+            this.docEventStreamPoll = response.data.stream_poll;
             this.liveUpdates = response.data.live; // TODO: start new loop by this or stop if None
             const replaceFn = async (d: DiffResult, parId: string) => {
                 const e = getElementByParId(parId);
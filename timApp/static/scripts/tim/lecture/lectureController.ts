@@ -108,6 +108,10 @@ export class LectureController {
     private wallInstancePromise?: Promise<LectureWallDialogComponent>;
     private lectureMenu?: LectureMenuComponent;
     private storedSettings = new TimStorage("lecture", StoredSettings);
+    private eventSource?: EventSource;
+    private eventSourceLectureId?: number;
+    private updateEventReceived = false;
+    private wakeUpPolling?: () => void;
 
     constructor(vctrl: ViewCtrl | undefined) {
         this.viewctrl = vctrl;
@@ -570,6 +574,7 @@ export class LectureController {
     async startLongPolling() {
         let lastID = -1;
         while (true) {
+            this.updateEventStream();
             if (this.lecture == null) {
                 await $timeout(5000);
                 continue;
@@ -580,13 +585,64 @@ export class LectureController {
                 const [timeout, last] = await this.pollOnce(lastID);
                 lastID = last;
                 $rootScope.$applyAsync();
-                await $timeout(Math.max(timeout, 1000));
+                await this.waitForUpdateEvent(Math.max(timeout, 1000));
             } else {
                 await $timeout(1000);
             }
         }
     }
 
+    /**
+     * Keeps an event stream open to the current lecture. The server sends an event whenever the lecture changes,
+     * so the updates can be polled right away instead of waiting for the poll interval.
+     */
+    private updateEventStream() {
+        const lectureId = this.lecture?.lecture_id;
+        if (this.eventSource && lectureId === this.eventSourceLectureId) {
+            return;
+        }
+        this.eventSource?.close();
+        this.eventSource = undefined;
+        this.eventSourceLectureId = lectureId;
+        if (lectureId === undefined || typeof EventSource === "undefined") {
+            return;
+        }
+        this.eventSource = new EventSource("/lectureEvents");
+        this.eventSource.addEventListener("update", () => {
+            this.updateEventReceived = true;
+            this.wakeUpPolling?.();
+        });
+    }
+
+    private hasEventStream() {
+        return this.eventSource?.readyState === EventSource.OPEN;
+    }
+
+    /**
+     * Waits for the given time or until an update event is received.
+     */
+    private waitForUpdateEvent(ms: number) {
+        return new Promise<void>((resolve) => {
+            let timer: number;
+            const done = () => {
+                window.clearTimeout(timer);
+                this.wakeUpPolling = undefined;
+                this.updateEventReceived = false;
+                resolve();
+            };
+            // All clients of the lecture get the event at the same time, so spread their polls a little.
+            const wakeUp = () => {
+                window.clearTimeout(timer);
+                timer = window.setTimeout(done, Math.random() * 500);
+            };
+            timer = window.setTimeout(done, ms);
+            this.wakeUpPolling = wakeUp;
+            if (this.updateEventReceived) {
+                wakeUp();
+            }
+        });
+    }
+
     async pollOnce(lastID: number): Promise<[number, number]> {
         let buster = "" + new Date().getTime();
         buster = buster.substring(buster.length - 4);
@@ -601,6 +657,7 @@ export class LectureController {
                     q: this.lectureSettings.useQuestions ? "t" : null, // get_questions
                     i: this.getCurrentQuestionId(), // current_question_id
                     p: this.getCurrentPointsId(), // current_points_id
+                    s: this.hasEventStream() ? "t" : null, // has_event_stream
                     b: buster,
                 },
             })
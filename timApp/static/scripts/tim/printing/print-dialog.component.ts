@@ -6,7 +6,7 @@ import {BrowserModule} from "@angular/platform-browser";
 import {HttpClient, HttpClientModule} from "@angular/common/http";
 import * as t from "io-ts";
 import {FormsModule} from "@angular/forms";
-import {TimStorage, toPromise} from "../util/utils";
+import {timeout, TimStorage, toPromise} from "../util/utils";
 import {IItem} from "../item/IItem";
 
 export interface ITemplate extends IItem {}
@@ -16,6 +16,13 @@ export interface ITemplateParams {
     doctemplate: string;
 }
 
+interface IPrintJobStatus {
+    job: string;
+    status: "queued" | "running" | "done" | "failed";
+    errormsg?: string;
+    line?: string;
+}
+
 export interface IPrintParams {
     document: IItem;
     params: ITemplateParams;
@@ -245,12 +252,12 @@ export class PrintDialogComponent extends AngularDialogComponent<
             this.notificationmsg = undefined;
 
             const r = await toPromise(
-                this.http.post<{
-                    url: string;
-                    errormsg?: string;
-                    latex?: string;
-                    latexline?: string;
-                }>("/print/" + this.data.document.path, {
+                this.http.post<
+                    {
+                        url: string;
+                        latex?: string;
+                    } & Partial<IPrintJobStatus>
+                >("/print/" + this.data.document.path, {
                     fileType,
                     templateDocId: chosenTemplateId,
                     printPluginsUserCode: pluginsUserCode,
@@ -258,17 +265,39 @@ export class PrintDialogComponent extends AngularDialogComponent<
                     force,
                 })
             );
-            if (r.ok) {
-                const response = r.result;
-                this.docUrl = response.url;
-                this.errormsg = response.errormsg;
-                this.latex = response.latex;
-                this.latexline = response.latexline;
-                this.loading = false;
-            } else {
+            if (!r.ok) {
                 this.errormsg = r.result.error.error.split("\\n").join("<br/>");
                 this.loading = false;
+                return;
+            }
+            const response = r.result;
+            let status: Partial<IPrintJobStatus> = response;
+            // The document is printed in the background; poll until the print job is finished.
+            while (
+                status.job &&
+                (status.status === "queued" || status.status === "running")
+            ) {
+                await timeout(1000);
+                const s = await toPromise(
+                    this.http.get<IPrintJobStatus>(`/print/jobs/${status.job}`)
+                );
+                if (!s.ok) {
+                    this.errormsg = s.result.error.error;
+                    this.loading = false;
+                    return;
+                }
+                status = s.result;
+            }
+            this.docUrl = response.url;
+            this.errormsg = status.errormsg;
+            if (status.line !== undefined) {
+                this.latex = response.latex;
+                this.latexline = `${response.latex}&line=${status.line}#L${status.line}`;
+            } else {
+                this.latex = undefined;
+                this.latexline = undefined;
             }
+            this.loading = false;
         }
     }
 
@@ -60,6 +60,12 @@ SESSION_COOKIE_SECURE = (
 
 MINIMUM_SCHEDULED_FUNCTION_INTERVAL = 1
 
+# Many tests check the read marks in the database right after marking; tests of the buffer enable it explicitly.
+READMARK_BUFFER = False
+
+# The test database is recreated for each test class, which does not invalidate the rights cached in Redis.
+RIGHTS_CACHE_SHARED = False
+
 INTERNAL_PLUGIN_DOMAIN = "localhost"
 
 MESSAGE_LISTS_ENABLED = True
@@ -210,6 +210,45 @@ class DocumentTest(TimDbTest):
                 DocumentParser(d.export_markdown(export_hashes=True)).get_blocks(),
             )
 
+    def test_update_single_version(self):
+        d = self.create_doc().document
+        pars = self.add_pars(d, 5)
+        ver = d.get_version()
+        fulltext = d.export_markdown()
+        blocks = DocumentParser(fulltext).get_blocks()
+        del blocks[1]
+        blocks[2]["md"] = "modified"
+        new_blocks = (
+            DocumentParser("#-\nnew 1\n\n#-\nnew 2")
+            .add_missing_attributes()
+            .get_blocks()
+        )
+        blocks = blocks[:1] + new_blocks + blocks[1:]
+        _, _, result = d.update(DocumentWriter(blocks).get_text(), fulltext)
+        self.assertEqual((ver[0] + 1, 0), d.get_version())
+        self.assertEqual(6, len(d.get_changelog().entries))
+        self.assertEqual([pars[1]], [p.get_id() for p in result.deleted])
+        self.assertEqual([pars[3]], [p.get_id() for p in result.changed])
+        self.assertEqual(
+            [p["id"] for p in new_blocks], [p.get_id() for p in result.added]
+        )
+        entry = d.get_changelog().entries[0]
+        self.assertEqual("Edited", entry.op.op.value)
+        self.assertEqual(
+            {pars[1], pars[3]} | {p["id"] for p in new_blocks}, set(entry.par_ids)
+        )
+        self.assertEqual(
+            [pars[0]] + [p["id"] for p in new_blocks] + pars[2:],
+            [par.get_id() for par in d],
+        )
+        self.assertEqual("modified", d.get_paragraph(pars[3]).get_markdown())
+
+        # A single modification is still logged as a normal Modified entry.
+        fulltext = d.export_markdown()
+        _, _, result = d.update(fulltext.replace("modified", "again"), fulltext)
+        self.assertEqual((ver[0] + 1, 1), d.get_version())
+        self.assertEqual("Modified", d.get_changelog().entries[0].op.op.value)
+
     def test_update_section(self):
         random.seed(0)
         for i in range(6, 10):
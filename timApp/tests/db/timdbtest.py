@@ -1,4 +1,3 @@
-import glob
 import os
 import sys
 import unittest
@@ -11,6 +10,7 @@ from sqlalchemy_utils import drop_database
 
 import timApp.markdown.dumboclient
 import timApp.timdb.init
+from timApp.document.automacrocache import clear_auto_macro_cache
 from timApp.document.docentry import DocEntry
 from timApp.document.docinfo import DocInfo
 from timApp.document.document import Document
@@ -40,10 +40,7 @@ class TimDbTest(unittest.TestCase):
             # Safety mechanism
             assert cls.test_files_path.as_posix() != "/tim_files"
             del_content(cls.test_files_path, onerror=change_permission_and_retry)
-            for f in glob.glob("/tmp/heading_cache_*"):
-                os.remove(f)
-            for f in glob.glob("/tmp/tim_auto_macros_*"):
-                os.remove(f)
+            clear_auto_macro_cache()
         else:
             cls.test_files_path.mkdir()
         # Safety mechanism to make sure we are not wiping some production database
@@ -1,15 +1,24 @@
+import csv
+import json
 from datetime import datetime, timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from timApp import tim_celery
-from timApp.admin.answer_cli import delete_old_answers
+from timApp.admin.answer_cli import (
+    delete_old_answers,
+    delete_answers_with_ids,
+    read_exported_answers,
+)
 from timApp.answer.answer import Answer
+from timApp.answer.answerimport import AnswerImport
 from timApp.answer.answers import (
     get_users_for_tasks,
     save_answer,
     get_existing_answers_info,
 )
 from timApp.answer.backup import get_backup_answer_file
+from timApp.answer.latestanswer import LatestAnswer
 from timApp.auth.accesstype import AccessType
 from timApp.plugin.taskid import TaskId
 from timApp.tests.server.timroutetest import TimRouteTest
@@ -155,6 +164,87 @@ class AnswerTest(TimRouteTest):
         for a, b in zip(result, result[1:]):
             self.assertLess(a.answered_on, b.answered_on)
 
+    def test_export_formats(self):
+        self.login_test1()
+        d = self.create_doc()
+        for i in range(3):
+            self.current_user.answers.append(
+                Answer(
+                    task_id=f"{d.id}.t",
+                    points=i,
+                    content=f"x{i}",
+                    answered_on=datetime(year=2020, month=5, day=18 + i),
+                    valid=True,
+                )
+            )
+        db.session.commit()
+        exported = self.get(f"/exportAnswers/{d.path}")
+        self.assertEqual(3, len(exported))
+        ndjson = self.get(
+            f"/exportAnswers/{d.path}",
+            query_string={"format": "ndjson"},
+            expect_mimetype="application/x-ndjson",
+        )
+        self.assertEqual(exported, [json.loads(l) for l in ndjson.splitlines()])
+        csv_text = self.get(f"/exportAnswers/{d.path}", query_string={"format": "csv"})
+        self.assertEqual(
+            [
+                ["email", "content", "valid", "points", "time", "task", "doc"],
+                *(
+                    [
+                        e["email"],
+                        e["content"],
+                        "True",
+                        str(e["points"]),
+                        e["time"],
+                        "t",
+                        d.path,
+                    ]
+                    for e in exported
+                ),
+            ],
+            list(csv.reader(StringIO(csv_text))),
+        )
+
+        d2 = self.create_doc()
+        self.assertEqual(
+            [], self.get(f"/exportAnswers/{d2.path}", query_string={"format": "json"})
+        )
+
+    def test_import_ndjson(self):
+        self.login_test1()
+        d = self.create_doc()
+        for day in (20, 18, 19):
+            self.current_user.answers.append(
+                Answer(
+                    task_id=f"{d.id}.t",
+                    points=None,
+                    content=f"x{day}",
+                    answered_on=datetime(year=2020, month=5, day=day),
+                    valid=day != 20,
+                )
+            )
+        db.session.commit()
+        ndjson = self.get(
+            f"/exportAnswers/{d.path}", query_string={"format": "ndjson"}
+        ).replace(self.current_user.email, self.current_user.email.upper())
+        d2 = self.create_doc()
+        for expected_imported in (3, 0):
+            imp = AnswerImport(doc_map={d.path: d2.path}, match_email_case=False)
+            imp.stage(read_exported_answers(StringIO(ndjson)))
+            self.assertEqual([d2.id], [doc.id for doc in imp.get_docs()])
+            result = imp.run()
+            db.session.commit()
+            self.assertEqual(expected_imported, result.imported)
+            self.assertEqual(3 - expected_imported, result.skipped_duplicates)
+        imported: list[Answer] = (
+            Answer.query.filter_by(task_id=f"{d2.id}.t").order_by(Answer.id).all()
+        )
+        self.assertEqual(["x18", "x19", "x20"], [a.content for a in imported])
+        la = LatestAnswer.query.get((f"{d2.id}.t", self.current_user.id))
+        self.assertEqual((imported[2].id, 3), (la.answer_id, la.count))
+        self.assertEqual((imported[1].id, 2), (la.valid_answer_id, la.valid_count))
+
     def test_too_large_answer(self):
         self.login_test1()
         d = self.create_doc(initial_par="#- {#t plugin=textfield}")
@@ -228,6 +318,54 @@ class AnswerTest(TimRouteTest):
         self.assertEqual("y2inv", anss[0].content_as_json.get("c"))
         self.assertEqual("y2", anss[1].content_as_json.get("c"))
 
+    def test_latest_answers(self):
+        self.login_test1()
+        d = self.create_doc()
+        u1, u2 = self.test_user_1, self.test_user_2
+        task_id = f"{d.id}.t"
+
+        def check(
+            u: User, answer: Answer, count, valid_answer: Answer | None, valid_count
+        ):
+            la = LatestAnswer.query.get((task_id, u.id))
+            self.assertEqual(
+                (
+                    answer.id,
+                    count,
+                    valid_answer.id if valid_answer else None,
+                    valid_count,
+                ),
+                (la.answer_id, la.count, la.valid_answer_id, la.valid_count),
+            )
+
+        a1 = self.add_answer(d, "t", "x1", user=u1)
+        a2 = self.add_answer(d, "t", "x2", user=u1, valid=False)
+        db.session.commit()
+        check(u1, a2, 2, a1, 1)
+        a3 = save_answer([u1, u2], TaskId.parse(task_id), "x3", None)
+        db.session.commit()
+        check(u1, a3, 3, a3, 2)
+        check(u2, a3, 1, a3, 1)
+
+        a3.valid = False
+        db.session.commit()
+        check(u1, a3, 3, a1, 1)
+        self.assertIsNone(LatestAnswer.query.get((task_id, u2.id)).valid_answer_id)
+
+        a3.users_all.remove(u2)
+        db.session.commit()
+        check(u1, a3, 3, a1, 1)
+        self.assertIsNone(LatestAnswer.query.get((task_id, u2.id)))
+
+        delete_answers_with_ids([a3.id, a1.id])
+        db.session.commit()
+        check(u1, a2, 1, None, 0)
+
+        self.get(f"/renameAnswers/t/t2/{d.id}")
+        self.assertIsNone(LatestAnswer.query.get((task_id, u1.id)))
+        task_id = f"{d.id}.t2"
+        check(u1, a2, 1, None, 0)
+
     def test_answer_backup(self):
         self.login_test1()
         d = self.create_doc(
@@ -197,6 +197,28 @@ stem: Hi, %%username%%!
         plugins = tree.cssselect("cs-runner")
         self.assertEqual("Hi, testuser1!", decode_csplugin(plugins[0])["stem"])
 
+    def test_usermacro_in_plugin_cached(self):
+        """Cached plugin markup is not shared between users whose macros differ."""
+        self.login_test1()
+        d = self.create_doc(
+            initial_par="""
+#- {plugin=csPlugin}
+type: cs
+stem: Hi, %%username%%!
+        """
+        )
+        self.test_user_2.grant_access(d, AccessType.view)
+        db.session.commit()
+        for _ in range(2):
+            for user, name in (
+                (self.login_test1, "testuser1"),
+                (self.login_test2, "testuser2"),
+            ):
+                user()
+                tree = self.get(d.url, as_tree=True)
+                plugins = tree.cssselect("cs-runner")
+                self.assertEqual(f"Hi, {name}!", decode_csplugin(plugins[0])["stem"])
+
     def test_addforevery_only_settings(self):
         self.login_test1()
         x = self.create_doc(self.get_personal_item_path("x/y"))
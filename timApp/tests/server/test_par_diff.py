@@ -1,7 +1,9 @@
 """Server tests for getParDiff route."""
 from lxml import html
 
+from timApp.auth.accesstype import AccessType
 from timApp.tests.server.timroutetest import TimRouteTest
+from timApp.timdb.sqa import db
 
 
 class ParDiffTest(TimRouteTest):
@@ -42,3 +44,26 @@ class ParDiffTest(TimRouteTest):
             d.document.export_markdown(),
         )
         self.get(f"/getParDiff/{d.id}/1/0")
+
+    def test_diff_rendered_per_user(self):
+        """Users polling the same diff see only their own answers."""
+        self.login_test1()
+        d = self.create_doc(initial_par="text")
+        self.test_user_2.grant_access(d, AccessType.view)
+        self.test_user_3.grant_access(d, AccessType.view)
+        db.session.commit()
+        d.document.add_text("#- {plugin=textfield #t}")
+        self.login_test2()
+        self.post_answer("textfield", f"{d.id}.t", user_input={"c": "answer2"})
+        self.login_test3()
+        self.post_answer("textfield", f"{d.id}.t", user_input={"c": "answer3"})
+        for login, own, other in (
+            (self.login_test2, "answer2", "answer3"),
+            (self.login_test3, "answer3", "answer2"),
+            (self.login_test2, "answer2", "answer3"),
+        ):
+            login()
+            r = self.get(f"/getParDiff/{d.id}/1/0")
+            texts = r["diff"][0]["content"]["texts"]
+            self.assertIn(own, texts)
+            self.assertNotIn(other, texts)
@@ -1,9 +1,14 @@
 """Server tests for printing."""
 import json
 import urllib.parse
+from unittest.mock import patch, Mock
 
+from timApp import tim_celery
 from timApp.document.docentry import DocEntry
 from timApp.document.specialnames import TEMPLATE_FOLDER_NAME, PRINT_FOLDER_NAME
+from timApp.document.usercontext import UserContext
+from timApp.printing.documentprinter import DocumentPrinter
+from timApp.printing.printsettings import PrintFormat
 from timApp.tests.server.timroutetest import TimRouteTest
 from timApp.util.flask.responsehelper import to_json_str
 from timApp.util.utils import exclude_keys
@@ -85,10 +90,21 @@ class PrintingTest(TimRouteTest):
         expected_url = (
             f"http://localhost/print/{d.path}?{urllib.parse.urlencode(exp_params)}"
         )
+        with self.print_jobs_inline():
+            r = self.json_post(
+                f"/print/{d.path}",
+                params_post,
+                expect_status=202,
+            )
+        self.assertEqual(expected_url, r["url"])
+        self.get(
+            f"/print/jobs/{r['job']}",
+            expect_content={"job": r["job"], "status": "done"},
+        )
         self.json_post(
             f"/print/{d.path}",
             params_post,
-            expect_status=201,
+            expect_status=200,
             expect_content={"success": True, "url": expected_url},
         )
         result = self.get_no_warn(expected_url)
@@ -122,7 +138,8 @@ class PrintingTest(TimRouteTest):
         expected_url = (
             f"http://localhost/print/{d.path}?{urllib.parse.urlencode(params_url)}"
         )
-        result = self.get_no_warn(expected_url)
+        with self.print_jobs_inline():
+            result = self.get_no_warn(expected_url)
 
         # TODO: XeLaTeX doesn't support removing timestamps from PDF file, so we cannot do a binary compare.
         # Just check the file size for now.
@@ -132,6 +149,56 @@ class PrintingTest(TimRouteTest):
         )
         self.login_test2()
         self.get(expected_url, expect_status=403)
+        self.get(f"/print/jobs/{r['job']}", expect_status=403)
+
+    def test_print_jobs_coalesce(self):
+        self.login_test1()
+        d = self.create_doc(initial_par="Hello")
+        t = self.create_empty_print_template()
+        params_post = {
+            "fileType": "latex",
+            "templateDocId": t.id,
+            "printPluginsUserCode": False,
+        }
+        with patch.object(tim_celery.print_document_task, "delay") as m:  # type: Mock
+            r1 = self.json_post(f"/print/{d.path}", params_post, expect_status=202)
+            r2 = self.json_post(f"/print/{d.path}", params_post, expect_status=202)
+            self.assertEqual(1, m.call_count)
+        self.assertEqual(r1["job"], r2["job"])
+        self.get(
+            f"/print/jobs/{r1['job']}",
+            expect_content={"job": r1["job"], "status": "queued"},
+        )
+        self.get("/print/jobs/x", expect_status=404)
+
+    def test_print_fragment_cache(self):
+        self.login_test1()
+        d = self.create_doc(initial_par="Hello 1\n#-\nHello 2\n#-\nHello 3")
+        t = self.create_empty_print_template()
+
+        def get_content() -> tuple[str, int]:
+            printer = DocumentPrinter(d, template_to_use=t, urlroot="")
+            content = printer.get_content(
+                UserContext.from_one_user(self.test_user_1),
+                target_format=PrintFormat.LATEX,
+            )
+            return content, printer.fragment_hits
+
+        c1, _ = get_content()
+        c2, hits = get_content()
+        self.assertEqual(c1, c2)
+        self.assertEqual(3, hits)
+        d.document.modify_paragraph(
+            d.document.get_paragraphs()[1].get_id(), "Hello two"
+        )
+        c3, hits = get_content()
+        self.assertEqual(2, hits)
+        self.assertEqual(c1.replace("Hello 2", "Hello two"), c3)
+
+    def print_jobs_inline(self):
+        return patch.object(
+            tim_celery.print_document_task, "delay", wraps=tim_celery.run_print_job
+        )
 
     def test_print_latex_autonumber(self):
         self.login_test1()
@@ -3,7 +3,9 @@ from datetime import timedelta
 from lxml.cssselect import CSSSelector
 
 from timApp.document.docinfo import DocInfo
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readings import get_readings, get_read_expiry_condition
+from timApp.readmark.readmarkbuffer import flush_read_marks
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.readmark.readparagraphtype import ReadParagraphType
 from timApp.tests.server.timroutetest import TimRouteTest
@@ -337,3 +339,57 @@ testuser2,3,0,0,0,0
                 READ,
             ),
         )
+
+    def test_readings_buffered(self):
+        self.login_test1()
+        d = self.create_doc(initial_par=["1", "2"])
+        pars = d.document.get_paragraphs()
+        q = ReadParagraph.query.filter_by(doc_id=d.id)
+        with self.temp_config({"READMARK_BUFFER": True}):
+            self.mark_as_read(d, pars[0].get_id())
+            self.mark_as_read(d, pars[0].get_id())
+            self.assertEqual(q.count(), 0)
+            self.check_readlines(self.get_readings(d), (READ, UNREAD))
+            self.assertEqual(q.count(), 1)
+            self.mark_as_read(d, pars[1].get_id())
+            self.assertEqual(flush_read_marks(), 1)
+            self.assertEqual(q.count(), 2)
+            self.mark_as_read(d, pars[1].get_id())
+            self.mark_as_unread(d, pars[1].get_id())
+            self.check_readlines(self.get_readings(d), (READ, READ))
+            self.assertEqual(q.count(), 2)
+
+    def test_latest_readings(self):
+        self.login_test1()
+        d = self.create_doc(initial_par=["1", "2"])
+        pars = d.document.get_paragraphs()
+        ug_id = self.get_test_user_1_group_id()
+        latest = LatestReadParagraph.query.filter_by(doc_id=d.id, usergroup_id=ug_id)
+        history = ReadParagraph.query.filter_by(doc_id=d.id)
+        self.mark_as_read(d, pars[0].get_id())
+        self.mark_as_read(d, pars[0].get_id(), ReadParagraphType.click_par)
+        d.document.modify_paragraph(pars[0].get_id(), "edited")
+        self.mark_as_read(d, pars[0].get_id())
+        self.assertEqual(history.count(), 3)
+        self.assertEqual(latest.count(), 2)
+        new_hash = d.document.get_paragraphs()[0].get_hash()
+        self.assertEqual(
+            new_hash,
+            latest.filter_by(type=ReadParagraphType.click_red).one().par_hash,
+        )
+
+        # Removing the latest mark brings back the previous one.
+        self.mark_as_unread(d, pars[0].get_id())
+        self.assertEqual(
+            pars[0].get_hash(),
+            latest.filter_by(type=ReadParagraphType.click_red).one().par_hash,
+        )
+        self.check_readlines(
+            self.get_readings(d), (MODIFIED + " " + PAR_CLICK_MODIFIED, UNREAD)
+        )
+        self.mark_as_unread(d, pars[0].get_id())
+        self.assertEqual(latest.count(), 1)
+
+        self.json_put(f"/read/{d.id}")
+        self.assertEqual(latest.count(), 3)
+        self.assertEqual(history.count(), 3)
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from timApp.auth.accesstype import AccessType
+from timApp.auth.rightscache import (
+    get_rights_for_users,
+    get_rights_for_items,
+    UncachedAccesses,
+    clear_request_cache,
+    invalidate_shared_entries,
+    RightsChanges,
+)
+from timApp.tests.server.timroutetest import TimRouteTest
+from timApp.timdb.sqa import db
+from timApp.user.usergroup import UserGroup
+from timApp.user.userutils import grant_access
+from timApp.util.utils import get_current_time
+
+
+class RightsCacheTest(TimRouteTest):
+    def check_rights(self, d, expected: dict[int, tuple[bool, bool]]):
+        """Checks the view (can_comment) and edit rights of the users and compares them with the uncached rights."""
+        users = [self.test_user_1, self.test_user_2, self.test_user_3]
+        rights = get_rights_for_users(d, users)
+        self.assertEqual(
+            expected,
+            {
+                u.id: (rights[u.id]["can_comment"], rights[u.id]["editable"])
+                for u in users
+            },
+        )
+        for u in users:
+            self.assertEqual(UncachedAccesses(u, d).get_item_rights(), rights[u.id])
+
+    def test_rights_invalidated(self):
+        self.login_test1()
+        d = self.create_doc()
+        u1, u2, u3 = self.test_user_1, self.test_user_2, self.test_user_3
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+        )
+
+        u2.grant_access(d, AccessType.edit)
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (True, True), u3.id: (False, False)}
+        )
+
+        u2.remove_access(d.id, "edit")
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+        )
+
+        ug = UserGroup.create("rightscachegroup")
+        ba = grant_access(ug, d, AccessType.view)
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+        )
+        u3.add_to_group(ug, added_by=None)
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (True, False)}
+        )
+
+        ba.accessible_from = get_current_time() + timedelta(hours=1)
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+        )
+
+        ba.accessible_from = get_current_time() - timedelta(hours=1)
+        for m in u3.memberships:
+            if m.usergroup_id == ug.id:
+                m.membership_end = get_current_time() - timedelta(seconds=1)
+        db.session.commit()
+        self.check_rights(
+            d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+        )
+
+    def test_rights_for_items(self):
+        self.login_test1()
+        d1 = self.create_doc()
+        d2 = self.create_doc()
+        self.test_user_2.grant_access(d2, AccessType.view)
+        db.session.commit()
+        rights = get_rights_for_items([d1, d2], self.test_user_2)
+        self.assertFalse(rights[d1.id]["can_comment"])
+        self.assertTrue(rights[d2.id]["can_comment"])
+
+    def test_shared_cache(self):
+        self.login_test1()
+        d = self.create_doc()
+        u1, u2, u3 = self.test_user_1, self.test_user_2, self.test_user_3
+        with self.temp_config({"RIGHTS_CACHE_SHARED": True}):
+            # The test database may have been recreated after the rights were cached.
+            invalidate_shared_entries(RightsChanges(everything=True))
+            self.check_rights(
+                d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+            )
+            u2.grant_access(d, AccessType.view)
+            db.session.commit()
+            clear_request_cache()
+            self.check_rights(
+                d, {u1.id: (True, True), u2.id: (True, False), u3.id: (False, False)}
+            )
+            u2.remove_access(d.id, "view")
+            db.session.commit()
+            clear_request_cache()
+            self.check_rights(
+                d, {u1.id: (True, True), u2.id: (False, False), u3.id: (False, False)}
+            )
@@ -131,6 +131,26 @@ class SearchTest(TimRouteTest):
             },
         )
 
+    def test_search_index_update(self):
+        self.make_admin(self.test_user_1)
+        self.login_test1()
+        self.create_doc(initial_par="Dogs like to hunt too.")
+        self.get(f"search/createContentFile")
+        url = "search?folder=&query=parrots&searchTitles=false"
+        self.get(url, expect_status=200, expect_contains={"word_result_count": 0})
+        d = self.create_doc(initial_par="Parrots like to talk.")
+        self.get(f"search/updateIndex")
+        r = self.get(url, expect_status=200)
+        self.assertEqual(1, r["word_result_count"])
+        self.assertEqual(d.id, r["content_results"][0]["doc"]["id"])
+        self.post_par(
+            d.document,
+            "Parakeets like to talk.",
+            d.document.get_paragraphs()[0].get_id(),
+        )
+        self.get(f"search/updateIndex")
+        self.get(url, expect_status=200, expect_contains={"word_result_count": 0})
+
     def test_search_without_view_rights(self):
         text_to_search = "secret"
         url = f"search?folder=&query={text_to_search}"
@@ -66,7 +66,12 @@ def is_redirect(response: Response):
 
 orig_getaddrinfo = socket.getaddrinfo
 
-TEXTUAL_MIMETYPES = {"text/html", "application/json", "text/plain"}
+TEXTUAL_MIMETYPES = {
+    "text/html",
+    "application/json",
+    "application/x-ndjson",
+    "text/plain",
+}
 LOCALHOST = "http://localhost/"
 
 BasicAuthParams = tuple[str, str]
@@ -0,0 +1,12 @@
+"""Makes the csPlugin modules importable in unit tests.
+
+csPlugin runs with timApp/modules/cs as its working directory, so its modules import each other by their bare names.
+"""
+import os
+import sys
+
+CS_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "modules", "cs")
+)
+if CS_DIR not in sys.path:
+    sys.path.append(CS_DIR)
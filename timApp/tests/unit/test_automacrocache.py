@@ -0,0 +1,109 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from redis.exceptions import LockNotOwnedError
+
+from timApp.document.automacrocache import (
+    DOCS_KEY,
+    AutoMacroCache,
+    LocalAutoMacroStore,
+    LocalTier,
+    RedisAutoMacroStore,
+    local_tier,
+)
+
+
+class TestAutoMacroCache(TestCase):
+    def setUp(self):
+        self.store = LocalAutoMacroStore()
+        local_tier.drop(None)
+
+    def tearDown(self):
+        local_tier.drop(None)
+
+    def test_flush(self):
+        c = AutoMacroCache(1, store=self.store)
+        self.assertIsNone(c.get_macros("a", (1, 0)))
+        c.set_macros("a", (1, 0), {"h": {1: 1}})
+        c.set_headings("a", (1, 0), ["x"])
+        self.assertEqual({"h": {1: 1}}, c.get_macros("a", (1, 0)))
+        self.assertEqual({}, self.store.load((1, 1, 0)))
+        c.flush()
+        self.assertEqual(
+            {"m:a": {"h": {1: 1}}, "h:a": ["x"]}, self.store.load((1, 1, 0))
+        )
+
+        c2 = AutoMacroCache(1, store=self.store)
+        self.assertEqual({"h": {1: 1}}, c2.get_macros("a", (1, 0)))
+        self.assertEqual(["x"], c2.get_headings("a", (1, 0)))
+        # Values are per version.
+        self.assertIsNone(c2.get_macros("a", (2, 0)))
+
+    def test_not_persistent(self):
+        c = AutoMacroCache(1, persist=False, store=self.store)
+        c.set_macros("a", (1, 0), {"h": {}})
+        c.flush()
+        self.assertEqual({}, self.store.load((1, 1, 0)))
+        self.assertIsNone(AutoMacroCache(1, store=self.store).get_macros("a", (1, 0)))
+
+    def test_reload_sees_other_writers(self):
+        c = AutoMacroCache(1, store=self.store)
+        self.assertIsNone(c.get_macros("a", (1, 0)))
+        self.store.save((1, 1, 0), {"m:a": {"h": {}}})
+        # The empty result is cached in the local tier until the cache is reloaded.
+        self.assertIsNone(AutoMacroCache(1, store=self.store).get_macros("a", (1, 0)))
+        c.reload()
+        self.assertEqual({"h": {}}, c.get_macros("a", (1, 0)))
+
+    def test_lru(self):
+        t = LocalTier(2)
+        t.put((1, 1, 0), {})
+        t.put((1, 2, 0), {})
+        t.get((1, 1, 0))
+        t.put((2, 1, 0), {})
+        self.assertIsNotNone(t.get((1, 1, 0)))
+        self.assertIsNone(t.get((1, 2, 0)))
+        t.drop(1)
+        self.assertIsNone(t.get((1, 1, 0)))
+        self.assertIsNotNone(t.get((2, 1, 0)))
+
+    def test_redis_lock_not_acquired(self):
+        store = RedisAutoMacroStore(expire_secs=10, lock_timeout=1)
+        client = MagicMock()
+        client.lock.return_value.acquire.return_value = False
+        with patch.object(RedisAutoMacroStore, "_client", return_value=client):
+            with patch("timApp.document.automacrocache.log_warning") as warn:
+                with store.lock(1):
+                    pass
+        warn.assert_called_once()
+        client.lock.return_value.release.assert_not_called()
+
+    def test_redis_lock_expired(self):
+        store = RedisAutoMacroStore(expire_secs=10, lock_timeout=1)
+        client = MagicMock()
+        client.lock.return_value.acquire.return_value = True
+        client.lock.return_value.release.side_effect = LockNotOwnedError()
+        with patch.object(RedisAutoMacroStore, "_client", return_value=client):
+            with store.lock(1):
+                pass
+        client.lock.return_value.release.assert_called_once()
+
+    def test_redis_clear(self):
+        store = RedisAutoMacroStore(expire_secs=10, lock_timeout=1)
+        client = MagicMock()
+        names = {
+            store.get_names_key(1): {b"tim-automacros-1-1-0", b"tim-automacros-1-2-0"},
+            store.get_names_key(2): {b"tim-automacros-2-1-0"},
+            DOCS_KEY: {b"1", b"2"},
+        }
+        client.smembers.side_effect = lambda k: names[k]
+        with patch.object(RedisAutoMacroStore, "_client", return_value=client):
+            store.clear(1)
+            client.delete.assert_called_once_with(
+                *names[store.get_names_key(1)], store.get_names_key(1)
+            )
+            client.srem.assert_called_once_with(DOCS_KEY, 1)
+            client.reset_mock()
+            store.clear(None)
+        self.assertEqual(2, client.delete.call_count)
+        client.scan_iter.assert_not_called()
@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from timApp.document.changelogfile import (
+    read_lines_reversed,
+    append_changelog_entry,
+    convert_legacy_changelog,
+    line_mentions_any,
+    CHANGELOG_FILE_NAME,
+    LEGACY_CHANGELOG_FILE_NAME,
+)
+
+
+class TestChangelogFile(TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_lines_reversed(self):
+        f = self.path / "f"
+        lines = [f"line {i} " + "x" * i for i in range(200)]
+        f.write_text("\n".join(lines) + "\n")
+        for block_size in (1, 7, 64, 100000):
+            self.assertEqual(
+                list(reversed(lines)), list(read_lines_reversed(f, block_size))
+            )
+        f.write_text("")
+        self.assertEqual([], list(read_lines_reversed(f)))
+
+    def test_convert_legacy(self):
+        (self.path / LEGACY_CHANGELOG_FILE_NAME).write_text(
+            "".join(json.dumps({"n": i}) + "\n" for i in (2, 1, 0))
+        )
+        append_changelog_entry(self.path / CHANGELOG_FILE_NAME, {"n": 3})
+        self.assertTrue(convert_legacy_changelog(self.path))
+        self.assertFalse((self.path / LEGACY_CHANGELOG_FILE_NAME).exists())
+        self.assertEqual(
+            [3, 2, 1, 0],
+            [
+                json.loads(l)["n"]
+                for l in read_lines_reversed(self.path / CHANGELOG_FILE_NAME)
+            ],
+        )
+        self.assertFalse(convert_legacy_changelog(self.path))
+
+    def test_line_mentions_any(self):
+        line = json.dumps(
+            {
+                "group_id": 1,
+                "par_id": "abc",
+                "op": "Edited",
+                "op_params": {"added": ["def"], "deleted": [], "changed": ["ghi"]},
+                "ver": [2, 0],
+            }
+        )
+        self.assertTrue(line_mentions_any(line, {"abc"}))
+        self.assertTrue(line_mentions_any(line, {"x", "ghi"}))
+        self.assertFalse(line_mentions_any(line, {"ab", "x"}))
+        self.assertFalse(line_mentions_any(line, set()))
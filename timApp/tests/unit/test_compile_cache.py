@@ -0,0 +1,127 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import timApp.tests.unit.csplugin  # noqa: F401
+import compile_cache
+
+
+def write(path: str, content: str, mtime: float | None = None) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+class CompileCacheTest(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        os.makedirs(self.cache_dir)
+        self.patcher = patch.object(compile_cache, "CACHE_DIR", self.cache_dir)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def make_prg(self, name: str, source: str = "int main() {}") -> str:
+        prgpath = os.path.join(self.tmp.name, name)
+        write(os.path.join(prgpath, "prog.c"), source)
+        return prgpath
+
+    def key(self, prgpath: str, commandline: str = "gcc prog.c -o prog") -> str | None:
+        return compile_cache.get_cache_key(
+            prgpath, "CC", commandline, "cs3", ["prog"], compile_cache.IGNORED_FILES
+        )
+
+    def compile(self, prgpath: str, status: str = "0") -> None:
+        """Writes the files that a run with save_compile_output=True leaves behind."""
+        write(os.path.join(prgpath, "prog"), "binary")
+        write(os.path.join(prgpath, compile_cache.COMPILE_OUT), "out")
+        write(os.path.join(prgpath, compile_cache.COMPILE_ERR), "warning")
+        write(os.path.join(prgpath, compile_cache.COMPILE_STATUS), status + "\n")
+
+    def test_cache_key(self):
+        p1 = self.make_prg("p1")
+        p2 = self.make_prg("p2")
+        key = self.key(p1)
+        self.assertIsNotNone(key)
+        self.assertEqual(key, self.key(p2))
+        # Outputs and ignored files do not affect the key.
+        self.compile(p2)
+        write(os.path.join(p2, "pwd.txt"), "/home/agent")
+        self.assertEqual(key, self.key(p2))
+
+        self.assertNotEqual(key, self.key(p1, "gcc -O2 prog.c -o prog"))
+        write(os.path.join(p2, "prog.c"), "int main() { return 1; }")
+        self.assertNotEqual(key, self.key(p2))
+        write(os.path.join(p1, "prog.h"), "")
+        self.assertNotEqual(key, self.key(p1))
+
+        with patch.object(compile_cache, "MAX_SOURCE_FILES", 1):
+            self.assertIsNone(self.key(p1))
+
+    def test_store_and_restore(self):
+        p1 = self.make_prg("p1")
+        key = self.key(p1)
+        self.assertFalse(compile_cache.restore(key, p1))
+        self.compile(p1)
+        self.assertTrue(compile_cache.store(key, p1, ["prog"]))
+        # The first stored entry is kept.
+        self.assertFalse(compile_cache.store(key, p1, ["prog"]))
+
+        p2 = self.make_prg("p2")
+        self.assertTrue(compile_cache.restore(key, p2))
+        self.assertEqual("binary", read(os.path.join(p2, "prog")))
+        self.assertEqual("out", read(os.path.join(p2, compile_cache.CACHED_OUT)))
+        self.assertEqual("warning", read(os.path.join(p2, compile_cache.CACHED_ERR)))
+
+        compile_cache.clean_compile_output(p2)
+        self.assertFalse(os.path.exists(os.path.join(p2, compile_cache.CACHED_OUT)))
+        self.assertTrue(os.path.exists(os.path.join(p2, "prog")))
+
+    def test_failed_compile_not_stored(self):
+        p = self.make_prg("p")
+        key = self.key(p)
+        self.assertFalse(compile_cache.store(key, p, ["prog"]))
+        self.compile(p, status="1")
+        self.assertFalse(compile_cache.store(key, p, ["prog"]))
+        self.assertFalse(compile_cache.restore(key, p))
+
+    def test_remove_outputs(self):
+        p = self.make_prg("p")
+        write(
+            os.path.join(p, "prog"), "left by an earlier run", mtime=time.time() + 100
+        )
+        write(os.path.join(p, "sub", "Main.class"), "left by an earlier run")
+        os.symlink(os.path.join(p, "prog.c"), os.path.join(p, "Link.class"))
+        compile_cache.remove_outputs(p, ["prog", "*.class"])
+        self.assertEqual(["prog.c"], list(compile_cache.walk_files(p)))
+        self.assertFalse(os.path.lexists(os.path.join(p, "Link.class")))
+        # The compile did not produce anything, so there is nothing to store.
+        write(os.path.join(p, compile_cache.COMPILE_STATUS), "0\n")
+        self.assertFalse(compile_cache.store(self.key(p), p, ["prog", "*.class"]))
+
+    def test_evict(self):
+        now = time.time()
+        for i, name in enumerate(("a", "b", "c")):
+            entry = os.path.join(self.cache_dir, name)
+            write(os.path.join(entry, "files", "prog"), "x" * 100)
+            os.utime(entry, (now - 100 + i, now - 100 + i))
+        stale = os.path.join(self.cache_dir, "tmp-1")
+        write(os.path.join(stale, "out"), "")
+        os.utime(stale, (now - 7200, now - 7200))
+
+        compile_cache.evict(250)
+        self.assertEqual(["b", "c"], sorted(os.listdir(self.cache_dir)))
+        compile_cache.clear()
+        self.assertEqual([], os.listdir(self.cache_dir))
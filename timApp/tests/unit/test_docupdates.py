@@ -0,0 +1,117 @@
+from threading import Barrier, Thread
+from time import sleep
+from unittest import TestCase
+
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.docupdates import (
+    DocUpdateHub,
+    ParDiffCache,
+    ParSnapshot,
+    parse_version,
+)
+
+
+class DocUpdateHubTest(TestCase):
+    def test_wait_returns_newest_version(self):
+        hub = DocUpdateHub()
+        hub.watch(1)
+        hub.dispatch(1, (2, 0))
+        hub.dispatch(1, (3, 1))
+        hub.dispatch(1, (3, 0))
+        hub.dispatch(2, (5, 0))
+        self.assertEqual((3, 1), hub.wait(1, (1, 0), timeout=1))
+        hub.unwatch(1)
+
+    def test_wait_times_out(self):
+        hub = DocUpdateHub()
+        hub.watch(1)
+        hub.dispatch(1, (2, 0))
+        self.assertEqual((2, 0), hub.wait(1, (2, 0), timeout=0.05))
+        hub.unwatch(1)
+
+    def test_waiter_is_woken(self):
+        hub = DocUpdateHub()
+        hub.watch(1)
+        result = []
+        t = Thread(target=lambda: result.append(hub.wait(1, (1, 0), timeout=5)))
+        t.start()
+        hub.dispatch(1, (1, 1))
+        t.join(timeout=5)
+        self.assertEqual([(1, 1)], result)
+        hub.unwatch(1)
+
+    def test_unwatched_docs_not_tracked(self):
+        hub = DocUpdateHub()
+        hub.dispatch(1, (1, 0))
+        hub.watch(1)
+        hub.watch(1)
+        hub.unwatch(1)
+        self.assertIn(1, hub.channels)
+        hub.unwatch(1)
+        self.assertEqual({}, hub.channels)
+
+    def test_parse_version(self):
+        self.assertEqual((12, 3), parse_version("12,3"))
+
+
+class ParDiffCacheTest(TestCase):
+    def test_computed_once_for_concurrent_requests(self):
+        cache = ParDiffCache(max_size=10)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            sleep(0.05)
+            return [{"type": "delete", "start_id": "a", "end_id": None}]
+
+        barrier = Barrier(20)
+        results = []
+
+        def get():
+            barrier.wait()
+            results.append(cache.get((1, (1, 0), (2, 0), None), compute))
+
+        threads = [Thread(target=get) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, cache.computed)
+        self.assertEqual(20, len(results))
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_size_bounded(self):
+        cache = ParDiffCache(max_size=2)
+        for i in range(3):
+            cache.get((1, (i, 0), (i + 1, 0), None), lambda: [])
+        cache.get((1, (2, 0), (3, 0), None), lambda: [])
+        self.assertEqual(3, cache.computed)
+        cache.get((1, (0, 0), (1, 0), None), lambda: [])
+        self.assertEqual(4, cache.computed)
+
+    def test_failed_compute_not_cached(self):
+        cache = ParDiffCache(max_size=2)
+
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            cache.get((1, (0, 0), (1, 0), None), fail)
+        self.assertEqual([], cache.get((1, (0, 0), (1, 0), None), lambda: []))
+
+
+class ParSnapshotTest(TestCase):
+    def test_new_par_every_time(self):
+        par = DocParagraph.create(None, md="x", html="<p>x</p>", attrs={"a": "b"})
+        snapshot = ParSnapshot.of(par)
+        p1 = snapshot.to_par(None)
+        p1.set_attr("a", "c")
+        p1.html = "<p>answer of user 1</p>"
+        p2 = snapshot.to_par(None)
+        self.assertIsNot(p1, p2)
+        self.assertEqual(par.get_id(), p2.get_id())
+        self.assertEqual(par.get_hash(), p2.get_hash())
+        self.assertEqual("x", p2.get_markdown())
+        self.assertEqual({"a": "b"}, p2.get_attrs())
+        self.assertEqual("<p>x</p>", p2.html)
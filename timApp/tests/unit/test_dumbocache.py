@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from timApp.markdown.dumbocache import LruDumboCache, get_item_key
+
+
+class TestDumboCache(TestCase):
+    def test_item_key(self):
+        opts = {"mathOption": "mathjax", "smartPunct": False}
+        k = get_item_key("", opts, "*a*")
+        self.assertEqual(k, get_item_key("", dict(reversed(opts.items())), "*a*"))
+        self.assertNotEqual(k, get_item_key("/mdkeys", opts, "*a*"))
+        self.assertNotEqual(k, get_item_key("", {**opts, "smartPunct": True}, "*a*"))
+        self.assertNotEqual(k, get_item_key("", opts, "*b*"))
+
+    def test_lru_size_bound(self):
+        c = LruDumboCache(max_size=10)
+        c.set_many({"a": "1234", "b": "1234"})
+        self.assertEqual(["1234", "1234", None], c.get_many(["a", "b", "c"]))
+        # "a" was used more recently, so "b" is evicted first.
+        c.get_many(["a"])
+        c.set_many({"c": "1234"})
+        self.assertEqual(["1234", None, "1234"], c.get_many(["a", "b", "c"]))
+        self.assertEqual(8, c.size)
+        # Values larger than the whole cache are not stored.
+        c.set_many({"d": "x" * 11})
+        self.assertEqual([None], c.get_many(["d"]))
+
+    def test_stats(self):
+        c = LruDumboCache(max_size=10)
+        self.assertIsNone(c.get_stats()["hit_rate"])
+        c.record(hits=3, misses=1)
+        self.assertEqual(0.75, c.get_stats()["hit_rate"])
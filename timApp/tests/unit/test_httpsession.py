@@ -0,0 +1,47 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+
+from timApp.util.httpsession import create_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports: set[int] = set()
+
+    def do_GET(self) -> None:
+        Handler.client_ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Set-Cookie", "session=secret; Path=/")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class TestHttpSession(TestCase):
+    def setUp(self) -> None:
+        Handler.client_ports = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        s = create_session(pool_hosts=2, pool_maxsize=2)
+        for _ in range(5):
+            self.assertEqual("ok", s.request("get", self.url).text)
+        self.assertEqual(1, len(Handler.client_ports))
+        s.close()
+
+    def test_cookies_not_stored(self):
+        s = create_session(pool_hosts=2, pool_maxsize=2)
+        r = s.request("get", self.url)
+        self.assertEqual("secret", r.cookies.get("session"))
+        self.assertEqual(0, len(s.cookies))
+        s.close()
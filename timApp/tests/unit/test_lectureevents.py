@@ -0,0 +1,35 @@
+from threading import Thread
+from time import monotonic
+from unittest import TestCase
+
+from timApp.lecture.lectureevents import LectureEventHub, MESSAGE, QUESTION
+
+
+class LectureEventHubTest(TestCase):
+    def test_wait_returns_new_events(self):
+        hub = LectureEventHub()
+        seq = hub.get_seq(1)
+        hub.dispatch(1, MESSAGE)
+        hub.dispatch(2, QUESTION)
+        hub.dispatch(1, QUESTION)
+        seq, events = hub.wait(1, seq, timeout=1)
+        self.assertEqual([MESSAGE, QUESTION], events)
+        self.assertEqual(seq, hub.get_seq(1))
+
+    def test_wait_times_out(self):
+        hub = LectureEventHub()
+        hub.dispatch(2, MESSAGE)
+        start = monotonic()
+        seq, events = hub.wait(1, hub.get_seq(1), timeout=0.05)
+        self.assertEqual([], events)
+        self.assertGreaterEqual(monotonic() - start, 0.05)
+
+    def test_waiter_is_woken(self):
+        hub = LectureEventHub()
+        seq = hub.get_seq(1)
+        result = []
+        t = Thread(target=lambda: result.append(hub.wait(1, seq, timeout=5)))
+        t.start()
+        hub.dispatch(1, MESSAGE)
+        t.join(timeout=5)
+        self.assertEqual([(seq + 1, [MESSAGE])], result)
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from timApp.markdown.autocounters import TimSandboxedEnvironment
+from timApp.markdown.markdownconverter import tim_filters
+from timApp.plugin.markupcache import (
+    find_markup_dependencies,
+    PluginMarkupCache,
+    get_markup_key,
+)
+
+
+class MarkupDependenciesTest(TestCase):
+    def setUp(self):
+        self.env = TimSandboxedEnvironment()
+        self.env.filters.update(tim_filters)
+        self.env.filters["isview"] = lambda v: v
+
+    def test_variables(self):
+        deps = find_markup_dependencies(
+            "stem: Hi, %%username%%!\n"
+            "{% for i in range(n) %}%%i%% %%rnd[0]|Pz%%{% endfor %}",
+            self.env,
+        )
+        self.assertTrue(deps.cacheable)
+        self.assertEqual(("n", "rnd", "username"), deps.variables)
+
+    def test_local_variables_not_dependencies(self):
+        deps = find_markup_dependencies("{% set x = 1 %}%%x%%", self.env)
+        self.assertEqual((), deps.variables)
+
+    def test_uncacheable(self):
+        for text in [
+            "%%'eq1'|c_eq%%",
+            "%%'teachers'|belongs%%",
+            "%%0|now%%",
+            "%%'view'|isview%%",
+            "%%x|random%%",
+            "%%lipsum()%%",
+            "%%lst.append(1)%%",
+            "{% if %}",
+        ]:
+            self.assertFalse(find_markup_dependencies(text, self.env).cacheable, text)
+
+
+class PluginMarkupCacheTest(TestCase):
+    def test_results_copied(self):
+        cache = PluginMarkupCache(max_size=10)
+        value = {"stem": "Hi", "list": [1, 2]}
+        cache.set("a", value)
+        value["list"].append(3)
+        result = cache.get("a")
+        self.assertEqual({"stem": "Hi", "list": [1, 2]}, result)
+        result["stem"] = "changed"
+        self.assertEqual("Hi", cache.get("a")["stem"])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+    def test_size_bounded(self):
+        cache = PluginMarkupCache(max_size=2)
+        for k in "abc":
+            cache.set(k, k)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual("c", cache.get("c"))
+
+    def test_dependencies_computed_once(self):
+        cache = PluginMarkupCache(max_size=2)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return find_markup_dependencies("%%x%%", TimSandboxedEnvironment())
+
+        for _ in range(3):
+            self.assertEqual(("x",), cache.get_dependencies("key", compute).variables)
+        self.assertEqual(1, len(calls))
+
+    def test_key(self):
+        self.assertEqual(
+            get_markup_key("h", {"b": 1, "a": 2}), get_markup_key("h", {"a": 2, "b": 1})
+        )
+        self.assertNotEqual(get_markup_key("h", {"a": 1}), get_markup_key("h", {}))
@@ -0,0 +1,95 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from timApp.document import parstore
+from timApp.document.parstore import PackedParStore
+
+
+class TestPackedParStore(TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "1"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_read(self):
+        s = PackedParStore(self.path, 1)
+        self.assertFalse(s.exists())
+        self.assertIsNone(s.read("a", "x"))
+        s.write("a", "x", {"id": "a", "t": "x", "md": "first"})
+        s.write("b", "y", {"id": "b", "t": "y", "md": "second"})
+        s.set_current("a", "x")
+        self.assertTrue(s.exists())
+        self.assertEqual("first", s.read("a", "x")["md"])
+        self.assertEqual("second", s.read("b", "y")["md"])
+        self.assertEqual("x", s.get_current("a"))
+        self.assertIsNone(s.get_current("b"))
+
+    def test_rewrite_same_revision(self):
+        s = PackedParStore(self.path, 1)
+        s.write("a", "x", {"md": "first"})
+        s.write("a", "x", {"md": "first", "h": {"a": "<p>first</p>"}})
+        self.assertEqual({"md": "first", "h": {"a": "<p>first</p>"}}, s.read("a", "x"))
+
+    def test_read_many(self):
+        s = PackedParStore(self.path, 1)
+        s.write_many((f"p{i}", "t", {"md": str(i)}) for i in range(100))
+        keys = [(f"p{i}", "t") for i in reversed(range(100))] + [("missing", "t")]
+        result = s.read_many(keys)
+        self.assertEqual(
+            [str(i) for i in reversed(range(100))], [r["md"] for r in result[:-1]]
+        )
+        self.assertIsNone(result[-1])
+
+    def test_sees_writes_from_other_instance(self):
+        s1 = PackedParStore(self.path, 1)
+        s2 = PackedParStore(self.path, 1)
+        s1.write("a", "x", {"md": "first"})
+        self.assertEqual("first", s2.read("a", "x")["md"])
+        s1.set_current("a", "x")
+        self.assertEqual("x", s2.get_current("a"))
+        s2.write("a", "z", {"md": "second"})
+        s2.set_current("a", "z")
+        self.assertEqual("z", s1.get_current("a"))
+
+    def test_compact(self):
+        s1 = PackedParStore(self.path, 1)
+        s2 = PackedParStore(self.path, 1)
+        for i in range(10):
+            s1.write_many((f"p{j}", "t", {"md": str(j), "h": i}) for j in range(5))
+        s1.write("p0", "u", {"md": "new"})
+        s1.set_current("p0", "u")
+        self.assertEqual({"md": "1", "h": 9}, s2.read("p1", "t"))
+        self.assertAlmostEqual(0.9, s1.get_dead_ratio(), delta=0.05)
+        old_segment = s1.segment_path
+        size_before = s1.get_size()
+
+        freed = s1.compact()
+        self.assertGreater(freed, 0)
+        self.assertFalse(old_segment.exists())
+        self.assertEqual(0, s1.get_dead_ratio())
+        self.assertLess(s1.get_size(), size_before)
+        # s2 still has the old index in memory.
+        self.assertEqual({"md": "2", "h": 9}, s2.read("p2", "t"))
+        self.assertEqual(
+            [{"md": "3", "h": 9}, {"md": "new"}],
+            PackedParStore(self.path, 1).read_many([("p3", "t"), ("p0", "u")]),
+        )
+        self.assertEqual("u", s2.get_current("p0"))
+
+        s2.write("p4", "t", {"md": "rewritten"})
+        self.assertEqual([{"md": "rewritten"}], s1.read_many([("p4", "t")]))
+        self.assertEqual(old_segment, s1.path / parstore.SEGMENT_FILE_NAME)
+        self.assertNotEqual(old_segment, s1.segment_path)
+
+    def test_compact_automatically(self):
+        s = PackedParStore(self.path, 1, compact_ratio=0.5)
+        with patch.object(parstore, "MIN_COMPACT_BYTES", 100):
+            for i in range(10):
+                s.write("a", "x", {"md": "x" * 20, "i": i})
+                self.assertLessEqual(s.get_dead_ratio(), 0.5)
+        self.assertEqual({"md": "x" * 20, "i": 9}, s.read("a", "x"))
+        self.assertEqual(1, len(list(self.path.glob("*.seg"))))
@@ -0,0 +1,70 @@
+import json
+import time
+from unittest import TestCase
+
+from flask import Flask
+
+from timApp.plugin.pluginexception import PluginException
+from timApp.plugin.pluginreqs import PluginReqsCache, PluginReqs
+
+
+class TestPluginReqsCache(TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.config["QST_PLUGIN_PORT"] = 5000
+        app.config["INTERNAL_PLUGIN_DOMAIN"] = "tim"
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.calls = 0
+        self.response: str | PluginException = json.dumps(
+            {"js": ["a.js", "/abs.js", "mod"], "css": ["a.css"], "multihtml": True}
+        )
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def fetch(self, plugin: str) -> str:
+        self.calls += 1
+        if isinstance(self.response, PluginException):
+            raise self.response
+        return self.response
+
+    def test_derived_values(self):
+        r = PluginReqs.from_response("imagex", self.response)
+        self.assertEqual(["/imagex/a.js", "/abs.js", "mod"], r.js_paths)
+        self.assertEqual(["/imagex/a.css"], r.css_paths)
+        self.assertTrue(r.multihtml)
+        self.assertFalse(r.multimd)
+        self.assertTrue(PluginReqs.from_response("mcq", "{}").multimd)
+        with self.assertRaises(PluginException):
+            PluginReqs.from_response("imagex", "not json")
+
+    def test_ttl_and_fallback(self):
+        c = PluginReqsCache(ttl=0.05, retry_secs=0.05, fetch=self.fetch)
+        first = c.get("imagex")
+        c.get("imagex")
+        self.assertEqual(1, self.calls)
+        time.sleep(0.06)
+        self.response = PluginException("down")
+        # The last known good value is used when the plugin is unreachable.
+        self.assertIs(first, c.get("imagex"))
+        self.assertEqual(2, self.calls)
+        # The last known good value is not refreshed again before retry_secs has passed.
+        self.assertIs(first, c.get("imagex"))
+        self.assertEqual(2, self.calls)
+        c.invalidate("imagex")
+        with self.assertRaises(PluginException):
+            c.get("imagex")
+        # Without a good value, failures are not cached.
+        with self.assertRaises(PluginException):
+            c.get("imagex")
+        self.assertEqual(4, self.calls)
+        self.response = "{}"
+        self.assertEqual({}, c.get("imagex").reqs)
+        self.assertEqual(5, self.calls)
+
+    def test_unknown_plugin(self):
+        c = PluginReqsCache(ttl=10, retry_secs=10, fetch=self.fetch)
+        with self.assertRaises(PluginException):
+            c.get("nonexistent")
+        self.assertEqual(0, self.calls)
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone, timedelta
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from timApp.readmark import readmarkbuffer
+from timApp.readmark.readmarkbuffer import (
+    BufferedReadMark,
+    get_insert_rows,
+    flush_doc_read_marks,
+)
+from timApp.readmark.readparagraphtype import ReadParagraphType
+
+
+def create_mark(par_id: str, read_type: ReadParagraphType, secs: int = 0):
+    return BufferedReadMark(
+        doc_id=1,
+        par_id=par_id,
+        par_hash="h",
+        type=read_type,
+        timestamp=datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=secs),
+    )
+
+
+class BufferedReadMarkTest(TestCase):
+    def test_json(self):
+        m = create_mark("a", ReadParagraphType.hover_par)
+        self.assertEqual(m, BufferedReadMark.from_json(m.to_json()))
+        self.assertEqual(m, BufferedReadMark.from_json(m.to_json().encode()))
+
+    def test_insert_rows_latest_of_identical(self):
+        rows = get_insert_rows(
+            5,
+            [
+                create_mark("a", ReadParagraphType.on_screen, 0),
+                create_mark("a", ReadParagraphType.on_screen, 1),
+                create_mark("a", ReadParagraphType.click_red, 2),
+                create_mark("b", ReadParagraphType.on_screen, 3),
+            ],
+        )
+        self.assertEqual(
+            [
+                ("a", ReadParagraphType.on_screen, 1),
+                ("a", ReadParagraphType.click_red, 2),
+                ("b", ReadParagraphType.on_screen, 3),
+            ],
+            [(r["par_id"], r["type"], r["timestamp"].second) for r in rows],
+        )
+        self.assertTrue(all(r["usergroup_id"] == 5 for r in rows))
+
+
+class FlushDocReadMarksTest(TestCase):
+    def test_flushes_only_doc_groups(self):
+        client = MagicMock()
+        client.smembers.return_value = {b"3", b"7"}
+        with patch.object(readmarkbuffer, "_client", return_value=client), patch.object(
+            readmarkbuffer, "is_buffering_enabled", return_value=True
+        ), patch.object(readmarkbuffer, "flush_read_marks", return_value=2) as flush:
+            self.assertEqual(2, flush_doc_read_marks(5))
+        client.smembers.assert_called_once_with("tim-readmarks-doc-groups-5")
+        self.assertEqual([3, 7], sorted(flush.call_args.args[0]))
@@ -0,0 +1,59 @@
+import time
+from unittest import TestCase
+
+import gevent
+from flask import Flask
+
+from timApp.plugin.pluginexception import PluginException
+from timApp.plugin.renderpool import RenderTask, run_render_tasks
+
+
+def sleeping(name: str, secs: float):
+    def f():
+        gevent.sleep(secs)
+        return name
+
+    return f
+
+
+def failing():
+    raise PluginException("failed")
+
+
+class TestRenderPool(TestCase):
+    def setUp(self):
+        self.ctx = Flask(__name__).app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_concurrent_in_order(self):
+        tasks = [
+            RenderTask("a", sleeping("a", 0.2)),
+            RenderTask("b", sleeping("b", 0.1)),
+            RenderTask("c", sleeping("c", 0.2), inline=True),
+            RenderTask("d", failing),
+        ]
+        start = time.perf_counter()
+        results = run_render_tasks(tasks, pool_size=4, timeout=5)
+        self.assertLess(time.perf_counter() - start, 0.45)
+        self.assertEqual(["a", "b", "c", None], [r.value for r in results])
+        self.assertEqual("failed", str(results[3].error))
+        self.assertGreaterEqual(results[0].elapsed, 0.2)
+
+    def test_timeout(self):
+        results = run_render_tasks(
+            [RenderTask("a", sleeping("a", 1)), RenderTask("b", sleeping("b", 0))],
+            pool_size=2,
+            timeout=0.1,
+        )
+        self.assertIsInstance(results[0].error, PluginException)
+        self.assertEqual("b", results[1].value)
+
+    def test_unexpected_error_is_raised(self):
+        def f():
+            raise ValueError("x")
+
+        with self.assertRaises(ValueError):
+            run_render_tasks([RenderTask("a", f)], pool_size=1, timeout=1)
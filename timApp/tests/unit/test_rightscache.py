@@ -0,0 +1,126 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import TestCase
+
+from timApp.auth.accesstype import AccessType
+from timApp.auth.rightscache import EffectiveAccesses, make_access_window
+from timApp.user.user import view_access_set, edit_access_set
+from timApp.util.utils import get_current_time
+
+
+def access_row(type=AccessType.view.value, **kwargs):
+    """Returns a row with the columns of BlockAccess."""
+    columns = dict(
+        accessible_from=None,
+        accessible_to=None,
+        duration=None,
+        duration_from=None,
+        duration_to=None,
+        require_confirm=None,
+    )
+    return SimpleNamespace(type=type, **(columns | kwargs))
+
+
+class EffectiveAccessesTest(TestCase):
+    def setUp(self):
+        self.now = get_current_time()
+        self.hour = timedelta(hours=1)
+
+    def accesses(self, *windows, is_admin=False, admin_to=None, logged_in=True):
+        return EffectiveAccesses(
+            logged_in=logged_in,
+            is_admin=is_admin,
+            admin_to=admin_to,
+            windows=tuple(windows),
+        )
+
+    def test_accessible_window(self):
+        now, hour = self.now, self.hour
+        for accessible_from, accessible_to, expected in [
+            (now - hour, None, True),
+            (now - hour, now + hour, True),
+            (now - hour, now - hour / 2, False),
+            (now + hour, None, False),
+            (None, None, False),
+        ]:
+            w = make_access_window(
+                access_row(
+                    type=AccessType.view.value,
+                    accessible_from=accessible_from,
+                    accessible_to=accessible_to,
+                ),
+                None,
+            )
+            self.assertEqual(
+                expected,
+                self.accesses(w).has_some_access(view_access_set),
+                (accessible_from, accessible_to),
+            )
+
+    def test_wrong_type(self):
+        w = make_access_window(
+            access_row(
+                type=AccessType.view.value, accessible_from=self.now - self.hour
+            ),
+            None,
+        )
+        self.assertFalse(self.accesses(w).has_some_access(edit_access_set))
+
+    def test_membership_ended(self):
+        a = access_row(type=AccessType.view.value, accessible_from=self.now - self.hour)
+        self.assertTrue(
+            self.accesses(make_access_window(a, self.now + self.hour)).has_some_access(
+                view_access_set
+            )
+        )
+        self.assertFalse(
+            self.accesses(make_access_window(a, self.now - self.hour)).has_some_access(
+                view_access_set
+            )
+        )
+
+    def test_unlockable(self):
+        now, hour = self.now, self.hour
+        for a, expected in [
+            (access_row(duration=hour, duration_from=now - hour), True),
+            (access_row(duration=hour, duration_from=now + hour), False),
+            (
+                access_row(duration=hour, duration_from=now - hour, duration_to=now),
+                False,
+            ),
+            (access_row(duration=hour), False),
+            (
+                access_row(
+                    duration=hour, duration_from=now - hour, require_confirm=True
+                ),
+                False,
+            ),
+        ]:
+            a.type = AccessType.view.value
+            accesses = self.accesses(make_access_window(a, None))
+            self.assertEqual(
+                expected, accesses.has_some_access(view_access_set, duration=True)
+            )
+            self.assertFalse(accesses.has_some_access(view_access_set))
+
+    def test_admin(self):
+        self.assertTrue(self.accesses(is_admin=True).has_some_access(edit_access_set))
+        self.assertFalse(
+            self.accesses(is_admin=True, admin_to=self.now - self.hour).has_some_access(
+                edit_access_set
+            )
+        )
+
+    def test_item_rights(self):
+        w = make_access_window(
+            access_row(
+                type=AccessType.view.value, accessible_from=self.now - self.hour
+            ),
+            None,
+        )
+        rights = self.accesses(w).get_item_rights()
+        self.assertTrue(rights["can_comment"])
+        self.assertFalse(rights["editable"])
+        rights = self.accesses(w, logged_in=False).get_item_rights()
+        self.assertFalse(rights["can_comment"])
+        self.assertFalse(rights["browse_own_answers"])
@@ -0,0 +1,107 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import timApp.tests.unit.csplugin  # noqa: F401
+import run
+import sandbox
+
+
+def write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class SandboxPoolTest(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.workdir = os.path.join(self.tmp.name, "prg")
+        write(os.path.join(self.workdir, "prog.sh"), "echo hello")
+        self.runtime = sandbox.LocalRuntime()
+        self.patchers = [
+            patch.object(sandbox, "POOL_DIR", os.path.join(self.tmp.name, "pool")),
+            patch.object(sandbox, "POOL_SIZE", 2),
+            patch.object(sandbox, "runtime", self.runtime),
+            patch.dict(
+                os.environ, {"COMPOSE_PROJECT_NAME": "tim", "TIM_ROOT": "/opt/tim"}
+            ),
+        ]
+        for p in self.patchers:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patchers):
+            p.stop()
+        self.tmp.cleanup()
+
+    def checkout(self) -> sandbox.Sandbox | None:
+        return sandbox.checkout("img", self.workdir, [])
+
+    def wait_for_checkout(self) -> sandbox.Sandbox:
+        """Waits until a released sandbox has been recycled."""
+        deadline = time.monotonic() + 5
+        while (box := self.checkout()) is None:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return box
+
+    def test_checkout_and_return(self):
+        box1 = self.checkout()
+        box2 = self.checkout()
+        self.assertIsNotNone(box1)
+        self.assertIsNotNone(box2)
+        self.assertNotEqual(box1.name, box2.name)
+        self.assertIsNone(self.checkout())
+        self.assertTrue(os.path.isfile(os.path.join(box1.home, "prog.sh")))
+
+        write(os.path.join(box1.home, "out.txt"), "result")
+        box1.copy_back()
+        self.assertTrue(os.path.isfile(os.path.join(self.workdir, "out.txt")))
+        os.remove(os.path.join(self.workdir, "out.txt"))
+        write(os.path.join(box1.home, "tmp", "left.txt"), "left behind")
+        box1.release()
+
+        box3 = self.wait_for_checkout()
+        self.assertEqual(box1.name, box3.name)
+        self.assertEqual(["prog.sh"], os.listdir(box3.home))
+        box2.release()
+        box3.release()
+
+    def test_recycled_after_use(self):
+        with patch.object(sandbox, "POOL_SIZE", 1), patch.object(
+            self.runtime, "start", wraps=self.runtime.start
+        ) as start, patch.object(
+            self.runtime, "recycle_args", wraps=self.runtime.recycle_args
+        ) as recycle:
+            box = self.checkout()
+            # The sandbox was not started cleanly yet.
+            start.assert_called_once()
+            box.release()
+            recycle.assert_called_once_with(box.name, "img", box.home, [])
+            box = self.wait_for_checkout()
+            start.assert_called_once()
+            box.release()
+
+            # A failed recycle leaves the sandbox to be started on checkout.
+            recycle.side_effect = lambda *args: ["false"]
+            box = self.wait_for_checkout()
+            box.release()
+            box = self.wait_for_checkout()
+            self.assertEqual(2, start.call_count)
+            box.release()
+
+    def test_timeout(self):
+        code, out, err, _ = run.run2(
+            ["sleep", "2"],
+            cwd=self.workdir,
+            timeout=0.2,
+            compile_commandline="",
+        )
+        self.assertEqual(-9, code)
+        box = self.wait_for_checkout()
+        box.release()
+        code, out, err, _ = run.run2(["bash", "prog.sh"], cwd=self.workdir, timeout=5)
+        self.assertEqual((0, "hello\n"), (code, out))
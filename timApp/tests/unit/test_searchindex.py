@@ -0,0 +1,169 @@
+import random
+import re
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from timApp.util.searchindex import IndexWriter, open_index, parse_query, fold
+
+WORDS = [
+    "cat",
+    "cats",
+    "House",
+    "like",
+    "hunt",
+    "c#",
+    "too.",
+    "kissa",
+    "Äiti",
+    "a-b",
+    "İstanbul",
+    "ſtar",
+    "σοφός",
+    "long" * 20,
+]
+
+
+def make_doc(doc_id: int, texts: list[str], title: str = "", relevance: int = 10):
+    return {
+        "doc_id": doc_id,
+        "d_r": relevance,
+        "doc_title": title or f"Document {doc_id}",
+        "pars": [
+            {"id": f"p{doc_id}_{i}", "attrs": {}, "md": t} for i, t in enumerate(texts)
+        ],
+    }
+
+
+def regex_matches(query: str, whole_words: bool, text: str) -> bool:
+    term = re.escape(query)
+    if whole_words:
+        term = rf"\b{term}\b"
+    return re.search(term, text, re.IGNORECASE | re.DOTALL) is not None
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "index"
+        self.writer = IndexWriter(self.path, segment_docs=3, max_small_segments=2)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def find(self, query: str, whole_words: bool = False) -> dict[int, set[int]]:
+        index = open_index(self.path)
+        return {
+            m.doc_id: m.par_indices
+            for m in index.find_content(query, False, whole_words)
+        }
+
+    def test_parse_query(self):
+        terms = parse_query("oo ba", False)
+        self.assertEqual(["oo", "ba"], [t.text for t in terms])
+        self.assertTrue(terms[0].matches("foo"))
+        self.assertFalse(terms[0].matches("oof"))
+        self.assertTrue(terms[1].matches("bar"))
+        self.assertFalse(terms[1].matches("abar"))
+        terms = parse_query("oo ba", True)
+        self.assertFalse(terms[0].matches("foo"))
+        self.assertTrue(terms[0].matches("oo"))
+        # A non-word character at the edge of the query ends the term.
+        terms = parse_query("c#", False)
+        self.assertTrue(terms[0].matches("abc"))
+        self.assertFalse(terms[0].matches("cd"))
+
+    def test_fold(self):
+        for a, b in [("İ", "i"), ("ı", "I"), ("ſ", "S"), ("ς", "Σ"), ("Äiti", "äITI")]:
+            self.assertIsNotNone(re.fullmatch(a, b, re.IGNORECASE))
+            self.assertEqual(fold(a), fold(b))
+            self.assertEqual(len(a), len(fold(a)))
+
+    def test_phrase_and_substring(self):
+        self.writer.rebuild(
+            [
+                make_doc(1, ["House cats like to hunt too.", "nothing here"]),
+                make_doc(2, ["cats like", "like cats"]),
+            ]
+        )
+        self.assertEqual({1: {0}, 2: {0}}, self.find("cats like"))
+        self.assertEqual({1: {0}, 2: {0}}, self.find("ts li"))
+        self.assertEqual({}, self.find("ts li", whole_words=True))
+        self.assertEqual({1: {0}, 2: {0, 1}}, self.find("cat"))
+        self.assertEqual({}, self.find("cat", whole_words=True))
+        self.assertEqual({1: {0}}, self.find("HOUSE"))
+
+    def test_candidates_contain_all_matches(self):
+        rnd = random.Random(1)
+        docs = [
+            make_doc(i, [" ".join(rnd.choices(WORDS, k=8)) for _ in range(3)])
+            for i in range(10)
+        ]
+        self.writer.rebuild(docs)
+        queries = [
+            "cats like",
+            "s li",
+            "c#",
+            "t",
+            "a-b",
+            "äiti kissa",
+            "too. c",
+            "istanbul",
+            "STAN",
+            "star",
+            "ΣΟΦΌΣ",
+            "glon",
+        ]
+        for query in queries:
+            for whole_words in (False, True):
+                expected = {
+                    d["doc_id"]: {
+                        i
+                        for i, p in enumerate(d["pars"])
+                        if regex_matches(query, whole_words, p["md"])
+                    }
+                    for d in docs
+                }
+                found = self.find(query, whole_words)
+                for doc_id, pars in expected.items():
+                    if pars:
+                        self.assertIn(doc_id, found, (query, whole_words))
+                        self.assertLessEqual(pars, found[doc_id], (query, whole_words))
+
+    def test_update_and_merge(self):
+        self.writer.rebuild([make_doc(i, [f"text{i}"]) for i in range(5)])
+        index = open_index(self.path)
+        self.assertEqual(2, len(index.segments))
+        self.writer.update([make_doc(1, ["changed"])], [1, 4])
+        self.assertEqual({}, self.find("text1"))
+        self.assertEqual({}, self.find("text4"))
+        self.assertEqual({1: {0}}, self.find("changed"))
+        self.assertEqual(4, open_index(self.path).doc_count())
+        for i in range(3):
+            self.writer.update([make_doc(10 + i, ["new"])], [])
+        index = open_index(self.path)
+        # The small segments have been merged.
+        self.assertLessEqual(
+            len([s for s in index.manifest["segments"] if s["size"] < 3]), 2
+        )
+        self.assertEqual({10: {0}, 11: {0}, 12: {0}}, self.find("new"))
+        self.assertEqual({1: {0}}, self.find("changed"))
+        self.assertEqual({0: {0}}, self.find("text0"))
+        self.assertEqual(7, index.doc_count())
+
+    def test_relevance_order(self):
+        self.writer.rebuild(
+            [
+                make_doc(1, ["cat"], relevance=5),
+                make_doc(2, ["cat"], relevance=20),
+                make_doc(3, ["cat"], relevance=5),
+            ]
+        )
+        index = open_index(self.path)
+        self.assertEqual(
+            [2, 1, 3], [m.doc_id for m in index.find_content("cat", False, False)]
+        )
+        self.assertEqual([2, 1, 3], [m.doc_id for m in index.find_titles()])
+        self.assertEqual(
+            "cat", index.find_content("cat", True, False)[0].read()["pars"][0]["md"]
+        )
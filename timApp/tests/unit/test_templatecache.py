@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from jinja2 import TemplateSyntaxError
+
+from timApp.markdown.autocounters import TimSandboxedEnvironment, AutoCounters
+from timApp.markdown.templatecache import TemplateCodeCache
+
+
+def create_env(delimiter: str = "%%") -> TimSandboxedEnvironment:
+    env = TimSandboxedEnvironment(delimiter)
+    env.filters["twice"] = lambda s: s * 2
+    return env
+
+
+class TemplateCodeCacheTest(TestCase):
+    def test_code_shared_between_environments(self):
+        cache = TemplateCodeCache(max_size=10)
+        env1 = create_env()
+        env2 = create_env()
+        self.assertEqual("ab", cache.from_string(env1, "a%%x%%").render(x="b"))
+        self.assertEqual("ac", cache.from_string(env2, "a%%x%%").render(x="c"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_filters_bound_to_own_environment(self):
+        cache = TemplateCodeCache(max_size=10)
+        calls1, calls2 = [], []
+        env1 = create_env()
+        env1.filters["c_"] = calls1.append
+        env2 = create_env()
+        env2.filters["c_"] = calls2.append
+        cache.from_string(env1, "%%'a'|c_%%").render()
+        cache.from_string(env2, "%%'b'|c_%%").render()
+        cache.from_string(env2, "%%'a'|c_%%").render()
+        self.assertEqual(["a"], calls1)
+        self.assertEqual(["b", "a"], calls2)
+
+    def test_counters_not_evaluated_when_compiling(self):
+        cache = TemplateCodeCache(max_size=10)
+        text = "%%'figA'|c_fig%% %%'figB'|c_fig%% %%'figA'|ref%%"
+        results = []
+        for _ in range(2):
+            env = create_env()
+            counters = AutoCounters({"use_autonumbering": True})
+            counters.renumbering = True
+            env.set_counters(counters)
+            counters.start_of_block()
+            cache.from_string(env, text).render()
+            results.append(counters.get_counter_macros())
+        self.assertEqual(results[0], results[1])
+        self.assertIn("figB", results[0])
+        self.assertEqual(1, cache.hits)
+
+    def test_environment_configuration_in_key(self):
+        cache = TemplateCodeCache(max_size=10)
+        env = create_env()
+        other_delimiter = create_env("¤")
+        self.assertEqual("b", cache.from_string(env, "%%x%%").render(x="b"))
+        self.assertEqual(
+            "%%x%%", cache.from_string(other_delimiter, "%%x%%").render(x="b")
+        )
+        env.filters["extra"] = str
+        cache.from_string(env, "%%x%%").render(x="b")
+        self.assertEqual((0, 3), (cache.hits, cache.misses))
+
+    def test_size_bounded(self):
+        cache = TemplateCodeCache(max_size=2)
+        env = create_env()
+        for t in ["%%a%%", "%%b%%", "%%c%%", "%%a%%"]:
+            cache.from_string(env, t)
+        self.assertEqual((0, 4), (cache.hits, cache.misses))
+        self.assertEqual(2, len(cache.codes))
+
+    def test_syntax_error_not_cached(self):
+        cache = TemplateCodeCache(max_size=2)
+        env = create_env()
+        for _ in range(2):
+            with self.assertRaises(TemplateSyntaxError):
+                cache.from_string(env, "{% if %}")
+        self.assertEqual(0, len(cache.codes))
+
+    def test_disabled(self):
+        cache = TemplateCodeCache(max_size=0)
+        env = create_env()
+        self.assertEqual("bb", cache.from_string(env, "%%x|twice%%").render(x="b"))
+        self.assertEqual(0, len(cache.codes))
@@ -0,0 +1,71 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from timApp.document.versionfile import (
+    apply_delta,
+    compact_versions,
+    encode_delta,
+    get_version_file_path,
+    read_version_header,
+    read_version_lines,
+    write_version_lines,
+    SNAPSHOT_INTERVAL,
+)
+
+
+def make_lines(n: int, suffix: str = "x") -> list[str]:
+    return [f"par{i:010d}/{suffix}{i}" for i in range(n)]
+
+
+class TestVersionFile(TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.doc_dir = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_full(self, ver, lines):
+        path = get_version_file_path(self.doc_dir, ver)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(line + "\n" for line in lines))
+
+    def test_delta_roundtrip(self):
+        base = make_lines(20)
+        new = base[:5] + ["new/1"] + base[6:15] + base[16:] + ["last/2"]
+        self.assertEqual(new, apply_delta(base, encode_delta(base, new)))
+        self.assertEqual([], apply_delta(base, encode_delta(base, [])))
+
+    def test_write_read(self):
+        lines = make_lines(1000)
+        versions = []
+        prev = None
+        for i in range(1, SNAPSHOT_INTERVAL + 10):
+            ver = (i, 0)
+            (self.doc_dir / str(i)).mkdir()
+            lines = lines[:i] + [f"mod{i:010d}/y"] + lines[i + 1 :]
+            write_version_lines(self.doc_dir, ver, lines, prev)
+            versions.append((ver, lines))
+            prev = ver
+        self.assertIsNone(read_version_header(self.doc_dir, (1, 0)))
+        self.assertEqual(((1, 0), 1), read_version_header(self.doc_dir, (2, 0)))
+        self.assertIsNone(read_version_header(self.doc_dir, (SNAPSHOT_INTERVAL + 2, 0)))
+        for ver, expected in versions:
+            self.assertEqual(expected, read_version_lines(self.doc_dir, ver))
+        self.assertEqual([], read_version_lines(self.doc_dir, (999, 0)))
+
+    def test_compact(self):
+        lines = make_lines(50)
+        versions = []
+        for i in range(1, 10):
+            lines = lines + [f"add{i:010d}/z"]
+            self.write_full((i, 0), lines)
+            versions.append(((i, 0), lines))
+        before, after = compact_versions(self.doc_dir, dry_run=True)
+        self.assertLess(after, before)
+        self.assertIsNone(read_version_header(self.doc_dir, (2, 0)))
+        self.assertEqual((before, after), compact_versions(self.doc_dir, dry_run=False))
+        self.assertIsNotNone(read_version_header(self.doc_dir, (2, 0)))
+        for ver, expected in versions:
+            self.assertEqual(expected, read_version_lines(self.doc_dir, ver))
@@ -0,0 +1,102 @@
+import http.server
+import json
+import time
+from http.client import HTTPConnection, RemoteDisconnected
+from threading import Thread
+from unittest import TestCase
+
+import timApp.tests.unit.csplugin  # noqa: F401
+from languages import limit_timeout
+from worker_pool import BoundedForkingMixIn, BUSY_MESSAGE
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/error":
+            raise RuntimeError("failed")
+        if self.path == "/sleep":
+            time.sleep(0.5)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(BoundedForkingMixIn, http.server.HTTPServer):
+    workers = 1
+    queue_size = 1
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def get(port: int, path: str) -> tuple[int, bytes]:
+    conn = HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request("GET", path)
+        r = conn.getresponse()
+        return r.status, r.read()
+    finally:
+        conn.close()
+
+
+class BoundedForkingMixInTest(TestCase):
+    def setUp(self):
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join(timeout=10)
+        self.server.server_close()
+
+    def wait_for(self, condition) -> None:
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_busy_when_saturated(self):
+        results = []
+
+        def sleep():
+            results.append(get(self.port, "/sleep"))
+
+        running = Thread(target=sleep)
+        running.start()
+        self.wait_for(lambda: len(self.server.active) == 1)
+        queued = Thread(target=sleep)
+        queued.start()
+        self.wait_for(lambda: len(self.server.pending) == 1)
+
+        status, body = get(self.port, "/")
+        self.assertEqual(503, status)
+        self.assertEqual({"error": BUSY_MESSAGE}, json.loads(body))
+
+        running.join(timeout=10)
+        queued.join(timeout=10)
+        self.assertEqual([(200, b"ok"), (200, b"ok")], results)
+        self.assertEqual(1, self.server.stats.rejected)
+        self.assertEqual(2, self.server.stats.accepted)
+
+    def test_slot_released_on_error(self):
+        with self.assertRaises(RemoteDisconnected):
+            get(self.port, "/error")
+        self.wait_for(lambda: not self.server.active)
+        self.assertEqual((200, b"ok"), get(self.port, "/"))
+        self.assertEqual((200, b"ok"), get(self.port, "/"))
+
+
+class LimitTimeoutTest(TestCase):
+    def test_limit_timeout(self):
+        now = time.monotonic()
+        self.assertEqual(10, limit_timeout(10, None))
+        self.assertEqual(10, limit_timeout(10, now + 20))
+        self.assertEqual("10", limit_timeout("10", now + 20))
+        self.assertEqual(4, limit_timeout(10, now + 5))
+        self.assertEqual(1, limit_timeout(10, now - 5))
+        self.assertEqual("x", limit_timeout("x", now + 5))
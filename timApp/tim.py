@@ -73,6 +73,7 @@ from timApp.notification.notify import notify
 from timApp.plugin.calendar.calendar import calendar_plugin
 from timApp.plugin.group_join.group_join import group_join_plugin
 from timApp.plugin.importdata.importData import importData_plugin
+from timApp.plugin.pluginreqs import start_plugin_reqs_warm_up
 from timApp.plugin.qst.qst import qst_plugin
 from timApp.plugin.reviewcanvas.reviewcanvas import reviewcanvas_plugin
 from timApp.plugin.routes import plugin_bp
@@ -458,6 +459,8 @@ def del_g(response):
             del g.see_answers
         if hasattr(g, "owned"):
             del g.owned
+        if hasattr(g, "effective_accesses"):
+            del g.effective_accesses
     return response
 
 
@@ -507,6 +510,9 @@ def init_app():
                 "SECRET_KEY must not be the same as default SECRET_KEY when DEBUG=False"
             )
 
+    if app.config["PLUGIN_REQS_WARM_UP"] and not app.config["TESTING"]:
+        start_plugin_reqs_warm_up(app)
+
     if app.config["MESSAGE_LISTS_ENABLED"]:
         log_info(f"Mailman client credentials configured: {check_mailman_connection()}")
         log_info(f"Mailman events REST auth configured: {has_valid_event_auth()}")
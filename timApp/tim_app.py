@@ -18,6 +18,7 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 
 from timApp.answer.answer import Answer, AnswerSaver
 from timApp.answer.answer_models import AnswerTag, AnswerUpload, UserAnswer
+from timApp.answer.latestanswer import LatestAnswer
 from timApp.auth.auth_models import AccessTypeModel, BlockAccess
 from timApp.auth.oauth2.models import OAuth2Token, OAuth2AuthorizationCode
 from timApp.auth.session.model import UserSession
@@ -91,6 +92,7 @@ from timApp.plugin.calendar.models import (
 from timApp.plugin.plugintype import PluginType
 from timApp.plugin.timtable.row_owner_info import RowOwnerInfo
 from timApp.printing.printeddoc import PrintedDoc
+from timApp.readmark.latestreadparagraph import LatestReadParagraph
 from timApp.readmark.readparagraph import ReadParagraph
 from timApp.sisu.scimusergroup import ScimUserGroup
 from timApp.slide.slidestatus import SlideStatus
@@ -174,6 +176,8 @@ all_models = (
     InternalMessageDisplay,
     LabelInVelp,
     Language,
+    LatestAnswer,
+    LatestReadParagraph,
     Lecture,
     LectureAnswer,
     LectureUsers,
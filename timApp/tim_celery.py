@@ -24,11 +24,13 @@ from timApp.plugin.containerLink import call_plugin_generic
 from timApp.plugin.exportdata import WithOutData, WithOutDataSchema
 from timApp.plugin.plugin import Plugin
 from timApp.plugin.pluginexception import PluginException
+from timApp.printing.printjobs import run_print_job
+from timApp.readmark.readmarkbuffer import flush_read_marks
 from timApp.tim_app import app
 from timApp.timdb.sqa import db
 from timApp.user.user import User
 from timApp.user.verification.verification import Verification
-from timApp.util.flask.search import create_search_files
+from timApp.util.flask.search import create_search_files, update_search_index
 from timApp.util.utils import get_current_time, collect_errors_from_hosts
 from tim_common.vendor.requests_futures import FuturesSession
 
@@ -74,11 +76,46 @@ celery = make_celery(app)
 @celery.task(ignore_result=True)
 def update_search_files():
     """
-    Calls function to create title and content search files. Meant to be scheduled.
+    Rebuilds the search index. Meant to be scheduled.
     """
     create_search_files()
 
 
+@celery.task(ignore_result=True)
+def update_search_index_task():
+    """
+    Updates the recently modified documents in the search index. Meant to be scheduled.
+    """
+    update_search_index()
+
+
+@celery.task(ignore_result=True)
+def print_document_task(
+    job_id: str,
+    doc_id: int,
+    template_doc_id: int | None,
+    file_type: str,
+    user_id: int,
+    plugins_user_print: bool,
+    eol_type: str,
+    urlroot: str,
+):
+    """
+    Prints a document. The result is stored in the print job; see :mod:`timApp.printing.printjobs`.
+    """
+    logger.info(f"Printing document {doc_id} as {file_type} (job {job_id})")
+    run_print_job(
+        job_id,
+        doc_id,
+        template_doc_id,
+        file_type,
+        user_id,
+        plugins_user_print,
+        eol_type,
+        urlroot,
+    )
+
+
 @celery.task(ignore_result=True)
 def process_notifications():
     """
@@ -276,3 +313,8 @@ def cleanup_oauth2_tokens():
     from timApp.auth.oauth2.oauth2 import delete_expired_oauth2_tokens
 
     delete_expired_oauth2_tokens()
+
+
+@celery.task(ignore_result=True)
+def flush_read_marks_task():
+    flush_read_marks()
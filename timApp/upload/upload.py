@@ -6,12 +6,15 @@ import posixpath
 import subprocess
 from dataclasses import dataclass
 from pathlib import Path, PurePosixPath
+from typing import Collection
 from urllib.parse import unquote, urlparse
 
 from flask import Blueprint, request, send_file, Response, url_for
 from wand.image import Image
 from werkzeug.utils import secure_filename
 
+from timApp.answer.answer import Answer
+from timApp.answer.answer_models import AnswerUpload
 from timApp.auth.accesshelper import (
     verify_view_access,
     verify_seeanswers_access,
@@ -156,6 +159,40 @@ def get_pluginupload(relfilename: str) -> tuple[str, PluginUpload]:
     return mt, up
 
 
+def get_answer_pluginuploads(
+    relfilenames: Collection[str], doc_ids: Collection[int]
+) -> dict[str, tuple[str, PluginUpload]]:
+    """Gets many plugin uploads with one query, for listing the answers of documents.
+
+    Only the uploads that are named exactly and that belong to an answer in one of the documents are returned.
+    The caller must have verified that the current user has seeanswers access to the documents.
+    The other uploads must be fetched with :func:`get_pluginupload`, which checks the access to each of them.
+
+    :param relfilenames: The upload paths, in the same form as for get_pluginupload.
+    :param doc_ids: The documents whose answers the uploads may belong to.
+    :return: The MIME types and uploads by the upload paths.
+    """
+    exact = {f for f in relfilenames if f.count("/") >= 4 and not f.endswith("/")}
+    if not exact:
+        return {}
+    rows: list[tuple[Block, str]] = (
+        Block.query.filter(
+            Block.description.in_(exact) & (Block.type_id == BlockType.Upload.value)
+        )
+        .join(AnswerUpload, AnswerUpload.upload_block_id == Block.id)
+        .join(Answer, Answer.id == AnswerUpload.answer_id)
+        .with_entities(Block, Answer.task_id)
+        .all()
+    )
+    result = {}
+    for block, task_id in rows:
+        if TaskId.parse(task_id).doc_id not in doc_ids:
+            continue
+        up = PluginUpload(block)
+        result[block.description] = get_mimetype(up.filesystem_path.as_posix()), up
+    return result
+
+
 # noinspection PyUnusedLocal
 @upload.post("/pluginUpload/<int:doc_id>/<task_id>/<user_id>/")
 def pluginupload_file2(doc_id: int, task_id: str, user_id):
@@ -3,7 +3,7 @@ import http.client
 import json
 from _csv import QUOTE_MINIMAL
 from io import StringIO
-from typing import Any
+from typing import Any, Iterable, Iterator
 from urllib.parse import urlparse, urljoin
 
 from flask import (
@@ -50,6 +50,37 @@ def json_response(
     return response
 
 
+def iter_json_array(items: Iterable[Any]) -> Iterator[str]:
+    """Encodes the items as a JSON array one item at a time."""
+    sep = "["
+    for item in items:
+        yield sep + to_json_str(item)
+        sep = ","
+    yield "[]" if sep == "[" else "]"
+
+
+def iter_ndjson(items: Iterable[Any]) -> Iterator[str]:
+    """Encodes the items as newline-delimited JSON, one item per line."""
+    for item in items:
+        yield to_json_str(item) + "\n"
+
+
+def json_stream_response(items: Iterable[Any], ndjson: bool = False) -> Response:
+    """Returns a response that streams the items as a JSON array or as newline-delimited JSON.
+
+    The items are encoded as they are iterated, so the whole list never needs to be in memory.
+    """
+    if ndjson:
+        chunks, mimetype = iter_ndjson(items), "application/x-ndjson"
+    else:
+        chunks, mimetype = iter_json_array(items), "application/json"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"No-Date-Conversion": "true"},
+    )
+
+
 def json_response_and_commit(jsondata, status_code=200):
     db.session.commit()
     return json_response(jsondata, status_code)
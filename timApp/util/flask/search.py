@@ -1,16 +1,13 @@
 """Routes for searching."""
-import os
 import re
 import sre_constants
-import subprocess
 import time
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from io import StringIO
-from pathlib import Path
-from typing import Match
+from typing import Match, Iterable, Iterator
 
-from flask import Blueprint, json
+from flask import Blueprint
 from flask import request
 from sqlalchemy.orm import joinedload, lazyload, defaultload
 
@@ -21,10 +18,10 @@ from timApp.auth.sessioninfo import get_current_user_object
 from timApp.document.docentry import DocEntry, get_documents
 from timApp.document.docinfo import DocInfo
 from timApp.folder.folder import Folder
-from timApp.item.block import Block
+from timApp.item.block import Block, BlockType
 from timApp.item.routes import get_document_relevance
 from timApp.item.tag import Tag
-from timApp.timdb.dbaccess import get_files_path
+from timApp.tim_app import app
 from timApp.timdb.exceptions import InvalidReferenceException
 from timApp.util.flask.requesthelper import (
     get_option,
@@ -34,6 +31,13 @@ from timApp.util.flask.requesthelper import (
 )
 from timApp.util.flask.responsehelper import json_response
 from timApp.util.logger import log_error, log_warning
+from timApp.util.searchindex import (
+    DocMatch,
+    DocRecord,
+    IndexWriter,
+    get_par_search_text,
+    open_index,
+)
 from timApp.util.utils import get_error_message, cache_folder_path
 
 search_routes = Blueprint("search", __name__, url_prefix="/search")
@@ -44,9 +48,7 @@ MIN_WHOLE_WORDS_QUERY_LENGTH = 1  # For whole word search.
 PREVIEW_LENGTH = 40  # Before and after the search word separately.
 PREVIEW_MAX_LENGTH = 160
 SEARCH_CACHE_FOLDER = cache_folder_path / "searchcache"
-PROCESSED_CONTENT_FILE_PATH = SEARCH_CACHE_FOLDER / "content_all_processed.log"
-PROCESSED_TITLE_FILE_PATH = SEARCH_CACHE_FOLDER / "titles_all_processed.log"
-RAW_CONTENT_FILE_PATH = SEARCH_CACHE_FOLDER / "all.log"
+SEARCH_INDEX_FOLDER = SEARCH_CACHE_FOLDER / "index"
 DEFAULT_RELEVANCE = 10
 
 
@@ -424,67 +426,31 @@ def validate_query(query: str, search_whole_words: bool) -> None:
         )
 
 
-# Query options for loading DocEntry relevance eagerly; it should speed up search cache processing because
+# Query options for loading DocEntry relevance eagerly; it should speed up search index processing because
 # we know we'll need relevance.
 docentry_eager_relevance_opt = (
     defaultload(DocEntry._block).joinedload(Block.relevance),
 )
 
 
-def add_doc_info_title_line(doc_id: int) -> str | None:
-    """
-    Forms a JSON-compatible string with doc id, title and path.
-
-    :param doc_id: Document id.
-    :return: String with doc data.
-    """
-    doc_info = DocEntry.find_by_id(
-        doc_id, docentry_load_opts=docentry_eager_relevance_opt
-    )
-    if not doc_info:
-        return None
-    doc_relevance = get_document_relevance(doc_info)
-    return (
-        json.dumps(
-            {"doc_id": doc_id, "d_r": doc_relevance, "doc_title": doc_info.title},
-            ensure_ascii=False,
-        )
-        + "\n"
+def get_search_index_writer() -> IndexWriter:
+    return IndexWriter(
+        SEARCH_INDEX_FOLDER,
+        segment_docs=app.config["SEARCH_INDEX_SEGMENT_DOCS"],
+        max_small_segments=app.config["SEARCH_INDEX_MAX_SMALL_SEGMENTS"],
     )
 
 
-def add_doc_info_content_line(
-    doc_id: int, par_data, remove_deleted_pars: bool = True, add_title: bool = False
-) -> str | None:
+def get_doc_search_record(doc_info: DocInfo) -> DocRecord:
     """
-    Forms a JSON-compatible string with doc_id and list of paragraph data with id and md attributes.
+    Collects the searchable data of a document: id, relevance, title and paragraphs with id, attrs and md.
 
-    :param doc_id: Document id.
-    :param par_data: List of paragraph dictionaries.
-    :param remove_deleted_pars: Check paragraph existence and leave deleted ones out.
-    :param add_title Add document title.
-    :return: String with paragraph data grouped under a document.
+    :param doc_info: Document.
+    :return: The document data for the search index.
     """
-    if not par_data:
-        return None
-    doc_info = DocEntry.find_by_id(
-        doc_id, docentry_load_opts=docentry_eager_relevance_opt
-    )
-    if not doc_info:
-        return None
-    par_json_list = []
-
-    doc_relevance = get_document_relevance(doc_info)
-
-    for par in par_data:
-        par_dict = json.loads(f"{{{par}}}")
-        par_id = par_dict["id"]
-        if remove_deleted_pars:
-            # If par can't be found (deleted), don't add it.
-            if not doc_info.document.has_paragraph(par_id):
-                continue
+    par_list = []
+    for doc_par in doc_info.document.get_paragraphs():
         # Resolve the markdown in full (including references) for better search
-        doc_par = doc_info.document.get_paragraph(par_id)
         par_md_buf = StringIO()
         if doc_par.is_par_reference() or doc_par.is_area_reference():
             try:
@@ -498,173 +464,116 @@ def add_doc_info_content_line(
             par_md_buf.write(doc_par.md)
 
         par_md = par_md_buf.getvalue().replace("\r", " ").replace("\n", " ")
-        # Cherry pick attributes, because others are unnecessary for the search.
-        par_attrs = par_dict["attrs"]
-        par_json_list.append({"id": par_id, "attrs": par_attrs, "md": par_md})
-    if add_title:
-        doc_title = doc_info.title
-        return (
-            json.dumps(
-                {
-                    "doc_id": doc_id,
-                    "d_r": doc_relevance,
-                    "doc_title": doc_title,
-                    "pars": par_json_list,
-                },
-                ensure_ascii=False,
-            )
-            + "\n"
-        )
-    else:
-        return (
-            json.dumps(
-                {"doc_id": doc_id, "d_r": doc_relevance, "pars": par_json_list},
-                ensure_ascii=False,
-            )
-            + "\n"
+        par_list.append(
+            {"id": doc_par.get_id(), "attrs": doc_par.get_attrs(), "md": par_md}
         )
+    return {
+        "doc_id": doc_info.id,
+        "d_r": get_document_relevance(doc_info),
+        "doc_title": doc_info.title,
+        "pars": par_list,
+    }
 
 
-def get_doc_par_id(line: str) -> tuple[int, str, str] | None:
+def get_doc_search_records(
+    doc_ids: Iterable[int], errors: list[str]
+) -> Iterator[DocRecord]:
     """
-    Takes doc id, par id and par data from one grep search result line.
+    Collects the searchable data of the documents that exist.
 
-    :param line: Tim pars grep search result line.
-    :return: Triple containing ids and par data.
+    :param doc_ids: Document ids.
+    :param errors: List where the errors are appended to.
+    :return: The document data for the search index.
     """
-    if line and len(line) > 10:
-        temp = line[2:].split("/", 2)
-        doc_id = int(temp[0])
-        par_id = temp[1]
-        par_data = temp[2].replace("current:", "", 1)
-        par_data = par_data[1:-2]
-        return doc_id, par_id, par_data
-    else:
-        return None
+    for doc_id in doc_ids:
+        try:
+            doc_info = DocEntry.find_by_id(
+                doc_id, docentry_load_opts=docentry_eager_relevance_opt
+            )
+            if doc_info:
+                yield get_doc_search_record(doc_info)
+        except Exception as e:
+            err = f"SEARCH_INDEX: '{get_error_message(e)}' while indexing document {doc_id}"
+            log_warning(err)
+            errors.append(err)
 
 
-def create_search_files(remove_deleted_pars=True):
-    """
-    Groups all TIM-paragraphs under documents and combines them into a single file.
-    Creates also a similar file for title searches and a raw file without grouping.
+def get_document_ids(modified_after: datetime | None = None) -> list[int]:
+    q = Block.query.filter_by(type_id=BlockType.Document.value)
+    if modified_after is not None:
+        q = q.filter(Block.modified > modified_after)
+    return [i for i, in q.with_entities(Block.id).order_by(Block.id)]
 
-    :param remove_deleted_pars: Check paragraph existence before adding.
-    :return: Status code and a message confirming success of file creation.
-    """
 
-    temp_content_file_name = (
-        SEARCH_CACHE_FOLDER / f"temp_{PROCESSED_CONTENT_FILE_PATH.name}"
-    )
-    temp_title_file_name = (
-        SEARCH_CACHE_FOLDER / f"temp_{PROCESSED_TITLE_FILE_PATH.name}"
-    )
-    index_log_file_name = SEARCH_CACHE_FOLDER / "index_log.log"
-    f: Path = RAW_CONTENT_FILE_PATH.parent
-    f.mkdir(exist_ok=True)
+def create_search_files() -> tuple[int, str]:
+    """
+    Rebuilds the search index from all documents.
 
+    :return: Status code and a message confirming success of the rebuild.
+    """
+    errors: list[str] = []
     try:
-        subprocess.Popen(
-            f'grep -R "" --include="current" . > {RAW_CONTENT_FILE_PATH} 2>&1',
-            cwd=(get_files_path() / "pars"),
-            shell=True,
-        ).communicate()
+        count = get_search_index_writer().rebuild(
+            get_doc_search_records(get_document_ids(), errors)
+        )
     except Exception as e:
         return (
             400,
-            f"Failed to create preliminary file {RAW_CONTENT_FILE_PATH}: {get_error_message(e)}",
+            f"Creating search index to {SEARCH_INDEX_FOLDER} failed: {get_error_message(e)}!",
         )
-    try:
-        raw_file = RAW_CONTENT_FILE_PATH.open("r", encoding="utf-8")
-    except FileNotFoundError:
-        return 400, f"Failed to open preliminary file {RAW_CONTENT_FILE_PATH}"
-    try:
-        with raw_file, temp_content_file_name.open(
-            "w+", encoding="utf-8"
-        ) as temp_content_file, temp_title_file_name.open(
-            "w+", encoding="utf-8"
-        ) as temp_title_file, index_log_file_name.open(
-            "w+", encoding="utf-8"
-        ) as index_log_file:
-
-            current_doc, current_pars = -1, []
-
-            for line in raw_file:
-                try:
-                    doc_id, par_id, par = get_doc_par_id(line)
-                    if not doc_id:
-                        continue
-                    if not current_doc:
-                        current_doc = doc_id
-                    # If same doc as previous line or the first, just add par data to list.
-                    if current_doc == doc_id:
-                        current_pars.append(par)
-                    # Otherwise save the previous one and empty par data.
-                    else:
-                        new_content_line = add_doc_info_content_line(
-                            current_doc, current_pars, remove_deleted_pars
-                        )
-                        new_title_line = add_doc_info_title_line(current_doc)
-                        if new_content_line:
-                            temp_content_file.write(new_content_line)
-                        if new_title_line:
-                            temp_title_file.write(new_title_line)
-                        current_doc = doc_id
-                        current_pars.clear()
-                        current_pars.append(par)
-                except Exception as e:
-                    err = f"SEARCH_INDEX: '{get_error_message(e)}' while writing search file line '{line}'"
-                    index_log_file.write(f"{err}\n")
-                    print(err)
-
-            # Write the last line separately, because loop leaves it unsaved.
-            if current_doc and current_pars:
-                new_content_line = add_doc_info_content_line(
-                    current_doc, current_pars, remove_deleted_pars
-                )
-                new_title_line = add_doc_info_title_line(current_doc)
-                if new_content_line:
-                    temp_content_file.write(new_content_line)
-                if new_title_line:
-                    temp_title_file.write(new_title_line)
+    return (
+        200,
+        f"Search index of {count} documents created to {SEARCH_INDEX_FOLDER}"
+        + (f" ({len(errors)} documents failed, see log)" if errors else ""),
+    )
 
-            temp_content_file.flush()
-            temp_title_file.flush()
-            os.fsync(temp_content_file)
-            os.fsync(temp_title_file)
 
-        temp_content_file_name.rename(PROCESSED_CONTENT_FILE_PATH)
-        temp_title_file_name.rename(PROCESSED_TITLE_FILE_PATH)
+def update_search_index() -> int:
+    """
+    Updates the documents that have been modified since the previous update or rebuild of the search index.
+    Does nothing if the index has not been built.
 
-        return (
-            200,
-            f"Combined and processed paragraph files created to "
-            f"{PROCESSED_CONTENT_FILE_PATH} and {PROCESSED_TITLE_FILE_PATH}",
-        )
-    except Exception as e:
-        return (
-            400,
-            f"Creating files to {PROCESSED_CONTENT_FILE_PATH} and {PROCESSED_TITLE_FILE_PATH} failed: {get_error_message(e)}!",
-        )
+    :return: Number of updated documents.
+    """
+    index = open_index(SEARCH_INDEX_FOLDER)
+    if index is None:
+        return 0
+    started = time.time()
+    doc_ids = get_document_ids(datetime.fromtimestamp(index.updated, tz=timezone.utc))
+    if not doc_ids:
+        return 0
+    errors: list[str] = []
+    return get_search_index_writer().update(
+        get_doc_search_records(doc_ids, errors), doc_ids, started=started
+    )
 
 
 @search_routes.get("createContentFile")
 def create_search_files_route():
     """
-    Route for grouping all TIM-paragraphs under documents and combining them into a single file.
-    Creates also a similar file for title searches and a raw file without grouping.
+    Route for rebuilding the search index from all documents.
     Note: may take several minutes, so timeout settings need to be lenient.
 
-    :return: A message confirming success of file creation.
+    :return: A message confirming success of the rebuild.
     """
     verify_admin()
 
-    # 'removeDeletedPars' checks paragraph existence before adding at the cost of taking more time.
-    status, msg = create_search_files(
-        get_option(request, "removeDeletedPars", default=True, cast=bool)
-    )
+    status, msg = create_search_files()
     return json_response(status_code=status, jsondata=msg)
 
 
+@search_routes.get("updateIndex")
+def update_search_index_route():
+    """
+    Route for updating the documents that have been modified since the previous update of the search index.
+
+    :return: A message with the number of updated documents.
+    """
+    verify_admin()
+    count = update_search_index()
+    return json_response(f"Updated {count} documents in the search index")
+
+
 @search_routes.get("/titles")
 def title_search():
     """
@@ -989,13 +898,10 @@ def is_timeouted(start_time: float, timeout: float) -> bool:
 @search_routes.get("")
 def search():
     """
-    Perform document word search on a combined and grouped par file using grep.
+    Perform document word search using the search index.
 
     :return: Document paragraph search results with total result count.
     """
-    # If the file containing all TIM content doesn't exist, give warning immediately.
-    content_search_file_path = PROCESSED_CONTENT_FILE_PATH
-    title_search_file_path = PROCESSED_TITLE_FILE_PATH
     (
         query,
         folder,
@@ -1014,13 +920,11 @@ def search():
     ignore_relevance = get_option(request, "ignoreRelevance", default=False, cast=bool)
     timeout = get_option(request, "timeout", default=120, cast=int)
 
-    if search_content and not content_search_file_path.exists():
-        raise NotExist(
-            f"Combined content file '{content_search_file_path}' not found, unable to perform content search!"
-        )
-    if search_titles and not title_search_file_path.exists():
+    # If the search index doesn't exist, give warning immediately.
+    index = open_index(SEARCH_INDEX_FOLDER)
+    if index is None:
         raise NotExist(
-            f"Combined title file '{title_search_file_path}' not found, unable to perform title search!"
+            f"Search index '{SEARCH_INDEX_FOLDER}' not found, unable to perform search!"
         )
 
     start_time = time.time()
@@ -1030,8 +934,6 @@ def search():
     incomplete_search_reason = ""
     current_doc = ""
     current_par = ""
-    content_output = []
-    title_output = []
     content_results = []
     title_results = []
     word_result_count = 0
@@ -1040,37 +942,30 @@ def search():
 
     term_regex = compile_regex(query, regex, case_sensitive, search_whole_words)
 
-    cmd = ["grep"]
-    if not case_sensitive:
-        cmd.append("-i")
-    if regex:
-        cmd.append("-E")
-    else:
-        cmd.append("-F")
-    if search_whole_words:
-        cmd.append("-sw")
-    cmd.append("--")
-    cmd.append(query)
-
-    if search_content:
-        try:
-            s = subprocess.Popen(
-                cmd + [content_search_file_path], stdout=subprocess.PIPE
+    def get_visible_doc(match: DocMatch) -> DocInfo | None:
+        """Returns the document if the user may see it in the results."""
+        # If relevance is ignored, skip check.
+        if not ignore_relevance and is_excluded(match.relevance, relevance_threshold):
+            return None
+        # TODO: Handle aliases and translated documents.
+        doc_info = (
+            DocEntry.query.filter(
+                (DocEntry.id == match.doc_id) & (DocEntry.name.like(folder + "%"))
             )
-            content_output_str = s.communicate()[0].decode("utf-8").strip()
-            content_output = content_output_str.splitlines()
-        except Exception as e:
-            raise RouteException(get_error_message(e))
-
-    if search_titles:
-        try:
-            s = subprocess.Popen(cmd + [title_search_file_path], stdout=subprocess.PIPE)
-            title_output_str = s.communicate()[0].decode("utf-8").strip()
-            title_output = title_output_str.splitlines()
-        except Exception as e:
-            raise RouteException(get_error_message(e))
-
-    if not content_output and not title_output:
+            .options(joinedload(DocEntry._block).joinedload(Block.relevance))
+            .first()
+        )
+        if not doc_info:
+            return None
+        # If not allowed to view, continue to the next one.
+        if not has_view_access(doc_info):
+            return None
+        # Skip if searching only owned and it's not owned.
+        if search_owned_docs and not user.has_ownership(doc_info, allow_admin=False):
+            return None
+        return doc_info
+
+    def response():
         return json_response(
             {
                 "title_result_count": title_result_count,
@@ -1082,7 +977,7 @@ def search():
             }
         )
 
-    for line in title_output:
+    for m in index.find_titles() if search_titles else []:
         try:
             if is_timeouted(start_time, timeout):
                 incomplete_search_reason = (
@@ -1090,67 +985,28 @@ def search():
                 )
                 raise TimeoutError("title search timeout")
 
-            # Any line shorter than this is broken.
-            if line and len(line) > 10:
-                # TODO: Combine with repeating parts from content loop.
-                line_info = json.loads(line)
-                doc_id = line_info["doc_id"]
-                # TODO: Handle aliases and translated documents.
-                doc_info = (
-                    DocEntry.query.filter(
-                        (DocEntry.id == doc_id) & (DocEntry.name.like(folder + "%"))
-                    )
-                    .options(joinedload(DocEntry._block).joinedload(Block.relevance))
-                    .first()
-                )
-                if not doc_info:
-                    continue
-                # If not allowed to view, continue to the next one.
-                if not has_view_access(doc_info):
-                    continue
-                # Skip if searching only owned and it's not owned.
-                if search_owned_docs:
-                    if not user.has_ownership(doc_info, allow_admin=False):
-                        continue
-                # If relevance is ignored or not found from search file, skip check.
-                if not ignore_relevance:
-                    try:
-                        relevance = line_info["d_r"]
-                    except KeyError:
-                        pass
-                    else:
-                        # Leave documents with excluded relevance out of the results.
-                        if is_excluded(relevance, relevance_threshold):
-                            continue
-                doc_result = DocResult(doc_info)
-
-                doc_title = line_info["doc_title"]
-                title_matches = list(term_regex.finditer(doc_title))
-                if title_matches:
-                    title_match_count = len(title_matches)
-                    doc_result.add_title_result(
-                        TitleResult(alt_num_results=title_match_count)
-                    )
-                    title_result_count += title_match_count
-
-                if doc_result.has_results():
-                    title_results.append(doc_result)
+            title_matches = list(term_regex.finditer(m.title))
+            if not title_matches:
+                continue
+            doc_info = get_visible_doc(m)
+            if not doc_info:
+                continue
+            current_doc = doc_info.path
+            doc_result = DocResult(doc_info)
+            title_match_count = len(title_matches)
+            doc_result.add_title_result(TitleResult(alt_num_results=title_match_count))
+            title_result_count += title_match_count
+            title_results.append(doc_result)
         except TimeoutError as e:
             log_search_error(get_error_message(e), query, current_doc, title=True)
-            return json_response(
-                {
-                    "title_result_count": title_result_count,
-                    "word_result_count": word_result_count,
-                    "errors": [],
-                    "incomplete_search_reason": incomplete_search_reason,
-                    "title_results": title_results,
-                    "content_results": content_results,
-                }
-            )
+            return response()
         except Exception as e:
             log_search_error(get_error_message(e), query, current_doc, title=True)
 
-    for line in content_output:
+    content_matches = (
+        index.find_content(query, regex, search_whole_words) if search_content else []
+    )
+    for m in content_matches:
         try:
             if is_timeouted(start_time, timeout):
                 incomplete_search_reason = (
@@ -1158,145 +1014,72 @@ def search():
                 )
                 raise TimeoutError("content search timeout")
 
-            # Any line shorter than this is broken.
-            if line and len(line) > 10:
-
-                # The file is supposed to contain doc_id and pars in a list for each document.
-                line_info = json.loads(line)
-                doc_id = line_info["doc_id"]
-
-                # TODO: Handle aliases.
-                doc_info = (
-                    DocEntry.query.filter(
-                        (DocEntry.id == doc_id) & (DocEntry.name.like(folder + "%"))
-                    )
-                    .options(joinedload(DocEntry._block).joinedload(Block.relevance))
-                    .first()
-                )
-                if not doc_info:
+            doc_info = get_visible_doc(m)
+            if not doc_info:
+                continue
+            current_doc = doc_info.path
+            pars = m.read()["pars"]
+            if m.par_indices is not None:
+                pars = [pars[i] for i in sorted(m.par_indices)]
+            doc_result = DocResult(doc_info)
+            edit_access = has_edit_access(doc_info)
+
+            for i, par in enumerate(pars):
+                current_par = par["id"]
+                attrs = par["attrs"]
+
+                # If par has visibility condition and user can't see markdown (lower than edit), skip it.
+                if attrs.get("visible") and not edit_access:
                     continue
-                # If not allowed to view, continue to the next one.
-                if not has_view_access(doc_info):
+
+                # If ignore_plugins or no edit access, leave out plugin and setting results.
+                if ("plugin" in attrs or "settings" in attrs) and (
+                    ignore_plugins or not edit_access
+                ):
                     continue
+                md = get_par_search_text(
+                    par, search_attrs and edit_access and not ignore_plugins
+                )
 
-                # Skip if searching only owned and it's not owned.
-                if search_owned_docs:
-                    if not user.has_ownership(doc_info, allow_admin=False):
-                        continue
-
-                # If relevance is ignored or not found from search file, skip check.
-                if not ignore_relevance:
-                    try:
-                        relevance = line_info["d_r"]
-                    except KeyError:
-                        # TODO: Add message to user about skipped relevances.
-                        pass
-                    else:
-                        if is_excluded(relevance, relevance_threshold):
-                            continue
-                pars = line_info["pars"]
-                doc_result = DocResult(doc_info)
-                edit_access = has_edit_access(doc_info)
-                # is_owner = user.has_ownership(doc_info, allow_admin=True)
-
-                for i, par in enumerate(pars):
-                    par_id = par["id"]
-                    md = par["md"]
-
-                    # If par has visibility condition and user can't see markdown (lower than edit), skip it.
-                    try:
-                        visibility = par["attrs"]["visible"]
-                        if visibility and not edit_access:
-                            continue
-                    except KeyError:
-                        pass
-
-                    # Tries to get plugin and settings key values from dict;
-                    # if par isn't either, gives KeyError and does nothing.
-                    try:
-                        plugin = par["attrs"]["plugin"]
-                        # If ignore_plugins or no edit access, leave out plugin and setting results.
-                        if ignore_plugins or not edit_access:
-                            continue
-                    except KeyError:
-                        pass
-                    try:
-                        settings = par["attrs"]["settings"]
-                        if ignore_plugins or not edit_access:
-                            continue
-                    except KeyError:
-                        pass
-                    if search_attrs and edit_access and not ignore_plugins:
-                        try:
-                            rd = str(par["attrs"])
-                            md = rd.replace("'", '"') + " " + md
-                        except KeyError:
-                            pass
-
-                    par_result = ParResult(par_id)
-                    par_matches = list(term_regex.finditer(md))
-
-                    if par_matches:
-                        # Word results aren't used for anything currently,
-                        # so to save time and bandwidth they are replaced by a number.
-                        par_result.alt_num_results = len(par_matches)
-                        # for m in matches:
-                        #     result = WordResult(match_word=m.group(0),
-                        #                         match_start=m.start(),
-                        #                         match_end=m.end())
-                        #     par_result.add_result(result)
-                        par_result.preview = preview_result(md, query, par_matches[0])
-
-                    # Don't add empty par result (in error cases).
-                    if par_result.has_results():
-                        doc_result.add_par_result(par_result)
-
-                    # End paragraph match search if limit has been reached, but
-                    # don't break and mark as incomplete if this was the last paragraph.
-                    if (
-                        doc_result.get_par_match_count() > max_doc_results
-                        and i != len(pars) - 1
-                    ):
-                        incomplete_search_reason = (
-                            f"one or more document has over the maximum "
-                            f"of {max_doc_results} results"
-                        )
-                        doc_result.incomplete = True
-                        break
-
-                # If no valid paragraph results, skip document.
-                if doc_result.has_results():
-                    word_result_count += doc_result.get_par_match_count()
-                    content_results.append(doc_result)
-
-                # End search if the limit is reached.
-                if word_result_count > max_results:
+                par_result = ParResult(current_par)
+                par_matches = list(term_regex.finditer(md))
+
+                if par_matches:
+                    # Word results aren't used for anything currently,
+                    # so to save time and bandwidth they are replaced by a number.
+                    par_result.alt_num_results = len(par_matches)
+                    par_result.preview = preview_result(md, query, par_matches[0])
+
+                # Don't add empty par result (in error cases).
+                if par_result.has_results():
+                    doc_result.add_par_result(par_result)
+
+                # End paragraph match search if limit has been reached, but
+                # don't break and mark as incomplete if this was the last paragraph.
+                if (
+                    doc_result.get_par_match_count() > max_doc_results
+                    and i != len(pars) - 1
+                ):
                     incomplete_search_reason = (
-                        f"more than maximum of {max_results} results"
+                        f"one or more document has over the maximum "
+                        f"of {max_doc_results} results"
                     )
+                    doc_result.incomplete = True
                     break
+
+            # If no valid paragraph results, skip document.
+            if doc_result.has_results():
+                word_result_count += doc_result.get_par_match_count()
+                content_results.append(doc_result)
+
+            # End search if the limit is reached.
+            if word_result_count > max_results:
+                incomplete_search_reason = f"more than maximum of {max_results} results"
+                break
         except TimeoutError as e:
-            log_search_error(get_error_message(e), query, current_doc, title=True)
-            return json_response(
-                {
-                    "title_result_count": title_result_count,
-                    "word_result_count": word_result_count,
-                    "errors": [],
-                    "incomplete_search_reason": incomplete_search_reason,
-                    "title_results": title_results,
-                    "content_results": content_results,
-                }
-            )
+            log_search_error(get_error_message(e), query, current_doc)
+            return response()
         except Exception as e:
             log_search_error(get_error_message(e), query, current_doc, par=current_par)
 
-    return json_response(
-        {
-            "title_result_count": title_result_count,
-            "word_result_count": word_result_count,
-            "errors": [],
-            "incomplete_search_reason": incomplete_search_reason,
-            "title_results": title_results,
-            "content_results": content_results,
-        }
-    )
+    return response()
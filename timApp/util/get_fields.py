@@ -16,6 +16,7 @@ from sqlalchemy import func, true
 from sqlalchemy.orm import lazyload, joinedload
 
 from timApp.answer.answer import Answer
+from timApp.answer.latestanswer import LatestAnswer
 from timApp.answer.answers import (
     get_points_by_rule,
     basic_tally_fields,
@@ -31,17 +32,13 @@ from timApp.plugin.taskid import TaskId
 from timApp.user.groups import verify_group_view_access
 from timApp.user.user import User, get_membership_end, get_membership_added
 from timApp.user.usergroup import UserGroup
+from timApp.util.answerutil import task_ids_to_strlist
 from timApp.util.flask.requesthelper import RouteException
 from timApp.util.utils import widen_fields, get_alias, seq_to_str, fin_timezone
 
 ALL_ANSWERED_WILDCARD = "*"
 
 
-def chunks(l: list, n: int):
-    for i in range(0, len(l), n):
-        yield l[i : i + n]
-
-
 tallyfield_re = re.compile(
     r"tally:((?P<doc>\d+)\.)?(?P<field>[a-zA-Z0-9öäåÖÄÅ_-]+)(?:.(?P<subfield>[a-zA-Z0-9öäåÖÄÅ_-]+))?(\[ *(?P<ds>[^\[\],]*) *, *(?P<de>[^\[\],]*) *\])?"
 )
@@ -307,22 +304,18 @@ def get_fields_and_users(
         UserContext.from_one_user(current_user),
     )
     sub = []
-    # For some reason, with 7 or more fields, executing the following query is very slow in PostgreSQL 9.5.
-    # That's why we split the list of task ids in chunks of size 6 and merge the results.
-    # TODO: Investigate if this is still true for PostgreSQL 11.
     not_global_taskids = [t for t in task_ids if not t.is_global]
-    for task_chunk in chunks(not_global_taskids, 6):
-        q = valid_answers_query(task_chunk).join(User, Answer.users)
+    if not_global_taskids:
+        q = LatestAnswer.query.filter(
+            LatestAnswer.task_id.in_(task_ids_to_strlist(not_global_taskids))
+            & (LatestAnswer.valid_answer_id != None)
+        ).join(User, User.id == LatestAnswer.user_id)
         if not requested_groups.include_all_answered:
             q = q.join(UserGroup, join_relation).filter(group_filter)
         elif user_filter is not None:
             # Ensure user filter gets applied even if group filter is skipped in include_all_answered
             q = q.filter(user_filter)
-        sub += (
-            q.group_by(Answer.task_id, User.id)
-            .with_entities(func.max(Answer.id), User.id)
-            .all()
-        )
+        sub = q.with_entities(LatestAnswer.valid_answer_id, User.id).all()
     aid_uid_map = defaultdict(list)
     user_ids = set()
     for aid, uid in sub:
@@ -376,15 +369,16 @@ def get_fields_and_users(
     if tasks_with_count_field:
         for u in users:
             counts[u.id] = {}
-        cnt = func.count(Answer.id).label("cnt")
         answer_counts = (
-            Answer.query.filter(
-                Answer.task_id.in_([tid.doc_task for tid in tasks_with_count_field])
+            LatestAnswer.query.filter(
+                LatestAnswer.task_id.in_(
+                    [tid.doc_task for tid in tasks_with_count_field]
+                )
+                & LatestAnswer.user_id.in_([u.id for u in users])
+            )
+            .with_entities(
+                LatestAnswer.user_id, LatestAnswer.task_id, LatestAnswer.count
             )
-            .join(User, Answer.users)
-            .filter(User.id.in_([u.id for u in users]))
-            .group_by(User.id, Answer.task_id)
-            .with_entities(User.id, Answer.task_id, cnt)
             .all()
         )
         for (uid, taskid, count) in answer_counts:
@@ -0,0 +1,72 @@
+"""Pooled HTTP connections for calls to plugins and Dumbo.
+
+Every call made with :func:`http_request` goes through a single :class:`requests.Session` per process, so the
+TCP connections to the plugins and Dumbo are kept alive and reused instead of being opened for every call.
+The pool keeps at most HTTP_POOL_MAXSIZE idle connections per host. Under gevent, the greenlets of a worker share
+the pool; a greenlet that finds no idle connection opens a new one, and connections above the limit are closed
+when they are returned to the pool.
+
+The session never stores cookies because it is shared by the requests of all users.
+
+Pooling can be disabled with the HTTP_CONNECTION_POOLING option, in which case every call opens a new connection.
+"""
+from __future__ import annotations
+
+import os
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_lock = Lock()
+
+
+def create_session(pool_hosts: int, pool_maxsize: int) -> requests.Session:
+    """Creates a session that keeps at most pool_maxsize connections to each of pool_hosts most recent hosts."""
+    s = requests.Session()
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def get_http_session() -> requests.Session:
+    """Returns the session of the current process.
+
+    The session is re-created in a forked process so that processes never share connections.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        from timApp.tim_app import app
+
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = create_session(
+                    app.config["HTTP_POOL_HOSTS"], app.config["HTTP_POOL_MAXSIZE"]
+                )
+                _session_pid = pid
+    return _session
+
+
+def close_http_session() -> None:
+    """Closes the pooled connections of the current process."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def http_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Like :func:`requests.request`, but uses the pooled connections if HTTP_CONNECTION_POOLING is enabled."""
+    from timApp.tim_app import app
+
+    if not app.config["HTTP_CONNECTION_POOLING"]:
+        return requests.request(method, url, **kwargs)
+    return get_http_session().request(method, url, **kwargs)
@@ -0,0 +1,515 @@
+"""On-disk inverted index for the document search.
+
+The index maps each term (a case-folded run of word characters, see :func:`fold`) to the paragraphs that contain it, along with the
+positions of the term within the paragraph. A query is answered by looking up the candidate paragraphs from the
+index; the search route then matches the query against the candidates only, using the same regular expression
+as before (see :func:`timApp.util.flask.search.compile_regex`). Looking up the candidates is therefore only an
+optimization and never changes the results:
+
+* A query is split into terms the same way as the paragraphs. Inner terms of the query must equal whole terms of
+  the paragraph, and consecutive query terms must be at consecutive positions (phrase search).
+* Unless whole words are searched, the first and last term of the query may also be a part of a term of the
+  paragraph (e.g. "oo ba" matches "foo bar").
+* The index is case-insensitive; case-sensitive queries are checked against the candidates.
+* Regular expressions and queries without word characters cannot use the index, so they are matched against all
+  indexed paragraphs.
+
+The terms of a segment are sorted, so the terms starting with a query term are found with a binary search. For the
+first term of a query, which may also match the end or the middle of a term, the segment has a suffix array: the
+(term, offset) pairs of the suffixes of its terms, sorted by the suffix.
+
+The index consists of immutable segments, each of which holds the terms, postings and the searchable content of a
+set of documents. A full rebuild writes new segments and replaces the old ones. An update writes the changed
+documents to a new segment and marks them deleted in the older segments. When there are too many small segments,
+they are merged. The list of segments is kept in a manifest file that is replaced atomically, so searches never
+see a partially written index.
+"""
+from __future__ import annotations
+
+import json
+import os
+from array import array
+from functools import lru_cache
+import re
+import shutil
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from filelock import FileLock
+
+TOKEN_RE = re.compile(r"\w+")
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "index.lock"
+DOCS_NAME = "docs.jsonl"
+POSTINGS_NAME = "postings.jsonl"
+LEXICON_NAME = "lexicon.json"
+SUFFIXES_NAME = "suffixes.bin"
+
+MAX_SUFFIX_TERM_LENGTH = 64
+"""Longer terms are not in the suffix array; they are checked one by one instead."""
+
+UNUSED_SEGMENT_KEEP_SECS = 3600
+"""How long segments that are no longer in the manifest are kept for searches that are still reading them."""
+
+DocRecord = dict[str, Any]
+"""The searchable data of a document: doc_id, d_r (relevance), doc_title and pars (a list of id, attrs, md)."""
+
+
+FOLD_EXCEPTIONS = {"\u1fd3": "\u0390", "\u1fe3": "\u03b0", "\ufb05": "\ufb06"}
+"""Characters that re.IGNORECASE matches with each other but that do not have the same case mapping."""
+
+
+@lru_cache(maxsize=None)
+def fold_char(c: str) -> str:
+    upper = c.upper()
+    lower = (upper if len(upper) == 1 else c).lower()[0]
+    return FOLD_EXCEPTIONS.get(lower, lower)
+
+
+def fold(term: str) -> str:
+    """Case-folds a term so that two terms are equal if re.IGNORECASE matches them with each other.
+
+    str.lower and str.casefold do not work for this: for example, re.IGNORECASE matches "İ" with "i" and "ſ" with
+    "s", but "İ".lower() is "i" followed by a combining dot and "ſ".lower() is "ſ". Folding each character
+    separately also keeps the positions of the characters.
+    """
+    if term.isascii():
+        return term.lower()
+    return "".join(fold_char(c) for c in term)
+
+
+def tokenize(text: str) -> list[str]:
+    return [fold(m.group(0)) for m in TOKEN_RE.finditer(text)]
+
+
+def get_par_search_text(par: dict, search_attrs: bool) -> str:
+    """Returns the text of an indexed paragraph that the query is matched against."""
+    if search_attrs:
+        return str(par["attrs"]).replace("'", '"') + " " + par["md"]
+    return par["md"]
+
+
+@dataclass
+class QueryTerm:
+    text: str
+    prefix_open: bool
+    """Whether the term may be preceded by other word characters."""
+    suffix_open: bool
+    """Whether the term may be followed by other word characters."""
+
+    def matches(self, term: str) -> bool:
+        if self.prefix_open and self.suffix_open:
+            return self.text in term
+        if self.prefix_open:
+            return term.endswith(self.text)
+        if self.suffix_open:
+            return term.startswith(self.text)
+        return term == self.text
+
+
+def parse_query(query: str, search_whole_words: bool) -> list[QueryTerm]:
+    """Splits a non-regex query into terms."""
+    matches = list(TOKEN_RE.finditer(query))
+    terms = []
+    for i, m in enumerate(matches):
+        terms.append(
+            QueryTerm(
+                text=fold(m.group(0)),
+                prefix_open=not search_whole_words and i == 0 and m.start() == 0,
+                suffix_open=not search_whole_words
+                and i == len(matches) - 1
+                and m.end() == len(query),
+            )
+        )
+    return terms
+
+
+ParKey = tuple[int, int]
+"""(doc_id, paragraph index)"""
+
+
+class SegmentWriter:
+    def __init__(self, path: Path):
+        path.mkdir(parents=True)
+        self.path = path
+        self.docs_file = (path / DOCS_NAME).open("wb")
+        self.docs: dict[int, dict[str, Any]] = {}
+        self.postings: dict[str, list[list]] = {}
+
+    def add(self, record: DocRecord) -> None:
+        doc_id = record["doc_id"]
+        line = json.dumps(record, ensure_ascii=False).encode() + b"\n"
+        self.docs[doc_id] = {
+            "offset": self.docs_file.tell(),
+            "length": len(line),
+            "title": record["doc_title"],
+            "d_r": record["d_r"],
+        }
+        self.docs_file.write(line)
+        for i, par in enumerate(record["pars"]):
+            positions: dict[str, list[int]] = {}
+            for pos, term in enumerate(tokenize(get_par_search_text(par, True))):
+                positions.setdefault(term, []).append(pos)
+            for term, ps in positions.items():
+                self.postings.setdefault(term, []).append([doc_id, i, ps])
+
+    def finish(self) -> None:
+        self.docs_file.close()
+        terms = sorted(self.postings)
+        offsets = []
+        with (self.path / POSTINGS_NAME).open("wb") as f:
+            for term in terms:
+                offsets.append(f.tell())
+                f.write(json.dumps(self.postings[term]).encode() + b"\n")
+            offsets.append(f.tell())
+        with (self.path / LEXICON_NAME).open("w", encoding="utf-8") as f:
+            json.dump(
+                {"terms": terms, "offsets": offsets, "docs": self.docs},
+                f,
+                ensure_ascii=False,
+            )
+        with (self.path / SUFFIXES_NAME).open("wb") as f:
+            build_suffixes(terms).tofile(f)
+
+
+def build_suffixes(terms: list[str]) -> array:
+    """Returns the suffix array of the terms as a flat array of (term index, offset) pairs."""
+    suffixes = sorted(
+        (
+            (i, offset)
+            for i, t in enumerate(terms)
+            if len(t) <= MAX_SUFFIX_TERM_LENGTH
+            for offset in range(len(t))
+        ),
+        key=lambda s: terms[s[0]][s[1] :],
+    )
+    return array("I", (n for pair in suffixes for n in pair))
+
+
+class Segment:
+    def __init__(self, path: Path):
+        self.path = path
+        with (path / LEXICON_NAME).open(encoding="utf-8") as f:
+            lexicon = json.load(f)
+        self.terms: list[str] = lexicon["terms"]
+        self.offsets: list[int] = lexicon["offsets"]
+        self.docs: dict[int, dict[str, Any]] = {
+            int(k): v for k, v in lexicon["docs"].items()
+        }
+        try:
+            self.suffixes = array("I")
+            with (path / SUFFIXES_NAME).open("rb") as f:
+                self.suffixes.frombytes(f.read())
+        except FileNotFoundError:
+            # The segment was written before the suffix arrays.
+            self.suffixes = build_suffixes(self.terms)
+        self.long_terms = [
+            i for i, t in enumerate(self.terms) if len(t) > MAX_SUFFIX_TERM_LENGTH
+        ]
+
+    def suffix(self, k: int) -> str:
+        """Returns the k-th suffix of the suffix array."""
+        return self.terms[self.suffixes[2 * k]][self.suffixes[2 * k + 1] :]
+
+    def find_terms(self, qt: QueryTerm) -> list[int]:
+        """Returns the indices of the terms that match the query term."""
+        if qt.prefix_open:
+            found = {i for i in self.long_terms if qt.matches(self.terms[i])}
+            count = len(self.suffixes) // 2
+            k = bisect_left(range(count), qt.text, key=self.suffix)
+            while k < count:
+                i, offset = self.suffixes[2 * k], self.suffixes[2 * k + 1]
+                term = self.terms[i]
+                if not term.startswith(qt.text, offset):
+                    break
+                if qt.suffix_open or offset + len(qt.text) == len(term):
+                    found.add(i)
+                k += 1
+            return sorted(found)
+        i = bisect_left(self.terms, qt.text)
+        result = []
+        while i < len(self.terms) and self.terms[i].startswith(qt.text):
+            if qt.matches(self.terms[i]):
+                result.append(i)
+            i += 1
+        return result
+
+    def read_postings(self, term_indices: list[int]) -> dict[ParKey, set[int]]:
+        result: dict[ParKey, set[int]] = {}
+        with (self.path / POSTINGS_NAME).open("rb") as f:
+            for i in term_indices:
+                f.seek(self.offsets[i])
+                for doc_id, par_index, positions in json.loads(
+                    f.read(self.offsets[i + 1] - self.offsets[i])
+                ):
+                    result.setdefault((doc_id, par_index), set()).update(positions)
+        return result
+
+    def find_pars(self, terms: list[QueryTerm]) -> dict[int, set[int]]:
+        """Returns the paragraphs that contain the terms at consecutive positions, grouped by document."""
+        candidates: dict[ParKey, set[int]] | None = None
+        for qt in terms:
+            postings = self.read_postings(self.find_terms(qt))
+            if candidates is None:
+                candidates = postings
+            else:
+                shifted = {}
+                for key, positions in candidates.items():
+                    following = postings.get(key)
+                    if following:
+                        p = {pos + 1 for pos in positions} & following
+                        if p:
+                            shifted[key] = p
+                candidates = shifted
+            if not candidates:
+                return {}
+        result: dict[int, set[int]] = {}
+        for doc_id, par_index in candidates or {}:
+            result.setdefault(doc_id, set()).add(par_index)
+        return result
+
+    def read_doc(self, doc_id: int) -> DocRecord:
+        d = self.docs[doc_id]
+        with (self.path / DOCS_NAME).open("rb") as f:
+            f.seek(d["offset"])
+            return json.loads(f.read(d["length"]))
+
+
+@dataclass
+class DocMatch:
+    """A document that may match a query."""
+
+    segment: Segment
+    doc_id: int
+    title: str
+    relevance: int
+    par_indices: set[int] | None
+    """The indices of the paragraphs that may match, or None if any paragraph may match."""
+
+    def read(self) -> DocRecord:
+        return self.segment.read_doc(self.doc_id)
+
+
+class SearchIndex:
+    """A read-only view of the index at the time it was opened."""
+
+    def __init__(self, path: Path, manifest: dict, segments: dict[str, Segment]):
+        self.path = path
+        self.manifest = manifest
+        self.segments = [
+            (segments[s["name"]], set(s["deleted"])) for s in manifest["segments"]
+        ]
+
+    @property
+    def updated(self) -> float:
+        """The time of the last update as a UNIX timestamp."""
+        return self.manifest["updated"]
+
+    def live_docs(self) -> Iterator[tuple[Segment, int]]:
+        for segment, deleted in self.segments:
+            for doc_id in segment.docs:
+                if doc_id not in deleted:
+                    yield segment, doc_id
+
+    def doc_count(self) -> int:
+        return sum(1 for _ in self.live_docs())
+
+    def _match(self, segment: Segment, doc_id: int, pars: set[int] | None) -> DocMatch:
+        d = segment.docs[doc_id]
+        return DocMatch(segment, doc_id, d["title"], d["d_r"], pars)
+
+    def find_content(
+        self, query: str, regex: bool, search_whole_words: bool
+    ) -> list[DocMatch]:
+        """Returns the documents whose paragraphs may match the query, ordered by relevance (descending)."""
+        terms = [] if regex else parse_query(query, search_whole_words)
+        result = []
+        if not terms:
+            result = [self._match(s, d, None) for s, d in self.live_docs()]
+        else:
+            for segment, deleted in self.segments:
+                for doc_id, pars in segment.find_pars(terms).items():
+                    if doc_id not in deleted:
+                        result.append(self._match(segment, doc_id, pars))
+        return sort_by_relevance(result)
+
+    def find_titles(self) -> list[DocMatch]:
+        """Returns all indexed documents ordered by relevance (descending) for matching their titles."""
+        return sort_by_relevance([self._match(s, d, None) for s, d in self.live_docs()])
+
+
+def sort_by_relevance(matches: list[DocMatch]) -> list[DocMatch]:
+    return sorted(matches, key=lambda m: (-m.relevance, m.doc_id))
+
+
+_segments: dict[Path, Segment] = {}
+_opened: tuple[Path, tuple[int, int, int], SearchIndex] | None = None
+
+
+def open_index(path: Path) -> SearchIndex | None:
+    """Opens the index in the given folder, or returns None if the index has not been built.
+
+    The opened segments are kept in memory and re-used as long as they are part of the index.
+    """
+    global _opened
+    manifest_path = path / MANIFEST_NAME
+    try:
+        st = manifest_path.stat()
+    except FileNotFoundError:
+        return None
+    # The manifest is always replaced by a new file, so this changes whenever the index changes.
+    version = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _opened is not None and _opened[0] == path and _opened[1] == version:
+        return _opened[2]
+    with manifest_path.open(encoding="utf-8") as f:
+        manifest = json.load(f)
+    paths = {path / s["name"] for s in manifest["segments"]}
+    for p in list(_segments):
+        if p.parent == path and p not in paths:
+            del _segments[p]
+    for p in paths:
+        if p not in _segments:
+            _segments[p] = Segment(p)
+    index = SearchIndex(path, manifest, {p.name: _segments[p] for p in paths})
+    _opened = (path, version, index)
+    return index
+
+
+class IndexWriter:
+    """Modifies the index. All modifications are done while holding a file lock."""
+
+    def __init__(self, path: Path, segment_docs: int, max_small_segments: int):
+        self.path = path
+        self.segment_docs = segment_docs
+        self.max_small_segments = max_small_segments
+
+    def lock(self) -> FileLock:
+        self.path.mkdir(parents=True, exist_ok=True)
+        return FileLock(str(self.path / LOCK_NAME))
+
+    def _read_manifest(self) -> dict:
+        try:
+            with (self.path / MANIFEST_NAME).open(encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "updated": 0, "segments": []}
+
+    def _write_manifest(self, manifest: dict) -> None:
+        tmp = self.path / f"{MANIFEST_NAME}.tmp"
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path / MANIFEST_NAME)
+        self._remove_unused_segments(manifest)
+
+    def _remove_unused_segments(self, manifest: dict) -> None:
+        names = {s["name"] for s in manifest["segments"]}
+        now = time.time()
+        for p in self.path.glob("seg-*"):
+            if (
+                p.name not in names
+                and now - p.stat().st_mtime > UNUSED_SEGMENT_KEEP_SECS
+            ):
+                shutil.rmtree(p, ignore_errors=True)
+
+    def _write_segments(
+        self, manifest: dict, records: Iterable[DocRecord]
+    ) -> tuple[list[dict], set[int]]:
+        """Writes the records to new segments of at most segment_docs documents each."""
+        generation = manifest["generation"]
+        segments: list[dict] = []
+        doc_ids: set[int] = set()
+        writer = None
+        for r in records:
+            if writer is None or len(writer.docs) >= self.segment_docs:
+                if writer is not None:
+                    writer.finish()
+                    segments[-1]["size"] = len(writer.docs)
+                name = f"seg-{generation}-{len(segments)}"
+                writer = SegmentWriter(self.path / name)
+                segments.append({"name": name, "deleted": []})
+            writer.add(r)
+            doc_ids.add(r["doc_id"])
+        if writer is not None:
+            writer.finish()
+            segments[-1]["size"] = len(writer.docs)
+        return segments, doc_ids
+
+    def rebuild(self, records: Iterable[DocRecord]) -> int:
+        """Replaces the whole index with the given documents.
+
+        :return: The number of indexed documents.
+        """
+        with self.lock():
+            manifest = self._read_manifest()
+            manifest["generation"] += 1
+            started = time.time()
+            segments, doc_ids = self._write_segments(manifest, records)
+            manifest["segments"] = segments
+            manifest["updated"] = started
+            self._write_manifest(manifest)
+            return len(doc_ids)
+
+    def update(
+        self,
+        records: Iterable[DocRecord],
+        doc_ids: Iterable[int] = (),
+        started: float | None = None,
+    ) -> int:
+        """Replaces documents in the index.
+
+        :param records: The new data of the documents.
+        :param doc_ids: Ids of documents to remove from the index unless they are in records.
+        :param started: The time when the records started to be collected. Documents modified after this will be
+         updated by the next update.
+        :return: The number of updated documents.
+        """
+        with self.lock():
+            manifest = self._read_manifest()
+            manifest["generation"] += 1
+            if started is None:
+                started = time.time()
+            segments, updated_ids = self._write_segments(manifest, records)
+            replaced = updated_ids | set(doc_ids)
+            for s in manifest["segments"]:
+                s["deleted"] = sorted(set(s["deleted"]) | replaced)
+            manifest["segments"] += segments
+            manifest["updated"] = started
+            self._merge_small_segments(manifest)
+            self._write_manifest(manifest)
+            return len(updated_ids)
+
+    def _merge_small_segments(self, manifest: dict) -> None:
+        """Merges the segments with fewer than segment_docs documents if there are more than max_small_segments
+        of them.
+        """
+        small = [s for s in manifest["segments"] if s["size"] < self.segment_docs]
+        if len(small) <= self.max_small_segments:
+            return
+        merged_names = {s["name"] for s in small}
+        manifest["generation"] += 1
+        records = (
+            segment.read_doc(doc_id)
+            for segment, deleted in (
+                (Segment(self.path / s["name"]), set(s["deleted"])) for s in small
+            )
+            for doc_id in segment.docs
+            if doc_id not in deleted
+        )
+        merged, _ = self._write_segments(manifest, records)
+        manifest["segments"] = [
+            s for s in manifest["segments"] if s["name"] not in merged_names
+        ] + merged
+
+    def clear(self) -> None:
+        with self.lock():
+            manifest = self._read_manifest()
+            manifest["generation"] += 1
+            manifest["segments"] = []
+            manifest["updated"] = 0
+            self._write_manifest(manifest)